@@ -0,0 +1,188 @@
+# --- AGENT CLIENT: client HTTP condiviso verso gli agent MT5 ---
+#
+# Un client per base URL (schema://host:porta) con connessioni keep-alive
+# riusate tra le chiamate, limite di connessioni per host, timeout di default
+# e retry SOLO sugli errori di connessione (richiesta mai arrivata all'agent:
+# un POST /order non viene mai ripetuto dopo un timeout di lettura).
+# I retry sono limitati da un budget per host (token bucket) per non
+# moltiplicare il carico quando un agent è giù.
+#
+# Uso:  agent_get(url, timeout=5) / agent_post(url, json=..., timeout=10)
+#       (stessa firma e stesse eccezioni di requests.get / requests.post)
+# Metriche: latenza ed errori per endpoint (agent_request_seconds / agent_http_errors_total)
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError
+from urllib3.util.retry import Retry
+
+from metrics import AGENT_SECONDS, AGENT_ERRORS
+
+AGENT_POOL_MAXSIZE = int(os.getenv("AGENT_POOL_MAXSIZE", 8))      # connessioni per host
+AGENT_CONNECT_RETRIES = int(os.getenv("AGENT_CONNECT_RETRIES", 2))
+AGENT_RETRY_RATIO = float(os.getenv("AGENT_RETRY_RATIO", 0.2))    # retry ammessi per richiesta
+DEFAULT_TIMEOUT = (3.05, 30)                                      # (connect, read) in secondi
+
+
+# ─────────────────────── RETRY BUDGET ───────────────────────
+
+class RetryBudget:
+    """
+    Token bucket per host: ogni richiesta aggiunge `ratio` token, ogni retry ne
+    consuma uno. Con l'agent giù i retry si esauriscono invece di moltiplicarsi.
+    """
+
+    def __init__(self, ratio=AGENT_RETRY_RATIO, initial=3.0, cap=10.0):
+        self.ratio = ratio
+        self.cap = cap
+        self.tokens = initial
+        self.retries = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                self.retries += 1
+                return True
+            self.denied += 1
+            return False
+
+
+class _BudgetRetry(Retry):
+    """Retry di urllib3 che consuma il budget dell'host solo per i tentativi che fa davvero."""
+
+    def __init__(self, *args, budget=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.budget = budget
+
+    def new(self, **kw):
+        retry = super().new(**kw)
+        retry.budget = self.budget
+        return retry
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        # errori non ripetibili (read, POST già inviato) o tentativi finiti: solleva urllib3,
+        # senza toccare il budget
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        if self.budget is None or self.budget.withdraw():
+            return retry
+        # budget esaurito: stesso errore che si avrebbe senza retry (le connessioni
+        # fallite arrivano a requests dentro MaxRetryError, come a tentativi finiti)
+        if error is not None and not isinstance(error, ConnectTimeoutError):
+            raise error
+        raise MaxRetryError(_pool, url, reason=error) from error
+
+
+# ─────────────────────── CLIENT SYNC ───────────────────────
+
+class AgentClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.budget = RetryBudget()
+        retry = _BudgetRetry(
+            total=AGENT_CONNECT_RETRIES,
+            connect=AGENT_CONNECT_RETRIES,
+            read=False,
+            status=0,
+            other=0,
+            backoff_factor=0.2,
+            raise_on_status=False,
+            budget=self.budget,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=AGENT_POOL_MAXSIZE,
+            pool_block=True,
+            max_retries=retry,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.requests = 0
+
+    def request(self, method, url, **kwargs):
+        if not url.startswith(("http://", "https://")):
+            url = f"{self.base_url}/{url.lstrip('/')}"
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        self.budget.deposit()
+        self.requests += 1
+        endpoint = _endpoint_of(url)
+        t0 = time.perf_counter()
+        try:
+            resp = self.session.request(method, url, **kwargs)
+        except Exception as e:
+            AGENT_ERRORS.inc(endpoint, type(e).__name__)
+            raise
+        finally:
+            AGENT_SECONDS.observe(time.perf_counter() - t0, endpoint)
+        if resp.status_code >= 400:
+            AGENT_ERRORS.inc(endpoint, resp.status_code)
+        return resp
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "retries": self.budget.retries,
+            "retries_denied": self.budget.denied,
+            "retry_tokens": round(self.budget.tokens, 2),
+        }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _base_of(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _endpoint_of(url):
+    """Label delle metriche: primo segmento del path (per /db/... l'ultimo), senza id e simboli."""
+    segments = [s for s in urlsplit(url).path.split("/") if s]
+    if not segments:
+        return "/"
+    if segments[0] == "db":
+        return "db/" + segments[-1]
+    return segments[0]
+
+
+def get_agent_client(url):
+    """Client condiviso per l'host di `url` (accetta sia base URL che URL completi)."""
+    base = _base_of(url)
+    with _clients_lock:
+        client = _clients.get(base)
+        if client is None:
+            client = AgentClient(base)
+            _clients[base] = client
+        return client
+
+
+def agent_get(url, **kwargs):
+    return get_agent_client(url).get(url, **kwargs)
+
+
+def agent_post(url, **kwargs):
+    return get_agent_client(url).post(url, **kwargs)
+
+
+def agent_clients_stats():
+    with _clients_lock:
+        return {base: c.stats() for base, c in _clients.items()}
+
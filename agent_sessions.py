@@ -0,0 +1,186 @@
+# --- AGENT SESSIONS: login MT5 attivo su ogni agent, riusato tra gli ordini ---
+#
+# with agent_session(base_url, mt5_path, login, password, server, log) as health:
+#     ...ordine sullo slave...
+#
+# Per agent si ricorda quale account è loggato e quando lo si è verificato.
+# Entro AGENT_HEALTH_TTL secondi dall'ultima verifica l'ordine parte senza
+# /health, /init-mt5 né /login. Dopo, un solo GET /health: si rifà il login
+# solo se l'agent riporta un altro account, il terminale disconnesso o MT5 non
+# inizializzato (agent vecchi senza "login" in /health: vale il login ricordato).
+# Il lock è per agent e resta acquisito per tutto il blocco with: due trader con
+# account diversi sullo stesso agent non si scambiano il login a metà ordine.
+# Dopo un errore nel blocco la sessione viene dimenticata (verifica al prossimo ordine).
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from agent_client import agent_get, agent_post
+from metrics import register_collector
+
+AGENT_HEALTH_TTL = float(os.getenv("AGENT_HEALTH_TTL", 5))   # sec di validità della verifica
+
+
+class AgentSessionError(Exception):
+    """Agent non inizializzabile o login rifiutato: il messaggio va nella risposta ko."""
+
+
+class _AgentSession:
+    __slots__ = ("login", "server", "checked_at", "lock")
+
+    def __init__(self):
+        self.login = None
+        self.server = None
+        self.checked_at = float("-inf")
+        self.lock = threading.RLock()
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_stats = {"hits": 0, "health_checks": 0, "inits": 0, "logins": 0, "errors": 0}
+
+
+def _get(base_url):
+    with _sessions_lock:
+        session = _sessions.get(base_url)
+        if session is None:
+            session = _sessions[base_url] = _AgentSession()
+        return session
+
+
+def _count(name):
+    with _sessions_lock:
+        _stats[name] += 1
+
+
+# ─────────────────────── HEALTH / INIT / LOGIN ───────────────────────
+
+def _health(base_url, log):
+    _count("health_checks")
+    try:
+        resp = agent_get(f"{base_url}/health", timeout=5)
+        if resp.status_code == 200:
+            data = resp.json()
+            if data.get("status") == "ok":
+                return data
+        log(f"⚠️ MT5 non attivo o errore nella risposta ({base_url})")
+    except Exception as e:
+        log(f"❌ Terminale non raggiungibile ({base_url}): {e}")
+    return None
+
+
+def _init(base_url, mt5_path, log):
+    log(f"🔹 Inizializzo terminale MT5 su {base_url}/init-mt5...")
+    _count("inits")
+    try:
+        resp = agent_post(f"{base_url}/init-mt5", json={"path": mt5_path}, timeout=10)
+    except Exception as e:
+        raise AgentSessionError(f"Errore durante init su {base_url}: {e}")
+    if resp.status_code != 200:
+        raise AgentSessionError(f"Init MT5 fallita ({base_url}): {resp.text}")
+    log(f"✅ MT5 inizializzato correttamente su {base_url}")
+
+
+def _login(base_url, login, password, server, log):
+    log(f"🔐 Login MT5 {login}@{server} su {base_url}...")
+    _count("logins")
+    body = {"login": int(login), "password": password, "server": server}
+    try:
+        resp = agent_post(f"{base_url}/login", json=body, timeout=20)
+    except Exception as e:
+        raise AgentSessionError(f"Errore login slave: {e}")
+    if resp.status_code != 200:
+        raise AgentSessionError(f"Errore login slave: {resp.text}")
+    log(f"✅ Login MT5 OK! Bilancio: {resp.json().get('balance')}")
+
+
+def _ensure(session, base_url, mt5_path, login, password, server, log):
+    login = int(login)
+    if (session.login == login and session.server == server
+            and time.monotonic() - session.checked_at < AGENT_HEALTH_TTL):
+        _count("hits")
+        return {"status": "ok", "login": login, "server": server, "cached": True}
+
+    health = _health(base_url, log)
+    if health is None:
+        session.login = None
+        _init(base_url, mt5_path, log)
+        health = {"status": "ok"}
+
+    if "login" in health:
+        relogin = (health.get("login") != login or not health.get("connected", True)
+                   or health.get("server") not in (None, server))
+    else:
+        # agent senza account in /health: ci si fida del login ricordato
+        relogin = session.login != login or session.server != server
+
+    if relogin:
+        if health.get("login"):
+            log(f"🔁 Account attivo {health.get('login')} ≠ {login}: nuovo login")
+        session.login = None
+        _login(base_url, login, password, server, log)
+    session.login, session.server = login, server
+    session.checked_at = time.monotonic()
+    return health
+
+
+# ─────────────────────── API ───────────────────────
+
+@contextmanager
+def agent_session(base_url, mt5_path, login, password, server, log=print):
+    """
+    Agent pronto con l'account (login, server) attivo per la durata del blocco.
+    Solleva AgentSessionError se init o login falliscono.
+    """
+    session = _get(base_url)
+    with session.lock:
+        try:
+            health = _ensure(session, base_url, mt5_path, login, password, server, log)
+        except AgentSessionError:
+            _count("errors")
+            session.login = None
+            raise
+        try:
+            yield health
+        except Exception:
+            session.login = None
+            raise
+
+
+def note_login(base_url, login, server):
+    """Login fatto fuori da agent_session (copy_orders, start_server): aggiorna lo stato."""
+    try:
+        login = int(login)
+    except (TypeError, ValueError):
+        login = None
+    session = _get(base_url)
+    with session.lock:
+        session.login, session.server = login, server
+        session.checked_at = time.monotonic()
+
+
+def invalidate(base_url=None):
+    """Dimentica il login (di un agent o di tutti): il prossimo ordine riverifica /health."""
+    with _sessions_lock:
+        targets = list(_sessions.values()) if base_url is None else [_sessions.get(base_url)]
+    for session in targets:
+        if session is not None:
+            with session.lock:
+                session.login = None
+
+
+def session_stats():
+    with _sessions_lock:
+        return {**_stats, "agents": len(_sessions)}
+
+
+@register_collector
+def _session_metrics():
+    stats = session_stats()
+    lines = []
+    for key, help in (("hits", "Ordini partiti con la sessione in cache"), ("health_checks", "GET /health verso gli agent"),
+                      ("inits", "POST /init-mt5"), ("logins", "POST /login"), ("errors", "Init o login falliti")):
+        name = f"agent_session_{key}_total"
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} counter", f"{name} {stats[key]}"]
+    return lines
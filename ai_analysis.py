@@ -1,6 +1,6 @@
 import os
 import json
-import requests
+from agent_client import agent_get
 from decimal import Decimal
 from openai import OpenAI
 from dotenv import load_dotenv
@@ -48,7 +48,6 @@ def fetch_trade_data(conn, trader_id, limit=100):
 
 def fetch_trade_data_from_mt5(trader_id, days=30, limit=100):
     """Fetch closed trades from MT5 history + trader config from DB."""
-    import requests
     from db import get_connection
 
     conn = get_connection()
@@ -76,7 +75,7 @@ def fetch_trade_data_from_mt5(trader_id, days=30, limit=100):
 
     # Recupera info conto MT5
     try:
-        status_resp = requests.get(f"{slave_url}/server_status", timeout=5)
+        status_resp = agent_get(f"{slave_url}/server_status", timeout=5)
         if status_resp.status_code == 200:
             account = status_resp.json().get("account", {})
             trader["mt5_login"] = account.get("login")
@@ -84,7 +83,7 @@ def fetch_trade_data_from_mt5(trader_id, days=30, limit=100):
     except Exception:
         pass
 
-    resp = requests.get(f"{slave_url}/history", params={"days": days}, timeout=15)
+    resp = agent_get(f"{slave_url}/history", params={"days": days}, timeout=15)
     if resp.status_code != 200:
         return trader, []
 
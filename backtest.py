@@ -1,12 +1,19 @@
 import pandas as pd
 import numpy as np
 import argparse
+import os
 import sys
-import requests
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from agent_client import agent_post
+from rates_codec import BAR_DTYPE, RATES_ACCEPT, decode_rates, to_bar_array
+from exit_kernel import EXIT_LABELS, EXIT_NONE, EXIT_SL, EXIT_TP, ENTRY_ERROR, HOLD_CLOSE, HOLD_ERROR, first_exit, simulate_grid
+import bar_store
+import result_cache
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
-from trading_signals_multi2 import STRATEGIES, Indicators, compute_regime, REGIME_WINDOW
+from trading_signals_multi2 import STRATEGIES, Indicators, SignalStrategy, compute_regime, regime_vector, REGIME_WINDOW
 from indicators.ta import compute_ema, compute_rsi, compute_macd, compute_atr, compute_hma, compute_ichimoku, compute_rolling_percentile
 
 TIMEFRAME_MAP = {
@@ -38,14 +45,12 @@ def fetch_rates(symbol, tf_key, n_candles, mt5_api_url, start_pos=0, retries=3):
     payload = {"symbol": symbol, "timeframe": TIMEFRAME_MAP[tf_key], "n_candles": n_candles, "start_pos": start_pos}
     for attempt in range(retries):
         try:
-            resp = requests.post(url, json=payload, timeout=120)
+            resp = agent_post(url, json=payload, headers={"Accept": RATES_ACCEPT}, timeout=120)
             resp.raise_for_status()
-            data = resp.json()
-            rates = data.get("rates", [])
-            if not rates:
+            rates = decode_rates(resp)
+            if rates is None:
                 return None
-            dtype = [("time", "i8"), ("open", "f8"), ("high", "f8"), ("low", "f8"), ("close", "f8"), ("tick_volume", "i8")]
-            return np.array([(r["time"], r["open"], r["high"], r["low"], r["close"], r.get("tick_volume", 0)) for r in rates], dtype=dtype)
+            return to_bar_array(rates)
         except Exception as e:
             print(f"    Attempt {attempt+1} failed: {e}")
             if attempt == retries - 1:
@@ -59,6 +64,8 @@ DEFAULT_BALANCE = 10000.0
 M1_LOOKBACK = 100
 M5_LOOKBACK = 60
 MAX_BARS = 40000
+FETCH_WORKERS = int(os.getenv("BACKTEST_FETCH_WORKERS", 4))   # blocchi scaricati in parallelo
+FETCH_BACKOFF = 0.5                                            # sec, raddoppia a ogni tentativo
 
 INSTRUMENT = {
     "XAUUSD":  {"pip": 0.01,    "contract": 100},
@@ -77,7 +84,8 @@ DEFAULT_SL = 500
 DEFAULT_TP = 600
 
 
-def fetch_rates_range(symbol, tf_key, date_from, date_to, mt5_api_url):
+def _request_rates_range(symbol, tf_key, date_from, date_to, mt5_api_url, attempts=3):
+    """POST /get_rates_range: array BAR_DTYPE (anche vuoto); solleva l'ultimo errore dopo `attempts` tentativi."""
     url = f"{mt5_api_url.rstrip('/')}/get_rates_range"
     payload = {
         "symbol": symbol,
@@ -85,24 +93,65 @@ def fetch_rates_range(symbol, tf_key, date_from, date_to, mt5_api_url):
         "date_from": date_from.strftime("%Y-%m-%d"),
         "date_to": date_to.strftime("%Y-%m-%d"),
     }
-    for attempt in range(3):
+    for attempt in range(attempts):
         try:
-            resp = requests.post(url, json=payload, timeout=120)
+            resp = agent_post(url, json=payload, headers={"Accept": RATES_ACCEPT}, timeout=120)
             resp.raise_for_status()
-            data = resp.json()
-            rates = data.get("rates", [])
-            if not rates:
-                return None
-            dtype = [("time", "i8"), ("open", "f8"), ("high", "f8"), ("low", "f8"), ("close", "f8"), ("tick_volume", "i8")]
-            return np.array([(r["time"], r["open"], r["high"], r["low"], r["close"], r.get("tick_volume", 0)) for r in rates], dtype=dtype)
+            rates = decode_rates(resp)
+            if rates is None:
+                return np.empty(0, dtype=BAR_DTYPE)
+            return to_bar_array(rates)
         except Exception as e:
+            if attempt == attempts - 1:
+                raise
             print(f"    Attempt {attempt+1} failed: {e}")
-            if attempt == 2:
-                return None
-    return None
+            time.sleep(FETCH_BACKOFF * 2 ** attempt)
 
 
-def fetch_data(symbol, strategy, days, mt5_api_url):
+def fetch_rates_range(symbol, tf_key, date_from, date_to, mt5_api_url):
+    try:
+        raw = _request_rates_range(symbol, tf_key, date_from, date_to, mt5_api_url)
+    except Exception:
+        return None
+    return raw if len(raw) else None
+
+
+def _download_chunks(symbol, jobs, mt5_api_url, progress_callback=None, cancel_flag=None):
+    """
+    Scarica in parallelo (al massimo FETCH_WORKERS richieste insieme) i blocchi
+    (tf, da, a) di tutti i timeframe. Ritorna {blocco: array}, None per i blocchi falliti.
+    progress_callback(fatti, totale) a ogni blocco completato.
+    """
+    results = {}
+    if not jobs:
+        return results
+    total = len(jobs)
+    done = 0
+    if progress_callback:
+        progress_callback(0, total)
+
+    with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, total), thread_name_prefix="fetch") as pool:
+        futures = {pool.submit(_request_rates_range, symbol, tf_key, a, b, mt5_api_url): (tf_key, a, b) for tf_key, a, b in jobs}
+        for fut in as_completed(futures):
+            job = futures[fut]
+            tf_key, a, b = job
+            try:
+                results[job] = fut.result()
+                print(f"    {tf_key.upper()} {a:%Y-%m-%d} -> {b:%Y-%m-%d}: {len(results[job])} bars")
+            except Exception as e:
+                results[job] = None
+                print(f"    {tf_key.upper()} {a:%Y-%m-%d} -> {b:%Y-%m-%d} failed, skipping: {e}")
+            done += 1
+            if progress_callback:
+                progress_callback(done, total)
+            if cancel_flag and cancel_flag():
+                for f in futures:
+                    f.cancel()
+                raise InterruptedError("Download cancelled")
+    return results
+
+
+def fetch_data(symbol, strategy, days, mt5_api_url, progress_callback=None, cancel_flag=None):
     from datetime import timedelta
     import math
 
@@ -129,39 +178,53 @@ def fetch_data(symbol, strategy, days, mt5_api_url):
     now = datetime.now()
     date_to = now
     date_from = now - timedelta(days=days)
+    day_from, day_to = date_from.date(), date_to.date()
 
+    # 1. piano dei blocchi da scaricare (con l'archivio locale: solo i giorni mancanti)
+    server = bar_store.broker_server(mt5_api_url) if bar_store.BAR_STORE_ENABLED else None
+    series = {}
+    jobs = []
     for tf_key, needed in tf_map.items():
         if not needed:
             continue
 
         bpd = bars_per_day[tf_key]
         total_bars = days * bpd
+        chunk_days = math.ceil(MAX_BARS / bpd * 0.9)
 
-        if total_bars <= MAX_BARS:
+        if server is not None:
+            series[tf_key] = bar_store.open_series(server, symbol, tf_key)
+            chunks = [c for a, b in series[tf_key].missing(day_from, day_to) for c in bar_store.split_days(a, b, chunk_days)]
+            if chunks:
+                print(f"  Fetching {tf_key.upper()} in {len(chunks)} chunks (missing from local store)...")
+            else:
+                print(f"  {tf_key.upper()}: local store ({day_from} -> {day_to})")
+        elif total_bars <= MAX_BARS:
             print(f"  Fetching {tf_key.upper()} ({date_from.date()} -> {date_to.date()})...")
-            raw = fetch_rates_range(symbol, tf_key, date_from, date_to, mt5_api_url)
-            if raw is None or len(raw) == 0:
-                raise ValueError(f"No {tf_key.upper()} data for {symbol}")
-            all_raw = [raw]
+            chunks = [(date_from, date_to)]
         else:
-            chunk_days = math.ceil(MAX_BARS / bpd * 0.9)
-            n_chunks = math.ceil(days / chunk_days)
-            print(f"  Fetching {tf_key.upper()} in {n_chunks} chunks ({days} days, ~{total_bars} bars)...")
-            all_raw = []
-            cursor_from = date_from
-            for ci in range(n_chunks):
-                cursor_to = min(cursor_from + timedelta(days=chunk_days), date_to)
-                print(f"    Chunk {ci+1}/{n_chunks}: {cursor_from.date()} -> {cursor_to.date()}")
-                raw = fetch_rates_range(symbol, tf_key, cursor_from, cursor_to, mt5_api_url)
-                if raw is not None and len(raw) > 0:
-                    all_raw.append(raw)
-                else:
-                    print(f"    Chunk {ci+1} returned no data, skipping.")
-                cursor_from = cursor_to + timedelta(days=1)
-                if cursor_from >= date_to:
-                    break
+            chunks = bar_store.split_days(date_from, date_to, chunk_days)
+            print(f"  Fetching {tf_key.upper()} in {len(chunks)} chunks ({days} days, ~{total_bars} bars)...")
+        jobs.extend((tf_key, a, b) for a, b in chunks)
+
+    # 2. download parallelo di tutti i blocchi, di tutti i timeframe
+    results = _download_chunks(symbol, jobs, mt5_api_url, progress_callback, cancel_flag)
+
+    # 3. fusione per timeframe (i blocchi si sovrappongono sulla mezzanotte: dedup sul time)
+    for tf_key, needed in tf_map.items():
+        if not needed:
+            continue
+
+        tf_jobs = sorted((j for j in jobs if j[0] == tf_key), key=lambda j: j[1])
+        if tf_key in series:
+            for job in tf_jobs:
+                if results[job] is not None:
+                    series[tf_key].write(results[job], job[1], job[2])
+            combined = series[tf_key].read(day_from, day_to)
+        else:
+            parts = [results[j] for j in tf_jobs if results[j] is not None and len(results[j]) > 0]
+            combined = np.concatenate(parts) if parts else None
 
-        combined = np.concatenate(all_raw) if all_raw else None
         if combined is None or len(combined) == 0:
             raise ValueError(f"No {tf_key.upper()} data for {symbol}")
 
@@ -174,6 +237,28 @@ def fetch_data(symbol, strategy, days, mt5_api_url):
     return dfs
 
 
+ALIGN_MINUTES = {"m5": 5, "m15": 15, "h1": 60}
+
+
+def precompute_alignment(dfs):
+    """
+    Allineamento multi-timeframe calcolato una volta sola: in ogni frame la colonna
+    <tf>_idx (tf = m5, m15, h1) è l'indice dell'ultima barra <tf> iniziata entro
+    quella barra (prima un searchsorted per ogni barra del ciclo di backtest).
+    Resta nei DataFrame, quindi vale per tutte le combinazioni che riusano gli
+    stessi dfs.
+    """
+    for tf, minutes in ALIGN_MINUTES.items():
+        df_tf = dfs.get(tf)
+        if df_tf is None:
+            continue
+        times = df_tf["time"].values
+        starts = (pd.Series(times) - pd.to_timedelta(pd.DatetimeIndex(times).minute % minutes, unit="m")).values
+        for df in dfs.values():
+            if df is not None:
+                df[f"{tf}_idx"] = np.searchsorted(starts, df["time"].values, side="right") - 1
+
+
 def precompute_indicators(dfs):
     df_m1 = dfs.get("m1")
     df_m5 = dfs.get("m5")
@@ -249,8 +334,87 @@ def precompute_indicators(dfs):
         df_h1["atr_h1"] = df_h1["tr"].rolling(14).mean()
         df_h1["vol_avg"] = df_h1["tick_volume"].rolling(20).mean()
 
+    precompute_alignment(dfs)
+
+
+def _vector_signals(strategy, pri_arr, m1_arr, m5_arr, m15_arr, idx_m5, idx_m15):
+    """
+    Backtest vettoriale (primario M1): costruisce un Indicators di array con gli
+    stessi valori che il ciclo barra per barra mette in `ind`, e chiede alla
+    strategia le maschere buy/sell. Campi disponibili: price, ema_fast, ema_slow,
+    ema21, rsi_m1, rsi, macd, macd_sig, volatilty_expansion/volatility_expansion,
+    is_spike, atr, atr_m1, lower, upper, hma_m5, hma_m5_prev, atr_m5_val,
+    trend_macro_up, trend_macro_50_up, atr_m15_pct, regime.
+    Ritorna (buy, sell, hold_exit) oppure None se la strategia non è vettorizzabile:
+    si torna al ciclo barra per barra.
+    hold_exit è None (on_hold_action di base) oppure (eventi_buy, eventi_sell, safe):
+    safe sono le barre dove hold_ind ha tutti i campi; sulle altre on_hold_action
+    va chiamata barra per barra.
+    """
+    v = Indicators()
+    v.price = pri_arr["close"]
+    v.ema_fast = m1_arr["ema9"]
+    v.ema_slow = m1_arr["ema21"]
+    v.ema21 = m1_arr["ema21"]
+    v.rsi_m1 = m1_arr["rsi14"]
+    v.rsi = m1_arr["rsi14"]
+    v.macd = m1_arr["macd"]
+    v.macd_sig = m1_arr["macd_sig"]
+    v.volatilty_expansion = m1_arr["atr"] > m1_arr["atr_ma10"]
+    v.volatility_expansion = v.volatilty_expansion
+    v.is_spike = m1_arr["is_spike"].astype(bool)
+    v.atr_m1 = m1_arr["atr"]
+    v.atr = m1_arr["atr"]
+    v.lower = m1_arr["ema21"] - 2 * m1_arr["atr"]
+    v.upper = m1_arr["ema21"] + 2 * m1_arr["atr"]
+
+    safe = np.ones(len(v.price), dtype=bool)
+    h = Indicators()
+    if idx_m5 is not None:
+        ok5 = idx_m5 >= 30
+        i5 = np.clip(idx_m5, 0, None)
+        v.hma_m5 = np.where(ok5, m5_arr["hma"][i5], 0.0)
+        v.hma_m5_prev = np.where(ok5, m5_arr["hma_prev"][i5], 0.0)
+        v.atr_m5_val = np.where(ok5, m5_arr["atr_m5"][i5], 0.0)
+        v.rsi = np.where(ok5, m5_arr["rsi14"][i5], m1_arr["rsi14"])
+        h.hma_m5 = v.hma_m5
+        h.hma_m5_prev = v.hma_m5_prev
+        safe &= ok5
+    if idx_m15 is not None:
+        ok15 = idx_m15 >= 30
+        i15 = np.clip(idx_m15, 0, None)
+        trend_up = m15_arr["close"][i15] > m15_arr["ema50"][i15]
+        pct = np.where(ok15, m15_arr["atr_m15_pct"][i15], np.nan)
+        v.trend_macro_up = np.where(ok15, trend_up, False)
+        v.trend_macro_50_up = v.trend_macro_up
+        v.atr_m15_pct = pct
+        v.regime = np.where(ok15, regime_vector(pct, is_spike=v.is_spike), "NORMAL")
+        h.trend_macro_up = trend_up
+        h.hma = m15_arr["hma"][i15]
+        h.hma_prev = m15_arr["hma_prev"][i15]
+        h.ema_short = m15_arr["ema5"][i15]
+        h.ema_long = m15_arr["ema20_m15"][i15]
+        safe &= ok15
+
+    try:
+        buy, sell = strategy.vector_conditions(v)
+    except AttributeError:
+        return None
+
+    if type(strategy).on_hold_action is SignalStrategy.on_hold_action:
+        return np.asarray(buy, dtype=bool), np.asarray(sell, dtype=bool), None
+    if strategy.vector_hold_conditions is None:
+        return None
+    try:
+        close_buy, close_sell = strategy.vector_hold_conditions(h)
+    except AttributeError:
+        return None
+    close_buy = (np.asarray(close_buy, dtype=bool) & safe) | ~safe
+    close_sell = (np.asarray(close_sell, dtype=bool) & safe) | ~safe
+    return np.asarray(buy, dtype=bool), np.asarray(sell, dtype=bool), (close_buy, close_sell, safe)
+
 
-def run_backtest(strategy, dfs, symbol, lot, balance, cancel_flag=None, progress_callback=None, direction_filter="both", skip_indicators=False, sl_pts_override=None, tp_pts_override=None, verbose=True):
+def run_backtest(strategy, dfs, symbol, lot, balance, cancel_flag=None, progress_callback=None, direction_filter="both", skip_indicators=False, sl_pts_override=None, tp_pts_override=None, verbose=True, vectorized=True, signals_only=False):
     _print = print if verbose else lambda *a, **k: None
     trades = []
     position = None
@@ -271,15 +435,12 @@ def run_backtest(strategy, dfs, symbol, lot, balance, cancel_flag=None, progress
 
     if use_m5:
         m5_times = df_m5["time"].values
-        m5_end = pd.Series(m5_times) - pd.to_timedelta(pd.DatetimeIndex(m5_times).minute % 5, unit="m")
 
     if use_m15:
         m15_times = df_m15["time"].values
-        m15_end = pd.Series(m15_times) - pd.to_timedelta(pd.DatetimeIndex(m15_times).minute % 15, unit="m")
 
     if use_h1:
         h1_times = df_h1["time"].values
-        h1_end = pd.Series(h1_times) - pd.to_timedelta(pd.DatetimeIndex(h1_times).minute % 60, unit="m")
 
     instr = INSTRUMENT.get(symbol, {"pip": 0.01, "contract": 100})
     pip = instr["pip"]
@@ -343,6 +504,11 @@ def run_backtest(strategy, dfs, symbol, lot, balance, cancel_flag=None, progress
         "close": primary_df["close"].values,
     }
 
+    # Allineamento barra primaria → ultima barra M5/M15/H1 (precompute_alignment)
+    if any(f"{tf}_idx" not in primary_df.columns for tf in ALIGN_MINUTES if dfs.get(tf) is not None):
+        precompute_alignment(dfs)
+    align = {tf: primary_df[f"{tf}_idx"].values for tf in ALIGN_MINUTES if dfs.get(tf) is not None}
+
     total = len(primary_df)
     start_idx = lookback
     print_steps = max(total // 20, 1)
@@ -350,234 +516,413 @@ def run_backtest(strategy, dfs, symbol, lot, balance, cancel_flag=None, progress
     _dbg_sell_signals = 0
     _dbg_evaluated = 0
 
-    for i in range(start_idx, total):
-        if cancel_flag and cancel_flag():
-            break
+    # ── helper per barra, condivisi dal ciclo barra per barra e dalla modalità vettoriale ──
 
+    def bar_indicators(i):
+        """Indicators della barra i, come li vedono buy_condition / sell_condition."""
         ts = primary_times[i]
-        low = pri_arr["low"][i]
-        high = pri_arr["high"][i]
         price = pri_arr["close"][i]
-        ts_str = str(ts)
-
-        if i % print_steps == 0:
-            pct = (i - start_idx) / max(total - start_idx, 1) * 100
-            _print(f"  ... {pct:.0f}% ({i}/{total}) | Trades: {len(trades)} | Bal: {balance:.2f}")
-            if progress_callback:
-                progress_callback(round(pct), len(trades), round(balance, 2))
+        ind = Indicators()
+        ind.session_label = _get_session_label(ts)
+
+        if use_m1:
+            ind.price = price
+            ind.ema_fast = m1_arr["ema9"][i]
+            ind.ema_slow = m1_arr["ema21"][i]
+            ind.ema21 = m1_arr["ema21"][i]
+            ind.rsi_m1 = m1_arr["rsi14"][i]
+            ind.rsi = m1_arr["rsi14"][i]
+            ind.macd = m1_arr["macd"][i]
+            ind.macd_sig = m1_arr["macd_sig"][i]
+            ind.volatilty_expansion = m1_arr["atr"][i] > m1_arr["atr_ma10"][i]
+            ind.volatility_expansion = ind.volatilty_expansion
+            ind.is_spike = m1_arr["is_spike"][i]
+            ind.atr_m1 = m1_arr["atr"][i]
+            ind.atr = m1_arr["atr"][i]
+            ind.lower = m1_arr["ema21"][i] - 2 * m1_arr["atr"][i]
+            ind.upper = m1_arr["ema21"][i] + 2 * m1_arr["atr"][i]
 
-        if position:
-            entry, direction, sl, tp = position
+            if use_m5:
+                idx_m5 = int(align["m5"][i])
+                if idx_m5 >= 30:
+                    ind.hma_m5 = m5_arr["hma"][idx_m5]
+                    ind.hma_m5_prev = m5_arr["hma_prev"][idx_m5]
+                    ind.atr_m5_val = m5_arr["atr_m5"][idx_m5]
+                    ind.ema_short = m5_arr["ema5"][idx_m5]
+                    ind.ema_long = m5_arr["ema15"][idx_m5]
+                    ind.rsi = m5_arr["rsi14"][idx_m5]
+                else:
+                    ind.hma_m5 = 0
+                    ind.hma_m5_prev = 0
+                    ind.atr_m5_val = 0
 
-            if direction == "buy":
-                if low <= sl:
-                    pnl = (sl - entry) * lot * contract
-                    balance += pnl
-                    _print(f"{ts_str} BUY SL @ {sl:.2f} | PnL: {pnl:.2f} | Bal: {balance:.2f}")
-                    trades.append({"time": ts, "type": "BUY", "exit": "SL", "pnl": pnl, "balance": balance})
-                    position = None
-                elif high >= tp:
-                    gain = (tp - entry) * lot * contract
-                    balance += gain
-                    _print(f"{ts_str} BUY TP @ {tp:.2f} | PnL: {gain:.2f} | Bal: {balance:.2f}")
-                    trades.append({"time": ts, "type": "BUY", "exit": "TP", "pnl": gain, "balance": balance})
-                    position = None
+            if use_m15:
+                idx_m15 = int(align["m15"][i])
+                if idx_m15 >= 30:
+                    price_m15 = m15_arr["close"][idx_m15]
+                    ind.trend_macro_up = price_m15 > m15_arr["ema50"][idx_m15]
+                    ind.trend_macro_50_up = price_m15 > m15_arr["ema50"][idx_m15]
+                    ind.ema_short = getattr(ind, "ema_short", None) or m15_arr["ema5"][idx_m15]
+                    ind.ema_long = getattr(ind, "ema_long", None) or m15_arr["ema20_m15"][idx_m15]
+                    ind.ema_long200 = m15_arr["ema200"][idx_m15]
+                    ind.hma = m15_arr["hma"][idx_m15]
+                    ind.hma_prev = m15_arr["hma_prev"][idx_m15]
+                    ind.atr_m15 = m15_arr["atr_m15"][idx_m15]
+                    ind.atr_m15_pct = m15_arr["atr_m15_pct"][idx_m15]
+                    ind.regime = compute_regime(ind.atr_m15_pct, is_spike=getattr(ind, "is_spike", False))
+                    ind.ema_short_prev = m15_arr["ema5"][idx_m15 - 1] if idx_m15 >= 1 else None
+                    ind.ema_long_prev = m15_arr["ema20_m15"][idx_m15 - 1] if idx_m15 >= 1 else None
+                    ind.price_prev = m15_arr["close"][idx_m15 - 1] if idx_m15 >= 1 else None
+                    ind.rsi_prev = m15_arr["rsi14"][idx_m15 - 1] if idx_m15 >= 1 else None
+                    vol_now = m15_arr["tick_volume"][idx_m15]
+                    vol_avg = m15_arr["vol_avg"][idx_m15]
+                    ind.volume_ok = vol_now > vol_avg * 1.2 if pd.notna(vol_avg) and vol_avg > 0 else True
+                else:
+                    ind.trend_macro_up = False
+                    ind.trend_macro_50_up = False
+                    ind.regime = "NORMAL"
+
+            if use_h1:
+                idx_h1 = int(align["h1"][i])
+                if idx_h1 >= 60:
+                    ind.tenkan = h1_arr["tenkan"][idx_h1]
+                    ind.kijun = h1_arr["kijun"][idx_h1]
+                    ind.senkou_a = h1_arr["senkou_a"][idx_h1]
+                    ind.senkou_b = h1_arr["senkou_b"][idx_h1]
+                    ind.chikou = h1_arr["chikou"][idx_h1]
+                    ind.price = h1_arr["close"][idx_h1]
+        elif use_h1:
+            ind.tenkan = h1_arr.get("tenkan", np.array([]))[i] if "tenkan" in h1_arr else None
+            ind.kijun = h1_arr.get("kijun", np.array([]))[i] if "kijun" in h1_arr else None
+            ind.senkou_a = h1_arr.get("senkou_a", np.array([]))[i] if "senkou_a" in h1_arr else None
+            ind.senkou_b = h1_arr.get("senkou_b", np.array([]))[i] if "senkou_b" in h1_arr else None
+            ind.chikou = h1_arr.get("chikou", np.array([]))[i] if "chikou" in h1_arr else None
+            ind.price = price
+            ind.rsi = h1_arr["rsi14"][i]
+            ind.hma = h1_arr["hma"][i]
+            ind.hma_prev = h1_arr["hma_prev"][i]
+        elif use_m15:
+            ind.ema_short = m15_arr["ema5"][i]
+            ind.ema_long = m15_arr["ema20_m15"][i]
+            ind.ema_long200 = m15_arr["ema200"][i]
+            ind.rsi = m15_arr["rsi14"][i]
+            ind.hma = m15_arr["hma"][i]
+            ind.hma_prev = m15_arr["hma_prev"][i]
+            ind.atr_m15 = m15_arr["atr_m15"][i]
+            vol_now = m15_arr["tick_volume"][i]
+            vol_avg = m15_arr["vol_avg"][i]
+            ind.volume_ok = vol_now > vol_avg * 1.2 if pd.notna(vol_avg) and vol_avg > 0 else True
+            ind.trend_macro_up = price > m15_arr["ema50"][i] if pd.notna(m15_arr["ema50"][i]) else None
+            ind.trend_macro_50_up = ind.trend_macro_up
+            if i > 0:
+                ind.ema_short_prev = m15_arr["ema5"][i - 1]
+                ind.ema_long_prev = m15_arr["ema20_m15"][i - 1]
+                ind.price_prev = m15_arr["close"][i - 1]
+                ind.rsi_prev = m15_arr["rsi14"][i - 1]
             else:
-                if high >= sl:
-                    pnl = (entry - sl) * lot * contract
-                    balance += pnl
-                    _print(f"{ts_str} SELL SL @ {sl:.2f} | PnL: {pnl:.2f} | Bal: {balance:.2f}")
-                    trades.append({"time": ts, "type": "SELL", "exit": "SL", "pnl": pnl, "balance": balance})
-                    position = None
-                elif low <= tp:
-                    gain = (entry - tp) * lot * contract
-                    balance += gain
-                    _print(f"{ts_str} SELL TP @ {tp:.2f} | PnL: {gain:.2f} | Bal: {balance:.2f}")
-                    trades.append({"time": ts, "type": "SELL", "exit": "TP", "pnl": gain, "balance": balance})
-                    position = None
+                ind.ema_short_prev = None
+                ind.ema_long_prev = None
+                ind.price_prev = None
+                ind.rsi_prev = None
+        elif use_m5:
+            ind.ema_short = m5_arr["ema5"][i]
+            ind.ema_long = m5_arr["ema15"][i]
+            ind.rsi = m5_arr["rsi14"][i]
+            ind.price = price
+            ind.hma = m5_arr["hma"][i]
+            ind.hma_prev = m5_arr["hma_prev"][i]
+            ind.atr_m5_val = m5_arr["atr_m5"][i]
+            vol_now = m5_arr["tick_volume"][i]
+            vol_avg = m5_arr["vol_avg"][i]
+            ind.volume_ok = vol_now > vol_avg * 0.8 if pd.notna(vol_avg) and vol_avg > 0 else True
+
+        return ind
+
+    def hold_action(i, direction):
+        """on_hold_action della strategia sulla barra i, con la posizione aperta in `direction`."""
+        ts = primary_times[i]
+        hold_ind = Indicators()
+        if use_m15:
+            idx_m15 = int(align["m15"][i])
+            if idx_m15 >= 30:
+                hold_ind.trend_macro_up = m15_arr["close"][idx_m15] > m15_arr["ema50"][idx_m15]
+                hold_ind.hma = m15_arr["hma"][idx_m15]
+                hold_ind.hma_prev = m15_arr["hma_prev"][idx_m15]
+                hold_ind.ema_short = m15_arr["ema5"][idx_m15]
+                hold_ind.ema_long = m15_arr["ema20_m15"][idx_m15]
+        if use_m5:
+            idx_m5 = int(align["m5"][i])
+            if idx_m5 >= 30:
+                hold_ind.hma_m5 = m5_arr["hma"][idx_m5]
+                hold_ind.hma_m5_prev = m5_arr["hma_prev"][idx_m5]
+
+        has_buy = direction == "buy"
+        has_sell = direction == "sell"
+        return strategy.on_hold_action(hold_ind, has_buy, has_sell, None)
+
+    def sl_tp_exit(i, position):
+        """("SL", prezzo) / ("TP", prezzo) se la barra i tocca lo stop o il target, altrimenti None."""
+        entry, direction, sl, tp = position
+        low = pri_arr["low"][i]
+        high = pri_arr["high"][i]
+        if direction == "buy":
+            if low <= sl:
+                return "SL", sl
+            if high >= tp:
+                return "TP", tp
+        else:
+            if high >= sl:
+                return "SL", sl
+            if low <= tp:
+                return "TP", tp
+        return None
+
+    def close_position(i, position, exit_label, exit_price, msg_label):
+        nonlocal balance
+        entry, direction = position[0], position[1]
+        ts = primary_times[i]
+        if direction == "buy":
+            pnl = (exit_price - entry) * lot * contract
+        else:
+            pnl = (entry - exit_price) * lot * contract
+        balance += pnl
+        _print(f"{str(ts)} {msg_label} @ {exit_price:.2f} | PnL: {pnl:.2f} | Bal: {balance:.2f}")
+        trades.append({"time": ts, "type": direction.upper(), "exit": exit_label, "pnl": pnl, "balance": balance})
 
-            if position is not None and hasattr(strategy, 'on_hold_action'):
-                hold_ind = Indicators()
-                if use_m15:
-                    idx_m15 = int(m15_end.searchsorted(ts, side="right")) - 1
-                    if idx_m15 >= 30:
-                        hold_ind.trend_macro_up = m15_arr["close"][idx_m15] > m15_arr["ema50"][idx_m15]
-                        hold_ind.hma = m15_arr["hma"][idx_m15]
-                        hold_ind.hma_prev = m15_arr["hma_prev"][idx_m15]
-                        hold_ind.ema_short = m15_arr["ema5"][idx_m15]
-                        hold_ind.ema_long = m15_arr["ema20_m15"][idx_m15]
-                if use_m5:
-                    idx_m5 = int(m5_end.searchsorted(ts, side="right")) - 1
-                    if idx_m5 >= 30:
-                        hold_ind.hma_m5 = m5_arr["hma"][idx_m5]
-                        hold_ind.hma_m5_prev = m5_arr["hma_prev"][idx_m5]
-
-                has_buy = direction == "buy"
-                has_sell = direction == "sell"
-                action = strategy.on_hold_action(hold_ind, has_buy, has_sell, None)
-                if action in ("close_buy", "close_sell"):
-                    close_dir = "buy" if action == "close_buy" else "sell"
-                    if direction == "buy":
-                        pnl = (price - entry) * lot * contract
-                    else:
-                        pnl = (entry - price) * lot * contract
-                    balance += pnl
-                    _print(f"{ts_str} {action.upper()} @ {price:.2f} | PnL: {pnl:.2f} | Bal: {balance:.2f}")
-                    trades.append({"time": ts, "type": direction.upper(), "exit": "HOLD_EXIT", "pnl": pnl, "balance": balance})
-                    position = None
+    def open_position(i, ind, direction):
+        price = pri_arr["close"][i]
+        if sl_pts_override is not None:
+            sl_pts = sl_pts_override
+        else:
+            sl_pts_dyn, _ = strategy.get_dynamic_sl_tp(ind)
+            sl_pts = sl_pts_dyn if sl_pts_dyn is not None else DEFAULT_SL
+        if tp_pts_override is not None:
+            tp_pts = tp_pts_override
+        else:
+            _, tp_pts_dyn = strategy.get_dynamic_sl_tp(ind)
+            tp_pts = tp_pts_dyn if tp_pts_dyn is not None else DEFAULT_TP
+
+        sl_price = price - (sl_pts * pip) if direction == "buy" else price + (sl_pts * pip)
+        tp_price = price + (tp_pts * pip) if direction == "buy" else price - (tp_pts * pip)
+        log = strategy.get_log_details(ind) if hasattr(strategy, "get_log_details") else ""
+        _print(f"{str(primary_times[i])} ENTRY {direction.upper()} @ {price:.2f} SL={sl_price:.2f} TP={tp_price:.2f} | {log}")
+        return (price, direction, sl_price, tp_price)
+
+    def report(i):
+        pct = (i - start_idx) / max(total - start_idx, 1) * 100
+        _print(f"  ... {pct:.0f}% ({i}/{total}) | Trades: {len(trades)} | Bal: {balance:.2f}")
+        if progress_callback:
+            progress_callback(round(pct), len(trades), round(balance, 2))
+
+    vec = None
+    if vectorized and use_m1 and not use_h1 and strategy.vector_conditions is not None:
+        vec = _vector_signals(strategy, pri_arr, m1_arr, m5_arr, m15_arr, align.get("m5"), align.get("m15"))
+
+    if signals_only:
+        # ── flusso di segnali indipendente da SL/TP (run_backtest_grid) ──
+        #    buy/sell: condizioni di ingresso per barra; flat_error: barre dove
+        #    il ciclo solleva un'eccezione appena le valuta senza posizione;
+        #    open_error: barre dove aprire la posizione solleva un'eccezione;
+        #    hold[dir]: HOLD_CLOSE / HOLD_ERROR di on_hold_action con posizione aperta
+        eligible = np.zeros(total, dtype=bool)
+        eligible[start_idx:] = True
+        eligible &= np.arange(total) % entry_step == 0
+        flat_error = np.zeros(total, dtype=bool)
+        open_error = np.zeros(total, dtype=bool)
+        hold = {"buy": np.zeros(total, dtype=np.int8), "sell": np.zeros(total, dtype=np.int8)}
+        has_hold = type(strategy).on_hold_action is not SignalStrategy.on_hold_action
+
+        def hold_code(i, direction):
+            try:
+                action = hold_action(i, direction)
+            except Exception:
+                return HOLD_ERROR
+            return HOLD_CLOSE if action in ("close_buy", "close_sell") else 0
+
+        if vec is not None:
+            buy_mask = vec[0] & eligible
+            sell_mask = vec[1] & eligible
+            for i in np.flatnonzero(buy_mask | sell_mask):
+                try:
+                    ind = bar_indicators(i)
+                    strategy.get_log_details(ind)
+                except Exception:
+                    open_error[i] = True
+            hold_exit = vec[2]
+            if hold_exit is not None:
+                hold["buy"][hold_exit[0] & hold_exit[2]] = HOLD_CLOSE
+                hold["sell"][hold_exit[1] & hold_exit[2]] = HOLD_CLOSE
+                for i in np.flatnonzero(~hold_exit[2]):
+                    hold["buy"][i] = hold_code(i, "buy")
+                    hold["sell"][i] = hold_code(i, "sell")
+        else:
+            buy_mask = np.zeros(total, dtype=bool)
+            sell_mask = np.zeros(total, dtype=bool)
+            for i in range(start_idx, total):
+                if cancel_flag and i % 5000 == 0 and cancel_flag():
+                    raise InterruptedError("Backtest annullato")
+                if has_hold:
+                    hold["buy"][i] = hold_code(i, "buy")
+                    hold["sell"][i] = hold_code(i, "sell")
+                if not eligible[i]:
+                    continue
+                try:
+                    ind = bar_indicators(i)
+                except Exception:
+                    flat_error[i] = True
+                    continue
+                try:
+                    buy_mask[i] = bool(strategy.buy_condition(ind))
+                    sell_mask[i] = bool(strategy.sell_condition(ind))
+                except Exception:
+                    continue
+                if buy_mask[i] or sell_mask[i]:
+                    try:
+                        strategy.get_log_details(ind)
+                    except Exception:
+                        open_error[i] = True
 
-        if position is None and i % entry_step == 0:
-            ind = Indicators()
-            ind.session_label = _get_session_label(ts)
-
-            if use_m1:
-                ind.price = price
-                ind.ema_fast = m1_arr["ema9"][i]
-                ind.ema_slow = m1_arr["ema21"][i]
-                ind.ema21 = m1_arr["ema21"][i]
-                ind.rsi_m1 = m1_arr["rsi14"][i]
-                ind.rsi = m1_arr["rsi14"][i]
-                ind.macd = m1_arr["macd"][i]
-                ind.macd_sig = m1_arr["macd_sig"][i]
-                ind.volatilty_expansion = m1_arr["atr"][i] > m1_arr["atr_ma10"][i]
-                ind.volatility_expansion = ind.volatilty_expansion
-                ind.is_spike = m1_arr["is_spike"][i]
-                ind.atr_m1 = m1_arr["atr"][i]
-                ind.atr = m1_arr["atr"][i]
-                ind.lower = m1_arr["ema21"][i] - 2 * m1_arr["atr"][i]
-                ind.upper = m1_arr["ema21"][i] + 2 * m1_arr["atr"][i]
+        return {
+            "times": primary_times, "close": pri_arr["close"], "low": pri_arr["low"], "high": pri_arr["high"],
+            "start": start_idx, "pip": pip, "contract": contract,
+            "buy": buy_mask, "sell": sell_mask, "flat_error": flat_error, "open_error": open_error,
+            "hold": hold if has_hold else None,
+        }
 
-                if use_m5:
-                    idx_m5 = int(m5_end.searchsorted(ts, side="right")) - 1
-                    if idx_m5 >= 30:
-                        ind.hma_m5 = m5_arr["hma"][idx_m5]
-                        ind.hma_m5_prev = m5_arr["hma_prev"][idx_m5]
-                        ind.atr_m5_val = m5_arr["atr_m5"][idx_m5]
-                        ind.ema_short = m5_arr["ema5"][idx_m5]
-                        ind.ema_long = m5_arr["ema15"][idx_m5]
-                        ind.rsi = m5_arr["rsi14"][idx_m5]
-                    else:
-                        ind.hma_m5 = 0
-                        ind.hma_m5_prev = 0
-                        ind.atr_m5_val = 0
+    if vec is not None:
+        # ── modalità vettoriale: maschere di ingresso per tutte le barre, si
+        #    avanza solo da un ingresso all'uscita successiva ──
+        buy_mask, sell_mask, hold_exit = vec
+        entry_dir = np.zeros(total, dtype=np.int8)
+        if direction_filter in ("buy", "both"):
+            entry_dir[buy_mask] = 1
+        if direction_filter in ("sell", "both"):
+            entry_dir[sell_mask & (entry_dir == 0)] = -1
+        if entry_step != 1:
+            entry_dir[np.arange(total) % entry_step != 0] = 0
+        candidates = np.flatnonzero(entry_dir)
+        candidates = candidates[candidates >= start_idx]
+
+        next_report = -(-start_idx // print_steps) * print_steps
+        cancelled = False
+        held = []              # (barra di ingresso, barra di uscita) per i contatori di debug
+        entry_bar = None
+        i = start_idx
+
+        def advance(j):
+            """Report di avanzamento fino alla barra j inclusa; False se il backtest è stato annullato."""
+            nonlocal next_report
+            while next_report <= j and next_report < total:
+                if cancel_flag and cancel_flag():
+                    return False
+                report(next_report)
+                next_report += print_steps
+            return not (cancel_flag and cancel_flag())
+
+        while True:
+            if position is None:
+                k = int(np.searchsorted(candidates, i))
+                if k == len(candidates):
+                    break
+                e = int(candidates[k])
+                if not advance(e):
+                    cancelled, i = True, e
+                    break
+                direction = "buy" if entry_dir[e] > 0 else "sell"
+                position = open_position(e, bar_indicators(e), direction)
+                entry_bar = e
+                i = e + 1
+                continue
 
-                if use_m15:
-                    idx_m15 = int(m15_end.searchsorted(ts, side="right")) - 1
-                    if idx_m15 >= 30:
-                        price_m15 = m15_arr["close"][idx_m15]
-                        ind.trend_macro_up = price_m15 > m15_arr["ema50"][idx_m15]
-                        ind.trend_macro_50_up = price_m15 > m15_arr["ema50"][idx_m15]
-                        ind.ema_short = getattr(ind, "ema_short", None) or m15_arr["ema5"][idx_m15]
-                        ind.ema_long = getattr(ind, "ema_long", None) or m15_arr["ema20_m15"][idx_m15]
-                        ind.ema_long200 = m15_arr["ema200"][idx_m15]
-                        ind.hma = m15_arr["hma"][idx_m15]
-                        ind.hma_prev = m15_arr["hma_prev"][idx_m15]
-                        ind.atr_m15 = m15_arr["atr_m15"][idx_m15]
-                        ind.atr_m15_pct = m15_arr["atr_m15_pct"][idx_m15]
-                        ind.regime = compute_regime(ind.atr_m15_pct, is_spike=getattr(ind, "is_spike", False))
-                        ind.ema_short_prev = m15_arr["ema5"][idx_m15 - 1] if idx_m15 >= 1 else None
-                        ind.ema_long_prev = m15_arr["ema20_m15"][idx_m15 - 1] if idx_m15 >= 1 else None
-                        ind.price_prev = m15_arr["close"][idx_m15 - 1] if idx_m15 >= 1 else None
-                        ind.rsi_prev = m15_arr["rsi14"][idx_m15 - 1] if idx_m15 >= 1 else None
-                        vol_now = m15_arr["tick_volume"][idx_m15]
-                        vol_avg = m15_arr["vol_avg"][idx_m15]
-                        ind.volume_ok = vol_now > vol_avg * 1.2 if pd.notna(vol_avg) and vol_avg > 0 else True
-                    else:
-                        ind.trend_macro_up = False
-                        ind.trend_macro_50_up = False
-                        ind.regime = "NORMAL"
-
-                if use_h1:
-                    idx_h1 = int(h1_end.searchsorted(ts, side="right")) - 1
-                    if idx_h1 >= 60:
-                        ind.tenkan = h1_arr["tenkan"][idx_h1]
-                        ind.kijun = h1_arr["kijun"][idx_h1]
-                        ind.senkou_a = h1_arr["senkou_a"][idx_h1]
-                        ind.senkou_b = h1_arr["senkou_b"][idx_h1]
-                        ind.chikou = h1_arr["chikou"][idx_h1]
-                        ind.price = h1_arr["close"][idx_h1]
-            elif use_h1:
-                ind.tenkan = h1_arr.get("tenkan", np.array([]))[i] if "tenkan" in h1_arr else None
-                ind.kijun = h1_arr.get("kijun", np.array([]))[i] if "kijun" in h1_arr else None
-                ind.senkou_a = h1_arr.get("senkou_a", np.array([]))[i] if "senkou_a" in h1_arr else None
-                ind.senkou_b = h1_arr.get("senkou_b", np.array([]))[i] if "senkou_b" in h1_arr else None
-                ind.chikou = h1_arr.get("chikou", np.array([]))[i] if "chikou" in h1_arr else None
-                ind.price = price
-                ind.rsi = h1_arr["rsi14"][i]
-                ind.hma = h1_arr["hma"][i]
-                ind.hma_prev = h1_arr["hma_prev"][i]
-            elif use_m15:
-                ind.ema_short = m15_arr["ema5"][i]
-                ind.ema_long = m15_arr["ema20_m15"][i]
-                ind.ema_long200 = m15_arr["ema200"][i]
-                ind.rsi = m15_arr["rsi14"][i]
-                ind.hma = m15_arr["hma"][i]
-                ind.hma_prev = m15_arr["hma_prev"][i]
-                ind.atr_m15 = m15_arr["atr_m15"][i]
-                vol_now = m15_arr["tick_volume"][i]
-                vol_avg = m15_arr["vol_avg"][i]
-                ind.volume_ok = vol_now > vol_avg * 1.2 if pd.notna(vol_avg) and vol_avg > 0 else True
-                ind.trend_macro_up = price > m15_arr["ema50"][i] if pd.notna(m15_arr["ema50"][i]) else None
-                ind.trend_macro_50_up = ind.trend_macro_up
-                if i > 0:
-                    ind.ema_short_prev = m15_arr["ema5"][i - 1]
-                    ind.ema_long_prev = m15_arr["ema20_m15"][i - 1]
-                    ind.price_prev = m15_arr["close"][i - 1]
-                    ind.rsi_prev = m15_arr["rsi14"][i - 1]
-                else:
-                    ind.ema_short_prev = None
-                    ind.ema_long_prev = None
-                    ind.price_prev = None
-                    ind.rsi_prev = None
-            elif use_m5:
-                ind.ema_short = m5_arr["ema5"][i]
-                ind.ema_long = m5_arr["ema15"][i]
-                ind.rsi = m5_arr["rsi14"][i]
-                ind.price = price
-                ind.hma = m5_arr["hma"][i]
-                ind.hma_prev = m5_arr["hma_prev"][i]
-                ind.atr_m5_val = m5_arr["atr_m5"][i]
-                vol_now = m5_arr["tick_volume"][i]
-                vol_avg = m5_arr["vol_avg"][i]
-                ind.volume_ok = vol_now > vol_avg * 0.8 if pd.notna(vol_avg) and vol_avg > 0 else True
+            is_buy = position[1] == "buy"
+            events = None if hold_exit is None else hold_exit[0 if is_buy else 1]
+            j, kind = first_exit(i, pri_arr["low"], pri_arr["high"], position[2], position[3], is_buy, events)
+            if kind == EXIT_NONE:
+                break
+            if not advance(j):
+                cancelled, i = True, j
+                break
+
+            if kind in (EXIT_SL, EXIT_TP):
+                label = EXIT_LABELS[kind]
+                exit_price = position[2] if kind == EXIT_SL else position[3]
+                close_position(j, position, label, exit_price, f"{position[1].upper()} {label}")
+            elif hold_exit[2][j]:
+                action = "close_buy" if is_buy else "close_sell"
+                close_position(j, position, "HOLD_EXIT", pri_arr["close"][j], action.upper())
+            else:
+                # barre senza tutti i campi di hold_ind: si chiama on_hold_action come nel ciclo
+                action = hold_action(j, position[1])
+                if action not in ("close_buy", "close_sell"):
+                    i = j + 1
+                    continue
+                close_position(j, position, "HOLD_EXIT", pri_arr["close"][j], action.upper())
+            held.append((entry_bar, j))
+            position = None
+            i = j
+
+        if not cancelled:
+            advance(total - 1)
+            i = total - 1
+
+        evaluated = np.zeros(total, dtype=bool)
+        evaluated[start_idx:i + 1 if cancelled else total] = True
+        if cancelled:
+            evaluated[i] = False
+        for e, x in held:
+            evaluated[e + 1:x] = False
+        if position is not None:
+            evaluated[entry_bar + 1:] = False
+        evaluated &= np.arange(total) % entry_step == 0
+        _dbg_evaluated = int(evaluated.sum())
+        _dbg_buy_signals = int((buy_mask & evaluated).sum())
+        _dbg_sell_signals = int((sell_mask & evaluated).sum())
 
-            try:
-                buy = strategy.buy_condition(ind)
-                sell = strategy.sell_condition(ind)
-            except Exception as e:
-                if i == start_idx or i % 5000 == 0:
-                    _print(f"  WARN condition eval @ bar {i}: {type(e).__name__}: {e}")
-                continue
+    else:
+        for i in range(start_idx, total):
+            if cancel_flag and cancel_flag():
+                break
 
-            _dbg_evaluated += 1
-            if buy:
-                _dbg_buy_signals += 1
-            if sell:
-                _dbg_sell_signals += 1
-
-            direction = None
-            if buy and direction_filter in ("buy", "both"):
-                direction = "buy"
-            elif sell and direction_filter in ("sell", "both"):
-                direction = "sell"
-
-            if direction:
-                if sl_pts_override is not None:
-                    sl_pts = sl_pts_override
-                else:
-                    sl_pts_dyn, _ = strategy.get_dynamic_sl_tp(ind)
-                    sl_pts = sl_pts_dyn if sl_pts_dyn is not None else DEFAULT_SL
-                if tp_pts_override is not None:
-                    tp_pts = tp_pts_override
-                else:
-                    _, tp_pts_dyn = strategy.get_dynamic_sl_tp(ind)
-                    tp_pts = tp_pts_dyn if tp_pts_dyn is not None else DEFAULT_TP
+            if i % print_steps == 0:
+                report(i)
 
-                sl_price = price - (sl_pts * pip) if direction == "buy" else price + (sl_pts * pip)
-                tp_price = price + (tp_pts * pip) if direction == "buy" else price - (tp_pts * pip)
-                position = (price, direction, sl_price, tp_price)
-                log = strategy.get_log_details(ind) if hasattr(strategy, "get_log_details") else ""
-                _print(f"{ts_str} ENTRY {direction.upper()} @ {price:.2f} SL={sl_price:.2f} TP={tp_price:.2f} | {log}")
+            if position:
+                hit = sl_tp_exit(i, position)
+                if hit:
+                    close_position(i, position, hit[0], hit[1], f"{position[1].upper()} {hit[0]}")
+                    position = None
+
+                if position is not None and hasattr(strategy, 'on_hold_action'):
+                    action = hold_action(i, position[1])
+                    if action in ("close_buy", "close_sell"):
+                        close_position(i, position, "HOLD_EXIT", pri_arr["close"][i], action.upper())
+                        position = None
+
+            if position is None and i % entry_step == 0:
+                ind = bar_indicators(i)
+
+                try:
+                    buy = strategy.buy_condition(ind)
+                    sell = strategy.sell_condition(ind)
+                except Exception as e:
+                    if i == start_idx or i % 5000 == 0:
+                        _print(f"  WARN condition eval @ bar {i}: {type(e).__name__}: {e}")
+                    continue
+
+                _dbg_evaluated += 1
+                if buy:
+                    _dbg_buy_signals += 1
+                if sell:
+                    _dbg_sell_signals += 1
+
+                direction = None
+                if buy and direction_filter in ("buy", "both"):
+                    direction = "buy"
+                elif sell and direction_filter in ("sell", "both"):
+                    direction = "sell"
+
+                if direction:
+                    position = open_position(i, ind, direction)
 
     _print(f"\nDEBUG: evaluated={_dbg_evaluated} buy_signals={_dbg_buy_signals} sell_signals={_dbg_sell_signals}")
 
@@ -587,81 +932,127 @@ def run_backtest(strategy, dfs, symbol, lot, balance, cancel_flag=None, progress
         _dbg_cond_sell = {"ema_cross": 0, "macd": 0, "hma_falling": 0, "macro_down": 0, "rsi": 0, "vol_exp": 0, "no_spike": 0}
         _dbg_nan = {"rsi": 0, "hma_m5": 0, "atr": 0, "macd": 0}
         _dbg_sample = 0
-        for i in range(start_idx, total):
-            ts = primary_times[i]
-            ind2 = Indicators()
-            ind2.ema_fast = m1_arr["ema9"][i]
-            ind2.ema_slow = m1_arr["ema21"][i]
-            ind2.ema21 = m1_arr["ema21"][i]
-            ind2.rsi_m1 = m1_arr["rsi14"][i]
-            ind2.macd = m1_arr["macd"][i]
-            ind2.macd_sig = m1_arr["macd_sig"][i]
-            ind2.volatilty_expansion = m1_arr["atr"][i] > m1_arr["atr_ma10"][i]
-            ind2.is_spike = m1_arr["is_spike"][i]
-            ind2.atr_m1 = m1_arr["atr"][i]
-            if use_m5:
-                idx_m5 = int(m5_end.searchsorted(ts, side="right")) - 1
-                if idx_m5 >= 30:
-                    ind2.hma_m5 = m5_arr["hma"][idx_m5]
-                    ind2.hma_m5_prev = m5_arr["hma_prev"][idx_m5]
-                    ind2.atr_m5_val = m5_arr["atr_m5"][idx_m5]
-                else:
-                    ind2.hma_m5 = 0
-                    ind2.hma_m5_prev = 0
-                    ind2.atr_m5_val = 0
-            if use_m15:
-                idx_m15 = int(m15_end.searchsorted(ts, side="right")) - 1
-                if idx_m15 >= 30:
-                    price_m15 = m15_arr["close"][idx_m15]
-                    ind2.trend_macro_up = price_m15 > m15_arr["ema50"][idx_m15]
-                else:
-                    ind2.trend_macro_up = False
-
-            if _dbg_sample < 5 and i % 1000 == 0:
-                _dbg_sample += 1
-                print(f"  SAMPLE bar {i}: ema_fast={ind2.ema_fast:.5f} ema_slow={ind2.ema_slow:.5f} "
-                      f"macd={ind2.macd:.6f} macd_sig={ind2.macd_sig:.6f} "
-                      f"hma_m5={ind2.hma_m5:.5f} hma_m5_prev={ind2.hma_m5_prev:.5f} "
-                      f"trend={ind2.trend_macro_up} rsi={ind2.rsi_m1:.2f} "
-                      f"vol_exp={ind2.volatilty_expansion} spike={ind2.is_spike}")
+        if use_m5 and use_m15:
+            # stessi conteggi del ciclo sotto, calcolati sulle colonne
+            rng = slice(start_idx, total)
+            ok5 = align["m5"][rng] >= 30
+            ok15 = align["m15"][rng] >= 30
+            i5 = np.clip(align["m5"][rng], 0, None)
+            i15 = np.clip(align["m15"][rng], 0, None)
+            ema_fast = m1_arr["ema9"][rng]
+            ema_slow = m1_arr["ema21"][rng]
+            macd_v = m1_arr["macd"][rng]
+            macd_s = m1_arr["macd_sig"][rng]
+            rsi_v = m1_arr["rsi14"][rng]
+            vol_exp = m1_arr["atr"][rng] > m1_arr["atr_ma10"][rng]
+            spike = m1_arr["is_spike"][rng].astype(bool)
+            hma5 = np.where(ok5, m5_arr["hma"][i5], 0.0)
+            hma5_prev = np.where(ok5, m5_arr["hma_prev"][i5], 0.0)
+            trend_up = np.where(ok15, m15_arr["close"][i15] > m15_arr["ema50"][i15], False)
+
+            for i in range(-(-start_idx // 1000) * 1000, total, 1000)[:5]:
+                k = i - start_idx
+                print(f"  SAMPLE bar {i}: ema_fast={ema_fast[k]:.5f} ema_slow={ema_slow[k]:.5f} "
+                      f"macd={macd_v[k]:.6f} macd_sig={macd_s[k]:.6f} "
+                      f"hma_m5={hma5[k]:.5f} hma_m5_prev={hma5_prev[k]:.5f} "
+                      f"trend={trend_up[k]} rsi={rsi_v[k]:.2f} "
+                      f"vol_exp={vol_exp[k]} spike={m1_arr['is_spike'][i]}")
+
+            _dbg_cond["ema_cross"] = int((~(ema_fast > ema_slow)).sum())
+            _dbg_cond["macd"] = int((~(macd_v > macd_s)).sum())
+            _dbg_cond["hma_rising"] = int((~(hma5 > hma5_prev)).sum())
+            _dbg_cond["macro"] = int((~trend_up).sum())
+            _dbg_cond["rsi"] = int((~((40 < rsi_v) & (rsi_v < 68))).sum())
+            _dbg_cond["vol_exp"] = int((~vol_exp).sum())
+            _dbg_cond["no_spike"] = int(spike.sum())
+            _dbg_cond_sell["ema_cross"] = int((~(ema_fast < ema_slow)).sum())
+            _dbg_cond_sell["macd"] = int((~(macd_v < macd_s)).sum())
+            _dbg_cond_sell["hma_falling"] = int((~(hma5 < hma5_prev)).sum())
+            _dbg_cond_sell["macro_down"] = int(trend_up.sum())
+            _dbg_cond_sell["rsi"] = int((~((32 < rsi_v) & (rsi_v < 60))).sum())
+            _dbg_cond_sell["vol_exp"] = _dbg_cond["vol_exp"]
+            _dbg_cond_sell["no_spike"] = _dbg_cond["no_spike"]
+            _dbg_nan["rsi"] = int(np.isnan(rsi_v).sum())
+            _dbg_nan["hma_m5"] = int(np.isnan(hma5).sum())
+            _dbg_nan["macd"] = int(np.isnan(macd_v).sum())
+        else:
+            for i in range(start_idx, total):
+                ts = primary_times[i]
+                ind2 = Indicators()
+                ind2.ema_fast = m1_arr["ema9"][i]
+                ind2.ema_slow = m1_arr["ema21"][i]
+                ind2.ema21 = m1_arr["ema21"][i]
+                ind2.rsi_m1 = m1_arr["rsi14"][i]
+                ind2.macd = m1_arr["macd"][i]
+                ind2.macd_sig = m1_arr["macd_sig"][i]
+                ind2.volatilty_expansion = m1_arr["atr"][i] > m1_arr["atr_ma10"][i]
+                ind2.is_spike = m1_arr["is_spike"][i]
+                ind2.atr_m1 = m1_arr["atr"][i]
+                if use_m5:
+                    idx_m5 = int(align["m5"][i])
+                    if idx_m5 >= 30:
+                        ind2.hma_m5 = m5_arr["hma"][idx_m5]
+                        ind2.hma_m5_prev = m5_arr["hma_prev"][idx_m5]
+                        ind2.atr_m5_val = m5_arr["atr_m5"][idx_m5]
+                    else:
+                        ind2.hma_m5 = 0
+                        ind2.hma_m5_prev = 0
+                        ind2.atr_m5_val = 0
+                if use_m15:
+                    idx_m15 = int(align["m15"][i])
+                    if idx_m15 >= 30:
+                        price_m15 = m15_arr["close"][idx_m15]
+                        ind2.trend_macro_up = price_m15 > m15_arr["ema50"][idx_m15]
+                    else:
+                        ind2.trend_macro_up = False
+
+                if _dbg_sample < 5 and i % 1000 == 0:
+                    _dbg_sample += 1
+                    print(f"  SAMPLE bar {i}: ema_fast={ind2.ema_fast:.5f} ema_slow={ind2.ema_slow:.5f} "
+                          f"macd={ind2.macd:.6f} macd_sig={ind2.macd_sig:.6f} "
+                          f"hma_m5={getattr(ind2, 'hma_m5', float('nan')):.5f} "
+                          f"hma_m5_prev={getattr(ind2, 'hma_m5_prev', float('nan')):.5f} "
+                          f"trend={getattr(ind2, 'trend_macro_up', None)} rsi={ind2.rsi_m1:.2f} "
+                          f"vol_exp={ind2.volatilty_expansion} spike={ind2.is_spike}")
+
+                try:
+                    if not (ind2.ema_fast > ind2.ema_slow):
+                        _dbg_cond["ema_cross"] += 1
+                    if not (ind2.macd > ind2.macd_sig):
+                        _dbg_cond["macd"] += 1
+                    if not (ind2.hma_m5 > ind2.hma_m5_prev):
+                        _dbg_cond["hma_rising"] += 1
+                    if not ind2.trend_macro_up:
+                        _dbg_cond["macro"] += 1
+                    if not (40 < ind2.rsi_m1 < 68):
+                        _dbg_cond["rsi"] += 1
+                    if not ind2.volatilty_expansion:
+                        _dbg_cond["vol_exp"] += 1
+                    if ind2.is_spike:
+                        _dbg_cond["no_spike"] += 1
+                    if not (ind2.ema_fast < ind2.ema_slow):
+                        _dbg_cond_sell["ema_cross"] += 1
+                    if not (ind2.macd < ind2.macd_sig):
+                        _dbg_cond_sell["macd"] += 1
+                    if not (ind2.hma_m5 < ind2.hma_m5_prev):
+                        _dbg_cond_sell["hma_falling"] += 1
+                    if ind2.trend_macro_up:
+                        _dbg_cond_sell["macro_down"] += 1
+                    if not (32 < ind2.rsi_m1 < 60):
+                        _dbg_cond_sell["rsi"] += 1
+                    if not ind2.volatilty_expansion:
+                        _dbg_cond_sell["vol_exp"] += 1
+                    if ind2.is_spike:
+                        _dbg_cond_sell["no_spike"] += 1
+                    if math.isnan(ind2.rsi_m1):
+                        _dbg_nan["rsi"] += 1
+                    if math.isnan(ind2.hma_m5):
+                        _dbg_nan["hma_m5"] += 1
+                    if math.isnan(ind2.macd):
+                        _dbg_nan["macd"] += 1
+                except Exception:
+                    pass
 
-            try:
-                if not (ind2.ema_fast > ind2.ema_slow):
-                    _dbg_cond["ema_cross"] += 1
-                if not (ind2.macd > ind2.macd_sig):
-                    _dbg_cond["macd"] += 1
-                if not (ind2.hma_m5 > ind2.hma_m5_prev):
-                    _dbg_cond["hma_rising"] += 1
-                if not ind2.trend_macro_up:
-                    _dbg_cond["macro"] += 1
-                if not (40 < ind2.rsi_m1 < 68):
-                    _dbg_cond["rsi"] += 1
-                if not ind2.volatilty_expansion:
-                    _dbg_cond["vol_exp"] += 1
-                if ind2.is_spike:
-                    _dbg_cond["no_spike"] += 1
-                if not (ind2.ema_fast < ind2.ema_slow):
-                    _dbg_cond_sell["ema_cross"] += 1
-                if not (ind2.macd < ind2.macd_sig):
-                    _dbg_cond_sell["macd"] += 1
-                if not (ind2.hma_m5 < ind2.hma_m5_prev):
-                    _dbg_cond_sell["hma_falling"] += 1
-                if ind2.trend_macro_up:
-                    _dbg_cond_sell["macro_down"] += 1
-                if not (32 < ind2.rsi_m1 < 60):
-                    _dbg_cond_sell["rsi"] += 1
-                if not ind2.volatilty_expansion:
-                    _dbg_cond_sell["vol_exp"] += 1
-                if ind2.is_spike:
-                    _dbg_cond_sell["no_spike"] += 1
-                if math.isnan(ind2.rsi_m1):
-                    _dbg_nan["rsi"] += 1
-                if math.isnan(ind2.hma_m5):
-                    _dbg_nan["hma_m5"] += 1
-                if math.isnan(ind2.macd):
-                    _dbg_nan["macd"] += 1
-            except Exception:
-                pass
 
         total_bars = total - start_idx
         print(f"\n  BUY conditions BLOCKING (how many bars fail each):")
@@ -676,6 +1067,7 @@ def run_backtest(strategy, dfs, symbol, lot, balance, cancel_flag=None, progress
 
     print(f"\nFinal balance: {balance:.2f} | Trades: {len(trades)}")
     if len(trades) == 0 and position is not None:
+        entry, direction, sl, tp = position
         print(f"  WARNING: open position at end: entry={entry} dir={direction} sl={sl} tp={tp}")
         # dump last 10 low/high values
         for j in range(max(0, i-10), i+1):
@@ -837,7 +1229,105 @@ def compute_summary(trades, balance, initial_balance, days=None):
     }
 
 
-def run_backtest_api(strategy_name, symbol, days, lot, balance, mt5_api_url, cancel_flag=None, progress_callback=None, direction="both", pre_fetched_dfs=None, skip_indicators=False, sl_pts=None, tp_pts=None, verbose=True):
+def grid_summary(pnl, balances, initial_balance, days=None):
+    """Campi scalari di compute_summary (senza by_session/by_hour/...) dagli array PnL / saldo dei trade."""
+    wins = [p for p in pnl if p > 0]
+    losses = [p for p in pnl if p < 0]
+    n = len(pnl)
+    balance = balances[-1] if n else initial_balance
+
+    max_dd = 0
+    if n:
+        peak = np.maximum.accumulate(np.concatenate(([initial_balance], balances)))[1:]
+        dd = (peak - balances).max()
+        if dd > 0:
+            max_dd = dd
+
+    win_rate = len(wins) / n * 100 if n else 0
+    gross_profit = sum(wins)
+    gross_loss = sum(losses)
+    avg_win = gross_profit / len(wins) if wins else 0
+    avg_loss = gross_loss / len(losses) if losses else 0
+    win_loss_ratio = abs(avg_win / avg_loss) if losses and wins else 0
+    days_span = days or 1
+
+    return {
+        "total_trades": n,
+        "wins": len(wins),
+        "losses": len(losses),
+        "win_rate": round(win_rate, 1),
+        "trades_per_day": round(n / days_span, 1) if n else 0,
+        "gross_profit": round(gross_profit, 2),
+        "gross_loss": round(gross_loss, 2),
+        "net_pnl": round(gross_profit + gross_loss, 2),
+        "final_balance": round(balance, 2),
+        "return_pct": round((balance - initial_balance) / initial_balance * 100, 1),
+        "avg_win": round(avg_win, 2),
+        "avg_loss": round(avg_loss, 2),
+        "win_loss_ratio": round(win_loss_ratio, 2),
+        "max_drawdown": round(max_dd, 2),
+    }
+
+
+def run_backtest_grid(strategy_name, symbol, days, lot, balance, dfs, sl_tp, direction="both", cancel_flag=None, skip_indicators=True):
+    """
+    run_backtest_api(..., sl_pts=sl, tp_pts=tp) per tutte le coppie di sl_tp in una
+    sola passata: i segnali di ingresso/uscita della strategia non dipendono da
+    SL/TP e si calcolano una volta (run_backtest con signals_only=True), poi
+    simulate_grid simula tutte le combinazioni insieme.
+    Ritorna, nello stesso ordine di sl_tp, {"summary": grid_summary, "balances":
+    saldi arrotondati dei trade} oppure {"error": ...} dove il backtest singolo
+    avrebbe sollevato un'eccezione.
+    """
+    strategy = STRATEGIES.get(strategy_name)
+    if not strategy:
+        return [{"error": f"Unknown strategy: {strategy_name}"} for _ in sl_tp]
+
+    try:
+        stream = run_backtest(strategy, dfs, symbol, lot, balance, cancel_flag=cancel_flag, skip_indicators=skip_indicators, verbose=False, signals_only=True)
+    except InterruptedError:
+        raise
+    except Exception as e:
+        return [{"error": str(e)} for _ in sl_tp]
+    if not isinstance(stream, dict):
+        # nessun timeframe primario: run_backtest non fa trade
+        return [{"summary": grid_summary([], [], balance, days), "balances": []} for _ in sl_tp]
+
+    pip = stream["pip"]
+    signal_dir = np.zeros(len(stream["close"]), dtype=np.int8)
+    if direction in ("buy", "both"):
+        signal_dir[stream["buy"]] = 1
+    if direction in ("sell", "both"):
+        signal_dir[stream["sell"] & (signal_dir == 0)] = -1
+    signal_dir[(signal_dir != 0) & stream["open_error"]] = ENTRY_ERROR
+    signal_dir[stream["flat_error"]] = ENTRY_ERROR
+
+    runs = simulate_grid(
+        signal_dir, stream["close"], stream["low"], stream["high"],
+        [sl * pip for sl, _ in sl_tp], [tp * pip for _, tp in sl_tp],
+        lot, stream["contract"], balance, hold=stream["hold"], start=stream["start"],
+    )
+
+    results = []
+    for r in runs:
+        if r["failed"]:
+            results.append({"error": "Backtest interrotto da un'eccezione della strategia"})
+            continue
+        results.append({
+            "summary": grid_summary(r["pnl"], r["balance"], balance, days),
+            "balances": np.round(r["balance"], 2).tolist(),
+        })
+    return results
+
+
+def backtest_cache_key(kind, strategy_name, fingerprint, **params):
+    """Chiave di result_cache per un run di strategy_name sulle barre con questo fingerprint."""
+    version = result_cache.strategy_version(STRATEGIES[strategy_name])
+    slot = result_cache.make_slot(kind, strategy=strategy_name, version=version, **params)
+    return result_cache.make_key(slot, fingerprint)
+
+
+def run_backtest_api(strategy_name, symbol, days, lot, balance, mt5_api_url, cancel_flag=None, progress_callback=None, direction="both", pre_fetched_dfs=None, skip_indicators=False, sl_pts=None, tp_pts=None, verbose=True, fetch_progress_callback=None):
     strategy = STRATEGIES.get(strategy_name)
     if not strategy:
         return {"error": f"Unknown strategy: {strategy_name}"}
@@ -846,7 +1336,20 @@ def run_backtest_api(strategy_name, symbol, days, lot, balance, mt5_api_url, can
         if pre_fetched_dfs is not None:
             dfs = pre_fetched_dfs
         else:
-            dfs = fetch_data(symbol, strategy, days, mt5_api_url)
+            dfs = fetch_data(symbol, strategy, days, mt5_api_url, progress_callback=fetch_progress_callback, cancel_flag=cancel_flag)
+
+        # stesso run sulle stesse barre: risultato dalla cache, niente simulazione
+        cache_key = backtest_cache_key(
+            "backtest", strategy_name, result_cache.dataset_fingerprint(dfs),
+            symbol=symbol, days=days, lot=lot, balance=balance, direction=direction, sl_pts=sl_pts, tp_pts=tp_pts,
+        )
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            if progress_callback:
+                trades = cached["trades"]
+                progress_callback(100, len(trades), trades[-1]["balance"] if trades else balance)
+            return cached
+
         trades, final_bal = run_backtest(strategy, dfs, symbol, lot, balance, cancel_flag=cancel_flag, progress_callback=progress_callback, direction_filter=direction, skip_indicators=skip_indicators, sl_pts_override=sl_pts, tp_pts_override=tp_pts, verbose=verbose)
         summary_data = compute_summary(trades, final_bal, balance, days)
 
@@ -860,7 +1363,7 @@ def run_backtest_api(strategy_name, symbol, days, lot, balance, mt5_api_url, can
                 "balance": round(t["balance"], 2),
             })
 
-        return {
+        result = {
             "strategy": strategy_name,
             "symbol": symbol,
             "days": days,
@@ -869,6 +1372,9 @@ def run_backtest_api(strategy_name, symbol, days, lot, balance, mt5_api_url, can
             "summary": summary_data,
             "trades": serializable_trades,
         }
+        if not (cancel_flag and cancel_flag()):
+            result_cache.put(cache_key, result)
+        return result
     except Exception as e:
         return {"error": str(e)}
 
@@ -0,0 +1,253 @@
+# --- BAR STORE: archivio locale delle candele storiche per i backtest ---
+#
+# Una serie per (server del broker, simbolo, timeframe) sotto BAR_STORE_DIR:
+#   <server>/<simbolo>_<tf>.bin   record BAR_DTYPE ordinati per time (letti con np.memmap)
+#   <server>/<simbolo>_<tf>.json  giorni già scaricati: [[da, a), ...] in ISO
+#
+# fetch_data chiede missing(da, a) → solo i giorni mai scaricati vanno all'agent,
+# write() aggiunge le barre (append in coda se più recenti, altrimenti riscrive
+# il file fuso e ordinato; a parità di time vince la barra nuova) e segna i
+# giorni come coperti, read() legge la
+# finestra dal memmap con searchsorted.
+# L'ultimo giorno prima di oggi non viene mai segnato come coperto: si riscarica
+# alla prossima richiesta (barre ancora in formazione / fuso del broker).
+import calendar
+import json
+import os
+import re
+import threading
+import time
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from agent_client import agent_get
+from rates_codec import BAR_DTYPE
+
+BAR_STORE_DIR = os.getenv("BAR_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "bar_store"))
+BAR_STORE_ENABLED = os.getenv("BAR_STORE_ENABLED", "1") not in ("0", "false", "False")
+SERVER_NAME_TTL = 600       # sec di validità del nome server letto da /server_status
+
+
+def _safe(name):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", str(name)).strip("_") or "unknown"
+
+
+def _day_ts(d):
+    """Giorno → timestamp (sec) della mezzanotte, stessa scala del campo time di MT5."""
+    return calendar.timegm(d.timetuple())
+
+
+# ─────────────────────── INTERVALLI DI GIORNI ───────────────────────
+
+def _merge_ranges(ranges):
+    out = []
+    for a, b in sorted(ranges):
+        if a >= b:
+            continue
+        if out and a <= out[-1][1]:
+            out[-1][1] = max(out[-1][1], b)
+        else:
+            out.append([a, b])
+    return out
+
+
+def _subtract_ranges(a, b, covered):
+    """Parti di [a, b) non coperte dagli intervalli (ordinati, disgiunti) in `covered`."""
+    missing = []
+    cursor = a
+    for c0, c1 in covered:
+        if c1 <= cursor:
+            continue
+        if c0 >= b:
+            break
+        if c0 > cursor:
+            missing.append((cursor, min(c0, b)))
+        cursor = max(cursor, c1)
+        if cursor >= b:
+            break
+    if cursor < b:
+        missing.append((cursor, b))
+    return missing
+
+
+def split_days(a, b, chunk_days):
+    """[a, b) → blocchi di al massimo chunk_days giorni (date o datetime)."""
+    chunks = []
+    while a < b:
+        end = min(a + timedelta(days=chunk_days), b)
+        chunks.append((a, end))
+        a = end
+    return chunks
+
+
+# ─────────────────────── SERIE SU DISCO ───────────────────────
+
+class BarSeries:
+    def __init__(self, root, server, symbol, tf_key):
+        self.server = server
+        self.symbol = symbol
+        self.tf_key = tf_key
+        folder = os.path.join(root, _safe(server))
+        base = os.path.join(folder, f"{_safe(symbol)}_{tf_key}")
+        self.folder = folder
+        self.data_path = base + ".bin"
+        self.meta_path = base + ".json"
+        self.lock = threading.Lock()
+        self.ranges = self._load_meta()
+
+    def _load_meta(self):
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            if meta.get("dtype") != [list(x) for x in BAR_DTYPE.descr]:
+                return []
+            return [[date.fromisoformat(a), date.fromisoformat(b)] for a, b in meta.get("ranges", [])]
+        except (OSError, ValueError):
+            return []
+
+    def _save_meta(self):
+        meta = {
+            "server": self.server,
+            "symbol": self.symbol,
+            "timeframe": self.tf_key,
+            "dtype": [list(x) for x in BAR_DTYPE.descr],
+            "ranges": [[a.isoformat(), b.isoformat()] for a, b in self.ranges],
+        }
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.meta_path)
+
+    def _count(self):
+        try:
+            return os.path.getsize(self.data_path) // BAR_DTYPE.itemsize
+        except OSError:
+            return 0
+
+    def _map(self):
+        n = self._count()
+        if n == 0:
+            return np.empty(0, dtype=BAR_DTYPE)
+        return np.memmap(self.data_path, dtype=BAR_DTYPE, mode="r", shape=(n,))
+
+    # ── API ──
+
+    def missing(self, day_from, day_to):
+        """Intervalli di giorni [da, a) ancora da scaricare."""
+        with self.lock:
+            return _subtract_ranges(day_from, day_to, self.ranges)
+
+    def write(self, raw, day_from, day_to):
+        """Aggiunge le barre scaricate per [day_from, day_to) e segna i giorni come coperti."""
+        raw = np.asarray(raw, dtype=BAR_DTYPE) if raw is not None else np.empty(0, dtype=BAR_DTYPE)
+        with self.lock:
+            os.makedirs(self.folder, exist_ok=True)
+            if len(raw):
+                raw = np.sort(raw, order="time")
+                raw = raw[np.concatenate(([True], np.diff(raw["time"]) > 0))]
+                stored = self._map()
+                times = stored["time"]
+                replaced = np.empty(0, dtype=np.intp)
+                if len(times):
+                    pos = np.searchsorted(times, raw["time"])
+                    dup = (pos < len(times)) & (times[np.minimum(pos, len(times) - 1)] == raw["time"])
+                    # stesso time: vince la barra riscaricata (era parziale o corretta dal broker),
+                    # quelle identiche non si riscrivono
+                    changed = dup.copy()
+                    changed[dup] = np.asarray(stored[pos[dup]]) != raw[dup]
+                    replaced = pos[changed]
+                    raw = raw[~dup | changed]
+                if len(raw):
+                    if len(times) == 0 or raw["time"][0] > times[-1]:
+                        with open(self.data_path, "ab") as f:
+                            f.write(raw.tobytes())
+                    else:
+                        keep = np.ones(len(stored), dtype=bool)
+                        keep[replaced] = False
+                        merged = np.concatenate((np.asarray(stored)[keep], raw))
+                        merged = merged[np.argsort(merged["time"], kind="stable")]
+                        tmp = self.data_path + ".tmp"
+                        with open(tmp, "wb") as f:
+                            f.write(merged.tobytes())
+                        del stored, times
+                        os.replace(tmp, self.data_path)
+
+            last_complete = date.today() - timedelta(days=1)
+            end = min(day_to, last_complete)
+            if day_from < end:
+                self.ranges = _merge_ranges(self.ranges + [[day_from, end]])
+                self._save_meta()
+
+    def read(self, day_from, day_to):
+        """Barre con time tra la mezzanotte di day_from e quella di day_to (inclusa), come copy_rates_range."""
+        with self.lock:
+            stored = self._map()
+            if len(stored) == 0:
+                return np.empty(0, dtype=BAR_DTYPE)
+            times = stored["time"]
+            lo = np.searchsorted(times, _day_ts(day_from), side="left")
+            hi = np.searchsorted(times, _day_ts(day_to), side="right")
+            return np.array(stored[lo:hi])
+
+    def stats(self):
+        with self.lock:
+            return {
+                "bars": self._count(),
+                "ranges": [[a.isoformat(), b.isoformat()] for a, b in self.ranges],
+            }
+
+
+_series = {}
+_series_lock = threading.Lock()
+
+
+def open_series(server, symbol, tf_key, root=None):
+    root = root or BAR_STORE_DIR
+    key = (root, server, symbol, tf_key)
+    with _series_lock:
+        series = _series.get(key)
+        if series is None:
+            series = BarSeries(root, server, symbol, tf_key)
+            _series[key] = series
+        return series
+
+
+# ─────────────────────── SERVER DEL BROKER ───────────────────────
+
+_server_names = {}          # agent base url → (nome, scadenza)
+
+
+def broker_server(mt5_api_url):
+    """
+    Nome del server del broker collegato all'agent (account.server di /server_status),
+    così due agent sullo stesso broker condividono le barre. Fallback: host:porta.
+    """
+    parts = urlsplit(mt5_api_url)
+    base = f"{parts.scheme}://{parts.netloc}"
+    now = time.monotonic()
+    with _series_lock:
+        cached = _server_names.get(base)
+        if cached and cached[1] > now:
+            return cached[0]
+
+    name = None
+    try:
+        resp = agent_get(f"{base}/server_status", timeout=5)
+        if resp.status_code == 200:
+            name = ((resp.json() or {}).get("account") or {}).get("server")
+    except Exception:
+        pass
+    ttl = SERVER_NAME_TTL if name else 30
+    name = name or parts.netloc
+
+    with _series_lock:
+        _server_names[base] = (name, now + ttl)
+    return name
+
+
+def store_stats():
+    with _series_lock:
+        series = list(_series.values())
+    return {f"{s.server}/{s.symbol}/{s.tf_key}": s.stats() for s in series}
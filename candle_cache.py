@@ -0,0 +1,301 @@
+# --- CANDLE CACHE: candele condivise tra i trader del polling engine ---
+#
+# Chiave (agent_url, simbolo, timeframe). Più trader sullo stesso simbolo e
+# slave condividono lo stesso DataFrame: entro CACHE_MAX_AGE secondi si
+# riusa la copia in memoria senza HTTP; dopo, si scaricano solo le ultime
+# barre (coda) e si fondono con quelle già in cache.
+# get_tick_bundle fa lo stesso per più timeframe insieme e porta con sé
+# posizioni, tick e symbol_info: un solo round-trip verso l'agent per tick.
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from agent_client import agent_get, agent_post
+from rates_codec import RATES_ACCEPT, decode_bundle_rates, decode_rates
+
+CACHE_MAX_AGE = float(os.getenv("CANDLE_CACHE_MAX_AGE", 1.0))     # sec: riuso senza HTTP
+CACHE_IDLE_TTL = float(os.getenv("CANDLE_CACHE_IDLE_TTL", 900))   # sec: entry inutilizzate → evict
+CACHE_MAX_ENTRIES = int(os.getenv("CANDLE_CACHE_MAX_ENTRIES", 256))
+TAIL_BARS = 3            # barre richieste per l'aggiornamento incrementale
+SWEEP_EVERY = 60.0       # sec tra due pulizie delle entry scadute
+BUNDLE_RETRY_AFTER = float(os.getenv("BUNDLE_RETRY_AFTER", 600))  # sec prima di riprovare /tick_bundle su un agent vecchio
+
+
+class _Entry:
+    __slots__ = ("df", "fetched_at", "last_used", "n_max", "lock")
+
+    def __init__(self):
+        self.df = None
+        self.fetched_at = 0.0
+        self.last_used = 0.0
+        self.n_max = 0
+        self.lock = threading.Lock()
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_last_sweep = 0.0
+_stats = {"hits": 0, "tail_fetches": 0, "full_fetches": 0, "errors": 0, "evictions": 0,
+          "bundles": 0, "bundle_fallbacks": 0}
+_no_bundle = {}          # agent_url → monotonic dell'ultimo 404/405 su /tick_bundle
+
+
+# ─────────────────────── FETCH ───────────────────────
+
+def fetch_rates_df(agent_url, symbol, timeframe, n_candles):
+    """POST /get_rates sull'agent → DataFrame con 'time' datetime, None se errore o vuoto."""
+    url = f"{agent_url}/get_rates"
+    payload = {"symbol": symbol, "timeframe": timeframe, "n_candles": n_candles}
+    try:
+        resp = agent_post(url, json=payload, headers={"Accept": RATES_ACCEPT}, timeout=30)
+        if resp.status_code != 200:
+            return None
+        return _rates_df(decode_rates(resp))
+    except Exception:
+        return None
+
+
+def _rates_df(rates):
+    """Structured array dell'agent → DataFrame con 'time' datetime, None se vuoto."""
+    if rates is None:
+        return None
+    df = pd.DataFrame(rates)
+    if "time" not in df.columns:
+        return None
+    # stessi tipi della risposta JSON (MT5 usa uint64/int32 per volumi e spread)
+    ints = [c for c in df.columns if df[c].dtype.kind in "iu"]
+    df[ints] = df[ints].astype("int64")
+    df['time'] = pd.to_datetime(df['time'], unit='s')
+    return df
+
+
+def _merge_tail(cached, tail, n_keep):
+    """Sostituisce in `cached` le barre da tail[0] in poi (l'ultima è in formazione)."""
+    first = tail["time"].iloc[0]
+    keep = cached[cached["time"] < first]
+    merged = pd.concat([keep, tail], ignore_index=True)
+    if len(merged) > n_keep:
+        merged = merged.iloc[-n_keep:].reset_index(drop=True)
+    return merged
+
+
+def _count(name):
+    with _cache_lock:
+        _stats[name] += 1
+
+
+def _refresh(entry, agent_url, symbol, timeframe, n_candles, tail=None):
+    """Aggiorna l'entry; `tail` sono le ultime TAIL_BARS barre se già scaricate (bundle)."""
+    cached = entry.df
+    n_full = entry.n_max
+    if cached is None or len(cached) < n_candles:
+        df = fetch_rates_df(agent_url, symbol, timeframe, n_full)
+        if df is not None:
+            _count("full_fetches")
+        return df
+
+    last_time = cached["time"].iloc[-1]
+    k = TAIL_BARS
+    while True:
+        if tail is None:
+            tail = fetch_rates_df(agent_url, symbol, timeframe, k)
+            if tail is None:
+                return None
+        if len(tail) >= n_full:
+            # la coda copre già tutta la finestra: nessuna fusione necessaria
+            _count("full_fetches")
+            return tail
+        if tail["time"].iloc[0] <= last_time:
+            _count("tail_fetches")
+            return _merge_tail(cached, tail, n_full)
+        if len(tail) < k:
+            # l'agent ha meno barre di quelle richieste: storico esaurito
+            _count("full_fetches")
+            return tail
+        # coda senza sovrapposizione (pausa lunga): allarga la richiesta
+        k = min(k * 4, n_full)
+        tail = None
+
+
+# ─────────────────────── API ───────────────────────
+
+def get_candles(agent_url, symbol, timeframe, n_candles, max_age=None):
+    """
+    Ultime `n_candles` candele di (agent, simbolo, timeframe), condivise tra i trader.
+    Ritorna una copia del DataFrame (come get_data) o None se l'agent non risponde.
+    """
+    max_age = CACHE_MAX_AGE if max_age is None else max_age
+    entry = _entries(agent_url, symbol, [timeframe])[timeframe]
+
+    with entry.lock:
+        entry.n_max = max(entry.n_max, n_candles)
+        df = entry.df
+        fresh = df is not None and len(df) >= n_candles and time.monotonic() - entry.fetched_at < max_age
+        if fresh:
+            _count("hits")
+        else:
+            df = _refresh(entry, agent_url, symbol, timeframe, n_candles)
+            if df is None:
+                _count("errors")
+                return None
+            entry.df = df
+            entry.fetched_at = time.monotonic()
+
+        return df.iloc[-n_candles:].reset_index(drop=True).copy()
+
+
+def get_tick_bundle(agent_url, symbol, frames, positions=False, tick=False, symbol_info=False,
+                    max_age=None):
+    """
+    Candele di più timeframe ({timeframe: n_candles}) più, a richiesta, posizioni, tick
+    e symbol_info dell'agent con una sola POST /tick_bundle.
+    Le candele passano dalla cache come in get_candles: quelle fresche non vengono
+    richieste, quelle in cache solo per le ultime TAIL_BARS barre.
+    Ritorna {"frames": {timeframe: DataFrame | None}, "positions", "tick", "symbol_info"}
+    (None dove l'agent non ha risposto). Un agent senza /tick_bundle viene servito
+    con le chiamate singole e riprovato dopo BUNDLE_RETRY_AFTER secondi.
+    """
+    max_age = CACHE_MAX_AGE if max_age is None else max_age
+    timeframes = sorted(frames)
+    entries = _entries(agent_url, symbol, timeframes)
+    out = {"frames": {}, "positions": None, "tick": None, "symbol_info": None}
+
+    if time.monotonic() - _no_bundle.get(agent_url, float("-inf")) < BUNDLE_RETRY_AFTER:
+        return _bundle_fallback(agent_url, symbol, frames, positions, tick, symbol_info, max_age)
+
+    # lock sempre nello stesso ordine (timeframe crescente): niente deadlock tra trader
+    for tf in timeframes:
+        entries[tf].lock.acquire()
+    try:
+        plan = []
+        for tf in timeframes:
+            entry, n = entries[tf], frames[tf]
+            entry.n_max = max(entry.n_max, n)
+            df = entry.df
+            if df is not None and len(df) >= n and time.monotonic() - entry.fetched_at < max_age:
+                _count("hits")
+                out["frames"][tf] = df
+            elif df is not None and len(df) >= n:
+                plan.append((tf, True, TAIL_BARS))
+            else:
+                plan.append((tf, False, entry.n_max))
+
+        payload = {
+            "symbol": symbol,
+            "rates": [{"timeframe": tf, "n_candles": k} for tf, _, k in plan],
+            "positions": positions, "tick": tick, "symbol_info": symbol_info,
+            "binary": True,
+        }
+        try:
+            resp = agent_post(f"{agent_url}/tick_bundle", json=payload, timeout=30)
+            status = resp.status_code
+            body = resp.json() if status == 200 else None
+        except Exception:
+            status, body = None, None
+
+        if status in (404, 405):
+            _no_bundle[agent_url] = time.monotonic()
+        else:
+            _count("bundles")
+            items = body.get("rates", []) if body else []
+            for i, (tf, is_tail, _) in enumerate(plan):
+                entry = entries[tf]
+                try:
+                    df = _rates_df(decode_bundle_rates(items[i]))
+                except (IndexError, ValueError):
+                    df = None
+                if df is not None and is_tail:
+                    df = _refresh(entry, agent_url, symbol, tf, frames[tf], tail=df)
+                elif df is not None:
+                    _count("full_fetches")
+                if df is None:
+                    _count("errors")
+                else:
+                    entry.df = df
+                    entry.fetched_at = time.monotonic()
+                out["frames"][tf] = df
+            if body:
+                for name in ("positions", "tick", "symbol_info"):
+                    out[name] = body.get(name)
+
+        for tf, df in out["frames"].items():
+            if df is not None:
+                out["frames"][tf] = df.iloc[-frames[tf]:].reset_index(drop=True).copy()
+    finally:
+        for tf in reversed(timeframes):
+            entries[tf].lock.release()
+
+    if status in (404, 405):
+        return _bundle_fallback(agent_url, symbol, frames, positions, tick, symbol_info, max_age)
+    return out
+
+
+def _bundle_fallback(agent_url, symbol, frames, positions, tick, symbol_info, max_age):
+    """Agent senza /tick_bundle: stesso risultato con get_candles e le GET singole."""
+    _count("bundle_fallbacks")
+    out = {"frames": {tf: get_candles(agent_url, symbol, tf, n, max_age) for tf, n in frames.items()}}
+    for name, wanted, path in (("positions", positions, "positions"),
+                               ("tick", tick, f"symbol_tick/{symbol}"),
+                               ("symbol_info", symbol_info, f"symbol_info/{symbol}")):
+        out[name] = None
+        if not wanted:
+            continue
+        try:
+            resp = agent_get(f"{agent_url}/{path}", timeout=10)
+            if resp.status_code == 200:
+                out[name] = resp.json()
+        except Exception:
+            pass
+    return out
+
+
+def _entries(agent_url, symbol, timeframes):
+    """Entry della cache per i timeframe richiesti (create se mancano), marcate come usate."""
+    now = time.monotonic()
+    entries = {}
+    with _cache_lock:
+        for tf in timeframes:
+            key = (agent_url, symbol, tf)
+            entry = _cache.get(key)
+            if entry is None:
+                entry = _Entry()
+                _cache[key] = entry
+            _cache.move_to_end(key)
+            entry.last_used = now
+            entries[tf] = entry
+        _evict(now)
+    return entries
+
+
+def _evict(now):
+    """Rimuove le entry inutilizzate da CACHE_IDLE_TTL e quelle oltre CACHE_MAX_ENTRIES (LRU).
+    Va chiamata con _cache_lock acquisito."""
+    global _last_sweep
+    while len(_cache) > CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+        _stats["evictions"] += 1
+    if now - _last_sweep < SWEEP_EVERY:
+        return
+    _last_sweep = now
+    for key in [k for k, e in _cache.items() if now - e.last_used > CACHE_IDLE_TTL]:
+        del _cache[key]
+        _stats["evictions"] += 1
+
+
+def invalidate(agent_url=None, symbol=None):
+    """Svuota la cache (tutta, o per agent/simbolo)."""
+    with _cache_lock:
+        if symbol is None:
+            for url in [u for u in _no_bundle if agent_url is None or u == agent_url]:
+                del _no_bundle[url]
+        for key in list(_cache):
+            if (agent_url is None or key[0] == agent_url) and (symbol is None or key[1] == symbol):
+                del _cache[key]
+
+
+def cache_stats():
+    with _cache_lock:
+        return {**_stats, "entries": len(_cache)}
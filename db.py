@@ -9,9 +9,11 @@ import uuid
 import mysql.connector
 from mysql.connector import Error as MySQLError
 import requests
+from agent_client import agent_post
+from agent_sessions import AgentSessionError, agent_session, note_login, invalidate as invalidate_agent_session
 from models import LoginRequest, LoginResponse, ServerRequest, TraderServersUpdate,Trader, Newtrader,UserResponse, ServerResponse
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi import APIRouter
 from fastapi.middleware.cors import CORSMiddleware
 # import MetaTrader5 as mt5
@@ -21,21 +23,14 @@ import re
 from mysql.connector import pooling
 from dotenv import load_dotenv
 from pprint import pformat
-from threading import Lock
+from contextlib import contextmanager
 
 
 load_dotenv()
 
 
-# pool = mysql.connector.pooling.MySQLConnectionPool(
-#     pool_name=os.environ.get("MYSQL_POOL_NAME"),
-#     pool_size=int(os.environ.get("MYSQL_POOL_SIZE")),
-#     host=os.environ.get("MYSQL_HOST"),
-#     user=os.environ.get("MYSQL_USER"),
-#     password=os.environ.get("MYSQL_PASSWORD"),
-#     database=os.environ.get("MYSQL_DB"),
-#     port=int(os.environ.get("MYSQL_PORT")),
-# )
+# pool di connessioni MySQL (size/overflow/health check): vedi db_pool.py
+from db_pool import pool, pool_stats
 
 # from fastapi_utils.tasks import repeat_every
 
@@ -79,7 +74,7 @@ def ensure_mt5_initialized(base_url: str, mt5_path: str, log=print):
     init_body = {"path": mt5_path}
 
     try:
-        init_resp = requests.post(init_url, json=init_body, timeout=10)
+        init_resp = agent_post(init_url, json=init_body, timeout=10)
     except Exception as e:
         # raise Exception(f"❌ Errore durante init su {base_url}: {e}")
         log(f"❌ Errore durante init su {base_url}: {e}")
@@ -87,6 +82,7 @@ def ensure_mt5_initialized(base_url: str, mt5_path: str, log=print):
 
 
     if init_resp is not None:
+        invalidate_agent_session(base_url)  # init = nessun account loggato
         if init_resp.status_code == 200:
             log(f"✅ Init MT5 riuscita ({base_url})")
         else:
@@ -108,11 +104,14 @@ def mt5_login(base_url, login, password, server, log):
     }
 
     log(f"🔹 Connessione MT5 a {login_url}")
-    resp = requests.post(login_url, json=login_body, timeout=10)
+    resp = agent_post(login_url, json=login_body, timeout=10)
 
     if resp.status_code != 200:
         # raise Exception(f"❌ Login fallito su {base_url}: {resp.text}")
         log(f"❌ Login fallito su {base_url}: {resp.text}")
+        invalidate_agent_session(base_url)
+    else:
+        note_login(base_url, login, server)
 
 
     data = resp.json()
@@ -122,38 +121,35 @@ def mt5_login(base_url, login, password, server, log):
 
 
 def get_connection():
+    """Connessione dal pool (db_pool.py): conn.close() la restituisce al pool."""
     try:
-
-        conn = mysql.connector.connect(
-            host=os.environ.get("MYSQL_HOST"),
-            user=os.environ.get("MYSQL_USER"),
-            password=os.environ.get("MYSQL_PASSWORD"),
-            database=os.environ.get("MYSQL_DB"),
-            port=int(os.environ.get("MYSQL_PORT")),
-            connection_timeout=int(os.environ.get("MYSQL_CONNECT_TIMEOUT", 5)),
-            read_timeout=int(os.environ.get("MYSQL_READ_TIMEOUT", 60)),
-            write_timeout=int(os.environ.get("MYSQL_WRITE_TIMEOUT", 60)),
-        )
-
-        print(os.environ.get("MYSQL_HOST"))
-        print(os.environ.get("MYSQL_DB"))
-        print(os.environ.get("MYSQL_PORT"))
-        
+        return pool.acquire()
+    except MySQLError as e:
+        raise HTTPException(status_code=500, detail=f"Errore di connessione MySQL: {e}")
 
 
-        # db locale 
-        # conn = mysql.connector.connect(
-        #     host="127.0.0.1",       # o "127.0.0.1"
-        #     user="trader",            # utente MySQL locale
-        #     password="vibe2025",            # lascia vuoto se non hai password
-        #     database="trader_db",   # nome del tuo database
-        #     port=3306               # porta predefinita MySQL
-        # )
+@contextmanager
+def db_connection():
+    """with db_connection() as conn: ... — la connessione torna sempre al pool."""
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
 
 
-        return conn
-    except MySQLError as e:
-        raise HTTPException(status_code=500, detail=f"Errore di connessione MySQL: {e}")
+@contextmanager
+def db_cursor(dictionary=False, commit=False):
+    """with db_cursor(dictionary=True) as cursor: ... — chiude cursore e connessione,
+    con commit=True esegue il commit se il blocco termina senza eccezioni."""
+    with db_connection() as conn:
+        cursor = conn.cursor(dictionary=dictionary)
+        try:
+            yield cursor
+            if commit:
+                conn.commit()
+        finally:
+            cursor.close()
 
 
 def run_migrations():
@@ -514,11 +510,9 @@ def update_server(server_id: int, server: ServerRequest):
 # Endpoint per recuperare tutti i trader
 @router.get("/traders", response_model=List[Trader])
 def get_traders():
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM traders")
-    rows = cursor.fetchall()
-    conn.close()
+    with db_cursor(dictionary=True) as cursor:
+        cursor.execute("SELECT * FROM traders")
+        rows = cursor.fetchall()
 
     # Mappa is_active -> status
     traders = []
@@ -842,7 +836,7 @@ def copy_orders(trader_id: int):
 
     log(f"🔹 Connessione allo slave via {login_url}")
     try:
-        resp = requests.post(login_url, json=login_body, timeout=30)
+        resp = agent_post(login_url, json=login_body, timeout=30)
         log(f"📡 Status code: {resp.status_code}")
         log(f"📩 Response: {resp.text}")
     except Exception as e:
@@ -850,7 +844,9 @@ def copy_orders(trader_id: int):
         raise
 
     if resp.status_code != 200:
+        invalidate_agent_session(base_url_slave)
         raise Exception(f"❌ Login fallito su {base_url_slave}: {resp.text}")
+    note_login(base_url_slave, trader["slave_user"], trader["slave_name"])
 
     data = resp.json()
     log(f"✅ Connessione allo slave {trader['slave_user']} riuscita! Bilancio: {data.get('balance')}")
@@ -928,7 +924,7 @@ def copy_orders(trader_id: int):
                 
                 # Chiamata API allo slave per abilitare il simbolo
                 select_url = f"{base_url}/symbol_select"
-                select_resp = requests.post(select_url, json={"symbol": symbol, "enable": True}, timeout=10)
+                select_resp = agent_post(select_url, json={"symbol": symbol, "enable": True}, timeout=10)
                 
                 if select_resp.status_code != 200 or not select_resp.json().get("enabled", False):
                     log(f"❌ Errore: impossibile attivare {symbol} sullo slave via API.")
@@ -1030,7 +1026,7 @@ def copy_orders(trader_id: int):
 
 
             try:
-                resp_order = requests.post(order_url, json=request, timeout=20)
+                resp_order = agent_post(order_url, json=request, timeout=20)
 
                 if resp_order.status_code != 200:
                     log(f"❌ Errore invio ordine allo slave: {resp_order.text}")
@@ -1198,7 +1194,7 @@ def close_slave_order(slave_base_url, slave_ticket):
     log(f"🔹 Chiudo ordine slave {slave_ticket}: {url}")
 
     try:
-        resp = requests.post(url, timeout=10)
+        resp = agent_post(url, timeout=10)
     except requests.exceptions.RequestException as e:
         log(f"❌ Errore di rete durante la chiusura dell’ordine {slave_ticket}: {e}")
         return {"error": str(e)}
@@ -1224,9 +1220,6 @@ def get_history(
     return get_history_db(trader_id, symbol, profit_min, profit_max)
 
 def get_history_db(trader_id, symbol=None, profit_min=None, profit_max=None):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-
     query = """
         SELECT 
             id, trader_id, master_order_id, master_ticket,
@@ -1253,14 +1246,18 @@ def get_history_db(trader_id, symbol=None, profit_min=None, profit_max=None):
 
     query += " ORDER BY closed_at DESC"
 
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-
-    cursor.close()
-    conn.close()
+    with db_cursor(dictionary=True) as cursor:
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
 
     return rows
 
+
+@router.get("/pool_stats")
+def get_pool_stats():
+    """Metriche del pool MySQL (attese, timeout, connessioni in uso)."""
+    return pool_stats()
+
 # --- AI ANALYSIS ---
 from ai_analysis import get_analysis
 
@@ -1296,149 +1293,136 @@ class OrderPayload(BaseModel):
     tp: Optional[float] = None
     broker: Optional[str] = None
 
-# Lock globale per evitare ordini duplicati simultanei
-open_order_lock = Lock()
-
-
 @router.post("/traders/{trader_id}/open_order_on_slave")
 def open_order_on_slave(payload: OrderPayload):
+    log_start = logs.seq  # solo le righe di log di questa richiesta
 
-    with open_order_lock:  # 🔒 blocca l'accesso concorrente
-
-
-        order_type = payload.order_type
-        volume = payload.volume
-        symbol = payload.symbol
-        trader_id = payload.trader_id
-        sl = payload.sl
-        tp = payload.tp
-        # broker corrente ...
-        broker = payload.broker
+    trader_id = payload.trader_id
+    # broker corrente ...
+    broker = payload.broker
 
-        conn = get_connection()
+    # connessione chiusa su ogni ramo (trader mancante, errore di sessione, tick/ordine falliti)
+    with db_connection() as conn:
         cursor = conn.cursor(dictionary=True)
 
-
         log("🚀 Entrato in open_order_on_slave()")
         log(f"📡 Broker corrente: {broker}")
 
         # 1️⃣ Recupero trader
         trader = get_trader(cursor, trader_id)
         if not trader:
-            return {"status": "ko", "message": "Trader non trovato", "logs": logs}
+            return {"status": "ko", "message": "Trader non trovato", "logs": "\n".join(logs.since(log_start))}
 
-        # 2️⃣ Inizializza server SLAVE
+        # 2️⃣ + 3️⃣ Sessione SLAVE: init e login solo se l'agent non ha già l'account attivo.
+        # 🔒 Il lock della sessione è per agent: niente ordini duplicati simultanei sullo
+        # stesso slave, mentre slave diversi non si aspettano più a vicenda.
         base_url_slave = f"http://{trader['slave_ip']}:{trader['slave_port']}"
-        log(f"🌐 Init MT5 slave: {base_url_slave}")
-        ensure_mt5_initialized(base_url_slave, trader["slave_path"], log)
-
-        # 3️⃣ Login SLAVE
-        login_url = f"{base_url_slave}/login"
-        login_body = {
-            "login": int(trader["slave_user"]),
-            "password": trader["slave_pwd"],
-            "server": trader["slave_name"]
-        }
-
-        log("🔐 Login allo SLAVE...")
-        resp = requests.post(login_url, json=login_body, timeout=20)
-        if resp.status_code != 200:
-            return {"status": "ko", "message": f"Errore login slave: {resp.text}",
-                    #  "logs": logs
-                    "logs": "\n".join(logs)
+        log(f"🌐 Sessione MT5 slave: {base_url_slave}")
+        try:
+            with agent_session(base_url_slave, trader["slave_path"], trader["slave_user"],
+                               trader["slave_pwd"], trader["slave_name"], log):
+                return _open_order(base_url_slave, payload, conn, cursor, log_start)
+        except AgentSessionError as e:
+            log(f"❌ {e}")
+            return {"status": "ko", "message": str(e), "logs": "\n".join(logs.since(log_start))}
 
-                    }
 
-        log("✅ Login SLAVE riuscito")
+def _open_order(base_url_slave, payload: OrderPayload, conn, cursor, log_start):
+    order_type = payload.order_type
+    volume = payload.volume
+    symbol = payload.symbol
+    trader_id = payload.trader_id
+    sl = payload.sl
+    tp = payload.tp
+    broker = payload.broker
 
-        # 4️⃣ Recupero tick SLAVE
-        # symbol = trader["symbol"] if "symbol" in trader else "XAUUSD"
-        tick_url = f"{base_url_slave}/symbol_tick/{symbol}"
+    # 4️⃣ Recupero tick SLAVE
+    # symbol = trader["symbol"] if "symbol" in trader else "XAUUSD"
+    tick_url = f"{base_url_slave}/symbol_tick/{symbol}"
 
 
-        log(f"📡 Richiedo tick dello SLAVE: {tick_url}")
-        resp_tick = safe_get(tick_url, timeout=10)
+    log(f"📡 Richiedo tick dello SLAVE: {tick_url}")
+    resp_tick = safe_get(tick_url, timeout=10)
 
-        if resp_tick.status_code != 200:
-            log(f"🔎 Verifica simbolo sullo SLAVE: {symbol}")
+    if resp_tick.status_code != 200:
+        log(f"🔎 Verifica simbolo sullo SLAVE: {symbol}")
+        invalidate_agent_session(base_url_slave)  # al prossimo ordine riverifica /health
 
-            return {"status": "ko", "message": f"Errore tick {resp_tick.text}",
-                    "logs": "\n".join(logs)
-                    #  "logs": logs
-                    }
+        return {"status": "ko", "message": f"Errore tick {resp_tick.text}",
+                "logs": "\n".join(logs.since(log_start))
+                #  "logs": logs
+                }
 
-        tick = resp_tick.json()
-        if "error" in tick or "bid" not in tick or "ask" not in tick:
-            log(f"⚠️ Tick non valido per {symbol}: {tick}")
-            return {"status": "ko", "message": f"Tick non valido: {tick}",
-                    "logs": "\n".join(logs)}
+    tick = resp_tick.json()
+    if "error" in tick or "bid" not in tick or "ask" not in tick:
+        log(f"⚠️ Tick non valido per {symbol}: {tick}")
+        return {"status": "ko", "message": f"Tick non valido: {tick}",
+                "logs": "\n".join(logs.since(log_start))}
 
-        log(f"📈 Tick ricevuto: BID={tick['bid']} ASK={tick['ask']}")
+    log(f"📈 Tick ricevuto: BID={tick['bid']} ASK={tick['ask']}")
 
-        price = tick["ask"] if order_type.lower() == "buy" else tick["bid"]
+    price = tick["ask"] if order_type.lower() == "buy" else tick["bid"]
 
-        # 5️⃣ Prepara ordine
-        order_request = {
-            "symbol": symbol,
-            "volume": volume,
-            "type": order_type.lower(),
-            "price": price,
-            # "price": 0.0,
-            "sl": sl,
-            "tp": tp,
-            "broker" : broker
+    # 5️⃣ Prepara ordine
+    order_request = {
+        "symbol": symbol,
+        "volume": volume,
+        "type": order_type.lower(),
+        "price": price,
+        # "price": 0.0,
+        "sl": sl,
+        "tp": tp,
+        "broker" : broker
 
-            
-        }
+        
+    }
 
-        order_url = f"{base_url_slave}/order"
-        log(f"📤 Invio ordine allo SLAVE → {order_url}")
+    order_url = f"{base_url_slave}/order"
+    log(f"📤 Invio ordine allo SLAVE → {order_url}")
 
 
-        
+    
 
-        resp_order = requests.post(order_url, json=order_request, timeout=20)
-        if resp_order.status_code != 200:
-            return {"status": "ko", "message": f"Errore invio ordine: {resp_order.text}",
-                    #  "logs": logs
-                    "logs": "\n".join(logs)
+    resp_order = agent_post(order_url, json=order_request, timeout=20)
+    if resp_order.status_code != 200:
+        invalidate_agent_session(base_url_slave)
+        return {"status": "ko", "message": f"Errore invio ordine: {resp_order.text}",
+                #  "logs": logs
+                "logs": "\n".join(logs.since(log_start))
 
-                    }
+                }
 
-        result = resp_order.json()
-        r = result.get("result", {})
-        log(f"✅ Risposta SLAVE: retcode={r.get('retcode')}, deal={r.get('deal')}, ticket={r.get('order')}")
+    result = resp_order.json()
+    r = result.get("result", {})
+    log(f"✅ Risposta SLAVE: retcode={r.get('retcode')}, deal={r.get('deal')}, ticket={r.get('order')}")
 
-        ticket = result.get("result", {}).get("order")
+    ticket = result.get("result", {}).get("order")
 
-        # 6️⃣ Scrive nel DB slave_orders
-        if ticket:
-            try:
-                cursor.execute("""
-                INSERT INTO slave_orders
-                    (trader_id, master_order_id, master_ticket, ticket,
-                     symbol, type, volume, price_open, opened_at)
-                VALUES (%s, NULL, NULL, %s, %s, %s, %s, %s, NOW())
-                """,
-                (trader_id, ticket, symbol, order_type, volume, price))
-
-                conn.commit()
-                log(f"💾 Ordine SLAVE salvato nel DB. Ticket={ticket}")
-            except Exception as e:
-                log(f"❌ Errore salvataggio slave_orders: {e}")
+    # 6️⃣ Scrive nel DB slave_orders
+    if ticket:
+        try:
+            cursor.execute("""
+            INSERT INTO slave_orders
+                (trader_id, master_order_id, master_ticket, ticket,
+                 symbol, type, volume, price_open, opened_at)
+            VALUES (%s, NULL, NULL, %s, %s, %s, %s, %s, NOW())
+            """,
+            (trader_id, ticket, symbol, order_type, volume, price))
 
-        # 7️⃣ Fine
-        cursor.close()
-        conn.close()
+            conn.commit()
+            log(f"💾 Ordine SLAVE salvato nel DB. Ticket={ticket}")
+        except Exception as e:
+            log(f"❌ Errore salvataggio slave_orders: {e}")
 
-        return {
-            "status": "ok",
-            "message": "Ordine inviato allo SLAVE",
-            "ticket": ticket,
-            # "logs": logs
-            "logs": "\n".join(logs)
+    # 7️⃣ Fine (la connessione la chiude open_order_on_slave)
+    return {
+        "status": "ok",
+        "message": "Ordine inviato allo SLAVE",
+        "ticket": ticket,
+        # "logs": logs
+        "logs": "\n".join(logs.since(log_start))
 
-        }
+    }
 
 
 # chiusura ordine determinato
@@ -1449,50 +1433,35 @@ class CloseOrderPayload(BaseModel):
 
 @router.post("/traders/{trader_id}/close_order_on_slave")
 def close_order_on_slave(payload: CloseOrderPayload):
+    log_start = logs.seq  # solo le righe di log di questa richiesta
     trader_id = payload.trader_id
     symbol = payload.symbol
 
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    log("🚀 Entrato in close_order_on_slave()")
-
-    # 1️⃣ Recupero trader
-    trader = get_trader(cursor, trader_id)
-    if not trader:
-        return {"status": "ko", "message": "Trader non trovato", }
-
-    # 2️⃣ Inizializza server SLAVE
-    base_url_slave = f"http://{trader['slave_ip']}:{trader['slave_port']}"
-    log(f"🌐 Init MT5 slave: {base_url_slave}")
-    ensure_mt5_initialized(base_url_slave, trader["slave_path"], log)
-
-    # 3️⃣ Login SLAVE
-    login_url = f"{base_url_slave}/login"
-    login_body = {
-        "login": int(trader["slave_user"]),
-        "password": trader["slave_pwd"],
-        "server": trader["slave_name"]
-    }
-
-    # Log dettagliato completo (inclusa password)
-    log("🔐 Tentativo di login allo SLAVE con i seguenti parametri:")
-    for k, v in login_body.items():
-        log(f"  {k}: {v}")
+    with db_connection() as conn:
+        cursor = conn.cursor(dictionary=True)
 
-    log(f"  URL: {login_url}")
+        log("🚀 Entrato in close_order_on_slave()")
 
+        # 1️⃣ Recupero trader
+        trader = get_trader(cursor, trader_id)
+        if not trader:
+            return {"status": "ko", "message": "Trader non trovato", }
 
-    log("🔐 Login allo SLAVE...")
-    resp = requests.post(login_url, json=login_body, timeout=30)
-    if resp.status_code != 200:
-        return {"status": "ko", "message": f"Errore login slave: {resp.text}", 
-                "logs": "\n".join(logs)
+        # 2️⃣ + 3️⃣ Sessione SLAVE: init e login solo se l'agent non ha già l'account attivo
+        base_url_slave = f"http://{trader['slave_ip']}:{trader['slave_port']}"
+        log(f"🌐 Sessione MT5 slave: {base_url_slave}")
+        try:
+            with agent_session(base_url_slave, trader["slave_path"], trader["slave_user"],
+                               trader["slave_pwd"], trader["slave_name"], log):
+                return _close_order(base_url_slave, payload, conn, cursor, log_start)
+        except AgentSessionError as e:
+            log(f"❌ {e}")
+            return {"status": "ko", "message": str(e), "logs": "\n".join(logs.since(log_start))}
 
-                # "logs": logs
-                }
 
-    log("✅ Login SLAVE riuscito")
+def _close_order(base_url_slave, payload: CloseOrderPayload, conn, cursor, log_start):
+    trader_id = payload.trader_id
+    symbol = payload.symbol
     log(f"Simbolo da chiudere: {symbol}")
 
     # 4️⃣ Prepara richiesta chiusura ordine
@@ -1505,11 +1474,12 @@ def close_order_on_slave(payload: CloseOrderPayload):
 
 
     try:
-        resp_order = requests.post(close_order_url, json=payload_order, timeout=20)
+        resp_order = agent_post(close_order_url, json=payload_order, timeout=20)
         if resp_order.status_code != 200:
+            invalidate_agent_session(base_url_slave)
             return {"status": "ko", "message": f"Errore chiusura ordine: {resp_order.text}", 
                     # "logs": logs
-                    "logs": "\n".join(logs)
+                    "logs": "\n".join(logs.since(log_start))
 
                     }
 
@@ -1536,8 +1506,9 @@ def close_order_on_slave(payload: CloseOrderPayload):
 
     except requests.RequestException as e:
         log(f"❌ Errore invio richiesta chiusura ordine: {e}")
+        invalidate_agent_session(base_url_slave)
         return {"status": "ko", "message": str(e), 
-                "logs": "\n".join(logs)
+                "logs": "\n".join(logs.since(log_start))
 
                 # "logs": logs
                 }
@@ -1551,10 +1522,13 @@ if __name__ == "__main__":
 
 import uuid
 import threading
+from fastapi import Request
 from pydantic import BaseModel as PydanticBaseModel
+from job_manager import JobStore, JobRejected, owner_of
 
-backtest_sessions = {}
-backtest_lock = threading.Lock()
+backtest_jobs = JobStore("backtest", max_running=int(os.getenv("BACKTEST_MAX_RUNNING", 4)))
+backtest_sessions = backtest_jobs.sessions
+backtest_lock = backtest_jobs.lock
 
 class BacktestRequest(PydanticBaseModel):
     strategy: str
@@ -1566,7 +1540,7 @@ class BacktestRequest(PydanticBaseModel):
     direction: str = "both"
 
 @router.post("/backtest")
-def run_backtest_endpoint(req: BacktestRequest):
+def run_backtest_endpoint(req: BacktestRequest, request: Request):
     from backtest import run_backtest_api, STRATEGIES
 
     if req.strategy not in STRATEGIES:
@@ -1600,9 +1574,7 @@ def run_backtest_endpoint(req: BacktestRequest):
         return JSONResponse(status_code=400, content={"error": "trader_id obbligatorio o trader non trovato"})
 
     session_id = str(uuid.uuid4())[:8]
-
-    with backtest_lock:
-        backtest_sessions[session_id] = {"status": "running", "result": None, "cancelled": False, "progress": 0, "trades_count": 0, "balance": 0, "mt5_url": mt5_api_url, "trader_name": trader_name, "trader_login": trader_login, "trader_server": trader_server}
+    session = {"status": "running", "result": None, "cancelled": False, "progress": 0, "trades_count": 0, "balance": 0, "fetch_progress": None, "mt5_url": mt5_api_url, "trader_name": trader_name, "trader_login": trader_login, "trader_server": trader_server}
 
     def _run():
         def on_progress(pct, trades_count, balance):
@@ -1612,6 +1584,11 @@ def run_backtest_endpoint(req: BacktestRequest):
                     backtest_sessions[session_id]["trades_count"] = trades_count
                     backtest_sessions[session_id]["balance"] = balance
 
+        def on_fetch_progress(done, total):
+            with backtest_lock:
+                if session_id in backtest_sessions:
+                    backtest_sessions[session_id]["fetch_progress"] = {"done": done, "total": total}
+
         try:
             result = run_backtest_api(
                 strategy_name=req.strategy,
@@ -1623,6 +1600,7 @@ def run_backtest_endpoint(req: BacktestRequest):
                 cancel_flag=lambda: backtest_sessions.get(session_id, {}).get("cancelled", False),
                 progress_callback=on_progress,
                 direction=req.direction,
+                fetch_progress_callback=on_fetch_progress,
             )
             with backtest_lock:
                 if session_id in backtest_sessions:
@@ -1637,19 +1615,32 @@ def run_backtest_endpoint(req: BacktestRequest):
                     backtest_sessions[session_id]["status"] = "error"
                     backtest_sessions[session_id]["result"] = {"error": str(e)}
 
-    t = threading.Thread(target=_run, daemon=True)
-    t.start()
+    try:
+        backtest_jobs.submit(session_id, session, _run, owner=owner_of(request))
+    except JobRejected as e:
+        return JSONResponse(status_code=429, content={"error": str(e)})
 
     return {"session_id": session_id}
 
 
 @router.get("/backtest/{session_id}")
 def get_backtest_status(session_id: str):
-    with backtest_lock:
-        session = backtest_sessions.get(session_id)
+    session = backtest_jobs.get(session_id)
     if not session:
         return JSONResponse(status_code=404, content={"error": "Session not found"})
-    return {"status": session["status"], "result": session["result"], "progress": session.get("progress", 0), "trades_count": session.get("trades_count", 0), "balance": session.get("balance", 0), "mt5_url": session.get("mt5_url"), "trader_name": session.get("trader_name"), "trader_login": session.get("trader_login"), "trader_server": session.get("trader_server")}
+    return {"status": session["status"], "result": backtest_jobs.result(session), "queued": session.get("queued", False), "queue_position": session.get("queue_position", 0), "progress": session.get("progress", 0), "trades_count": session.get("trades_count", 0), "balance": session.get("balance", 0), "fetch_progress": session.get("fetch_progress"), "mt5_url": session.get("mt5_url"), "trader_name": session.get("trader_name"), "trader_login": session.get("trader_login"), "trader_server": session.get("trader_server")}
+
+
+@router.get("/backtest/{session_id}/events")
+def stream_backtest_events(session_id: str):
+    """Stream SSE del backtest: progress (trade, saldo, download) e risultato finale una volta sola."""
+    if backtest_jobs.get(session_id) is None:
+        return JSONResponse(status_code=404, content={"error": "Session not found"})
+    return StreamingResponse(
+        backtest_jobs.events(session_id, fields=("status", "progress", "trades_count", "balance", "fetch_progress")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/backtest/{session_id}/cancel")
@@ -1670,7 +1661,7 @@ def analyze_backtest_endpoint(session_id: str):
         return JSONResponse(status_code=404, content={"error": "Session not found"})
     if session["status"] != "done":
         return JSONResponse(status_code=400, content={"error": "Backtest non completato"})
-    result = session.get("result")
+    result = backtest_jobs.result(session)
     if not result or result.get("error"):
         return JSONResponse(status_code=400, content={"error": "Nessun risultato da analizzare"})
 
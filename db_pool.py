@@ -0,0 +1,208 @@
+# --- DB POOL: pool di connessioni MySQL per db.get_connection ---
+#
+# - POOL_SIZE connessioni persistenti + POOL_OVERFLOW temporanee (chiuse al rilascio)
+# - oltre size+overflow si attende fino a POOL_TIMEOUT secondi, poi PoolError
+# - health check: ping delle connessioni rimaste inattive più di PING_AFTER
+#   secondi e riciclo di quelle più vecchie di RECYCLE secondi
+# - conn.close() restituisce la connessione al pool (rollback della transazione
+#   aperta, così la connessione successiva non legge uno snapshot vecchio)
+# - metriche di attesa: pool_stats()
+import os
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+from mysql.connector.errors import PoolError
+
+POOL_SIZE = int(os.environ.get("MYSQL_POOL_SIZE", 5))
+POOL_OVERFLOW = int(os.environ.get("MYSQL_POOL_OVERFLOW", 10))
+POOL_TIMEOUT = float(os.environ.get("MYSQL_POOL_TIMEOUT", 10))
+POOL_RECYCLE = float(os.environ.get("MYSQL_POOL_RECYCLE", 1800))
+POOL_PING_AFTER = float(os.environ.get("MYSQL_POOL_PING_AFTER", 30))
+
+
+def _connect():
+    return mysql.connector.connect(
+        host=os.environ.get("MYSQL_HOST"),
+        user=os.environ.get("MYSQL_USER"),
+        password=os.environ.get("MYSQL_PASSWORD"),
+        database=os.environ.get("MYSQL_DB"),
+        port=int(os.environ.get("MYSQL_PORT")),
+        connection_timeout=int(os.environ.get("MYSQL_CONNECT_TIMEOUT", 5)),
+        read_timeout=int(os.environ.get("MYSQL_READ_TIMEOUT", 60)),
+        write_timeout=int(os.environ.get("MYSQL_WRITE_TIMEOUT", 60)),
+    )
+
+
+class PooledConnection:
+    """Proxy della connessione MySQL: close() (o il GC) la restituisce al pool."""
+
+    def __init__(self, pool, raw, created_at, overflow):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._overflow = overflow
+
+    def __getattr__(self, name):
+        raw = self.__dict__.get("_raw")
+        if raw is None:
+            raise AttributeError(f"connessione già restituita al pool ({name})")
+        return getattr(raw, name)
+
+    def close(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool._release(raw, self._created_at, self._overflow)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # rete di sicurezza per chi dimentica conn.close()
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    def __init__(self, connect=_connect, size=POOL_SIZE, overflow=POOL_OVERFLOW,
+                 timeout=POOL_TIMEOUT, recycle=POOL_RECYCLE, ping_after=POOL_PING_AFTER):
+        self._connect = connect
+        self.size = size
+        self.overflow = overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self._idle = deque()          # (raw, created_at, last_used)
+        self._open = 0                # connessioni persistenti aperte (idle + in uso)
+        self._overflow_out = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0, "waits": 0, "wait_total_ms": 0.0, "wait_max_ms": 0.0,
+            "timeouts": 0, "created": 0, "recycled": 0, "health_failures": 0,
+        }
+
+    # ── checkout ──
+
+    def acquire(self):
+        t0 = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    raw, created_at, last_used = self._idle.pop()
+                    overflow = False
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    raw, created_at, last_used, overflow = None, None, None, False
+                    break
+                if self._overflow_out < self.overflow:
+                    self._overflow_out += 1
+                    raw, created_at, last_used, overflow = None, None, None, True
+                    break
+                remaining = self.timeout - (time.monotonic() - t0)
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolError(f"Pool MySQL esaurito: nessuna connessione libera dopo {self.timeout:g}s")
+                waited = True
+                self._cond.wait(remaining)
+
+            wait_ms = (time.monotonic() - t0) * 1000
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_total_ms"] += wait_ms
+                self._stats["wait_max_ms"] = max(self._stats["wait_max_ms"], wait_ms)
+
+        try:
+            if raw is not None:
+                raw, created_at = self._validate(raw, created_at, last_used)
+            if raw is None:
+                raw = self._connect()
+                created_at = time.monotonic()
+                with self._cond:
+                    self._stats["created"] += 1
+        except Exception:
+            self._discard(overflow)
+            raise
+        return PooledConnection(self, raw, created_at, overflow)
+
+    def _validate(self, raw, created_at, last_used):
+        """Ricicla le connessioni troppo vecchie, pinga quelle inattive da tempo."""
+        now = time.monotonic()
+        if now - created_at > self.recycle:
+            self._close_quietly(raw)
+            with self._cond:
+                self._stats["recycled"] += 1
+            return None, None
+        if now - last_used > self.ping_after:
+            try:
+                raw.ping(reconnect=False)
+            except Exception:
+                self._close_quietly(raw)
+                with self._cond:
+                    self._stats["health_failures"] += 1
+                return None, None
+        return raw, created_at
+
+    # ── rilascio ──
+
+    def _release(self, raw, created_at, overflow):
+        healthy = True
+        try:
+            if raw.in_transaction:
+                raw.rollback()
+        except Exception:
+            healthy = False
+
+        if overflow or not healthy:
+            self._close_quietly(raw)
+            self._discard(overflow)
+            return
+        with self._cond:
+            self._idle.append((raw, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, overflow):
+        with self._cond:
+            if overflow:
+                self._overflow_out -= 1
+            else:
+                self._open -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            s.update({
+                "size": self.size,
+                "overflow": self.overflow,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle) + self._overflow_out,
+                "overflow_in_use": self._overflow_out,
+            })
+        s["wait_avg_ms"] = round(s["wait_total_ms"] / s["waits"], 1) if s["waits"] else 0.0
+        s["wait_total_ms"] = round(s["wait_total_ms"], 1)
+        s["wait_max_ms"] = round(s["wait_max_ms"], 1)
+        return s
+
+
+pool = ConnectionPool()
+
+
+def pool_stats():
+    return pool.stats()
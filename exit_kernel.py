@@ -0,0 +1,362 @@
+# --- EXIT KERNEL: risoluzione SL/TP condivisa dai motori di backtest ---
+#
+# Stessa semantica di backtest.run_backtest e di research_tasks.run_generic_backtest:
+# - la posizione si apre sulla close della barra di ingresso e si controlla
+#   dalla barra successiva
+# - sulla stessa barra lo SL ha la precedenza sul TP
+#   (buy: low <= sl poi high >= tp, sell: high >= sl poi low <= tp)
+# - dopo un'uscita alla barra x un nuovo ingresso può avvenire già sulla barra x
+#
+# Con numba installato i cicli sono compilati (njit), altrimenti si usa la
+# scansione NumPy a blocchi crescenti. Le due versioni danno gli stessi indici
+# e gli stessi prezzi (nessun fastmath: stessa aritmetica IEEE di Python).
+import numpy as np
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    njit = None
+    HAS_NUMBA = False
+
+EXIT_NONE = 0       # posizione ancora aperta a fine serie
+EXIT_SL = 1
+EXIT_TP = 2
+EXIT_EVENT = 3      # uscita per evento esterno (es. HOLD_EXIT della strategia)
+
+EXIT_LABELS = {EXIT_SL: "SL", EXIT_TP: "TP", EXIT_EVENT: "HOLD_EXIT"}
+
+# codici di simulate_grid
+ENTRY_ERROR = 2     # in signal_dir: valutare/aprire l'ingresso solleva un'eccezione
+HOLD_CLOSE = 1      # on_hold_action chiude la posizione su questa barra
+HOLD_ERROR = 2      # on_hold_action solleva un'eccezione su questa barra
+
+
+# ─────────────────────── CICLI (compilati con numba) ───────────────────────
+
+def _first_exit_loop(start, lows, highs, sl, tp, is_buy, events):
+    n = lows.shape[0]
+    for i in range(start, n):
+        if is_buy:
+            if lows[i] <= sl:
+                return i, EXIT_SL
+            if highs[i] >= tp:
+                return i, EXIT_TP
+        else:
+            if highs[i] >= sl:
+                return i, EXIT_SL
+            if lows[i] <= tp:
+                return i, EXIT_TP
+        if events.shape[0] > 0 and events[i]:
+            return i, EXIT_EVENT
+    return n, EXIT_NONE
+
+
+def _sequential_loop(signal_dir, closes, lows, highs, sl_dist, tp_dist, start, lot_contract):
+    n = closes.shape[0]
+    entry_idx = np.empty(n, dtype=np.int64)
+    exit_idx = np.empty(n, dtype=np.int64)
+    exit_type = np.empty(n, dtype=np.int8)
+    pnl = np.empty(n, dtype=np.float64)
+    no_events = np.zeros(0, dtype=np.bool_)
+    count = 0
+    i = start
+    while i < n:
+        if signal_dir[i] == 0:
+            i += 1
+            continue
+        is_buy = signal_dir[i] > 0
+        entry = closes[i]
+        if is_buy:
+            sl = entry - sl_dist
+            tp = entry + tp_dist
+        else:
+            sl = entry + sl_dist
+            tp = entry - tp_dist
+        j, kind = _first_exit_loop(i + 1, lows, highs, sl, tp, is_buy, no_events)
+        entry_idx[count] = i
+        exit_idx[count] = j
+        exit_type[count] = kind
+        if kind == EXIT_SL:
+            pnl[count] = ((sl - entry) if is_buy else (entry - sl)) * lot_contract
+        elif kind == EXIT_TP:
+            pnl[count] = ((tp - entry) if is_buy else (entry - tp)) * lot_contract
+        else:
+            pnl[count] = 0.0
+        count += 1
+        i = j
+    return entry_idx[:count], exit_idx[:count], exit_type[:count], pnl[:count]
+
+
+if HAS_NUMBA:
+    _first_exit_loop = njit(cache=True)(_first_exit_loop)
+    _sequential_loop = njit(cache=True)(_sequential_loop)
+
+
+# ─────────────────────── FALLBACK NUMPY ───────────────────────
+
+def _first_exit_numpy(start, lows, highs, sl, tp, is_buy, events):
+    """Scansione a blocchi crescenti (64, 128, ... barre): poche operazioni NumPy per trade."""
+    n = len(lows)
+    step = 64
+    while start < n:
+        end = min(n, start + step)
+        if is_buy:
+            hit_sl = lows[start:end] <= sl
+            hit_tp = highs[start:end] >= tp
+        else:
+            hit_sl = highs[start:end] >= sl
+            hit_tp = lows[start:end] <= tp
+        hit = hit_sl | hit_tp
+        if events is not None:
+            hit = hit | events[start:end]
+        if hit.any():
+            k = int(hit.argmax())
+            if hit_sl[k]:
+                return start + k, EXIT_SL
+            if hit_tp[k]:
+                return start + k, EXIT_TP
+            return start + k, EXIT_EVENT
+        start = end
+        step = min(step * 2, 65536)
+    return n, EXIT_NONE
+
+
+def _sequential_numpy(signal_dir, closes, lows, highs, sl_dist, tp_dist, start, lot_contract):
+    n = len(closes)
+    candidates = np.flatnonzero(signal_dir)
+    entries, exits, kinds, pnls = [], [], [], []
+    i = start
+    while True:
+        k = int(np.searchsorted(candidates, i))
+        if k == len(candidates):
+            break
+        e = int(candidates[k])
+        is_buy = signal_dir[e] > 0
+        entry = closes[e]
+        sl = entry - sl_dist if is_buy else entry + sl_dist
+        tp = entry + tp_dist if is_buy else entry - tp_dist
+        j, kind = _first_exit_numpy(e + 1, lows, highs, sl, tp, is_buy, None)
+        if kind == EXIT_SL:
+            pnl = ((sl - entry) if is_buy else (entry - sl)) * lot_contract
+        elif kind == EXIT_TP:
+            pnl = ((tp - entry) if is_buy else (entry - tp)) * lot_contract
+        else:
+            pnl = 0.0
+        entries.append(e)
+        exits.append(j)
+        kinds.append(kind)
+        pnls.append(pnl)
+        if j >= n:
+            break
+        i = j
+    return (np.asarray(entries, dtype=np.int64), np.asarray(exits, dtype=np.int64),
+            np.asarray(kinds, dtype=np.int8), np.asarray(pnls, dtype=np.float64))
+
+
+# ─────────────────────── API ───────────────────────
+
+def first_exit(start, lows, highs, sl, tp, is_buy, events=None):
+    """
+    Prima barra >= start che tocca SL/TP (o con events[i] True).
+    Ritorna (indice, tipo EXIT_*); (len(lows), EXIT_NONE) se la posizione resta aperta.
+    """
+    if HAS_NUMBA:
+        ev = np.zeros(0, dtype=np.bool_) if events is None else np.asarray(events, dtype=np.bool_)
+        j, kind = _first_exit_loop(int(start), lows, highs, float(sl), float(tp), bool(is_buy), ev)
+        return int(j), int(kind)
+    return _first_exit_numpy(start, lows, highs, sl, tp, is_buy, events)
+
+
+def resolve_exits(entry_idx, is_buy, entry_price, sl, tp, lows, highs, lot_contract):
+    """
+    Uscite di trade indipendenti (una riga per ingresso).
+    Ritorna (exit_idx, exit_type, pnl); pnl = 0 per i trade rimasti aperti.
+    """
+    count = len(entry_idx)
+    exit_idx = np.empty(count, dtype=np.int64)
+    exit_type = np.empty(count, dtype=np.int8)
+    pnl = np.zeros(count, dtype=np.float64)
+    for k in range(count):
+        buy = bool(is_buy[k])
+        j, kind = first_exit(int(entry_idx[k]) + 1, lows, highs, sl[k], tp[k], buy)
+        exit_idx[k] = j
+        exit_type[k] = kind
+        if kind == EXIT_SL:
+            pnl[k] = ((sl[k] - entry_price[k]) if buy else (entry_price[k] - sl[k])) * lot_contract
+        elif kind == EXIT_TP:
+            pnl[k] = ((tp[k] - entry_price[k]) if buy else (entry_price[k] - tp[k])) * lot_contract
+    return exit_idx, exit_type, pnl
+
+
+def simulate_trades(signal_dir, closes, lows, highs, sl_dist, tp_dist, lot_contract, start=0):
+    """
+    Backtest a posizione singola su un flusso di segnali fisso
+    (signal_dir: +1 buy, -1 sell, 0 nessun ingresso per barra).
+    Ingresso sulla close con SL/TP a distanza fissa, un solo trade alla volta.
+    Ritorna (entry_idx, exit_idx, exit_type, pnl); l'ultimo trade può essere
+    EXIT_NONE (aperto a fine serie, exit_idx = len(closes)).
+    """
+    signal_dir = np.asarray(signal_dir, dtype=np.int8)
+    closes = np.asarray(closes, dtype=np.float64)
+    lows = np.asarray(lows, dtype=np.float64)
+    highs = np.asarray(highs, dtype=np.float64)
+    loop = _sequential_loop if HAS_NUMBA else _sequential_numpy
+    return loop(signal_dir, closes, lows, highs, float(sl_dist), float(tp_dist), int(start), float(lot_contract))
+
+
+# ─────────────────────── GRIGLIA SL × TP ───────────────────────
+
+def _sparse_table(values, op):
+    """levels[j][i] = op(values[i : i + 2**j]) (op = np.minimum / np.maximum)."""
+    levels = [values]
+    width = 1
+    while 2 * width <= len(values):
+        prev = levels[-1]
+        levels.append(op(prev[:len(prev) - width], prev[width:]))
+        width *= 2
+    return levels
+
+
+def _first_crossing(levels, start, thr, below):
+    """
+    Per ogni query: prima barra >= start con valore <= thr (below) o >= thr,
+    len(values) se nessuna. Binary lifting sulla sparse table: si salta ogni
+    blocco di 2**j barre che resta tutto dall'altra parte della soglia.
+    """
+    n = len(levels[0])
+    pos = np.array(start, dtype=np.int64)
+    if n == 0:
+        return pos
+    for j in range(len(levels) - 1, -1, -1):
+        width = 1 << j
+        level = levels[j]
+        vals = level[np.minimum(pos, len(level) - 1)]
+        clear = vals > thr if below else vals < thr
+        pos += width * ((pos + width <= n) & clear)
+    return pos
+
+
+def simulate_grid(signal_dir, closes, lows, highs, sl_dists, tp_dists, lot, contract, balance, hold=None, start=0):
+    """
+    Backtest a posizione singola per M combinazioni (sl_dists[m], tp_dists[m])
+    sullo stesso flusso di segnali, con la semantica di run_backtest:
+    signal_dir per barra: +1 buy, -1 sell, 0 niente, ENTRY_ERROR (la combinazione
+    che ci arriva senza posizione fallisce); hold: None oppure {"buy": codici,
+    "sell": codici} per barra (HOLD_CLOSE → uscita HOLD_EXIT sulla close,
+    HOLD_ERROR → la combinazione fallisce), valutati dopo SL/TP.
+    PnL = (uscita - ingresso) * lot * contract, saldo aggiornato trade per trade.
+
+    Le barre di uscita SL/TP di ogni ingresso si trovano per tutti i livelli
+    insieme (sparse table di min(low) / max(high)); poi tutte le combinazioni
+    avanzano in parallelo da un trade al successivo.
+    Ritorna una lista di M dict: entry_idx, exit_idx, exit_type, is_buy, pnl,
+    balance (array per trade) e failed.
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    n = len(closes)
+    signal_dir = np.asarray(signal_dir, dtype=np.int8)
+    sl_dists = np.asarray(sl_dists, dtype=np.float64)
+    tp_dists = np.asarray(tp_dists, dtype=np.float64)
+    n_combos = len(sl_dists)
+
+    cand = np.flatnonzero(signal_dir[start:]) + start
+    code = signal_dir[cand]
+    entry = closes[cand]
+    is_buy = code == 1
+    is_sell = code == -1
+    n_cand = len(cand)
+
+    lows = np.asarray(lows, dtype=np.float64)
+    highs = np.asarray(highs, dtype=np.float64)
+    low_levels = _sparse_table(np.where(np.isnan(lows), np.inf, lows), np.minimum)
+    high_levels = _sparse_table(np.where(np.isnan(highs), -np.inf, highs), np.maximum)
+
+    sl_values, sl_col = np.unique(sl_dists, return_inverse=True)
+    tp_values, tp_col = np.unique(tp_dists, return_inverse=True)
+    sl_hit = np.full((n_cand, len(sl_values)), n, dtype=np.int64)
+    tp_hit = np.full((n_cand, len(tp_values)), n, dtype=np.int64)
+    for mask, sign in ((is_buy, 1.0), (is_sell, -1.0)):
+        if not mask.any():
+            continue
+        e = entry[mask][:, None]
+        s0 = np.broadcast_to((cand[mask] + 1)[:, None], (mask.sum(), len(sl_values)))
+        t0 = np.broadcast_to((cand[mask] + 1)[:, None], (mask.sum(), len(tp_values)))
+        if sign > 0:
+            sl_hit[mask] = _first_crossing(low_levels, s0, e - sl_values, below=True)
+            tp_hit[mask] = _first_crossing(high_levels, t0, e + tp_values, below=False)
+        else:
+            sl_hit[mask] = _first_crossing(high_levels, s0, e + sl_values, below=False)
+            tp_hit[mask] = _first_crossing(low_levels, t0, e - tp_values, below=True)
+
+    ev_hit = np.full(n_cand, n, dtype=np.int64)
+    ev_code = np.zeros(n_cand, dtype=np.int8)
+    if hold is not None:
+        for mask, codes in ((is_buy, hold["buy"]), (is_sell, hold["sell"])):
+            codes = np.asarray(codes, dtype=np.int8)
+            nxt = np.where(codes != 0, np.arange(n), n)
+            nxt = np.append(np.minimum.accumulate(nxt[::-1])[::-1], n)
+            ev_hit[mask] = nxt[cand[mask] + 1]
+            hit = mask & (ev_hit < n)
+            ev_code[hit] = codes[ev_hit[hit]]
+
+    # primo ingresso a partire da ogni barra (n → nessuno)
+    next_cand = np.searchsorted(cand, np.arange(n + 1))
+    entry_err = code == ENTRY_ERROR
+    hold_err = ev_code == HOLD_ERROR
+
+    # catena di trade: tutte le combinazioni avanzano insieme da un ingresso al
+    # successivo; tipo di uscita e PnL si ricavano dopo, in blocco
+    cur = np.full(n_combos, next_cand[min(start, n)], dtype=np.int64)
+    active = cur < n_cand
+    steps_m, steps_c = [], []
+    while active.any():
+        m = np.flatnonzero(active)
+        c = cur[m]
+        steps_m.append(m)
+        steps_c.append(c)
+        sl_tp = np.minimum(sl_hit[c, sl_col[m]], tp_hit[c, tp_col[m]])
+        e_hit = ev_hit[c]
+        stop = entry_err[c] | ((e_hit < sl_tp) & hold_err[c])
+        cur[m] = np.where(stop, n_cand, next_cand[np.minimum(sl_tp, e_hit)])
+        active[m] = cur[m] < n_cand
+
+    if steps_m:
+        m = np.concatenate(steps_m)
+        c = np.concatenate(steps_c)
+        order = np.argsort(m, kind="stable")
+        m, c = m[order], c[order]
+    else:
+        m = c = np.zeros(0, dtype=np.int64)
+
+    s_hit = sl_hit[c, sl_col[m]]
+    t_hit = tp_hit[c, tp_col[m]]
+    x = np.minimum(np.minimum(s_hit, t_hit), ev_hit[c])
+    kind = np.where(s_hit == x, EXIT_SL, np.where(t_hit == x, EXIT_TP, EXIT_EVENT)).astype(np.int8)
+    fail = entry_err[c] | ((kind == EXIT_EVENT) & (x < n) & hold_err[c])
+    failed = np.zeros(n_combos, dtype=bool)
+    failed[m[fail]] = True
+    keep = (x < n) & ~fail
+    m, c, x, kind = m[keep], c[keep], x[keep], kind[keep]
+
+    buy = is_buy[c]
+    e = entry[c]
+    sl_d = sl_values[sl_col[m]]
+    tp_d = tp_values[tp_col[m]]
+    sl_price = np.where(buy, e - sl_d, e + sl_d)
+    tp_price = np.where(buy, e + tp_d, e - tp_d)
+    exit_price = np.where(kind == EXIT_SL, sl_price, np.where(kind == EXIT_TP, tp_price, closes[x]))
+    pnl = np.where(buy, (exit_price - e) * lot * contract, (e - exit_price) * lot * contract)
+
+    bounds = np.searchsorted(m, np.arange(n_combos + 1))
+    out = []
+    for j in range(n_combos):
+        a, b = bounds[j], bounds[j + 1]
+        # saldo trade per trade, con le stesse somme in sequenza di run_backtest
+        bal = np.add.accumulate(np.concatenate(([balance], pnl[a:b])))[1:]
+        out.append({
+            "entry_idx": cand[c[a:b]], "exit_idx": x[a:b], "exit_type": kind[a:b],
+            "is_buy": buy[a:b], "pnl": pnl[a:b], "balance": bal,
+            "failed": bool(failed[j]),
+        })
+    return out
@@ -0,0 +1,38 @@
+"""
+Kernel NumPy vettorizzati per gli indicatori di indicators/ta.py.
+
+Sostituiscono i `rolling(n).apply(lambda ...)` (una chiamata Python per barra)
+con operazioni su finestre scorrevoli, mantenendo la stessa semantica:
+NaN finché la finestra non è piena e NaN se la finestra contiene un NaN.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def wma_values(values, n):
+    """
+    WMA lineare (pesi 1..n) su un array 1D.
+    Ritorna un array float della stessa lunghezza, NaN nelle prime n-1 posizioni.
+    """
+    x = np.asarray(values, dtype=float)
+    out = np.full(x.shape[0], np.nan)
+    if n <= 0 or x.shape[0] < n:
+        return out
+
+    weights = np.arange(1, n + 1, dtype=float)
+    windows = sliding_window_view(x, n)
+    out[n - 1:] = windows @ weights / weights.sum()
+    return out
+
+
+def hma_values(values, period=16):
+    """
+    Hull Moving Average su un array 1D: WMA(2*WMA(n/2) - WMA(n), sqrt(n)).
+    """
+    x = np.asarray(values, dtype=float)
+    half = int(period / 2)
+    sqrt = int(np.sqrt(period))
+    wma_half = wma_values(x, half)
+    wma_full = wma_values(x, period)
+    return wma_values(2 * wma_half - wma_full, sqrt)
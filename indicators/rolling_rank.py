@@ -0,0 +1,63 @@
+"""
+Rank mobile incrementale (percentile del valore corrente nella finestra).
+
+Mantiene la finestra ordinata (bisect) invece di ricalcolare
+np.mean(x <= x[-1]) su ogni finestra: O(log w) per barra per la ricerca,
+più lo spostamento in C della lista ordinata.
+Stessa semantica di compute_rolling_percentile: NaN finché la finestra
+non è piena o se contiene un NaN.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+import math
+
+import numpy as np
+
+
+class RollingRank:
+    """
+    Finestra ordinata a dimensione fissa, aggiornabile una barra alla volta.
+    update(x) ritorna la frazione di valori della finestra <= x (x incluso).
+    """
+
+    def __init__(self, window):
+        if window <= 0:
+            raise ValueError("window deve essere > 0")
+        self.window = int(window)
+        self._fifo = deque()      # valori in ordine di arrivo
+        self._sorted = []         # valori non-NaN ordinati
+        self._nan_count = 0
+
+    def update(self, value):
+        value = float(value)
+        is_nan = math.isnan(value)
+
+        self._fifo.append(value)
+        if is_nan:
+            self._nan_count += 1
+        else:
+            insort(self._sorted, value)
+
+        if len(self._fifo) > self.window:
+            old = self._fifo.popleft()
+            if math.isnan(old):
+                self._nan_count -= 1
+            else:
+                del self._sorted[bisect_left(self._sorted, old)]
+
+        if len(self._fifo) < self.window or self._nan_count:
+            return np.nan
+        return bisect_right(self._sorted, value) / self.window
+
+
+def rolling_rank_values(values, window):
+    """Rank mobile su un array 1D (float64, NaN finché la finestra non è piena)."""
+    x = np.asarray(values, dtype=float)
+    out = np.full(x.shape[0], np.nan)
+    if x.shape[0] < window:
+        return out
+    rr = RollingRank(window)
+    for i, v in enumerate(x.tolist()):
+        out[i] = rr.update(v)
+    return out
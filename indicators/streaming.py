@@ -0,0 +1,305 @@
+"""
+Indicatori incrementali (streaming) per il polling live.
+
+Ogni CandleStream tiene lo stato degli indicatori di una coppia
+(agent, simbolo, timeframe) e lo aggiorna in O(1) a ogni nuova candela
+CHIUSA, invece di ricalcolare EMA/RSI/MACD/ATR/HMA da zero a ogni tick.
+
+Le formule replicano quelle di indicators/ta.py:
+- EMA      → ewm(span, adjust=False)
+- RSI      → medie mobili semplici di gain/loss (come compute_rsi)
+- ATR      → media mobile di high-low (compute_atr) o del true range
+- HMA      → WMA(2*WMA(n/2) - WMA(n), sqrt(n))
+- percentile → RollingRank (compute_rolling_percentile)
+Stessa semantica NaN: NaN finché la finestra non è piena.
+"""
+
+from collections import deque
+import math
+import threading
+
+import numpy as np
+
+from indicators.rolling_rank import RollingRank
+
+
+# ─────────────────────── STATI ELEMENTARI ───────────────────────
+
+class EmaState:
+    """EMA con adjust=False: y = (1-a)*y_prev + a*x, seme = primo valore valido."""
+
+    def __init__(self, period):
+        self.alpha = 2.0 / (period + 1.0)
+        self.value = np.nan
+
+    def update(self, x):
+        if math.isnan(x):
+            return self.value
+        if math.isnan(self.value):
+            self.value = x
+        else:
+            self.value = (1.0 - self.alpha) * self.value + self.alpha * x
+        return self.value
+
+
+class SmaState:
+    """Media mobile semplice; NaN se la finestra non è piena o contiene NaN."""
+
+    RESYNC_EVERY = 1000  # ricalcolo periodico della somma contro la deriva float
+
+    def __init__(self, period):
+        self.period = int(period)
+        self._win = deque()
+        self._sum = 0.0
+        self._nan = 0
+        self._updates = 0
+
+    def update(self, x):
+        self._win.append(x)
+        if math.isnan(x):
+            self._nan += 1
+        else:
+            self._sum += x
+        if len(self._win) > self.period:
+            old = self._win.popleft()
+            if math.isnan(old):
+                self._nan -= 1
+            else:
+                self._sum -= old
+
+        self._updates += 1
+        if self._updates % self.RESYNC_EVERY == 0:
+            self._sum = math.fsum(v for v in self._win if not math.isnan(v))
+
+        if len(self._win) < self.period or self._nan:
+            return np.nan
+        return self._sum / self.period
+
+
+class RsiState:
+    """RSI con medie semplici di gain/loss, come indicators.ta.compute_rsi."""
+
+    def __init__(self, period):
+        self._prev = np.nan
+        self._gain = SmaState(period)
+        self._loss = SmaState(period)
+
+    def update(self, x):
+        delta = x - self._prev
+        self._prev = x
+        gain = max(delta, 0.0) if not math.isnan(delta) else np.nan
+        loss = max(-delta, 0.0) if not math.isnan(delta) else np.nan
+        avg_gain = self._gain.update(gain)
+        avg_loss = self._loss.update(loss)
+        if math.isnan(avg_gain) or math.isnan(avg_loss):
+            return np.nan
+        if avg_loss == 0:
+            # stessa aritmetica di pandas: rs=inf → 100, 0/0 → NaN
+            return np.nan if avg_gain == 0 else 100.0
+        rs = avg_gain / avg_loss
+        return 100 - (100 / (1 + rs))
+
+
+class MacdLineState:
+    """Linea MACD = EMA(fast) - EMA(slow)."""
+
+    def __init__(self, fast=12, slow=26):
+        self._fast = EmaState(fast)
+        self._slow = EmaState(slow)
+
+    def update(self, x):
+        return self._fast.update(x) - self._slow.update(x)
+
+
+class WmaState:
+    """WMA lineare (pesi 1..n) aggiornata in O(1); NaN in ingresso vengono saltati
+    (compaiono solo nel warm-up delle serie derivate, come nel calcolo batch)."""
+
+    # _num += n*x - _sum cancella cifre a ogni passo: ricalcolo frequente (O(n), n piccolo)
+    # per restare entro ~1e-13 relativo dal calcolo batch anche su serie lunghe
+    RESYNC_EVERY = 100
+
+    def __init__(self, period):
+        self.period = int(period)
+        self._win = deque()
+        self._sum = 0.0
+        self._num = 0.0
+        self._denom = self.period * (self.period + 1) / 2.0
+        self._updates = 0
+
+    def update(self, x):
+        if math.isnan(x):
+            return np.nan
+        n = self.period
+        if len(self._win) < n:
+            self._win.append(x)
+            self._sum += x
+            self._num += len(self._win) * x
+        else:
+            old = self._win.popleft()
+            self._num += n * x - self._sum
+            self._sum += x - old
+            self._win.append(x)
+
+        self._updates += 1
+        if self._updates % self.RESYNC_EVERY == 0:
+            self._sum = math.fsum(self._win)
+            self._num = math.fsum((i + 1) * v for i, v in enumerate(self._win))
+
+        if len(self._win) < n:
+            return np.nan
+        return self._num / self._denom
+
+
+class HmaState:
+    """Hull Moving Average incrementale."""
+
+    def __init__(self, period=16):
+        self._half = WmaState(int(period / 2))
+        self._full = WmaState(period)
+        self._out = WmaState(int(np.sqrt(period)))
+
+    def update(self, x):
+        half = self._half.update(x)
+        full = self._full.update(x)
+        return self._out.update(2 * half - full)
+
+
+class TrueRangeState:
+    """True range; sulla prima candela (senza close precedente) vale high-low."""
+
+    def __init__(self):
+        self._prev_close = np.nan
+
+    def update(self, bar):
+        high, low = bar["high"], bar["low"]
+        tr = high - low
+        if not math.isnan(self._prev_close):
+            tr = max(tr, abs(high - self._prev_close), abs(low - self._prev_close))
+        self._prev_close = bar["close"]
+        return tr
+
+
+class RankState(RollingRank):
+    """Percentile mobile (compute_rolling_percentile) come stato streaming."""
+
+
+# ─────────────────────── STREAM PER (AGENT, SIMBOLO, TF) ───────────────────────
+
+def high_low(bar, values):
+    return bar["high"] - bar["low"]
+
+
+def candle_body(bar, values):
+    return abs(bar["close"] - bar["open"])
+
+
+class StreamSnapshot:
+    """Copia immutabile degli ultimi valori di uno stream (letta fuori dal lock)."""
+
+    def __init__(self, history, last_time):
+        self._history = history
+        self.last_time = last_time
+
+    def get(self, name, back=0):
+        """Valore di `name` sulla candela chiusa più recente (back=0) o `back` candele prima."""
+        h = self._history[name]
+        if back >= len(h):
+            return np.nan
+        return h[-1 - back]
+
+
+class CandleStream:
+    """
+    Stato incrementale degli indicatori di un timeframe.
+    spec: lista di (nome, factory, sorgente) valutata in ordine;
+      - sorgente str  → colonna della candela o feature già calcolata
+      - sorgente None → la candela intera (es. TrueRangeState)
+      - sorgente callable(bar, values) → valore derivato
+      - factory None  → la feature è il valore della sorgente così com'è
+    """
+
+    def __init__(self, spec, history=16):
+        self.spec = spec
+        self.history = history
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._states = {name: (factory() if factory else None) for name, factory, _ in self.spec}
+        self._history = {name: deque(maxlen=self.history) for name, _, _ in self.spec}
+        self.last_time = None
+        self.bars = 0
+
+    def push(self, bar):
+        values = {}
+        for name, factory, source in self.spec:
+            if source is None:
+                x = bar
+            elif callable(source):
+                x = source(bar, values)
+            elif source in values:
+                x = values[source]
+            else:
+                x = float(bar[source])
+            state = self._states[name]
+            value = state.update(x) if state is not None else x
+            values[name] = value
+            self._history[name].append(value)
+        self.last_time = bar["time"]
+        self.bars += 1
+
+    def sync(self, df):
+        """
+        Allinea lo stato alle candele chiuse di `df` (l'ultima riga è in formazione).
+        Ingerisce solo le candele più recenti di last_time; un frame più vecchio dello
+        stato (altro trader sullo stesso stream già avanti di una candela) non cambia
+        nulla, si riparte da zero solo se i dati non si sovrappongono più (gap).
+        Ritorna uno StreamSnapshot coerente.
+        """
+        with self.lock:
+            if df is not None and len(df) > 1:
+                times = df["time"].values[:-1]
+                last = self.last_time
+                if last is None or times[0] > last:
+                    self._reset()
+                    start = 0
+                else:
+                    start = int(np.searchsorted(times, last, side="right"))
+
+                if start < len(times):
+                    cols = {c: df[c].values[start:len(times)] for c in ("open", "high", "low", "close")}
+                    for j in range(len(times) - start):
+                        self.push({
+                            "time": times[start + j],
+                            "open": float(cols["open"][j]),
+                            "high": float(cols["high"][j]),
+                            "low": float(cols["low"][j]),
+                            "close": float(cols["close"][j]),
+                        })
+
+            return StreamSnapshot({k: tuple(v) for k, v in self._history.items()}, self.last_time)
+
+
+_streams = {}
+_streams_lock = threading.Lock()
+
+
+def get_stream(agent_url, symbol, timeframe, spec, history=16):
+    """Stream condiviso per (agent, simbolo, timeframe): i trader sullo stesso
+    simbolo e agent leggono lo stesso stato."""
+    key = (agent_url, symbol, timeframe)
+    with _streams_lock:
+        stream = _streams.get(key)
+        if stream is None or stream.spec is not spec:
+            stream = CandleStream(spec, history=history)
+            _streams[key] = stream
+        return stream
+
+
+def drop_streams(agent_url=None, symbol=None):
+    """Rimuove gli stream (tutti, o solo quelli di un agent/simbolo)."""
+    with _streams_lock:
+        for key in list(_streams):
+            if (agent_url is None or key[0] == agent_url) and (symbol is None or key[1] == symbol):
+                del _streams[key]
@@ -1,6 +1,9 @@
 import pandas as pd
 import numpy as np
 
+from indicators.kernels import wma_values, hma_values
+from indicators.rolling_rank import rolling_rank_values
+
 def compute_ema(df, period):
     return df['close'].ewm(span=period, adjust=False).mean()
 
@@ -31,10 +34,9 @@ def compute_rolling_percentile(series, window):
     Percentile mobile del valore corrente rispetto agli ultimi `window` valori.
     Usa solo dati passati/attuali (nessun lookahead).
     Ritorna NaN finché la finestra non è piena.
+    Calcolato con la finestra ordinata di indicators/rolling_rank.py.
     """
-    def _pct(x):
-        return float(np.mean(x <= x[-1]))
-    return series.rolling(window).apply(_pct, raw=True)
+    return pd.Series(rolling_rank_values(series.to_numpy(dtype=float), window), index=series.index)
 def compute_bollinger(df, period=20, num_std=2):
     """
     Calcola le Bollinger Bands.
@@ -56,20 +58,17 @@ def compute_bollinger(df, period=20, num_std=2):
     return sma, upper_band, lower_band
 
 def wma(series, n):
-    weights = np.arange(1, n + 1, dtype=float)
-    return series.rolling(n).apply(lambda x: np.dot(x, weights) / weights.sum(), raw=True)
+    # kernel vettorizzato (indicators/kernels.py): stessi valori del vecchio rolling.apply
+    # (a meno dell'arrotondamento float, ~1e-15 relativo)
+    return pd.Series(wma_values(series.to_numpy(dtype=float), n), index=series.index)
 
 def compute_hma(df, period=16):
     """
     Calcola l'Hull Moving Average (HMA) su una serie 'close'.
-    WMA pesata correttamente via rolling.apply.
+    WMA pesata calcolata dal kernel NumPy (niente rolling.apply).
     """
     close = df['close']
-    half = int(period / 2)
-    sqrt = int(np.sqrt(period))
-    wma_half = wma(close, half)
-    wma_full = wma(close, period)
-    return wma(2 * wma_half - wma_full, sqrt)
+    return pd.Series(hma_values(close.to_numpy(dtype=float), period), index=close.index)
 
 def compute_adx(df, period=14):
     """
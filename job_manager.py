@@ -0,0 +1,312 @@
+# --- JOB MANAGER: sessioni di backtest / ricerca in background ---
+#
+# jobs = JobStore("backtest", max_running=4)
+# jobs.submit(session_id, {"status": "running", ...}, target, *args, owner="roberto")
+# session = jobs.get(session_id)      # dict della sessione (None se sconosciuta o scaduta)
+# result  = jobs.result(session)      # risultato, riletto dal disco se è stato scaricato
+#
+# - coda limitata: al più max_running job in esecuzione per store e max_queued in attesa;
+#   oltre, submit solleva JobRejected (gli endpoint rispondono 429)
+# - limite per utente: al più max_per_user job attivi (in coda o in esecuzione) per owner
+# - jobs.sessions / jobs.lock sono il dict e il lock di prima (backtest_sessions,
+#   research_sessions): il target continua ad aggiornare progress/status/result lì
+# - a fine job: meta della sessione in JOBS_DIR/<kind>/<id>.json e risultato in <id>.pkl;
+#   i risultati oltre JOBS_SPILL_BYTES restano solo su disco. Le sessioni finite
+#   sopravvivono ai riavvii e vengono rimosse (memoria e disco) dopo JOBS_TTL secondi.
+# - un job in coda resta con status "running" (compatibilità con i client che fanno
+#   polling) e ha queued=True + queue_position; se annullato prima di partire non viene eseguito.
+# - stream: jobs.events(session_id, fields) è il generatore Server-Sent Events della sessione
+#   (event progress quando cambiano i campi, event rows con le migliori righe parziali
+#   pubblicate dal target con jobs.push_rows, event result una volta sola a fine job)
+import asyncio
+import json
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs"))
+JOBS_MAX_RUNNING = int(os.getenv("JOBS_MAX_RUNNING", 2))
+JOBS_MAX_QUEUED = int(os.getenv("JOBS_MAX_QUEUED", 20))
+JOBS_MAX_PER_USER = int(os.getenv("JOBS_MAX_PER_USER", 3))
+JOBS_TTL = float(os.getenv("JOBS_TTL", 6 * 3600))                 # secondi dopo la fine
+JOBS_SPILL_BYTES = int(os.getenv("JOBS_SPILL_BYTES", 256 * 1024))  # risultati più grandi → solo su disco
+JOBS_SWEEP_INTERVAL = float(os.getenv("JOBS_SWEEP_INTERVAL", 60))
+SSE_POLL = float(os.getenv("SSE_POLL", 0.25))              # secondi tra due controlli della sessione
+SSE_HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", 15))      # commento keep-alive per proxy e browser
+STREAM_TOP_N = int(os.getenv("STREAM_TOP_N", 20))          # righe parziali tenute per sessione
+
+FINISHED = ("done", "error", "cancelled")
+
+_stores = []
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+class JobRejected(Exception):
+    """Job rifiutato per coda piena o limite per utente raggiunto."""
+
+
+def owner_of(request):
+    """Owner di un job: header X-User (utente loggato nel frontend) o IP del client."""
+    if request is None:
+        return "anonymous"
+    user = request.headers.get("X-User")
+    if user:
+        return user.strip()
+    return request.client.host if request.client else "anonymous"
+
+
+class JobStore:
+    def __init__(self, kind, max_running=None, max_queued=None, max_per_user=None, ttl=None, spill_bytes=None):
+        self.kind = kind
+        self.max_running = max_running or JOBS_MAX_RUNNING
+        self.max_queued = JOBS_MAX_QUEUED if max_queued is None else max_queued
+        self.max_per_user = max_per_user or JOBS_MAX_PER_USER
+        self.ttl = JOBS_TTL if ttl is None else ttl
+        self.spill_bytes = JOBS_SPILL_BYTES if spill_bytes is None else spill_bytes
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self._queue = []        # session_id in attesa, in ordine di arrivo
+        self._executor = ThreadPoolExecutor(max_workers=self.max_running, thread_name_prefix=f"job-{kind}")
+        self._restore()
+        _stores.append(self)
+        _start_sweeper()
+
+    # ─────────────────────── SUBMIT ───────────────────────
+
+    def submit(self, session_id, session, target, *args, owner="anonymous"):
+        """Registra la sessione e accoda target(*args). Solleva JobRejected oltre i limiti."""
+        self.evict_expired()
+        with self.lock:
+            active = [s for s in self.sessions.values() if s.get("status") not in FINISHED]
+            if sum(1 for s in active if s.get("owner") == owner) >= self.max_per_user:
+                raise JobRejected(f"Limite di {self.max_per_user} job attivi per {owner} raggiunto")
+            if len(self._queue) >= self.max_queued:
+                raise JobRejected(f"Coda {self.kind} piena ({self.max_queued} job in attesa)")
+            position = len(self._queue) + 1
+            session.update({
+                "owner": owner,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "queued": True,
+                "queue_position": position,
+            })
+            self.sessions[session_id] = session
+            self._queue.append(session_id)
+        self._executor.submit(self._run, session_id, target, args)
+        print(f"[Jobs] 📥 {self.kind} {session_id} in coda (owner={owner}, posizione {position})")
+        return session
+
+    def _run(self, session_id, target, args):
+        with self.lock:
+            self._queue.remove(session_id)
+            for pos, sid in enumerate(self._queue, 1):
+                self.sessions[sid]["queue_position"] = pos
+            session = self.sessions[session_id]
+            session["queued"] = False
+            session["queue_position"] = 0
+            session["started_at"] = time.time()
+            cancelled = session.get("cancelled", False)
+            if cancelled:
+                session["status"] = "cancelled"
+        if not cancelled:
+            try:
+                target(*args)
+            except Exception as e:
+                print(f"[Jobs] ❌ {self.kind} {session_id}: {e}")
+                with self.lock:
+                    session["status"] = "error"
+                    session["result"] = {"error": str(e)}
+        with self.lock:
+            if session.get("status") not in FINISHED:
+                session["status"] = "cancelled" if session.get("cancelled") else "done"
+            session["finished_at"] = time.time()
+        self._persist(session_id, session)
+
+    # ─────────────────────── LETTURA ───────────────────────
+
+    def get(self, session_id):
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def result(self, session):
+        """Risultato della sessione, dal disco se è stato scaricato."""
+        if session.get("result") is not None or not session.get("result_file"):
+            return session.get("result")
+        try:
+            with open(session["result_file"], "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"[Jobs] ⚠️ Risultato illeggibile {session['result_file']}: {e}")
+            return {"error": "Risultato non più disponibile"}
+
+    def push_rows(self, session_id, rows, key, n=None):
+        """Unisce rows alle righe parziali della sessione tenendo le migliori n per key (decrescente)."""
+        n = n or STREAM_TOP_N
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return
+            merged = (session.get("partial_rows") or []) + list(rows)
+            merged.sort(key=key, reverse=True)
+            session["partial_rows"] = merged[:n]
+            session["partial_seq"] = session.get("partial_seq", 0) + 1
+
+    def stats(self):
+        with self.lock:
+            statuses = {}
+            for s in self.sessions.values():
+                key = "queued" if s.get("queued") else s.get("status")
+                statuses[key] = statuses.get(key, 0) + 1
+            return {"kind": self.kind, "sessions": len(self.sessions), "queued": len(self._queue), **statuses}
+
+    # ─────────────────────── STREAM ───────────────────────
+
+    async def events(self, session_id, fields=("status", "progress")):
+        """Server-Sent Events della sessione fino al risultato finale (inviato una volta sola)."""
+        last_progress = last_rows = None
+        last_beat = time.monotonic()
+        seq = 0
+        while True:
+            with self.lock:
+                session = self.sessions.get(session_id)
+                if session is None:
+                    yield _sse("error", {"error": "Session not found"}, seq)
+                    return
+                progress = {f: session.get(f) for f in fields}
+                progress["queued"] = session.get("queued", False)
+                progress["queue_position"] = session.get("queue_position", 0)
+                rows_seq = session.get("partial_seq")
+                rows = session.get("partial_rows") if rows_seq != last_rows else None
+                finished = session.get("status") in FINISHED
+            if progress != last_progress:
+                last_progress = progress
+                seq += 1
+                yield _sse("progress", progress, seq)
+            if rows_seq != last_rows:
+                last_rows = rows_seq
+                seq += 1
+                yield _sse("rows", {"rows": rows}, seq)
+            if finished:
+                result = await asyncio.to_thread(self.result, session)
+                seq += 1
+                yield _sse("result", {"status": session.get("status"), "result": result}, seq)
+                return
+            if time.monotonic() - last_beat >= SSE_HEARTBEAT:
+                last_beat = time.monotonic()
+                yield ": ping\n\n"
+            await asyncio.sleep(SSE_POLL)
+
+    # ─────────────────────── DISCO ───────────────────────
+
+    def _dir(self):
+        return os.path.join(JOBS_DIR, self.kind)
+
+    def _persist(self, session_id, session):
+        """Salva meta e risultato della sessione finita; i risultati grandi escono dalla memoria."""
+        folder = self._dir()
+        try:
+            os.makedirs(folder, exist_ok=True)
+            result = session.get("result")
+            if result is not None:
+                payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+                path = os.path.join(folder, f"{session_id}.pkl")
+                with open(path + ".tmp", "wb") as f:
+                    f.write(payload)
+                os.replace(path + ".tmp", path)
+                with self.lock:
+                    session["result_file"] = path
+                    if len(payload) > self.spill_bytes:
+                        session["result"] = None
+                        print(f"[Jobs] 💾 {self.kind} {session_id}: risultato di {len(payload) / 1024:.0f} KB spostato su disco")
+            with self.lock:
+                meta = {k: v for k, v in session.items() if k != "result"}
+            with open(os.path.join(folder, f"{session_id}.json"), "w") as f:
+                json.dump(meta, f, default=str)
+        except Exception as e:
+            print(f"[Jobs] ⚠️ Persistenza {self.kind} {session_id} fallita: {e}")
+
+    def _restore(self):
+        """Ricarica le sessioni finite e non scadute salvate dai processi precedenti."""
+        try:
+            names = os.listdir(self._dir())
+        except FileNotFoundError:
+            return
+        now = time.time()
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            session_id = name[:-5]
+            try:
+                with open(os.path.join(self._dir(), name)) as f:
+                    meta = json.load(f)
+            except Exception:
+                continue
+            if now - (meta.get("finished_at") or 0) > self.ttl:
+                self._remove_files(session_id)
+                continue
+            meta["result"] = None
+            self.sessions[session_id] = meta
+        if self.sessions:
+            print(f"[Jobs] ♻️ {self.kind}: {len(self.sessions)} sessioni ripristinate")
+
+    def _remove_files(self, session_id):
+        for ext in (".json", ".pkl"):
+            try:
+                os.remove(os.path.join(self._dir(), session_id + ext))
+            except FileNotFoundError:
+                pass
+
+    # ─────────────────────── EVICTION ───────────────────────
+
+    def evict_expired(self):
+        """Rimuove le sessioni finite da più di ttl secondi. Ritorna quante."""
+        now = time.time()
+        with self.lock:
+            expired = [sid for sid, s in self.sessions.items()
+                       if s.get("status") in FINISHED and s.get("finished_at") and now - s["finished_at"] > self.ttl]
+            for sid in expired:
+                del self.sessions[sid]
+        for sid in expired:
+            self._remove_files(sid)
+        if expired:
+            print(f"[Jobs] 🧹 {self.kind}: {len(expired)} sessioni scadute rimosse")
+        return len(expired)
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        if self in _stores:
+            _stores.remove(self)
+
+
+def _json_default(obj):
+    if hasattr(obj, "item"):        # scalari numpy
+        return obj.item()
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    return str(obj)
+
+
+def _sse(event, data, seq):
+    return f"id: {seq}\nevent: {event}\ndata: {json.dumps(data, default=_json_default)}\n\n"
+
+
+def _sweep_loop():
+    while True:
+        time.sleep(JOBS_SWEEP_INTERVAL)
+        for store in list(_stores):
+            try:
+                store.evict_expired()
+            except Exception as e:
+                print(f"[Jobs] ⚠️ Eviction {store.kind} fallita: {e}")
+
+
+def _start_sweeper():
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep_loop, name="job-sweeper", daemon=True)
+            _sweeper.start()
@@ -1,18 +1,91 @@
 # logger.py
+#
+# log(message, file=...) non scrive più nulla sul thread chiamante: formatta le righe,
+# le aggiunge al ring buffer in memoria (logs) e le mette in una coda limitata.
+# Un thread di background svuota la coda a blocchi: stampa a colori e scrive su file
+# (handle tenuti aperti, un flush per blocco) con rotazione per dimensione e per giorno.
+# Coda piena → la riga va solo nel ring buffer e viene contata in dropped (mai bloccare
+# i thread di polling).
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 from decimal import Decimal
+from collections import deque
+import atexit
 import json
+import os
+import queue
+import threading
 from pprint import pformat
 import time
+import uuid
 import sys
 import io
 import re
 
+LOG_BUFFER_LINES = int(os.getenv("LOG_BUFFER_LINES", 5000))     # righe tenute in memoria
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", 20000))          # righe in attesa del writer
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 0.2))
+LOG_BATCH = int(os.getenv("LOG_BATCH", 1000))                   # righe al massimo per flush
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 20 * 1024 * 1024))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", 5))                  # file ruotati tenuti (file.1 ... file.N)
+LOG_ROTATE_DAILY = os.getenv("LOG_ROTATE_DAILY", "1") not in ("0", "false", "False")
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "1") not in ("0", "false", "False")
+
+
+class LogBuffer:
+    """Ring buffer delle ultime righe di log con numero di sequenza crescente."""
+
+    def __init__(self, capacity):
+        self._lines = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.seq = 0            # sequenza dell'ultima riga aggiunta
+        self.epoch = uuid.uuid4().hex[:12]  # id del buffer: cambia quando le sequenze ripartono da 1
+
+    def append(self, line):
+        with self._lock:
+            self.seq += 1
+            self._lines.append((self.seq, line))
+            return self.seq
+
+    def since(self, seq):
+        """Righe con sequenza > seq ancora nel buffer."""
+        return [line for _, line in self.entries(seq)]
+
+    def entries(self, since=0, limit=None):
+        """(sequenza, riga) con sequenza > since ancora nel buffer, al più limit."""
+        with self._lock:
+            if not self._lines or self._lines[-1][0] <= since:
+                return []
+            first = self._lines[0][0]
+            start = max(0, since - first + 1)
+            stop = len(self._lines) if limit is None else min(len(self._lines), start + limit)
+            return [self._lines[i] for i in range(start, stop)]
+
+    @property
+    def first_seq(self):
+        """Sequenza della riga più vecchia ancora nel buffer (seq + 1 se vuoto)."""
+        with self._lock:
+            return self._lines[0][0] if self._lines else self.seq + 1
+
+    def __iter__(self):
+        with self._lock:
+            return iter([line for _, line in self._lines])
+
+    def __len__(self):
+        return len(self._lines)
+
+    def clear(self):
+        with self._lock:
+            self._lines.clear()
 
 
 start_time = datetime.now()
-logs = []  # lista globale dei log
+logs = LogBuffer(LOG_BUFFER_LINES)  # ultime righe di log (ring buffer)
+
+_queue = queue.Queue(maxsize=LOG_QUEUE_MAX)
+_writer = None
+_writer_lock = threading.Lock()
+_stats = {"written": 0, "dropped": 0, "rotations": 0, "batches": 0}
 
 # ── ANSI colori ──
 YELLOW = "\033[93m"
@@ -47,6 +120,19 @@ def colorize_signal(text: str) -> str:
     )
 
 
+_ROME = ZoneInfo("Europe/Rome")
+_ts_cache = (None, "")
+
+
+def _timestamp():
+    """Timestamp al minuto, ricalcolato una volta per minuto."""
+    global _ts_cache
+    minute = int(time.time() // 60)
+    if _ts_cache[0] != minute:
+        _ts_cache = (minute, datetime.now(_ROME).strftime("[%d/%m/%Y %H:%M]"))
+    return _ts_cache[1]
+
+
 def log(message, file="server_log.txt"):
     global logs
 
@@ -70,23 +156,153 @@ def log(message, file="server_log.txt"):
     # timestamp = f"[+{elapsed:.1f}s]"
 
     # 📅 timestamp stile italiano SENZA secondi
-    timestamp = datetime.now(ZoneInfo("Europe/Rome")).strftime("[%d/%m/%Y %H:%M]")
+    timestamp = _timestamp()
 
 
+    _start_writer()
     for line in message.splitlines():
         line_to_print = f"{timestamp} {line}"
-        # 1. Salva in memoriaa
+        # 1. Salva in memoria (ring buffer)
         logs.append(line_to_print)
-        # 2. Stampa a video con colori ANSI
-        colored = colorize_signal(line_to_print)
-        print(colored, flush=True)
-        # 3. SCRIVI SU FILE (SEMPRE SENZA COLORI)
-        with open(file, "a", encoding="utf-8") as f:
-            f.write(line_to_print + "\n")
+        # 2. Console e file: al writer di background
+        try:
+            _queue.put_nowait((file, line_to_print))
+        except queue.Full:
+            _stats["dropped"] += 1
+
+
+# ─────────────────────── WRITER ───────────────────────
+
+class _LogFile:
+    """File di log tenuto aperto, con rotazione per dimensione e cambio di giorno."""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+        self.size = 0
+        self.day = None
+
+    def _open(self):
+        self.f = open(self.path, "a", encoding="utf-8")
+        self.size = self.f.tell()
+        try:
+            self.day = datetime.fromtimestamp(os.path.getmtime(self.path)).date() if self.size else datetime.now().date()
+        except OSError:
+            self.day = datetime.now().date()
+
+    def write(self, text):
+        if self.f is None:
+            self._open()
+        if self.size and (self.size + len(text) > LOG_MAX_BYTES or (LOG_ROTATE_DAILY and datetime.now().date() != self.day)):
+            self.rotate()
+        self.f.write(text)
+        self.size += len(text.encode("utf-8"))
+
+    def rotate(self):
+        self.close()
+        for i in range(LOG_BACKUPS - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if LOG_BACKUPS > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        _stats["rotations"] += 1
+        self._open()
+
+    def flush(self):
+        if self.f is not None:
+            self.f.flush()
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+_files = {}     # path → _LogFile (usato solo dal thread writer)
+
+
+def _write_batch(batch):
+    by_file = {}
+    for file, line in batch:
+        by_file.setdefault(file, []).append(line)
+    if LOG_CONSOLE:
+        print("\n".join(colorize_signal(line) for _, line in batch), flush=True)
+    for file, lines in by_file.items():
+        try:
+            out = _files.get(file)
+            if out is None:
+                out = _files[file] = _LogFile(file)
+            out.write("\n".join(lines) + "\n")
+            out.flush()
+        except Exception as e:
+            print(f"[Logger] ⚠️ Scrittura su {file} fallita: {e}", file=sys.stderr)
+    _stats["written"] += len(batch)
+    _stats["batches"] += 1
+
+
+def _writer_loop():
+    while True:
+        try:
+            item = _queue.get(timeout=LOG_FLUSH_INTERVAL)
+        except queue.Empty:
+            continue
+        batch, done = [], []
+        while item is not None:
+            if isinstance(item, threading.Event):
+                done.append(item)       # richiesta di flush: completata dopo questo blocco
+            else:
+                batch.append(item)
+            if len(batch) >= LOG_BATCH:
+                break
+            try:
+                item = _queue.get_nowait()
+            except queue.Empty:
+                break
+        if batch:
+            _write_batch(batch)
+        for ev in done:
+            ev.set()
+
+
+def _start_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_writer_loop, name="log-writer", daemon=True)
+            _writer.start()
+
+
+def flush(timeout=5.0):
+    """Attende che il writer abbia scritto le righe accodate finora."""
+    if _writer is None:
+        return True
+    ev = threading.Event()
+    try:
+        _queue.put(ev, timeout=timeout)
+    except queue.Full:
+        return False
+    return ev.wait(timeout)
+
+
+def log_stats():
+    return {**_stats, "queued": _queue.qsize(), "buffered": len(logs), "seq": logs.seq}
+
+
+@atexit.register
+def _close():
+    flush(2.0)
+    for out in list(_files.values()):
+        out.close()
 
 
 import requests
 
+from agent_client import agent_get, agent_post
+
 class FakeResponse:
     def __init__(self, status_code=500, json_data=None, error_msg="Errore di rete"):
         self.status_code = status_code
@@ -104,7 +320,7 @@ class FakeResponse:
 
 def safe_get(url, timeout=3):
     try:
-        return requests.get(url, timeout=timeout)
+        return agent_get(url, timeout=timeout)
     except requests.exceptions.ConnectionError:
         log(f"❌ Connessione fallita verso {url}")
         return FakeResponse(status_code=503, error_msg=f"Connessione fallita verso {url}")
@@ -118,7 +334,7 @@ def safe_get(url, timeout=3):
 
 def safe_post(url, json=None, timeout=3):
     try:
-        return requests.post(url, json=json, timeout=timeout)
+        return agent_post(url, json=json, timeout=timeout)
     except requests.exceptions.ConnectionError:
         log(f"❌ Connessione fallita verso {url}")
         return FakeResponse(status_code=503, error_msg=f"Connessione fallita verso {url}")
@@ -3,9 +3,10 @@ import logging
 import os
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.exceptions import RequestValidationError
 from dotenv import load_dotenv
+import metrics
 
 # i files a cui punta il main: db.py, mt5_routes.py
 from db import router as db_router
@@ -91,6 +92,12 @@ async def global_exception_handler(request: Request, exc: Exception):
 def root():
     return {"status": "running", "message": "MT5 Manager API active"}
 
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Metriche del motore di polling in formato testo Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # --- RUN SERVER ---
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,175 @@
+# --- METRICS: contatori e istogrammi del motore di polling, formato Prometheus ---
+#
+# STAGE_SECONDS.observe(secondi, "get_data")          # istogramma con label
+# with STAGE_SECONDS.time("positions"): ...           # stesso, cronometrato
+# TICKS_SKIPPED.inc("market_closed")                  # contatore con label
+# render()                                            # testo per GET /metrics
+#
+# Costo sul tick: un perf_counter, un bisect e qualche incremento sotto un lock
+# per metrica (niente allocazioni oltre alla prima serie di ogni combinazione di label).
+# register_collector(fn) aggiunge metriche calcolate al momento della lettura
+# (fn ritorna righe già in formato Prometheus), es. le statistiche dello scheduler.
+import threading
+import time
+from bisect import bisect_left
+
+# secondi: dal ms delle chiamate in cache ai 30 s dei timeout HTTP
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def remove(self, *labelvalues):
+        """Elimina la serie (es. trader fermato)."""
+        with self._lock:
+            self._series.pop(tuple(map(str, labelvalues)), None)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, n=1):
+        key = tuple(map(str, labelvalues))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + n
+
+    def value(self, *labelvalues):
+        with self._lock:
+            return self._series.get(tuple(map(str, labelvalues)), 0)
+
+    def render(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        return self.header() + [f"{self.name}{_labels(self.labels, k)} {_num(v)}" for k, v in series]
+
+
+class _Timer:
+    __slots__ = ("hist", "labelvalues", "t0")
+
+    def __init__(self, hist, labelvalues):
+        self.hist = hist
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.hist.observe(time.perf_counter() - self.t0, *self.labelvalues)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labelvalues):
+        key = tuple(map(str, labelvalues))
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labelvalues):
+        return _Timer(self, labelvalues)
+
+    def snapshot(self, *labelvalues):
+        """(conteggi per bucket non cumulativi, somma, conteggio) della serie."""
+        with self._lock:
+            series = self._series.get(tuple(map(str, labelvalues)))
+            return (list(series[0]), series[1], series[2]) if series else None
+
+    def render(self):
+        with self._lock:
+            series = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        lines = self.header()
+        for key, (counts, total, count) in series:
+            acc = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le = 'le="%s"' % _num(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {acc}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_num(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+def register_collector(fn):
+    """fn() → lista di righe Prometheus (HELP/TYPE inclusi), chiamata a ogni render()."""
+    with _registry_lock:
+        if fn not in _collectors:
+            _collectors.append(fn)
+    return fn
+
+
+def render():
+    with _registry_lock:
+        metrics = list(_registry)
+        collectors = list(_collectors)
+    lines = []
+    for m in metrics:
+        lines.extend(m.render())
+    for fn in collectors:
+        try:
+            lines.extend(fn())
+        except Exception as e:
+            lines.append(f"# collector {getattr(fn, '__name__', fn)} fallito: {_escape(e)}")
+    return "\n".join(lines) + "\n"
+
+
+# ─────────────────────── METRICHE DEL POLLING ───────────────────────
+
+STAGE_SECONDS = Histogram(
+    "polling_stage_seconds", "Latenza degli stadi del tick di polling (tick_bundle, get_data, indicators, send_order, close_position)",
+    ("stage",),
+)
+TICK_SECONDS = Histogram("polling_tick_seconds", "Durata di SignalStrategy.run per trader", ("trader",))
+TICKS_SKIPPED = Counter("polling_ticks_skipped_total", "Tick terminati senza decisione, per motivo", ("reason",))
+SIGNALS = Counter("polling_signals_total", "Segnali calcolati dai tick completi", ("signal",))
+AGENT_SECONDS = Histogram("agent_request_seconds", "Latenza delle chiamate HTTP verso gli agent MT5", ("endpoint",))
+AGENT_ERRORS = Counter("agent_http_errors_total", "Errori HTTP verso gli agent MT5 (status >= 400 o eccezione)", ("endpoint", "error"))
@@ -8,9 +8,11 @@ import MetaTrader5 as mt5
 # importante! gira solo in Windows !
 import concurrent
 import subprocess
+import numpy as np
 import pandas as pd
+import base64
 import json
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from pydantic import BaseModel
 import sys
 import uvicorn
@@ -169,7 +171,8 @@ def health_check():
     """
     Health check endpoint:
     - Controlla se MT5 è inizializzato
-    - Restituisce stato OK o errore
+    - Restituisce stato OK o errore, con l'account loggato (login/server, None se
+      nessuno) e la connessione al trade server: il manager rifà il login solo se cambiano
     """
     try:
         info = mt5.terminal_info()
@@ -180,7 +183,14 @@ def health_check():
         version = mt5.version()
         version_str = ".".join(map(str, version))  # converte in stringa tipo "5.00.1234.0"
 
-        return {"status": "ok", "mt5_version": version_str}
+        account = mt5.account_info()
+        return {
+            "status": "ok",
+            "mt5_version": version_str,
+            "login": account.login if account else None,
+            "server": account.server if account else None,
+            "connected": bool(info.connected),
+        }
     except Exception as e:
         log("Errore INIT:", mt5.last_error())
         return {"status": "error", "message": str(e)}
@@ -711,8 +721,35 @@ from fastapi import Body
 
 # ... (restante codice)
 
+# Trasporto binario delle candele: con "Accept: application/x-mt5-rates" si
+# rispondono i byte grezzi dello structured array di MT5 (dtype nell'header
+# X-Rates-Dtype), senza DataFrame né JSON. Senza header: JSON come prima.
+RATES_MEDIA_TYPE = "application/x-mt5-rates"
+
+
+def _rates_response(request: Request, rates):
+    if rates is None or len(rates) == 0:
+        return {"rates": []}
+
+    if RATES_MEDIA_TYPE in request.headers.get("accept", ""):
+        rates = np.ascontiguousarray(rates)
+        return Response(
+            content=rates.tobytes(),
+            media_type=RATES_MEDIA_TYPE,
+            headers={
+                "X-Rates-Dtype": json.dumps(rates.dtype.descr),
+                "X-Rates-Count": str(len(rates)),
+            },
+        )
+
+    # Trasforma in DataFrame (gestisce automaticamente i tipi numpy)
+    df = pd.DataFrame(rates)
+    # .to_json() con orient="records" converte correttamente numpy.int64 in int e float64 in float
+    return {"rates": json.loads(df.to_json(orient="records"))}
+
+
 @app.post("/get_rates")
-def get_rates(payload: dict = Body(...)):
+def get_rates(request: Request, payload: dict = Body(...)):
     """
     Ritorna i dati storici (candele) per un simbolo e timeframe specifici.
     Payload: {"symbol": "EURUSD", "timeframe": 15, "n_candles": 100}
@@ -728,21 +765,12 @@ def get_rates(payload: dict = Body(...)):
     # 1. Recupero dati da MT5
     rates = mt5.copy_rates_from_pos(symbol, timeframe, start_pos, n_candles)
 
-    if rates is None or len(rates) == 0:
-        return {"rates": []}
-
-    # 2. Trasforma in DataFrame (gestisce automaticamente i tipi numpy)
-    df = pd.DataFrame(rates)
-
-    # 3. Converte il DataFrame in una lista di dizionari con tipi Python standard
-    # .to_json() con orient="records" converte correttamente numpy.int64 in int e float64 in float
-    rates_list = json.loads(df.to_json(orient="records"))
-
-    return {"rates": rates_list}
+    # 2. Binario o JSON a seconda dell'header Accept
+    return _rates_response(request, rates)
 
 
 @app.post("/get_rates_range")
-def get_rates_range(payload: dict = Body(...)):
+def get_rates_range(request: Request, payload: dict = Body(...)):
     """
     Ritorna dati storici in un range di date.
     Payload: {"symbol": "XAUUSD", "timeframe": 1, "date_from": "2025-01-01", "date_to": "2025-07-01"}
@@ -760,13 +788,53 @@ def get_rates_range(payload: dict = Body(...)):
 
     rates = mt5.copy_rates_range(symbol, timeframe, dt_from, dt_to)
 
+    return _rates_response(request, rates)
+
+
+def _rates_item(rates, binary):
+    """Candele di una richiesta del bundle: byte grezzi in base64 (binary) o record JSON."""
     if rates is None or len(rates) == 0:
         return {"rates": []}
+    if binary:
+        rates = np.ascontiguousarray(rates)
+        return {
+            "dtype": rates.dtype.descr,
+            "count": len(rates),
+            "data": base64.b64encode(rates.tobytes()).decode("ascii"),
+        }
+    return {"rates": json.loads(pd.DataFrame(rates).to_json(orient="records"))}
 
-    df = pd.DataFrame(rates)
-    rates_list = json.loads(df.to_json(orient="records"))
 
-    return {"rates": rates_list}
+@app.post("/tick_bundle")
+def tick_bundle(payload: dict = Body(...)):
+    """
+    Tutto quello che serve a un tick di polling in una sola chiamata.
+    Payload: {"symbol": "XAUUSD",
+              "rates": [{"timeframe": 1, "n_candles": 100}, {"timeframe": 15, "n_candles": 300}],
+              "positions": true, "tick": true, "symbol_info": true, "binary": true}
+    Ogni richiesta di rates può avere un suo "symbol" e "start_pos". La risposta ha
+    "rates" nello stesso ordine delle richieste (un errore non blocca le altre) e solo
+    le chiavi positions / tick / symbol_info richieste, con lo stesso formato degli
+    endpoint singoli.
+    """
+    symbol = payload.get("symbol")
+    binary = bool(payload.get("binary"))
+    out = {"rates": []}
+    for req in payload.get("rates", []):
+        sym = req.get("symbol", symbol)
+        timeframe = req.get("timeframe")
+        if not sym or timeframe is None:
+            out["rates"].append({"error": "Missing symbol or timeframe"})
+            continue
+        rates = mt5.copy_rates_from_pos(sym, timeframe, req.get("start_pos", 0), req.get("n_candles", 100))
+        out["rates"].append(_rates_item(rates, binary))
+    if payload.get("positions"):
+        out["positions"] = get_positions()
+    if payload.get("tick") and symbol:
+        out["tick"] = get_symbol_tick(symbol)
+    if payload.get("symbol_info") and symbol:
+        out["symbol_info"] = get_symbol_info(symbol)
+    return out
 
 
 # -----------------------
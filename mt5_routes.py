@@ -2,6 +2,8 @@ from datetime import datetime
 from pydantic import BaseModel
 import requests
 from logger import  logs
+from agent_client import agent_post
+from agent_sessions import note_login
 from fastapi import APIRouter, HTTPException, Request
 from models import (
     LoginRequest, LoginResponse, BuyRequest, SellRequest, CloseRequest,
@@ -16,7 +18,7 @@ router = APIRouter()
 async def manager_check_server(payload: dict):
     agent_url = f"http://{payload['host']}:{payload['port']}/check-server"
     try:
-        r = requests.post(agent_url, json={}, timeout=5)
+        r = agent_post(agent_url, json={}, timeout=5)
         return r.json()
     except requests.exceptions.ConnectionError:
         return {"connected": False, "error": "Connessione rifiutata — agente MT5 non raggiungibile"}
@@ -41,7 +43,6 @@ async def start_server(server: ServerRequest):
     """
     Ordina all'agente remoto di avviare MT5 e lo inizializza.
     """
-    import requests
     from fastapi import HTTPException
 
     # MAX_WAIT = 90  # secondi massimi di attesa
@@ -75,23 +76,24 @@ async def start_server(server: ServerRequest):
 
     try:
         # 1️⃣ Avvia MT5 tramite agente (che è già avviato)
-        response = requests.post(agent_url_start, json=payload_start, timeout=120)
+        response = agent_post(agent_url_start, json=payload_start, timeout=120)
         if response.status_code != 200:
             raise HTTPException(status_code=500, detail=f"Errore avvio MT5 agente: {response.text}")
         print(f"✅ MT5 avviato sul server remoto: {response.json()}")
 
         
         # 2️⃣ Inizializza MT5 (tramite agente già avviato)
-        response_init = requests.post(agent_url_init, json=payload_init, timeout=30)
+        response_init = agent_post(agent_url_init, json=payload_init, timeout=30)
         if response_init.status_code != 200:
             raise HTTPException(status_code=500, detail=f"Errore init MT5 agente: {response_init.text}")
         print(f"✅ MT5 inizializzato sul server remoto: {response_init.json()}")
 
         # 3️⃣ Login MT5 ()
-        response_login = requests.post(agent_url_login, json=payload_login, timeout=30)
+        response_login = agent_post(agent_url_login, json=payload_login, timeout=30)
         if response_login.status_code != 200:
             raise HTTPException(status_code=500, detail=f"Errore login MT5: {response_login.text}")
         print(f"🔐 Login MT5 effettuato: {response_login.json()}")
+        note_login(f"http://{server.ip}:{server.port}", server.user, server.server)
 
 
         return {
@@ -0,0 +1,237 @@
+# --- POLLING SCHEDULER: un solo thread di scheduling per tutti i trader ---
+#
+# Sostituisce le catene di threading.Timer (un thread nuovo per trader a ogni
+# intervallo). Un heap ordinato per scadenza decide quando eseguire ogni job;
+# l'esecuzione avviene in un pool di worker limitato (POLLING_WORKERS).
+#
+# - cadenza fissa (niente drift): la prossima scadenza è la precedente + intervallo
+# - phase spreading: i job con lo stesso intervallo partono sfasati (hash della chiave)
+# - un job non si sovrappone mai a sé stesso: viene rimesso nell'heap solo a fine
+#   esecuzione; se è durato più dell'intervallo i tick persi sono saltati (overrun)
+# - una chiave, un tick alla volta: se schedule() sostituisce un job il cui tick è
+#   ancora in corso (restart di un trader), il job nuovo entra nell'heap solo a fine tick
+# - metriche: deadline mancate, ritardo di avvio, durata dei tick
+import heapq
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from logger import log as global_log
+from metrics import register_collector
+
+POLLING_WORKERS = int(os.getenv("POLLING_WORKERS", 16))
+LATE_TOLERANCE = 0.5        # sec di ritardo oltre i quali un tick conta come deadline mancata
+LATENCY_SAMPLES = 500       # campioni recenti per le percentili
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class PollingJob:
+    """Handle di un job periodico. cancel() ha la stessa semantica di threading.Timer."""
+
+    def __init__(self, scheduler, key, fn, interval):
+        self.scheduler = scheduler
+        self.key = key
+        self.fn = fn
+        self.interval = float(interval)
+        self.due = 0.0
+        self.running = False
+        self.cancelled = False
+        self.successor = None       # job che lo sostituisce, in attesa della fine del tick in corso
+        self.ticks = 0
+        self.missed = 0
+        self.overruns = 0
+        self.last_duration = None
+        self.durations = deque(maxlen=100)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def stats(self):
+        durs = list(self.durations)
+        return {
+            "interval": self.interval,
+            "ticks": self.ticks,
+            "missed_deadlines": self.missed,
+            "overruns": self.overruns,
+            "running": self.running,
+            "last_duration_ms": round(self.last_duration * 1000, 1) if self.last_duration is not None else None,
+            "p95_duration_ms": round(_percentile(durs, 0.95) * 1000, 1) if durs else None,
+        }
+
+
+class PollingScheduler:
+    def __init__(self, max_workers=POLLING_WORKERS):
+        self.max_workers = max_workers
+        self._heap = []
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="polling")
+        self._thread = threading.Thread(target=self._loop, name="polling-scheduler", daemon=True)
+        self._jobs = {}
+        self._running = {}          # chiave → job con un tick in esecuzione
+        self._lateness = deque(maxlen=LATENCY_SAMPLES)
+        self._durations = deque(maxlen=LATENCY_SAMPLES)
+        self._totals = {"ticks": 0, "missed_deadlines": 0, "overruns": 0, "errors": 0}
+        self._thread.start()
+
+    # ── API ──
+
+    def schedule(self, key, fn, interval, first_delay=None):
+        """
+        Esegue fn() ogni `interval` secondi finché il job non viene cancellato.
+        Se first_delay è None il primo tick è sfasato in [0, interval) in base
+        alla chiave, così i trader con lo stesso intervallo non partono insieme.
+        Un job già registrato con la stessa chiave viene cancellato; se ha un tick
+        in corso, il nuovo parte solo dopo (mai due fn() della stessa chiave insieme).
+        """
+        job = PollingJob(self, key, fn, interval)
+        if first_delay is None:
+            first_delay = (zlib.crc32(str(key).encode()) % 1000) / 1000.0 * job.interval
+        with self._cond:
+            old = self._jobs.get(key)
+            if old is not None:
+                old.cancel()
+            self._jobs[key] = job
+            job.due = time.monotonic() + first_delay
+            busy = self._running.get(key)
+            if busy is not None:
+                busy.successor = job
+            else:
+                self._push(job)
+        return job
+
+    def stats(self):
+        with self._cond:
+            jobs = {str(k): j.stats() for k, j in self._jobs.items() if not j.cancelled}
+            lateness = list(self._lateness)
+            durations = list(self._durations)
+            totals = dict(self._totals)
+        return {
+            **totals,
+            "workers": self.max_workers,
+            "jobs": len(jobs),
+            "lateness_p50_ms": round(_percentile(lateness, 0.5) * 1000, 1) if lateness else None,
+            "lateness_max_ms": round(max(lateness) * 1000, 1) if lateness else None,
+            "tick_p50_ms": round(_percentile(durations, 0.5) * 1000, 1) if durations else None,
+            "tick_p95_ms": round(_percentile(durations, 0.95) * 1000, 1) if durations else None,
+            "per_job": jobs,
+        }
+
+    # ── interni ──
+
+    def _push(self, job):
+        self._seq += 1
+        heapq.heappush(self._heap, (job.due, self._seq, job))
+        self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                due, _, job = self._heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(timeout=delay)
+                    continue
+                heapq.heappop(self._heap)
+
+                if job.cancelled:
+                    if self._jobs.get(job.key) is job:
+                        del self._jobs[job.key]
+                    continue
+
+                job.running = True
+                self._running[job.key] = job
+
+            try:
+                self._pool.submit(self._run, job, due)
+            except RuntimeError:
+                # pool chiuso (shutdown dell'interprete): lo scheduler termina
+                return
+
+    def _run(self, job, due):
+        start = time.monotonic()
+        lateness = start - due
+        try:
+            job.fn()
+        except Exception as e:
+            global_log(f"❌ Polling job {job.key}: {e}")
+            with self._cond:
+                self._totals["errors"] += 1
+        end = time.monotonic()
+
+        with self._cond:
+            job.running = False
+            if self._running.get(job.key) is job:
+                del self._running[job.key]
+            successor, job.successor = job.successor, None
+            if successor is not None:
+                if not successor.cancelled:
+                    self._push(successor)
+                elif self._jobs.get(successor.key) is successor:
+                    del self._jobs[successor.key]
+            job.ticks += 1
+            job.last_duration = end - start
+            job.durations.append(end - start)
+            self._totals["ticks"] += 1
+            self._lateness.append(lateness)
+            self._durations.append(end - start)
+            if lateness > LATE_TOLERANCE:
+                job.missed += 1
+                self._totals["missed_deadlines"] += 1
+
+            if job.cancelled:
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
+                return
+
+            # cadenza fissa: se siamo rimasti indietro si saltano i tick persi
+            job.due = due + job.interval
+            if job.due < end:
+                skipped = int((end - job.due) // job.interval) + 1
+                job.due += skipped * job.interval
+                job.missed += skipped
+                job.overruns += 1
+                self._totals["missed_deadlines"] += skipped
+                self._totals["overruns"] += 1
+            self._push(job)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = PollingScheduler()
+        return _scheduler
+
+
+@register_collector
+def _scheduler_metrics():
+    """Totali dello scheduler per /metrics (vuoto finché il polling non è mai partito)."""
+    if _scheduler is None:
+        return []
+    with _scheduler._cond:
+        totals = dict(_scheduler._totals)
+        jobs = sum(1 for j in _scheduler._jobs.values() if not j.cancelled)
+    lines = []
+    for key, help in (("ticks", "Tick eseguiti"), ("missed_deadlines", "Tick partiti in ritardo o saltati"),
+                      ("overruns", "Tick durati più dell'intervallo"), ("errors", "Tick terminati con eccezione")):
+        name = f"polling_scheduler_{key}_total"
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} counter", f"{name} {totals[key]}"]
+    lines += ["# HELP polling_scheduler_jobs Trader in polling", "# TYPE polling_scheduler_jobs gauge", f"polling_scheduler_jobs {jobs}"]
+    return lines
@@ -0,0 +1,80 @@
+# --- RATES CODEC: trasporto binario delle candele agent → manager ---
+#
+# /get_rates e /get_rates_range dell'agent rispondono in binario se la richiesta
+# ha "Accept: application/x-mt5-rates": il corpo sono i byte grezzi dello
+# structured array di MT5, il dtype viaggia nell'header X-Rates-Dtype (JSON di
+# dtype.descr) e il numero di barre in X-Rates-Count. Il client decodifica con
+# np.frombuffer, senza passare da liste di dict.
+# Un agent vecchio ignora l'header e risponde in JSON: decode_rates gestisce
+# entrambi i formati. Nelle voci "rates" di /tick_bundle gli stessi byte viaggiano
+# in base64 dentro il JSON (decode_bundle_rates).
+import base64
+import json
+
+import numpy as np
+import pandas as pd
+
+RATES_MEDIA_TYPE = "application/x-mt5-rates"
+RATES_ACCEPT = f"{RATES_MEDIA_TYPE}, application/json;q=0.5"
+
+# dtype usato dal backtester
+BAR_DTYPE = np.dtype([
+    ("time", "i8"), ("open", "f8"), ("high", "f8"),
+    ("low", "f8"), ("close", "f8"), ("tick_volume", "i8"),
+])
+
+
+def decode_rates(resp):
+    """
+    Risposta di /get_rates o /get_rates_range → structured array con i campi
+    dell'agent (time, open, high, low, close, tick_volume, spread, real_volume).
+    In binario l'array è una vista read-only sul corpo della risposta.
+    Ritorna None se non ci sono barre.
+    """
+    ctype = resp.headers.get("content-type", "")
+    if ctype.startswith(RATES_MEDIA_TYPE):
+        descr = json.loads(resp.headers["X-Rates-Dtype"])
+        dtype = np.dtype([tuple(field) for field in descr])
+        body = resp.content
+        count = int(resp.headers.get("X-Rates-Count", len(body) // dtype.itemsize))
+        if len(body) != count * dtype.itemsize:
+            raise ValueError(f"Risposta rates troncata: {len(body)} byte, attesi {count * dtype.itemsize}")
+        if count == 0:
+            return None
+        return np.frombuffer(body, dtype=dtype, count=count)
+
+    rates = resp.json().get("rates", [])
+    if not rates:
+        return None
+    return pd.DataFrame(rates).to_records(index=False)
+
+
+def decode_bundle_rates(item):
+    """
+    Voce di "rates" della risposta di /tick_bundle → structured array come decode_rates
+    (None se non ci sono barre). Solleva ValueError se l'agent ha segnalato un errore.
+    """
+    if "error" in item:
+        raise ValueError(item["error"])
+    if "data" in item:
+        dtype = np.dtype([tuple(field) for field in item["dtype"]])
+        body = base64.b64decode(item["data"])
+        count = int(item.get("count", len(body) // dtype.itemsize))
+        if len(body) != count * dtype.itemsize:
+            raise ValueError(f"Voce rates troncata: {len(body)} byte, attesi {count * dtype.itemsize}")
+        if count == 0:
+            return None
+        return np.frombuffer(body, dtype=dtype, count=count)
+    rates = item.get("rates", [])
+    if not rates:
+        return None
+    return pd.DataFrame(rates).to_records(index=False)
+
+
+def to_bar_array(rates):
+    """Copia colonna per colonna nei campi di BAR_DTYPE (0 per i campi mancanti)."""
+    out = np.empty(len(rates), dtype=BAR_DTYPE)
+    names = rates.dtype.names
+    for name in BAR_DTYPE.names:
+        out[name] = rates[name] if name in names else 0
+    return out
@@ -0,0 +1,131 @@
+# --- RESEARCH POOL: esecuzione parallela delle griglie di signal research ---
+#
+# with ResearchPool(dataset) as pool:
+#     results = pool.map(fn, tasks, progress=..., cancel=...)
+#
+# - fn(dataset, task) è una funzione top-level (deve essere importabile dai
+#   processi figli); results ha lo stesso ordine di tasks, qualunque sia
+#   l'ordine di completamento. Un task che solleva un'eccezione restituisce
+#   l'eccezione al suo posto, senza fermare gli altri.
+# - executor "process": ProcessPoolExecutor con contesto spawn (stesso
+#   comportamento su Windows e Linux, niente fork di un processo con thread
+#   attivi); il dataset arriva ai worker una volta sola, nell'initializer, e
+#   i task viaggiano a blocchi di chunk_size. Se il dataset è un DatasetHandle
+#   (shared_dataset.publish) i worker si agganciano al blocco condiviso senza copie.
+# - executor "serial": stessi task nel thread chiamante (debug, macchine a un core).
+# - progress(done, total) viene chiamato nel thread chiamante a ogni blocco
+#   completato; se cancel() diventa True i blocchi non ancora partiti vengono
+#   annullati e map solleva InterruptedError.
+import math
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from shared_dataset import DatasetHandle, attach
+
+RESEARCH_EXECUTOR = os.getenv("RESEARCH_EXECUTOR", "process")      # "process" | "serial"
+RESEARCH_WORKERS = int(os.getenv("RESEARCH_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+RESEARCH_CHUNK = int(os.getenv("RESEARCH_CHUNK", 64))               # task massimi per blocco
+CANCEL_POLL = 0.5                                                   # sec tra due controlli di cancel()
+
+_DATASET = None     # dataset del worker (impostato dall'initializer)
+
+
+def _init_worker(dataset):
+    global _DATASET
+    _DATASET = attach(dataset) if isinstance(dataset, DatasetHandle) else dataset
+
+
+def _run_chunk(fn, start, tasks, dataset=None):
+    """Esegue un blocco di task; ritorna (indice del primo task, risultati)."""
+    if dataset is None:
+        dataset = _DATASET
+    results = []
+    for task in tasks:
+        try:
+            results.append(fn(dataset, task))
+        except Exception as e:
+            results.append(e)
+    return start, results
+
+
+class ResearchPool:
+    def __init__(self, dataset, executor=None, workers=None):
+        self.dataset = dataset
+        self.executor = executor or RESEARCH_EXECUTOR
+        self.workers = max(1, workers or RESEARCH_WORKERS)
+        self._pool = None
+        if self.executor == "process" and self.workers > 1:
+            try:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(dataset,),
+                )
+            except Exception as e:
+                print(f"[ResearchPool] ⚠️ Pool di processi non disponibile ({e}), esecuzione seriale")
+                self._pool = None
+        if self._pool is None and isinstance(dataset, DatasetHandle):
+            self.dataset = attach(dataset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        # wait=True: i worker devono aver finito (e staccato il dataset condiviso)
+        # prima che la sessione faccia release del blocco
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def _chunk_size(self, n_tasks, chunk_size):
+        if chunk_size:
+            return max(1, chunk_size)
+        return max(1, min(RESEARCH_CHUNK, math.ceil(n_tasks / (self.workers * 4))))
+
+    def map(self, fn, tasks, progress=None, cancel=None, chunk_size=None, on_result=None):
+        """Risultati nell'ordine dei task; on_result(start, risultati) per ogni chunk completato (risultati parziali)."""
+        tasks = list(tasks)
+        total = len(tasks)
+        results = [None] * total
+        if total == 0:
+            return results
+        size = self._chunk_size(total, chunk_size)
+        chunks = [(i, tasks[i:i + size]) for i in range(0, total, size)]
+        done = 0
+
+        if self._pool is None:
+            for start, chunk in chunks:
+                if cancel and cancel():
+                    raise InterruptedError("Ricerca annullata")
+                _, res = _run_chunk(fn, start, chunk, self.dataset)
+                results[start:start + len(res)] = res
+                done += len(res)
+                if on_result:
+                    on_result(start, res)
+                if progress:
+                    progress(done, total)
+            return results
+
+        pending = {self._pool.submit(_run_chunk, fn, start, chunk) for start, chunk in chunks}
+        try:
+            while pending:
+                finished, pending = wait(pending, timeout=CANCEL_POLL, return_when=FIRST_COMPLETED)
+                if cancel and cancel():
+                    raise InterruptedError("Ricerca annullata")
+                for fut in finished:
+                    start, res = fut.result()
+                    results[start:start + len(res)] = res
+                    done += len(res)
+                    if on_result:
+                        on_result(start, res)
+                if finished and progress:
+                    progress(done, total)
+        finally:
+            for fut in pending:
+                fut.cancel()
+        return results
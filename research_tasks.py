@@ -0,0 +1,247 @@
+# --- RESEARCH TASKS: task dei worker di ResearchPool (signal research, auto/agent discover) ---
+#
+# with ResearchPool(generic_dataset(df_is, cache_is, df_oos, cache_oos, **params)) as pool:
+#     metrics = pool.map(auto_is_task, combos)
+#
+# I worker spawn di research_pool importano questo modulo per trovare i task: qui
+# niente router FastAPI né db (JobStore, sweeper, pool MySQL, client OpenAI restano
+# nel processo del server). Solo grid_task importa backtest, al primo task del worker.
+#
+# ─────────────────────── Backtest generico EMA+RSI ───────────────────────
+
+def summarize_trades(trades, initial):
+    net_pnl = sum(t[3] for t in trades)
+    return_pct = net_pnl / initial * 100 if initial else 0
+    wins = [t for t in trades if t[3] > 0]
+    losses = [t for t in trades if t[3] < 0]
+    win_rate = len(wins) / len(trades) * 100 if trades else 0
+    avg_win = sum(t[3] for t in wins) / len(wins) if wins else 0
+    avg_loss = abs(sum(t[3] for t in losses) / len(losses)) if losses else 0
+    reward_risk = avg_win / avg_loss if avg_loss > 0 else 1
+    sharpe = (win_rate / 100 * reward_risk - (1 - win_rate / 100)) if win_rate else 0
+
+    peak = initial
+    max_dd_abs = 0
+    for t in trades:
+        bal = t[4]
+        peak = max(peak, bal)
+        dd = bal - peak
+        if dd < max_dd_abs:
+            max_dd_abs = dd
+    max_dd_pct = max_dd_abs / initial * 100 if initial else 0
+
+    return {
+        "trades": len(trades),
+        "win_rate": win_rate,
+        "return_pct": return_pct,
+        "max_dd": max_dd_pct,
+        "sharpe": sharpe,
+        "avg_win": avg_win,
+        "avg_loss": avg_loss,
+    }
+
+
+def prepare_split_cache(dfx, ema_periods, rsi_periods, volume_filter, sessions):
+    """Precalcola indicatori/filtri una sola volta per un dataframe."""
+    from indicators.ta import compute_ema, compute_rsi
+    import numpy as np
+    import pandas as pd
+
+    ema_cache = {p: compute_ema(dfx, p).to_numpy(dtype=float) for p in ema_periods}
+    rsi_cache = {p: compute_rsi(dfx, p).to_numpy(dtype=float) for p in rsi_periods}
+    vol_arr = None
+    if volume_filter:
+        vol = dfx["tick_volume"].to_numpy(dtype=float)
+        vol_avg = pd.Series(vol).rolling(20).mean().to_numpy()
+        vol_arr = np.nan_to_num(vol > vol_avg)
+    sess_arr = None
+    if sessions:
+        from backtest import _get_session_label
+        sess_arr = [_get_session_label(t) for t in dfx["time"].to_numpy()]
+    return ema_cache, rsi_cache, vol_arr, sess_arr
+
+
+def generic_signal_dir(df, ema_fast, ema_slow, rsi_period, rsi_oversold, rsi_overbought, direction, volume_filter=False, sessions=None, ema_cache=None, rsi_arr=None, sess_arr=None, vol_ok_arr=None, rsi_cache=None):
+    """Segnali EMA+RSI per barra (1 buy, -1 sell, 0 nessuno) e barre di warm-up."""
+    import numpy as np
+    import pandas as pd
+    from indicators.ta import compute_ema, compute_rsi
+
+    if ema_cache is None:
+        ema_cache = {}
+    if ema_fast not in ema_cache:
+        ema_cache[ema_fast] = compute_ema(df, ema_fast).to_numpy(dtype=float)
+    if ema_slow not in ema_cache:
+        ema_cache[ema_slow] = compute_ema(df, ema_slow).to_numpy(dtype=float)
+    ema_f = ema_cache[ema_fast]
+    ema_s = ema_cache[ema_slow]
+
+    if rsi_arr is None:
+        if rsi_cache is not None and rsi_period in rsi_cache:
+            rsi_arr = rsi_cache[rsi_period]
+        else:
+            rsi_arr = compute_rsi(df, rsi_period).to_numpy(dtype=float)
+            if rsi_cache is not None:
+                rsi_cache[rsi_period] = rsi_arr
+    rsi = rsi_arr
+
+    if vol_ok_arr is None and volume_filter:
+        vol = df["tick_volume"].to_numpy(dtype=float)
+        vol_avg = pd.Series(vol).rolling(20).mean().to_numpy()
+        vol_ok_arr = np.nan_to_num(vol > vol_avg)
+
+    if sess_arr is None and sessions:
+        from backtest import _get_session_label
+        sess_arr = [_get_session_label(t) for t in df["time"].to_numpy()]
+
+    lookback = max(ema_slow, rsi_period) + 5
+    can_enter = ~(np.isnan(ema_f) | np.isnan(ema_s) | np.isnan(rsi))
+    if sess_arr is not None:
+        can_enter &= np.isin(np.asarray(sess_arr, dtype=object), list(sessions))
+    if vol_ok_arr is not None:
+        can_enter &= np.asarray(vol_ok_arr, dtype=bool)
+    can_enter[:lookback] = False
+
+    signal_dir = np.zeros(len(ema_f), dtype=np.int8)
+    if direction in ("buy", "both"):
+        signal_dir[can_enter & (ema_f > ema_s) & (rsi < rsi_oversold)] = 1
+    if direction in ("sell", "both"):
+        signal_dir[can_enter & (signal_dir == 0) & (ema_f < ema_s) & (rsi > rsi_overbought)] = -1
+    return signal_dir, lookback
+
+
+def price_arrays(df):
+    return (df["close"].to_numpy(dtype=float), df["low"].to_numpy(dtype=float),
+            df["high"].to_numpy(dtype=float), df["time"].to_numpy())
+
+
+def generic_trades(prices, signal_dir, lookback, sl_pts, tp_pts, lot, balance, pip, contract, spread_pips=0.0, bars=None):
+    """Trade SL/TP sui segnali (prices da price_arrays); bars limita la simulazione alle prime barre.
+    Ritorna (trades, saldo, trade aperto a fine dati)."""
+    from exit_kernel import EXIT_LABELS, EXIT_NONE, simulate_trades
+
+    close, low, high, times = (a[:bars] for a in prices)
+
+    entry_idx, exit_idx, exit_type, pnl = simulate_trades(
+        signal_dir[:bars], close, low, high, sl_pts * pip, tp_pts * pip, lot * contract, start=lookback)
+
+    cost = spread_pips * pip * contract * lot
+    trades = []
+    still_open = False
+    for x, kind, p, is_buy in zip(exit_idx, exit_type, pnl, signal_dir[entry_idx] > 0):
+        balance -= cost
+        if kind == EXIT_NONE:
+            still_open = True
+            continue
+        balance += p
+        trades.append((times[x], "BUY" if is_buy else "SELL", EXIT_LABELS[kind], p, balance))
+
+    return trades, balance, still_open
+
+
+def run_generic_backtest(df, ema_fast, ema_slow, rsi_period, rsi_oversold, rsi_overbought, sl_pts, tp_pts, direction, lot, balance, pip, contract, spread_pips=0.0, volume_filter=False, sessions=None, ema_cache=None, rsi_arr=None, sess_arr=None, vol_ok_arr=None, rsi_cache=None):
+    signal_dir, lookback = generic_signal_dir(
+        df, ema_fast, ema_slow, rsi_period, rsi_oversold, rsi_overbought, direction,
+        volume_filter=volume_filter, sessions=sessions, ema_cache=ema_cache, rsi_arr=rsi_arr,
+        sess_arr=sess_arr, vol_ok_arr=vol_ok_arr, rsi_cache=rsi_cache,
+    )
+    trades, balance, _ = generic_trades(price_arrays(df), signal_dir, lookback, sl_pts, tp_pts, lot, balance, pip, contract, spread_pips)
+    return trades, balance
+
+
+# ─────────────────────── Task per ResearchPool ───────────────────────
+# Funzioni top-level (picklabili) eseguite nei worker di research_pool.
+# Il dataset è il dict costruito da generic_dataset:
+#   {"is": (df_is, cache_is), "oos": (df_oos, cache_oos), "params": {...}}
+
+def generic_dataset(df_is, cache_is, df_oos, cache_oos, **params):
+    return {"is": (df_is, cache_is), "oos": (df_oos, cache_oos), "params": params}
+
+
+SIGNAL_MEMO_SIZE = 512      # segnali memorizzati per dataset (cambiano solo EMA/RSI/direzione, non SL/TP)
+
+
+def dataset_signal_dir(ds, split, ef, es, rsi_p, ro, rb, dirn):
+    """generic_signal_dir con memo nel dataset: le combinazioni SL×TP dello stesso segnale lo riusano."""
+    memo = ds.setdefault("_signals", {})
+    key = (split, ef, es, rsi_p, ro, rb, dirn)
+    hit = memo.get(key)
+    if hit is None:
+        df, cache = ds[split]
+        p = ds["params"]
+        hit = generic_signal_dir(
+            df, ef, es, rsi_p, ro, rb, dirn, volume_filter=p["volume_filter"], sessions=p["sessions"],
+            ema_cache=cache[0], rsi_cache=cache[1], vol_ok_arr=cache[2], sess_arr=cache[3],
+        )
+        if len(memo) >= SIGNAL_MEMO_SIZE:
+            memo.clear()
+        memo[key] = hit
+    return hit
+
+
+def generic_metrics(ds, split, ef, es, rsi_p, ro, rb, sl, tp, dirn, bars=None):
+    """Metriche di summarize_trades; con bars anche (trade aperto a fine finestra, segnale)."""
+    prices = ds.setdefault("_prices", {})
+    if split not in prices:
+        prices[split] = price_arrays(ds[split][0])
+    p = ds["params"]
+    signal_dir, lookback = dataset_signal_dir(ds, split, ef, es, rsi_p, ro, rb, dirn)
+    trades, _, still_open = generic_trades(
+        prices[split], signal_dir, lookback, sl, tp, p["lot"], p["balance"], p["pip"], p["contract"], p["spread_pips"], bars=bars)
+    if bars is None:
+        return summarize_trades(trades, p["balance"])
+    return summarize_trades(trades, p["balance"]), still_open, signal_dir
+
+
+def auto_is_task(ds, combo):
+    """Auto-discover FASE 1: metriche in-sample, None se sotto min_trades."""
+    ef, es, ro, rb, sl, tp, dirn = combo
+    metrics = generic_metrics(ds, "is", ef, es, 14, ro, rb, sl, tp, dirn)
+    return metrics if metrics["trades"] >= ds["params"]["min_trades"] else None
+
+
+def auto_oos_task(ds, combo):
+    ef, es, ro, rb, sl, tp, dirn = combo
+    return generic_metrics(ds, "oos", ef, es, 14, ro, rb, sl, tp, dirn)
+
+
+def agent_eval_task(ds, c):
+    """Agent-discover: (metriche IS, metriche OOS), (None, None) se sotto min_trades in-sample."""
+    args = (c["ema_fast"], c["ema_slow"], c["rsi_period"], c["rsi_oversold"], c["rsi_overbought"], c["sl"], c["tp"], c["direction"])
+    m_is = generic_metrics(ds, "is", *args)
+    if m_is["trades"] < ds["params"]["min_trades"]:
+        return None, None
+    return m_is, generic_metrics(ds, "oos", *args)
+
+
+def auto_rung_task(ds, task):
+    """Auto-discover a successive halving: metriche sulle prime `bars` barre in-sample e numero
+    massimo di trade ancora raggiungibile sull'in-sample intero.
+
+    Gli indicatori sono causali, quindi la simulazione sulle prime barre coincide con quella
+    completa fino a lì: ai trade chiusi si possono aggiungere al più quello ancora aperto e
+    uno per ogni barra con segnale dopo la finestra.
+    """
+    import numpy as np
+
+    bars, (ef, es, ro, rb, sl, tp, dirn) = task
+    metrics, still_open, signal_dir = generic_metrics(ds, "is", ef, es, 14, ro, rb, sl, tp, dirn, bars=bars)
+    max_trades = metrics["trades"] + int(still_open) + int(np.count_nonzero(signal_dir[bars:]))
+    return metrics, max_trades
+
+
+def grid_task(ds, task):
+    """Signal research: griglia SL×TP di una (strategia, direzione) con run_backtest_grid."""
+    from backtest import run_backtest_grid
+    strategy, dirn, sl_tp, tf_key = task
+    p = ds["params"]
+    return run_backtest_grid(
+        strategy_name=strategy,
+        symbol=p["symbol"],
+        days=p["days"],
+        lot=p["lot"],
+        balance=p["balance"],
+        dfs=ds["dfs"][tf_key],
+        sl_tp=sl_tp,
+        direction=dirn,
+    )
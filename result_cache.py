@@ -0,0 +1,253 @@
+# --- RESULT CACHE: risultati dei backtest indicizzati per contenuto ---
+#
+# slot = make_slot("backtest", symbol=..., strategy=..., version=..., lot=..., ...)
+# key  = make_key(slot, dataset_fingerprint(dfs))
+# hit  = get(key)  /  put(key, risultato)
+#
+# - slot: hash dei parametri del run (strategia e sua versione, SL/TP, direzione, lotto...)
+#   e della versione del motore: sorgente di ENGINE_SOURCES (backtest, exit_kernel,
+#   strategie, indicators/*). Cambia il codice → cambiano le chiavi, senza ricordarsi
+#   di incrementare ENGINE_VERSION.
+# - fingerprint: hash delle barre usate (time + OHLC + volume di ogni timeframe); una
+#   barra aggiunta o corretta cambia la chiave, quindi un risultato non viene mai
+#   riusato su dati diversi. Al primo put con un fingerprint nuovo le entry dello
+#   stesso slot con fingerprint vecchi vengono rimosse (memoria e disco).
+# - memoria: LRU di RESULT_CACHE_MAX_ENTRIES risultati; disco: un pickle per entry
+#   sotto RESULT_CACHE_DIR/<slot>/<fingerprint>.pkl, sopravvive ai riavvii.
+import functools
+import glob
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "result_cache"))
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") not in ("0", "false", "False")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 4096))
+RESULT_CACHE_DISK_MAX = int(os.getenv("RESULT_CACHE_DISK_MAX", 20000))     # file su disco prima della pulizia
+ENGINE_VERSION = 1      # da incrementare quando cambia la semantica dei backtest (invalida tutto)
+# sorgenti che decidono il risultato di un backtest (glob relativi alla cartella del progetto)
+ENGINE_SOURCES = ("backtest.py", "exit_kernel.py", "trading_signals_multi2.py", "indicators/*.py")
+
+FINGERPRINT_COLUMNS = ("time", "open", "high", "low", "close", "tick_volume")
+
+_mem = OrderedDict()    # key → risultato
+_slots = {}             # slot → fingerprint corrente
+_lock = threading.Lock()
+_stats = {"hits": 0, "disk_hits": 0, "misses": 0, "puts": 0, "invalidated": 0, "evictions": 0}
+_puts_since_prune = 0
+
+
+# ─────────────────────── CHIAVI ───────────────────────
+
+def dataset_fingerprint(dfs):
+    """Hash delle barre di ogni timeframe (solo colonne di mercato: gli indicatori precalcolati non contano)."""
+    h = hashlib.blake2b(digest_size=16)
+    for tf in sorted(k for k, df in dfs.items() if df is not None):
+        df = dfs[tf]
+        h.update(f"{tf}:{len(df)}".encode())
+        for col in FINGERPRINT_COLUMNS:
+            if col in df.columns:
+                h.update(col.encode())
+                h.update(np.ascontiguousarray(df[col].to_numpy()).tobytes())
+    return h.hexdigest()
+
+
+def strategy_version(strategy):
+    """
+    Versione della strategia: hash del sorgente di tutte le classi della MRO (anche i
+    metodi ereditati da SignalStrategy), così cambia il codice → nuove chiavi.
+    """
+    return _class_version(strategy if isinstance(strategy, type) else type(strategy))
+
+
+@functools.lru_cache(maxsize=None)
+def _class_version(cls):
+    h = hashlib.blake2b(digest_size=8)
+    for klass in cls.__mro__:
+        if klass is object:
+            continue
+        try:
+            src = inspect.getsource(klass)
+        except (OSError, TypeError):
+            src = klass.__qualname__
+        h.update(src.encode())
+    return h.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def engine_version():
+    """Hash dei sorgenti di ENGINE_SOURCES (helper di modulo, Indicators, run_backtest, kernel...)."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.blake2b(str(ENGINE_VERSION).encode(), digest_size=8)
+    for pattern in ENGINE_SOURCES:
+        for path in sorted(glob.glob(os.path.join(root, pattern))):
+            h.update(os.path.relpath(path, root).replace(os.sep, "/").encode())
+            with open(path, "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def make_slot(kind, **params):
+    payload = json.dumps({"kind": kind, "engine": engine_version(), **params}, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=12).hexdigest()
+
+
+def make_key(slot, fingerprint):
+    return f"{slot}/{fingerprint}"
+
+
+# ─────────────────────── DISCO ───────────────────────
+
+def _path(key):
+    return os.path.join(RESULT_CACHE_DIR, *key.split("/")) + ".pkl"
+
+
+def _disk_read(key):
+    try:
+        with open(_path(key), "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[ResultCache] ⚠️ Entry illeggibile {key}: {e}")
+        return None
+
+
+def _disk_write(key, value):
+    path = _path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"[ResultCache] ⚠️ Scrittura su disco fallita {key}: {e}")
+
+
+def _disk_drop_slot(slot, keep):
+    """Rimuove dal disco i fingerprint dello slot diversi da keep."""
+    folder = os.path.join(RESULT_CACHE_DIR, slot)
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        return 0
+    dropped = 0
+    for name in names:
+        if name != f"{keep}.pkl" and name.endswith(".pkl"):
+            try:
+                os.remove(os.path.join(folder, name))
+                dropped += 1
+            except FileNotFoundError:
+                pass
+    return dropped
+
+
+def _disk_prune():
+    """Oltre RESULT_CACHE_DISK_MAX file elimina i meno usati di recente (mtime)."""
+    try:
+        files = []
+        for slot in os.listdir(RESULT_CACHE_DIR):
+            folder = os.path.join(RESULT_CACHE_DIR, slot)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                files.append((os.path.getmtime(path), path))
+    except FileNotFoundError:
+        return
+    excess = len(files) - RESULT_CACHE_DISK_MAX
+    if excess <= 0:
+        return
+    files.sort()
+    for _, path in files[:excess]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass
+
+
+# ─────────────────────── API ───────────────────────
+
+def get(key):
+    """Risultato in cache per key (memoria, poi disco) o None."""
+    if not RESULT_CACHE_ENABLED:
+        return None
+    with _lock:
+        if key in _mem:
+            _mem.move_to_end(key)
+            _stats["hits"] += 1
+            return _mem[key]
+    value = _disk_read(key)
+    with _lock:
+        if value is None:
+            _stats["misses"] += 1
+            return None
+        _stats["disk_hits"] += 1
+        _remember(key, value)
+    try:
+        os.utime(_path(key))
+    except OSError:
+        pass
+    return value
+
+
+def put(key, value):
+    """Salva value sotto key; le entry dello stesso slot con un altro fingerprint vengono invalidate."""
+    global _puts_since_prune
+    if not RESULT_CACHE_ENABLED:
+        return
+    slot, fingerprint = key.split("/", 1)
+    with _lock:
+        stale = _slots.get(slot) != fingerprint
+        _slots[slot] = fingerprint
+        if stale:
+            for old in [k for k in _mem if k.startswith(slot + "/") and k != key]:
+                del _mem[old]
+        _remember(key, value)
+        _stats["puts"] += 1
+        _puts_since_prune += 1
+        prune = _puts_since_prune >= 500
+        if prune:
+            _puts_since_prune = 0
+    _disk_write(key, value)
+    if stale:
+        dropped = _disk_drop_slot(slot, fingerprint)
+        with _lock:
+            _stats["invalidated"] += dropped
+    if prune:
+        _disk_prune()
+
+
+def _remember(key, value):
+    """Inserisce in memoria con politica LRU. Va chiamata con _lock acquisito."""
+    _mem[key] = value
+    _mem.move_to_end(key)
+    while len(_mem) > RESULT_CACHE_MAX_ENTRIES:
+        _mem.popitem(last=False)
+        _stats["evictions"] += 1
+
+
+def clear(disk=False):
+    """Svuota la cache in memoria (e, con disk=True, anche quella su disco)."""
+    import shutil
+    with _lock:
+        _mem.clear()
+        _slots.clear()
+    if disk:
+        shutil.rmtree(RESULT_CACHE_DIR, ignore_errors=True)
+
+
+def cache_stats():
+    with _lock:
+        return {**_stats, "entries": len(_mem)}
@@ -0,0 +1,206 @@
+# --- SHARED DATASET: dataset di ricerca in memoria condivisa per i worker ---
+#
+# handle = publish(key, data)     # copia gli array una volta in un blocco SharedMemory
+# data   = attach(handle)         # nei worker: viste numpy/pandas zero-copy, sola lettura
+# release(key)                    # a fine sessione: al refcount 0 il blocco viene rimosso
+#
+# data è una struttura annidata di dict / tuple / list con foglie:
+# - np.ndarray numerici (bool, int, float, datetime64) → nel blocco condiviso
+# - pd.DataFrame → una vista per colonna numerica (le altre colonne viaggiano nell'handle)
+# - qualsiasi altro oggetto (liste di stringhe, scalari, None) → copiato nell'handle
+# L'handle è piccolo e picklabile: si passa all'initializer di ResearchPool al
+# posto del dataset e ogni worker apre il blocco una volta sola (cache per nome).
+# La stessa key pubblicata di nuovo incrementa il refcount e ritorna lo stesso
+# handle: la key deve identificare il contenuto (es. session_id).
+import atexit
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+ALIGN = 64              # byte, allineamento degli array nel blocco
+_SHM_KINDS = "biufcmM"  # dtype numpy copiabili così come sono
+
+_registry = {}          # key → {"shm": SharedMemory, "handle": DatasetHandle, "refs": int}
+_registry_lock = threading.Lock()
+_attached = {}          # nome blocco → (SharedMemory, data) aperti da questo processo
+_attached_lock = threading.Lock()
+
+
+class DatasetHandle:
+    __slots__ = ("key", "shm_name", "layout", "nbytes")
+
+    def __init__(self, key, shm_name, layout, nbytes):
+        self.key = key
+        self.shm_name = shm_name
+        self.layout = layout
+        self.nbytes = nbytes
+
+    def __getstate__(self):
+        return (self.key, self.shm_name, self.layout, self.nbytes)
+
+    def __setstate__(self, state):
+        self.key, self.shm_name, self.layout, self.nbytes = state
+
+    def __repr__(self):
+        return f"DatasetHandle({self.key!r}, {self.shm_name}, {self.nbytes} byte)"
+
+
+# ─────────────────────── LAYOUT ───────────────────────
+
+def _shareable(arr):
+    return isinstance(arr, np.ndarray) and arr.dtype.kind in _SHM_KINDS and not arr.dtype.hasobject
+
+
+def _is_container(obj):
+    return isinstance(obj, (dict, list, tuple, np.ndarray, pd.DataFrame))
+
+
+def _plan(obj, arrays, offset):
+    """Layout di obj; gli array da copiare finiscono in arrays come (offset, array). Ritorna (layout, offset)."""
+    def _array(arr, offset):
+        arr = np.ascontiguousarray(arr)
+        offset = -(-offset // ALIGN) * ALIGN
+        arrays.append((offset, arr))
+        return ("a", offset, arr.dtype.str, arr.shape), offset + arr.nbytes
+
+    if _shareable(obj):
+        return _array(obj, offset)
+    if isinstance(obj, pd.DataFrame):
+        cols = []
+        for name in obj.columns:
+            values = obj[name].to_numpy()
+            if _shareable(values) and not isinstance(obj[name].dtype, pd.api.extensions.ExtensionDtype):
+                leaf, offset = _array(values, offset)
+            else:
+                leaf = ("v", obj[name])
+            cols.append((name, leaf))
+        index = obj.index
+        if isinstance(index, pd.RangeIndex) and index.start == 0 and index.step == 1:
+            index_leaf = None
+        else:
+            index_leaf = ("v", index)
+        return ("f", cols, index_leaf, len(obj)), offset
+    if isinstance(obj, dict):
+        items = []
+        for k, v in obj.items():
+            leaf, offset = _plan(v, arrays, offset)
+            items.append((k, leaf))
+        return ("d", items), offset
+    if isinstance(obj, (list, tuple)) and any(_is_container(v) for v in obj):
+        items = []
+        for v in obj:
+            leaf, offset = _plan(v, arrays, offset)
+            items.append(leaf)
+        return ("t" if isinstance(obj, tuple) else "l", items), offset
+    return ("v", obj), offset
+
+
+def _build(layout, buf):
+    kind = layout[0]
+    if kind == "a":
+        _, offset, dtype, shape = layout
+        arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=buf, offset=offset)
+        arr.flags.writeable = False
+        return arr
+    if kind == "f":
+        _, cols, index_leaf, n = layout
+        data = {name: _build(leaf, buf) for name, leaf in cols}
+        index = index_leaf[1] if index_leaf is not None else pd.RangeIndex(n)
+        return pd.DataFrame(data, index=index, copy=False)
+    if kind == "d":
+        return {k: _build(leaf, buf) for k, leaf in layout[1]}
+    if kind == "t":
+        return tuple(_build(leaf, buf) for leaf in layout[1])
+    if kind == "l":
+        return [_build(leaf, buf) for leaf in layout[1]]
+    return layout[1]
+
+
+# ─────────────────────── REGISTRO ───────────────────────
+
+def publish(key, data):
+    """Pubblica data sotto key (o incrementa il refcount se già pubblicata). Ritorna l'handle."""
+    with _registry_lock:
+        entry = _registry.get(key)
+        if entry is not None:
+            entry["refs"] += 1
+            return entry["handle"]
+
+        arrays = []
+        layout, nbytes = _plan(data, arrays, 0)
+        shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        for offset, arr in arrays:
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf, offset=offset)[...] = arr
+        handle = DatasetHandle(key, shm.name, layout, nbytes)
+        _registry[key] = {"shm": shm, "handle": handle, "refs": 1}
+        print(f"[SharedDataset] 📦 {key}: {len(arrays)} array, {nbytes / 1e6:.1f} MB in {shm.name}")
+        return handle
+
+
+def retain(key):
+    with _registry_lock:
+        entry = _registry.get(key)
+        if entry is None:
+            raise KeyError(f"Dataset {key!r} non pubblicato")
+        entry["refs"] += 1
+        return entry["handle"]
+
+
+def release(key):
+    """Decrementa il refcount di key; a zero chiude e rimuove il blocco condiviso. Key sconosciute: no-op."""
+    with _registry_lock:
+        entry = _registry.get(key)
+        if entry is None:
+            return
+        entry["refs"] -= 1
+        if entry["refs"] > 0:
+            return
+        del _registry[key]
+    _unlink(entry["shm"])
+
+
+def _unlink(shm):
+    with _attached_lock:
+        _attached.pop(shm.name, None)
+    try:
+        shm.close()
+    except BufferError:
+        pass    # viste ancora vive in questo processo: il blocco resta mappato finché non vengono liberate
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def attach(handle):
+    """Dataset di handle come viste di sola lettura sul blocco condiviso (aperto una volta per processo)."""
+    with _attached_lock:
+        cached = _attached.get(handle.shm_name)
+        if cached is not None:
+            return cached[1]
+        with _registry_lock:
+            entry = _registry.get(handle.key)
+        if entry is not None and entry["shm"].name == handle.shm_name:
+            shm = entry["shm"]          # processo che ha pubblicato: niente seconda mappatura
+        else:
+            shm = shared_memory.SharedMemory(name=handle.shm_name)
+        data = _build(handle.layout, shm.buf)
+        _attached[handle.shm_name] = (shm, data)
+        return data
+
+
+def published():
+    """{key: (refcount, byte)} dei dataset pubblicati da questo processo."""
+    with _registry_lock:
+        return {k: (e["refs"], e["handle"].nbytes) for k, e in _registry.items()}
+
+
+@atexit.register
+def _cleanup():
+    with _registry_lock:
+        entries = list(_registry.values())
+        _registry.clear()
+    for entry in entries:
+        _unlink(entry["shm"])
@@ -1,25 +1,35 @@
 """
 Signal Research API — ottimizzazione SL/TP per multiple strategie.
 """
+import os
 import uuid
 import io
-import threading
+import math
 import logging
 from itertools import product
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from pydantic import BaseModel
 from typing import List, Optional
 from fastapi.responses import JSONResponse, StreamingResponse
 
 from logger import log as global_log
+from research_pool import ResearchPool, RESEARCH_WORKERS
+from research_tasks import (
+    prepare_split_cache, generic_dataset,
+    grid_task, auto_is_task, auto_oos_task, auto_rung_task, agent_eval_task,
+)
+import shared_dataset
+import result_cache
+from job_manager import JobStore, JobRejected, owner_of
 
 router = APIRouter()
 
 AUTO_LOG_FILE = "auto_discover_log.txt"
 
-# Session storage
-research_sessions = {}
-research_lock = threading.Lock()
+# Session storage: job in coda limitata (i processi di ResearchPool usano già tutte le CPU)
+research_jobs = JobStore("research", max_running=int(os.getenv("RESEARCH_MAX_RUNNING", 1)))
+research_sessions = research_jobs.sessions
+research_lock = research_jobs.lock
 
 
 class SignalResearchRequest(BaseModel):
@@ -40,10 +50,8 @@ class SignalResearchRequest(BaseModel):
 
 
 def _get_mt5_api_url(trader_id: int) -> Optional[str]:
-    from db import get_connection
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
+    from db import db_cursor
+    with db_cursor() as cursor:
         cursor.execute("""
             SELECT ss.ip, ss.port
             FROM traders t
@@ -51,16 +59,82 @@ def _get_mt5_api_url(trader_id: int) -> Optional[str]:
             WHERE t.id = %s
         """, (trader_id,))
         row = cursor.fetchone()
-        if row and row[0] and row[1]:
-            return f"http://{row[0]}:{row[1]}"
-    finally:
-        cursor.close()
-        conn.close()
+    if row and row[0] and row[1]:
+        return f"http://{row[0]}:{row[1]}"
+    return None
+
+
+def _get_default_mt5_api_url() -> Optional[str]:
+    """Agent dello slave del primo trader (richieste senza trader_id)."""
+    from db import db_cursor
+    with db_cursor() as cursor:
+        cursor.execute("""
+            SELECT ss.ip, ss.port
+            FROM traders t
+            JOIN servers ss ON ss.id = t.slave_server_id
+            LIMIT 1
+        """)
+        row = cursor.fetchone()
+    if row and row[0] and row[1]:
+        return f"http://{row[0]}:{row[1]}"
     return None
 
 
+def _row_return(row):
+    return row["return_pct"]
+
+
+def _result_row(strategy, sl, tp, dirn, summary, balances, config):
+    """Riga dei risultati di /signal-research/run da summary e saldi (arrotondati) dei trade."""
+    # Compute max DD percentage
+    net_pnl = summary.get("net_pnl", 0)
+    init_bal = config["balance"]
+    return_pct = (net_pnl / init_bal * 100) if init_bal else 0
+
+    # Max drawdown from trade balance curve
+    peak = init_bal
+    max_dd_abs = 0
+    for bal in balances:
+        peak = max(peak, bal)
+        dd = bal - peak
+        if dd < max_dd_abs:
+            max_dd_abs = dd
+    max_dd_pct = (max_dd_abs / init_bal * 100) if init_bal else 0
+
+    # Sharpe-like ratio
+    win_rate = summary.get("win_rate", 0)
+    avg_win = summary.get("avg_win", 0)
+    avg_loss = abs(summary.get("avg_loss", 1))
+    reward_risk = avg_win / avg_loss if avg_loss > 0 else 1
+    sharpe = (win_rate / 100 * reward_risk - (1 - win_rate / 100)) if win_rate else 0
+
+    total_trades = summary.get("total_trades", 0)
+
+    return {
+        "strategy": strategy,
+        "sl": sl,
+        "tp": tp,
+        "direction": dirn,
+        "max_hold": 30,
+        "trades": total_trades,
+        "win_rate": round(win_rate, 1),
+        "return_pct": round(return_pct, 1),
+        "max_dd": round(max_dd_pct, 1),
+        "avg_hold": 0,
+        "sharpe": round(sharpe, 2),
+    }
+
+
+def _run_session(target, session_id: str, config: dict):
+    """Job di una sessione di ricerca: a fine sessione libera i dataset condivisi pubblicati."""
+    try:
+        target(session_id, config)
+    finally:
+        shared_dataset.release(session_id)
+
+
 def _run_optimization(session_id: str, config: dict):
-    from backtest import run_backtest_api, fetch_data, precompute_indicators, STRATEGIES
+    from backtest import fetch_data, precompute_indicators, backtest_cache_key, STRATEGIES
 
     mt5_api_url = config["mt5_api_url"]
     symbol = config["symbol"]
@@ -79,7 +153,8 @@ def _run_optimization(session_id: str, config: dict):
 
     # Group strategies by timeframe requirements → fetch data once per group
     dfs_cache = {}
-    strategy_dfs = {}
+    fingerprints = {}
+    strategy_tf = {}
     strategy_errors = {}
     for sname in config["strategies"]:
         strat = STRATEGIES.get(sname)
@@ -90,103 +165,101 @@ def _run_optimization(session_id: str, config: dict):
             print(f"[SignalResearch] Fetching data for TF set M1={tf_key[0]} M5={tf_key[1]} M15={tf_key[2]} H1={tf_key[3]}...")
             try:
                 dfs = fetch_data(symbol, strat, days, mt5_api_url)
-                precompute_indicators(dfs)
+                fingerprints[tf_key] = result_cache.dataset_fingerprint(dfs)
                 dfs_cache[tf_key] = dfs
             except Exception as e:
                 print(f"[SignalResearch] Error fetching data for {sname}: {e}")
                 dfs_cache[tf_key] = None
                 strategy_errors[sname] = str(e)
-        strategy_dfs[sname] = dfs_cache[tf_key]
+        strategy_tf[sname] = tf_key
         if dfs_cache[tf_key] is None:
             strategy_errors.setdefault(sname, "Nessun dato disponibile per questa strategia sul simbolo selezionato")
 
     # Update total after filtering invalid strategies
-    valid_combos = [(s, sl, tp, d) for s, sl, tp, d in all_combos if strategy_dfs.get(s) is not None]
+    valid_combos = [(s, sl, tp, d) for s, sl, tp, d in all_combos if dfs_cache.get(strategy_tf.get(s)) is not None]
     total = len(valid_combos)
 
-    results = []
-    for idx, (strategy, sl, tp, dirn) in enumerate(valid_combos):
-        if cancel():
+    # Combinazioni già simulate sulle stesse barre: dalla result_cache
+    def _cache_key(strategy, sl, tp, dirn):
+        return backtest_cache_key(
+            "grid", strategy, fingerprints[strategy_tf[strategy]],
+            symbol=symbol, days=days, lot=config["lot"], balance=config["balance"], direction=dirn, sl=sl, tp=tp,
+        )
+
+    grid_results = {}
+    for combo in valid_combos:
+        cached = result_cache.get(_cache_key(*combo))
+        if cached is not None:
+            grid_results[combo] = cached
+    if grid_results:
+        print(f"[SignalResearch] {len(grid_results)}/{total} combinazioni dalla cache")
+        research_jobs.push_rows(session_id, [
+            _result_row(strategy, sl, tp, dirn, run.get("summary", {}), run.get("balances", []), config)
+            for (strategy, sl, tp, dirn), run in grid_results.items()
+        ], key=_row_return)
+
+    # Una griglia SL×TP per (strategia, direzione): i segnali si calcolano una volta
+    # sola e tutte le combinazioni si simulano insieme (run_backtest_grid);
+    # le griglie girano in parallelo sul ResearchPool
+    groups = {}
+    for strategy, sl, tp, dirn in valid_combos:
+        if (strategy, sl, tp, dirn) not in grid_results:
+            groups.setdefault((strategy, dirn), {})[(sl, tp)] = None
+    tasks = [(strategy, dirn, list(sl_tp), strategy_tf[strategy]) for (strategy, dirn), sl_tp in groups.items()]
+    n_cached = len(grid_results)
+
+    def _progress(done, _total):
+        pct = int((n_cached + sum(len(t[2]) for t in tasks[:done])) / total * 100) if total else 100
+        with research_lock:
+            if session_id in research_sessions:
+                research_sessions[session_id]["progress"] = pct
+
+    def _partial_rows(start, chunk):
+        # migliori righe parziali per lo stream SSE, man mano che le griglie finiscono
+        rows = []
+        for (strategy, dirn, sl_tp, _tf), runs in zip(tasks[start:start + len(chunk)], chunk):
+            if isinstance(runs, Exception):
+                continue
+            rows.extend(_result_row(strategy, sl, tp, dirn, run.get("summary", {}), run.get("balances", []), config)
+                        for (sl, tp), run in zip(sl_tp, runs) if "error" not in run)
+        research_jobs.push_rows(session_id, rows, key=_row_return)
+
+    runs_by_group = []
+    if tasks:
+        # indicatori solo per i timeframe che hanno ancora combinazioni da simulare
+        used_tf = {t[3] for t in tasks}
+        for tf_key in used_tf:
+            precompute_indicators(dfs_cache[tf_key])
+        dataset = {
+            "dfs": {k: dfs_cache[k] for k in used_tf},
+            "params": {"symbol": symbol, "days": days, "lot": config["lot"], "balance": config["balance"]},
+        }
+        try:
+            with ResearchPool(shared_dataset.publish(session_id, dataset)) as pool:
+                runs_by_group = pool.map(grid_task, tasks, progress=_progress, cancel=cancel, chunk_size=1, on_result=_partial_rows)
+        except InterruptedError:
             with research_lock:
                 if session_id in research_sessions:
                     research_sessions[session_id]["status"] = "cancelled"
             return
+    else:
+        _progress(0, 0)
 
-        try:
-            result = run_backtest_api(
-                strategy_name=strategy,
-                symbol=symbol,
-                days=days,
-                lot=config["lot"],
-                balance=config["balance"],
-                mt5_api_url=mt5_api_url,
-                cancel_flag=cancel,
-                direction=dirn,
-                pre_fetched_dfs=strategy_dfs[strategy],
-                skip_indicators=True,
-                sl_pts=sl,
-                tp_pts=tp,
-                verbose=False,
-            )
-
-            summary = result.get("summary", {})
-            trades = result.get("trades", [])
-
-            # Compute max DD percentage
-            net_pnl = summary.get("net_pnl", 0)
-            init_bal = config["balance"]
-            return_pct = (net_pnl / init_bal * 100) if init_bal else 0
-
-            # Max drawdown from trade balance curve
-            peak = init_bal
-            max_dd_abs = 0
-            for t in trades:
-                bal = t.get("balance", init_bal)
-                peak = max(peak, bal)
-                dd = bal - peak
-                if dd < max_dd_abs:
-                    max_dd_abs = dd
-            max_dd_pct = (max_dd_abs / init_bal * 100) if init_bal else 0
-
-            # Sharpe-like ratio
-            win_rate = summary.get("win_rate", 0)
-            avg_win = summary.get("avg_win", 0)
-            avg_loss = abs(summary.get("avg_loss", 1))
-            reward_risk = avg_win / avg_loss if avg_loss > 0 else 1
-            sharpe = (win_rate / 100 * reward_risk - (1 - win_rate / 100)) if win_rate else 0
-
-            total_trades = summary.get("total_trades", 0)
-            trades_per_day = total_trades / config["days"] if config["days"] > 0 else 0
-
-            # Average hold (from trades list)
-            avg_hold = 0
-            if trades:
-                # Try to compute avg hold from trade times
-                avg_hold = 0  # will be computed by the strategy
-
-            results.append({
-                "strategy": strategy,
-                "sl": sl,
-                "tp": tp,
-                "direction": dirn,
-                "max_hold": 30,
-                "trades": total_trades,
-                "win_rate": round(win_rate, 1),
-                "return_pct": round(return_pct, 1),
-                "max_dd": round(max_dd_pct, 1),
-                "avg_hold": round(avg_hold, 0),
-                "sharpe": round(sharpe, 2),
-            })
-
-        except Exception as e:
-            logging.error(f"Signal research error for {strategy} SL={sl} TP={tp}: {e}")
+    for (strategy, dirn, sl_tp, _tf), runs in zip(tasks, runs_by_group):
+        if isinstance(runs, Exception):
+            logging.error(f"Signal research error for {strategy} {dirn}: {runs}")
             continue
+        for (sl, tp), run in zip(sl_tp, runs):
+            grid_results[(strategy, sl, tp, dirn)] = run
+            if "error" not in run:
+                result_cache.put(_cache_key(strategy, sl, tp, dirn), run)
 
-        # Update progress
-        pct = int((idx + 1) / total * 100)
-        with research_lock:
-            if session_id in research_sessions:
-                research_sessions[session_id]["progress"] = pct
+    results = []
+    for strategy, sl, tp, dirn in valid_combos:
+        run = grid_results.get((strategy, sl, tp, dirn))
+        if run is None:
+            continue
+        results.append(_result_row(strategy, sl, tp, dirn, run.get("summary", {}), run.get("balances", []), config))
 
     # Sort by return_pct descending
     results.sort(key=lambda x: x["return_pct"], reverse=True)
@@ -207,7 +280,7 @@ def _run_optimization(session_id: str, config: dict):
 
 
 @router.post("/signal-research/run")
-def start_signal_research(req: SignalResearchRequest):
+def start_signal_research(req: SignalResearchRequest, request: Request):
     if not req.strategies:
         return JSONResponse(status_code=400, content={"error": "No strategies selected"})
 
@@ -218,22 +291,7 @@ def start_signal_research(req: SignalResearchRequest):
 
     if not mt5_api_url:
         # Try default trader
-        from db import get_connection
-        conn = get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute("""
-                SELECT ss.ip, ss.port
-                FROM traders t
-                JOIN servers ss ON ss.id = t.slave_server_id
-                LIMIT 1
-            """)
-            row = cursor.fetchone()
-            if row and row[0] and row[1]:
-                mt5_api_url = f"http://{row[0]}:{row[1]}"
-        finally:
-            cursor.close()
-            conn.close()
+        mt5_api_url = _get_default_mt5_api_url()
 
     if not mt5_api_url:
         return JSONResponse(status_code=400, content={"error": "No MT5 API URL found"})
@@ -257,34 +315,47 @@ def start_signal_research(req: SignalResearchRequest):
         "mt5_api_url": mt5_api_url,
     }
 
-    with research_lock:
-        research_sessions[session_id] = {
-            "status": "running",
-            "result": None,
-            "cancelled": False,
-            "progress": 0,
-            "config": config,
-        }
-
-    t = threading.Thread(target=_run_optimization, args=(session_id, config), daemon=True)
-    t.start()
+    session = {
+        "status": "running",
+        "result": None,
+        "cancelled": False,
+        "progress": 0,
+        "config": config,
+    }
+    try:
+        research_jobs.submit(session_id, session, _run_session, _run_optimization, session_id, config, owner=owner_of(request))
+    except JobRejected as e:
+        return JSONResponse(status_code=429, content={"error": str(e)})
 
     return {"session_id": session_id}
 
 
 @router.get("/signal-research/{session_id}")
 def get_research_status(session_id: str):
-    with research_lock:
-        session = research_sessions.get(session_id)
+    session = research_jobs.get(session_id)
     if not session:
         return JSONResponse(status_code=404, content={"error": "Session not found"})
     return {
         "status": session["status"],
-        "result": session["result"],
+        "result": research_jobs.result(session),
         "progress": session.get("progress", 0),
+        "queued": session.get("queued", False),
+        "queue_position": session.get("queue_position", 0),
     }
 
 
+@router.get("/signal-research/{session_id}/events")
+def stream_research_events(session_id: str):
+    """Stream SSE: progress, migliori righe parziali della griglia e risultato finale una volta sola."""
+    if research_jobs.get(session_id) is None:
+        return JSONResponse(status_code=404, content={"error": "Session not found"})
+    return StreamingResponse(
+        research_jobs.events(session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/signal-research/{session_id}/cancel")
 def cancel_research(session_id: str):
     with research_lock:
@@ -308,6 +379,8 @@ class AutoDiscoverRequest(BaseModel):
     volume_filter: bool = False
     sessions_filter: str = ""
     use_spread: bool = True
+    search: str = "grid"        # "grid" (griglia completa) | "halving" (successive halving)
+    halving_eta: int = 3        # ad ogni gradino prosegue 1/eta delle combinazioni, finestra x eta
 
 
 # Spread stimato in pips (usato solo nel backtest auto, per non sovrastimare i rendimenti)
@@ -325,38 +398,6 @@ SPREAD_PIPS = {
 }
 
 
-def _summarize_trades(trades, initial):
-    net_pnl = sum(t[3] for t in trades)
-    return_pct = net_pnl / initial * 100 if initial else 0
-    wins = [t for t in trades if t[3] > 0]
-    losses = [t for t in trades if t[3] < 0]
-    win_rate = len(wins) / len(trades) * 100 if trades else 0
-    avg_win = sum(t[3] for t in wins) / len(wins) if wins else 0
-    avg_loss = abs(sum(t[3] for t in losses) / len(losses)) if losses else 0
-    reward_risk = avg_win / avg_loss if avg_loss > 0 else 1
-    sharpe = (win_rate / 100 * reward_risk - (1 - win_rate / 100)) if win_rate else 0
-
-    peak = initial
-    max_dd_abs = 0
-    for t in trades:
-        bal = t[4]
-        peak = max(peak, bal)
-        dd = bal - peak
-        if dd < max_dd_abs:
-            max_dd_abs = dd
-    max_dd_pct = max_dd_abs / initial * 100 if initial else 0
-
-    return {
-        "trades": len(trades),
-        "win_rate": win_rate,
-        "return_pct": return_pct,
-        "max_dd": max_dd_pct,
-        "sharpe": sharpe,
-        "avg_win": avg_win,
-        "avg_loss": avg_loss,
-    }
-
-
 def _get_sl_tp_ranges(symbol: str):
     sym = symbol.upper()
     if "XAU" in sym or "GOLD" in sym:
@@ -370,127 +411,75 @@ def _get_sl_tp_ranges(symbol: str):
     return 100, 600, 50, 200, 1200, 100
 
 
-def _prepare_split_cache(dfx, ema_periods, rsi_periods, volume_filter, sessions):
-    """Precalcola indicatori/filtri una sola volta per un dataframe."""
-    from indicators.ta import compute_ema, compute_rsi
-    from backtest import _get_session_label
-    import numpy as np
-    import pandas as pd
-
-    ema_cache = {p: compute_ema(dfx, p).to_numpy(dtype=float) for p in ema_periods}
-    rsi_cache = {p: compute_rsi(dfx, p).to_numpy(dtype=float) for p in rsi_periods}
-    vol_arr = None
-    if volume_filter:
-        vol = dfx["tick_volume"].to_numpy(dtype=float)
-        vol_avg = pd.Series(vol).rolling(20).mean().to_numpy()
-        vol_arr = np.nan_to_num(vol > vol_avg)
-    sess_arr = None
-    if sessions:
-        sess_arr = [_get_session_label(t) for t in dfx["time"].to_numpy()]
-    return ema_cache, rsi_cache, vol_arr, sess_arr
-
-
-def _run_generic_backtest(df, ema_fast, ema_slow, rsi_period, rsi_oversold, rsi_overbought, sl_pts, tp_pts, direction, lot, balance, pip, contract, spread_pips=0.0, volume_filter=False, sessions=None, ema_cache=None, rsi_arr=None, sess_arr=None, vol_ok_arr=None, rsi_cache=None):
-    import numpy as np
-    import pandas as pd
-    from indicators.ta import compute_ema, compute_rsi
-    from backtest import _get_session_label
-
-    close = df["close"].to_numpy(dtype=float)
-    low = df["low"].to_numpy(dtype=float)
-    high = df["high"].to_numpy(dtype=float)
-    times = df["time"].to_numpy()
-
-    if ema_cache is None:
-        ema_cache = {}
-    if ema_fast not in ema_cache:
-        ema_cache[ema_fast] = compute_ema(df, ema_fast).to_numpy(dtype=float)
-    if ema_slow not in ema_cache:
-        ema_cache[ema_slow] = compute_ema(df, ema_slow).to_numpy(dtype=float)
-    ema_f = ema_cache[ema_fast]
-    ema_s = ema_cache[ema_slow]
-
-    if rsi_arr is None:
-        if rsi_cache is not None and rsi_period in rsi_cache:
-            rsi_arr = rsi_cache[rsi_period]
-        else:
-            rsi_arr = compute_rsi(df, rsi_period).to_numpy(dtype=float)
-            if rsi_cache is not None:
-                rsi_cache[rsi_period] = rsi_arr
-    rsi = rsi_arr
-
-    if vol_ok_arr is None and volume_filter:
-        vol = df["tick_volume"].to_numpy(dtype=float)
-        vol_avg = pd.Series(vol).rolling(20).mean().to_numpy()
-        vol_ok_arr = np.nan_to_num(vol > vol_avg)
-
-    if sess_arr is None and sessions:
-        sess_arr = [_get_session_label(t) for t in times]
-
-    cost = spread_pips * pip * contract * lot
-    trades = []
-    position = None
-    entry = dirn = sl_price = tp_price = 0.0
-    lookback = max(ema_slow, rsi_period) + 5
-    total = len(close)
-    lot_contract = lot * contract
-
-    for i in range(lookback, total):
-        price = close[i]
-        lo = low[i]
-        hi = high[i]
-
-        if position:
-            if dirn == 0:  # buy
-                if lo <= sl_price:
-                    pnl = (sl_price - entry) * lot_contract
-                    balance += pnl
-                    trades.append((times[i], "BUY", "SL", pnl, balance))
-                    position = None
-                elif hi >= tp_price:
-                    pnl = (tp_price - entry) * lot_contract
-                    balance += pnl
-                    trades.append((times[i], "BUY", "TP", pnl, balance))
-                    position = None
-            else:  # sell
-                if hi >= sl_price:
-                    pnl = (entry - sl_price) * lot_contract
-                    balance += pnl
-                    trades.append((times[i], "SELL", "SL", pnl, balance))
-                    position = None
-                elif lo <= tp_price:
-                    pnl = (entry - tp_price) * lot_contract
-                    balance += pnl
-                    trades.append((times[i], "SELL", "TP", pnl, balance))
-                    position = None
-
-        if position is None:
-            ef = ema_f[i]
-            es = ema_s[i]
-            rv = rsi[i]
-            if np.isnan(ef) or np.isnan(es) or np.isnan(rv):
-                continue
-            if sess_arr is not None and sess_arr[i] not in sessions:
-                continue
-            if vol_ok_arr is not None and not vol_ok_arr[i]:
+# ─────────────────────── Successive halving ───────────────────────
+HALVING_MIN_BARS = 300      # barre del gradino più corto
+HALVING_MAX_RUNGS = 4
+HALVING_KEEP_MIN = 45       # sopravvissuti minimi per gradino (3x i 15 validati out-of-sample)
+
+
+def _log_auto_error(combo, e):
+    ef, es, ro, rb, sl, tp, _dirn = combo
+    logging.error(f"[AutoDiscover] EMA{ef}/{es} RSI<{ro} RSI>{rb} SL={sl} TP={tp}: {e}")
+    global_log(f"[AutoDiscover] Errore EMA{ef}/{es} RSI<{ro} RSI>{rb} SL={sl} TP={tp}: {e}", file=AUTO_LOG_FILE)
+
+
+def _halving_rungs(n_bars, eta):
+    """Finestre (prime N barre in-sample) dei gradini: n/eta^k, ..., n/eta, n."""
+    rungs = [n_bars]
+    while len(rungs) < HALVING_MAX_RUNGS and rungs[0] // eta >= HALVING_MIN_BARS:
+        rungs.insert(0, rungs[0] // eta)
+    return rungs
+
+
+def _halving_search(pool, combos, n_bars, eta, min_trades, set_progress, cancel):
+    """Successive halving sull'in-sample: tutte le combinazioni sulla finestra più corta, poi solo
+    il miglior 1/eta (per rendimento) su finestre eta volte più lunghe, fino all'in-sample intero.
+    A ogni gradino scarta le combinazioni che non possono più arrivare a min_trades (potatura esatta).
+    Ritorna [(metriche sull'in-sample intero, combo)] come la griglia completa."""
+    rungs = _halving_rungs(n_bars, eta)
+    survivors = list(combos)
+    for r, bars in enumerate(rungs):
+        out = pool.map(
+            auto_rung_task, [(bars, c) for c in survivors],
+            progress=lambda done, total, r=r: set_progress(int((r + done / total) / len(rungs) * 100)),
+            cancel=cancel,
+        )
+        alive = []
+        for combo, res in zip(survivors, out):
+            if isinstance(res, Exception):
+                _log_auto_error(combo, res)
                 continue
+            metrics, max_trades = res
+            if max_trades >= min_trades:
+                alive.append((metrics, combo))
 
-            if (direction in ("buy", "both")) and ef > es and rv < rsi_oversold:
-                entry = price
-                dirn = 0
-                sl_price = price - sl_pts * pip
-                tp_price = price + tp_pts * pip
-                position = True
-                balance -= cost
-            elif (direction in ("sell", "both")) and ef < es and rv > rsi_overbought:
-                entry = price
-                dirn = 1
-                sl_price = price + sl_pts * pip
-                tp_price = price - tp_pts * pip
-                position = True
-                balance -= cost
+        if r == len(rungs) - 1:
+            is_results = [(m, c) for m, c in alive if m["trades"] >= min_trades]
+            global_log(f"[AutoDiscover] Halving {r + 1}/{len(rungs)}: {bars} barre, {len(survivors)} combinazioni, {len(is_results)} sopra min_trade", file=AUTO_LOG_FILE)
+            return is_results
 
-    return trades, balance
+        alive.sort(key=lambda x: -x[0]["return_pct"])
+        keep = max(HALVING_KEEP_MIN, math.ceil(len(alive) / eta))
+        global_log(f"[AutoDiscover] Halving {r + 1}/{len(rungs)}: {bars} barre, {len(survivors)} combinazioni, {len(alive)} possono arrivare a min_trade, ne proseguono {min(keep, len(alive))}", file=AUTO_LOG_FILE)
+        survivors = [c for _, c in alive[:keep]]
+    return []
+
+
+def _auto_row(metrics, combo):
+    """Riga di auto-discover con le metriche in-sample di una combinazione."""
+    ef, es, ro, rb, sl, tp, dirn = combo
+    return {
+        "label": f"EMA{ef}/{es} RSI<{ro} RSI>{rb}",
+        "ema_fast": int(ef), "ema_slow": int(es),
+        "rsi_oversold": int(ro), "rsi_overbought": int(rb),
+        "sl": int(sl), "tp": int(tp), "direction": dirn,
+        # in-sample
+        "trades": int(metrics["trades"]),
+        "win_rate": float(round(metrics["win_rate"], 1)),
+        "return_pct": float(round(metrics["return_pct"], 1)),
+        "max_dd": float(round(metrics["max_dd"], 1)),
+        "sharpe": float(round(metrics["sharpe"], 2)),
+    }
 
 
 def _run_auto_discover(session_id: str, config: dict):
@@ -504,13 +493,15 @@ def _run_auto_discover(session_id: str, config: dict):
     volume_filter = config.get("volume_filter", False)
     use_spread = config.get("use_spread", True)
     sessions = [s.strip() for s in config.get("sessions_filter", "").split(",") if s.strip()] or None
+    search = config.get("search", "grid")
+    halving_eta = max(2, config.get("halving_eta", 3))
     sl_min, sl_max, sl_step, tp_min, tp_max, tp_step = _get_sl_tp_ranges(symbol)
     cancel = lambda: research_sessions.get(session_id, {}).get("cancelled", False)
 
     # Fetch data using first strategy that works
     strat = next(iter(STRATEGIES.values()))
     print(f"[AutoDiscover] Fetching {days} days of {symbol}...")
-    global_log(f"[AutoDiscover] Avvio ricerca automatica per {symbol} ({days} giorni), walk-forward 70/30, min_trade={min_trades}", file=AUTO_LOG_FILE)
+    global_log(f"[AutoDiscover] Avvio ricerca automatica per {symbol} ({days} giorni), walk-forward 70/30, min_trade={min_trades}, ricerca={search}", file=AUTO_LOG_FILE)
     try:
         dfs = fetch_data(symbol, strat, days, mt5_api_url)
     except Exception as e:
@@ -520,7 +511,7 @@ def _run_auto_discover(session_id: str, config: dict):
                 research_sessions[session_id]["result"] = {"error": f"Impossibile scaricare dati per {symbol}: {e}"}
         return
 
-    df = dfs.get("m15") or dfs.get("m1") or dfs.get("m5")
+    df = next((dfs[tf] for tf in ("m15", "m1", "m5") if dfs.get(tf) is not None), None)
     if df is None:
         with research_lock:
             if session_id in research_sessions:
@@ -564,71 +555,63 @@ def _run_auto_discover(session_id: str, config: dict):
 
     # Precalcola indicatori e filtri una sola volta per split (grande speedup)
     ema_periods = set(ema_fast_vals) | set(ema_slow_vals)
-    cache_is = _prepare_split_cache(df_is, ema_periods, {14}, volume_filter, sessions)
-    cache_oos = _prepare_split_cache(df_oos, ema_periods, {14}, volume_filter, sessions)
+    cache_is = prepare_split_cache(df_is, ema_periods, {14}, volume_filter, sessions)
+    cache_oos = prepare_split_cache(df_oos, ema_periods, {14}, volume_filter, sessions)
 
     total = len(all_combos)
     is_results = []
 
-    # FASE 1: ottimizzazione sul campione in-sample
-    for i, (ef, es, ro, rb, sl, tp, dirn) in enumerate(all_combos):
-        if cancel():
+    def _set_progress(pct):
+        with research_lock:
+            if session_id in research_sessions:
+                research_sessions[session_id]["progress"] = pct
+
+    dataset = generic_dataset(
+        df_is, cache_is, df_oos, cache_oos,
+        lot=config["lot"], balance=initial, pip=pip, contract=contract, spread_pips=spread_pips,
+        volume_filter=volume_filter, sessions=sessions, min_trades=min_trades,
+    )
+    with ResearchPool(shared_dataset.publish(session_id, dataset)) as pool:
+        # FASE 1: ottimizzazione sul campione in-sample (griglia completa o successive halving)
+        try:
+            if search == "halving":
+                is_results = _halving_search(pool, all_combos, len(df_is), halving_eta, min_trades, _set_progress, cancel)
+            else:
+                def _partial_rows(start, chunk):
+                    research_jobs.push_rows(session_id, [
+                        _auto_row(metrics, combo) for combo, metrics in zip(all_combos[start:start + len(chunk)], chunk)
+                        if metrics is not None and not isinstance(metrics, Exception)
+                    ], key=_row_return)
+
+                is_metrics = pool.map(auto_is_task, all_combos, progress=lambda done, _t: _set_progress(int(done / total * 100)), cancel=cancel, on_result=_partial_rows)
+                for combo, metrics in zip(all_combos, is_metrics):
+                    if isinstance(metrics, Exception):
+                        _log_auto_error(combo, metrics)
+                        continue
+                    if metrics is not None:
+                        is_results.append((metrics, combo))
+        except InterruptedError:
             with research_lock:
                 if session_id in research_sessions:
                     research_sessions[session_id]["status"] = "cancelled"
             return
 
-        try:
-            trades, final_bal = _run_generic_backtest(
-                df_is, ef, es, 14, ro, rb, sl, tp, dirn,
-                config["lot"], initial, pip, contract,
-                spread_pips=spread_pips, volume_filter=volume_filter, sessions=sessions,
-                ema_cache=cache_is[0], rsi_arr=None, vol_ok_arr=cache_is[2], sess_arr=cache_is[3], rsi_cache=cache_is[1],
-            )
-            metrics = _summarize_trades(trades, initial)
-            if metrics["trades"] < min_trades:
-                continue
-            is_results.append((metrics, (ef, es, ro, rb, sl, tp, dirn)))
-        except Exception as e:
-            logging.error(f"[AutoDiscover] EMA{ef}/{es} RSI<{ro} RSI>{rb} SL={sl} TP={tp}: {e}")
-            global_log(f"[AutoDiscover] Errore EMA{ef}/{es} RSI<{ro} RSI>{rb} SL={sl} TP={tp}: {e}", file=AUTO_LOG_FILE)
-            continue
-
-        pct = int((i + 1) / total * 100)
-        with research_lock:
-            if session_id in research_sessions:
-                research_sessions[session_id]["progress"] = pct
-
-    # Prendi i migliori in-sample (per rendimento) e validali out-of-sample
-    is_results.sort(key=lambda x: -x[0]["return_pct"])
-    top = is_results[:15]
+        # Prendi i migliori in-sample (per rendimento) e validali out-of-sample
+        is_results.sort(key=lambda x: -x[0]["return_pct"])
+        top = is_results[:15]
+        if search == "halving":     # i gradini usano finestre parziali: righe solo a fine ricerca
+            research_jobs.push_rows(session_id, [_auto_row(m, c) for m, c in top], key=_row_return)
+        oos_metrics = pool.map(auto_oos_task, [combo for _, combo in top])
 
     results = []
-    for metrics, (ef, es, ro, rb, sl, tp, dirn) in top:
-        try:
-            trades_oos, final_bal_oos = _run_generic_backtest(
-                df_oos, ef, es, 14, ro, rb, sl, tp, dirn,
-                config["lot"], initial, pip, contract,
-                spread_pips=spread_pips, volume_filter=volume_filter, sessions=sessions,
-                ema_cache=cache_oos[0], rsi_arr=None, vol_ok_arr=cache_oos[2], sess_arr=cache_oos[3], rsi_cache=cache_oos[1],
-            )
-            oos = _summarize_trades(trades_oos, initial)
-        except Exception as e:
-            logging.error(f"[AutoDiscover] OOS EMA{ef}/{es} SL={sl} TP={tp}: {e}")
+    for (metrics, combo), oos in zip(top, oos_metrics):
+        if isinstance(oos, Exception):
+            ef, es, _ro, _rb, sl, tp, _d = combo
+            logging.error(f"[AutoDiscover] OOS EMA{ef}/{es} SL={sl} TP={tp}: {oos}")
             continue
 
-        label = f"EMA{ef}/{es} RSI<{ro} RSI>{rb}"
         results.append({
-            "label": label,
-            "ema_fast": int(ef), "ema_slow": int(es),
-            "rsi_oversold": int(ro), "rsi_overbought": int(rb),
-            "sl": int(sl), "tp": int(tp), "direction": dirn,
-            # in-sample
-            "trades": int(metrics["trades"]),
-            "win_rate": float(round(metrics["win_rate"], 1)),
-            "return_pct": float(round(metrics["return_pct"], 1)),
-            "max_dd": float(round(metrics["max_dd"], 1)),
-            "sharpe": float(round(metrics["sharpe"], 2)),
+            **_auto_row(metrics, combo),
             # out-of-sample (validazione)
             "oos_trades": int(oos["trades"]),
             "oos_win_rate": float(round(oos["win_rate"], 1)),
@@ -807,7 +790,7 @@ def _run_agent_discover(session_id: str, config: dict):
                 research_sessions[session_id]["result"] = {"error": f"Impossibile scaricare dati per {symbol}: {e}"}
         return
 
-    df = dfs.get("m15") or dfs.get("m1") or dfs.get("m5")
+    df = next((dfs[tf] for tf in ("m15", "m1", "m5") if dfs.get(tf) is not None), None)
     if df is None:
         with research_lock:
             if session_id in research_sessions:
@@ -828,29 +811,14 @@ def _run_agent_discover(session_id: str, config: dict):
     df_oos = df.iloc[split:].reset_index(drop=True)
     ema_periods = set(range(bounds["ema_fast"][0], bounds["ema_slow"][1] + 1))
     rsi_periods = set(range(bounds["rsi_period"][0], bounds["rsi_period"][1] + 1))
-    cache_is = _prepare_split_cache(df_is, ema_periods, rsi_periods, volume_filter, sessions)
-    cache_oos = _prepare_split_cache(df_oos, ema_periods, rsi_periods, volume_filter, sessions)
-
-    def _eval(c):
-        trades, _ = _run_generic_backtest(
-            df_is, c["ema_fast"], c["ema_slow"], c["rsi_period"],
-            c["rsi_oversold"], c["rsi_overbought"], c["sl"], c["tp"], c["direction"],
-            config["lot"], initial, pip, contract,
-            spread_pips=spread_pips, volume_filter=volume_filter, sessions=sessions,
-            ema_cache=cache_is[0], rsi_cache=cache_is[1], vol_ok_arr=cache_is[2], sess_arr=cache_is[3],
-        )
-        m_is = _summarize_trades(trades, initial)
-        if m_is["trades"] < min_trades:
-            return None, None
-        trades_oos, _ = _run_generic_backtest(
-            df_oos, c["ema_fast"], c["ema_slow"], c["rsi_period"],
-            c["rsi_oversold"], c["rsi_overbought"], c["sl"], c["tp"], c["direction"],
-            config["lot"], initial, pip, contract,
-            spread_pips=spread_pips, volume_filter=volume_filter, sessions=sessions,
-            ema_cache=cache_oos[0], rsi_cache=cache_oos[1], vol_ok_arr=cache_oos[2], sess_arr=cache_oos[3],
-        )
-        m_oos = _summarize_trades(trades_oos, initial)
-        return m_is, m_oos
+    cache_is = prepare_split_cache(df_is, ema_periods, rsi_periods, volume_filter, sessions)
+    cache_oos = prepare_split_cache(df_oos, ema_periods, rsi_periods, volume_filter, sessions)
+
+    dataset = generic_dataset(
+        df_is, cache_is, df_oos, cache_oos,
+        lot=config["lot"], balance=initial, pip=pip, contract=contract, spread_pips=spread_pips,
+        volume_filter=volume_filter, sessions=sessions, min_trades=min_trades,
+    )
 
     rng = random.Random()
     tested = {}
@@ -899,26 +867,27 @@ def _run_agent_discover(session_id: str, config: dict):
         if _config_key(c) not in tested:
             seed_pool.append(c)
 
-    for round_idx in range(iterations):
-        if cancel():
-            with research_lock:
-                if session_id in research_sessions:
-                    research_sessions[session_id]["status"] = "cancelled"
-            return
+    with ResearchPool(shared_dataset.publish(session_id, dataset), workers=min(batch_size, RESEARCH_WORKERS)) as pool:
+        for round_idx in range(iterations):
+            if cancel():
+                with research_lock:
+                    if session_id in research_sessions:
+                        research_sessions[session_id]["status"] = "cancelled"
+                return
 
-        # Proposte: prima iterazione = seed, poi LLM (o random se fallisce)
-        proposals = []
-        if round_idx == 0:
-            proposals = seed_pool
-        else:
-            hist = sorted(results, key=lambda r: -r["oos_return_pct"])[:15]
-            hist_txt = "\n".join(
-                f"- EMA{r['ema_fast']}/{r['ema_slow']} RSI{r.get('rsi_period',14)}<{r['rsi_oversold']} >{r['rsi_overbought']} "
-                f"{r['direction']} SL={r['sl']} TP={r['tp']}: IS {r['return_pct']:+.1f}% ({r['trades']}t, WR {r['win_rate']:.0f}%, DD {r['max_dd']:.1f}%) | "
-                f"OOS {r['oos_return_pct']:+.1f}% ({r['oos_trades']}t, WR {r['oos_win_rate']:.0f}%)"
-                for r in hist
-            )
-            prompt = f"""Sei un quant researcher che ottimizza strategie di trading con validazione walk-forward.
+            # Proposte: prima iterazione = seed, poi LLM (o random se fallisce)
+            proposals = []
+            if round_idx == 0:
+                proposals = seed_pool
+            else:
+                hist = sorted(results, key=lambda r: -r["oos_return_pct"])[:15]
+                hist_txt = "\n".join(
+                    f"- EMA{r['ema_fast']}/{r['ema_slow']} RSI{r.get('rsi_period',14)}<{r['rsi_oversold']} >{r['rsi_overbought']} "
+                    f"{r['direction']} SL={r['sl']} TP={r['tp']}: IS {r['return_pct']:+.1f}% ({r['trades']}t, WR {r['win_rate']:.0f}%, DD {r['max_dd']:.1f}%) | "
+                    f"OOS {r['oos_return_pct']:+.1f}% ({r['oos_trades']}t, WR {r['oos_win_rate']:.0f}%)"
+                    for r in hist
+                )
+                prompt = f"""Sei un quant researcher che ottimizza strategie di trading con validazione walk-forward.
 Stai cercando parametri per la strategia EMA + RSI su {symbol} ({days} giorni, split 70/30 con costi spread {'ATTIVI' if use_spread else 'DISATTIVI'}).
 Balance iniziale ${initial}, lotto {config['lot']}, minimo {min_trades} trade in-sample.
 
@@ -943,46 +912,50 @@ se una direzione domina, RSI più estremo per meno trade ma più puliti, ecc.).
 
 Rispondi SOLO con JSON valido in questo formato esatto:
 {{"reasoning": "breve spiegazione in italiano (max 200 parole)", "configs": [{{"ema_fast": 9, "ema_slow": 50, "rsi_period": 14, "rsi_oversold": 35, "rsi_overbought": 65, "sl": 200, "tp": 900, "direction": "buy"}}]}}"""
-            llm_reasoning, raw_cfgs = _llm_propose_configs(prompt, batch_size, model)
-            if raw_cfgs:
-                reasoning = llm_reasoning or reasoning
-                for rc in raw_cfgs:
-                    c = _sanitize_agent_config(rc if isinstance(rc, dict) else {}, bounds, direction)
-                    if _config_key(c) not in tested:
-                        proposals.append(c)
-            if len(proposals) < batch_size:
-                while len(proposals) < batch_size:
-                    c = _random_agent_config(bounds, rng, direction)
-                    if _config_key(c) not in tested:
-                        proposals.append(c)
-
-        for c in proposals:
-            if cancel():
+                llm_reasoning, raw_cfgs = _llm_propose_configs(prompt, batch_size, model)
+                if raw_cfgs:
+                    reasoning = llm_reasoning or reasoning
+                    for rc in raw_cfgs:
+                        c = _sanitize_agent_config(rc if isinstance(rc, dict) else {}, bounds, direction)
+                        if _config_key(c) not in tested:
+                            proposals.append(c)
+                if len(proposals) < batch_size:
+                    while len(proposals) < batch_size:
+                        c = _random_agent_config(bounds, rng, direction)
+                        if _config_key(c) not in tested:
+                            proposals.append(c)
+
+            # Valuta tutto il batch in parallelo (IS + OOS per proposta), risultati in ordine di proposta
+            def _progress(done, _total, base=evals_done):
+                pct = int((base + done) / total_evals * 100)
+                with research_lock:
+                    if session_id in research_sessions:
+                        research_sessions[session_id]["progress"] = pct
+
+            try:
+                evaluated = pool.map(agent_eval_task, proposals, progress=_progress, cancel=cancel, chunk_size=1)
+            except InterruptedError:
                 with research_lock:
                     if session_id in research_sessions:
                         research_sessions[session_id]["status"] = "cancelled"
                 return
-            try:
-                m_is, m_oos = _eval(c)
+            evals_done += len(proposals)
+
+            for c, res in zip(proposals, evaluated):
+                if isinstance(res, Exception):
+                    logging.error(f"[AgentDiscover] Errore EMA{c['ema_fast']}/{c['ema_slow']} SL={c['sl']} TP={c['tp']}: {res}")
+                    continue
+                m_is, m_oos = res
                 if m_is is None:
                     tested[_config_key(c)] = True
                     continue
                 _add(c, m_is, m_oos)
-            except Exception as e:
-                logging.error(f"[AgentDiscover] Errore EMA{c['ema_fast']}/{c['ema_slow']} SL={c['sl']} TP={c['tp']}: {e}")
-                continue
-            finally:
-                evals_done += 1
-                pct = int(evals_done / total_evals * 100)
-                with research_lock:
-                    if session_id in research_sessions:
-                        research_sessions[session_id]["progress"] = pct
 
-        global_log(f"[AgentDiscover] Round {round_idx + 1}/{iterations}: {len(results)} config valide finora, best OOS {best_oos:+.2f}%", file=AUTO_LOG_FILE)
+            global_log(f"[AgentDiscover] Round {round_idx + 1}/{iterations}: {len(results)} config valide finora, best OOS {best_oos:+.2f}%", file=AUTO_LOG_FILE)
 
-        if round_idx > 0 and stale_rounds >= 2 * batch_size:
-            global_log("[AgentDiscover] Nessun miglioramento, stop anticipato", file=AUTO_LOG_FILE)
-            break
+            if round_idx > 0 and stale_rounds >= 2 * batch_size:
+                global_log("[AgentDiscover] Nessun miglioramento, stop anticipato", file=AUTO_LOG_FILE)
+                break
 
     results.sort(key=lambda r: -(r["oos_return_pct"] if r["oos_trades"] else -999))
     target_hits = [r for r in results if r["target_hit"]]
@@ -1012,24 +985,8 @@ Rispondi SOLO con JSON valido in questo formato esatto:
 
 
 @router.post("/signal-research/agent-discover")
-def start_agent_discover(req: AgentDiscoverRequest):
-    mt5_api_url = None
-    from db import get_connection
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""
-            SELECT ss.ip, ss.port
-            FROM traders t
-            JOIN servers ss ON ss.id = t.slave_server_id
-            LIMIT 1
-        """)
-        row = cursor.fetchone()
-        if row and row[0] and row[1]:
-            mt5_api_url = f"http://{row[0]}:{row[1]}"
-    finally:
-        cursor.close()
-        conn.close()
+def start_agent_discover(req: AgentDiscoverRequest, request: Request):
+    mt5_api_url = _get_default_mt5_api_url()
 
     if not mt5_api_url:
         return JSONResponse(status_code=400, content={"error": "No MT5 API URL found"})
@@ -1052,39 +1009,23 @@ def start_agent_discover(req: AgentDiscoverRequest):
         "mt5_api_url": mt5_api_url,
     }
 
-    with research_lock:
-        research_sessions[session_id] = {
-            "status": "running",
-            "result": None,
-            "cancelled": False,
-            "progress": 0,
-            "config": config,
-        }
-
-    t = threading.Thread(target=_run_agent_discover, args=(session_id, config), daemon=True)
-    t.start()
+    session = {
+        "status": "running",
+        "result": None,
+        "cancelled": False,
+        "progress": 0,
+        "config": config,
+    }
+    try:
+        research_jobs.submit(session_id, session, _run_session, _run_agent_discover, session_id, config, owner=owner_of(request))
+    except JobRejected as e:
+        return JSONResponse(status_code=429, content={"error": str(e)})
     return {"session_id": session_id}
 
 
 @router.post("/signal-research/auto-discover")
-def start_auto_discover(req: AutoDiscoverRequest):
-    mt5_api_url = None
-    from db import get_connection
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""
-            SELECT ss.ip, ss.port
-            FROM traders t
-            JOIN servers ss ON ss.id = t.slave_server_id
-            LIMIT 1
-        """)
-        row = cursor.fetchone()
-        if row and row[0] and row[1]:
-            mt5_api_url = f"http://{row[0]}:{row[1]}"
-    finally:
-        cursor.close()
-        conn.close()
+def start_auto_discover(req: AutoDiscoverRequest, request: Request):
+    mt5_api_url = _get_default_mt5_api_url()
 
     if not mt5_api_url:
         return JSONResponse(status_code=400, content={"error": "No MT5 API URL found"})
@@ -1097,20 +1038,26 @@ def start_auto_discover(req: AutoDiscoverRequest):
         "balance": req.balance,
         "direction": req.direction,
         "target_return": req.target_return,
+        "min_trades": req.min_trades,
+        "volume_filter": req.volume_filter,
+        "sessions_filter": req.sessions_filter,
+        "use_spread": req.use_spread,
+        "search": req.search,
+        "halving_eta": req.halving_eta,
         "mt5_api_url": mt5_api_url,
     }
 
-    with research_lock:
-        research_sessions[session_id] = {
-            "status": "running",
-            "result": None,
-            "cancelled": False,
-            "progress": 0,
-            "config": config,
-        }
-
-    t = threading.Thread(target=_run_auto_discover, args=(session_id, config), daemon=True)
-    t.start()
+    session = {
+        "status": "running",
+        "result": None,
+        "cancelled": False,
+        "progress": 0,
+        "config": config,
+    }
+    try:
+        research_jobs.submit(session_id, session, _run_session, _run_auto_discover, session_id, config, owner=owner_of(request))
+    except JobRejected as e:
+        return JSONResponse(status_code=429, content={"error": str(e)})
     return {"session_id": session_id}
 
 
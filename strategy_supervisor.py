@@ -18,10 +18,10 @@ from zoneinfo import ZoneInfo
 from typing import Optional
 
 import pandas as pd
-import requests
 
 from logger import log as global_log
-from db import get_connection
+from agent_client import agent_get
+from db import db_cursor
 from indicators.ta import compute_atr, compute_rolling_percentile
 from trading_signals_multi2 import (
     get_data,
@@ -64,9 +64,7 @@ def now_iso() -> str:
 
 def _load_traders() -> list[dict]:
     """Tutti i trader attivi con strategia + info server slave."""
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    try:
+    with db_cursor(dictionary=True) as cursor:
         cursor.execute("""
             SELECT t.id, t.name, t.is_active, t.selected_signal, t.selected_symbol,
                    t.custom_signal_interval, t.sessions_filter,
@@ -79,9 +77,6 @@ def _load_traders() -> list[dict]:
             ORDER BY t.id
         """)
         return cursor.fetchall()
-    finally:
-        cursor.close()
-        conn.close()
 
 
 def _is_running(trader_id: int) -> bool:
@@ -92,18 +87,13 @@ def _is_running(trader_id: int) -> bool:
 def _performance(trader_id: int) -> dict:
     """Metriche sugli ultimi 30 trade chiusi (da slave_orders)."""
     try:
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-        try:
+        with db_cursor(dictionary=True) as cursor:
             cursor.execute("""
                 SELECT profit FROM slave_orders
                 WHERE trader_id = %s AND closed_at IS NOT NULL
                 ORDER BY closed_at DESC LIMIT 30
             """, (trader_id,))
             rows = cursor.fetchall()
-        finally:
-            cursor.close()
-            conn.close()
     except Exception:
         return {
             "total_trades": 0, "win_rate": None,
@@ -175,7 +165,7 @@ def _market_snapshot(symbol: str, slave_url: str) -> dict:
 
 def _open_positions(slave_url: str, symbol: str) -> int:
     try:
-        resp = requests.get(f"{slave_url}/positions", timeout=5)
+        resp = agent_get(f"{slave_url}/positions", timeout=5)
         if resp.status_code == 200:
             return len([p for p in resp.json() if p.get("symbol") == symbol])
     except Exception:
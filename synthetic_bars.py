@@ -0,0 +1,25 @@
+# --- SYNTHETIC BARS: candele finte condivise dai test degli indicatori e dei kernel ---
+#
+# df = make_bars(5000, seed=7)        # time, open, high, low, close
+# df.set_index("time")                # serie con indice temporale (indicators/ta.py)
+#
+# Random walk tipo XAUUSD M1: stessa sequenza di close per seed, qualunque colonna
+# usi il test, così i dati restano confrontabili tra test_ta_kernels, test_streaming
+# e test_exit_kernel.
+
+import numpy as np
+import pandas as pd
+
+
+def make_bars(n, seed=42, start=2000.0):
+    """Random walk OHLC tipo XAUUSD M1 con colonna time."""
+    rng = np.random.default_rng(seed)
+    close = start + np.cumsum(rng.normal(0, 0.35, n))
+    op = np.r_[close[0], close[:-1]]
+    return pd.DataFrame({
+        "time": pd.date_range("2025-01-01", periods=n, freq="min").to_numpy(),
+        "open": op,
+        "high": np.maximum(op, close) + np.abs(rng.normal(0, 0.2, n)),
+        "low": np.minimum(op, close) - np.abs(rng.normal(0, 0.2, n)),
+        "close": close,
+    })
@@ -0,0 +1,147 @@
+"""
+Test per agent_client (client HTTP condiviso verso gli agent MT5)
+
+- timeout di lettura: ReadTimeout come requests.get (safe_get → 504), GET e POST mai ripetuti
+- agent giù: i retry di connessione consumano il budget dell'host, a budget finito
+  nessun retry e sempre requests.ConnectionError
+- pool: al più AGENT_POOL_MAXSIZE connessioni per host, keep-alive riusato tra le chiamate
+- eseguibile con pytest oppure direttamente:  python test_agent_client.py
+"""
+
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+
+import agent_client
+import logger
+from agent_client import AgentClient
+
+
+class _Agent(ThreadingHTTPServer):
+    """Agent finto: /ok risponde subito, /slow?s=… dopo s secondi; conta richieste e connessioni."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.hits = 0
+        self.active = 0
+        self.max_active = 0
+        self.peers = set()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"          # keep-alive
+
+    def _serve(self):
+        server = self.server
+        with server.lock:
+            server.hits += 1
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            server.peers.add(self.client_address[1])
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                self.rfile.read(length)
+            parts = urlsplit(self.path)
+            if parts.path == "/slow":
+                time.sleep(float(parse_qs(parts.query)["s"][0]))
+            body = b'{"status": "ok"}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    do_GET = do_POST = _serve
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def agent():
+    server = _Agent()
+    yield server
+    server.close()
+
+
+def _closed_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_read_timeout_is_not_retried(agent, monkeypatch):
+    client = AgentClient(agent.url)
+    with pytest.raises(requests.ReadTimeout):
+        client.get("/slow?s=0.5", timeout=(1, 0.1))
+    with pytest.raises(requests.ReadTimeout):
+        client.post("/slow?s=0.5", json={"order": 1}, timeout=(1, 0.1))
+    time.sleep(0.5)
+    assert agent.hits == 2 and client.stats()["retries"] == 0
+    assert client.stats()["retries_denied"] == 0
+
+    monkeypatch.setattr(logger, "log", lambda *a, **k: None)
+    assert logger.safe_get(f"{agent.url}/slow?s=0.5", timeout=0.1).status_code == 504
+
+
+def test_connect_errors_consume_budget():
+    client = AgentClient(f"http://127.0.0.1:{_closed_port()}")
+    client.budget.tokens = 2.0
+    client.budget.ratio = 0.0
+    for _ in range(3):
+        with pytest.raises(requests.ConnectionError):
+            client.get("/ok", timeout=1)
+    stats = client.stats()
+    assert stats["retries"] == 2                    # i due retry del primo tentativo
+    assert stats["retries_denied"] == 2             # poi nessun retry: budget finito
+    assert stats["retry_tokens"] == 0
+
+
+def test_pool_limit_and_keep_alive(agent, monkeypatch):
+    monkeypatch.setattr(agent_client, "AGENT_POOL_MAXSIZE", 2)
+    client = AgentClient(agent.url)
+    with ThreadPoolExecutor(6) as ex:
+        codes = list(ex.map(lambda _: client.get("/slow?s=0.1").status_code, range(6)))
+    assert codes == [200] * 6
+    assert agent.max_active == 2                    # gli altri aspettano una connessione libera
+    peers = set(agent.peers)
+    for _ in range(20):
+        assert client.get("/ok").status_code == 200
+    assert agent.peers == peers                     # nessuna nuova connessione
+
+
+def test_shared_client_per_host(agent):
+    a = agent_client.get_agent_client(f"{agent.url}/positions")
+    b = agent_client.get_agent_client(f"{agent.url}/symbol_tick/XAUUSD")
+    assert a is b and a.base_url == agent.url
+    assert agent_client.agent_get(f"{agent.url}/ok").json() == {"status": "ok"}
+
+
+if __name__ == "__main__":
+    test_connect_errors_consume_budget()
+    print("✅ AgentClient OK")
@@ -0,0 +1,317 @@
+"""
+Test per agent_sessions (login MT5 riusato tra gli ordini)
+
+- entro AGENT_HEALTH_TTL nessuna chiamata all'agent; dopo, solo GET /health
+- nuovo login solo con account diverso, terminale disconnesso o MT5 non inizializzato (init + login)
+- agent vecchi senza "login" in /health: vale il login ricordato
+- login rifiutato → AgentSessionError e sessione dimenticata
+- lock per agent: un ordine su uno slave non blocca gli altri slave
+- open_order_on_slave: due ordini di fila fanno un solo /login
+- open/close_order_on_slave: connessione al db chiusa anche sui rami di errore
+- eseguibile con pytest oppure direttamente:  python test_agent_sessions.py
+  (in questo caso lancia solo il confronto delle chiamate per ordine: i test usano monkeypatch)
+"""
+
+import threading
+import time
+
+import pytest
+
+import agent_sessions
+from agent_sessions import AgentSessionError, agent_session
+
+URL = "http://slave-agent:1"
+
+
+class _Resp:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body or {}
+        self.text = str(self._body)
+
+    def json(self):
+        return self._body
+
+
+class FakeAgent:
+    """Agent MT5 finto: stato del terminale e registro delle chiamate."""
+
+    def __init__(self, report_login=True):
+        self.report_login = report_login
+        self.initialized = True
+        self.login = None
+        self.connected = True
+        self.reject_login = False
+        self.calls = []
+
+    def get(self, url, **kwargs):
+        path = url.split("/", 3)[3]
+        self.calls.append(path)
+        if path == "health":
+            if not self.initialized:
+                return _Resp(200, {"status": "error", "message": "MT5 non inizializzato"})
+            body = {"status": "ok", "mt5_version": "5.0"}
+            if self.report_login:
+                body.update(login=self.login, server="Broker-Demo" if self.login else None,
+                            connected=self.connected)
+            return _Resp(200, body)
+        if path.startswith("symbol_tick"):
+            return _Resp(200, {"bid": 2000.0, "ask": 2000.2})
+        return _Resp(404)
+
+    def post(self, url, json=None, **kwargs):
+        path = url.split("/", 3)[3]
+        self.calls.append(path)
+        if path == "init-mt5":
+            self.initialized, self.login = True, None
+            return _Resp(200, {"status": "ok"})
+        if path == "login":
+            if self.reject_login:
+                return _Resp(400, {"detail": "Login fallito"})
+            self.login, self.connected = json["login"], True
+            return _Resp(200, {"balance": 1000.0})
+        if path == "order":
+            return _Resp(200, {"result": {"retcode": 10009, "order": 42}})
+        return _Resp(200)
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    fake = FakeAgent()
+    _install(monkeypatch, fake)
+    yield fake
+    agent_sessions.invalidate()
+
+
+def _install(monkeypatch, fake):
+    agent_sessions.invalidate()
+    monkeypatch.setattr(agent_sessions, "agent_get", fake.get)
+    monkeypatch.setattr(agent_sessions, "agent_post", fake.post)
+
+
+def _use(login=1001, server="Broker-Demo", url=URL):
+    with agent_session(url, "C:/mt5/terminal64.exe", login, "pwd", server, log=lambda m: None) as health:
+        return health
+
+
+def test_cached_within_ttl(agent):
+    _use()
+    assert agent.calls == ["health", "login"]
+    agent.calls.clear()
+    assert _use()["cached"]
+    assert _use(login="1001")["cached"]             # dal DB arriva come stringa
+    assert agent.calls == []
+
+
+def test_after_ttl_only_health(agent, monkeypatch):
+    _use()
+    monkeypatch.setattr(agent_sessions, "AGENT_HEALTH_TTL", 0)
+    agent.calls.clear()
+    _use()
+    assert agent.calls == ["health"]
+
+
+def test_relogin_on_other_account_or_disconnect(agent, monkeypatch):
+    monkeypatch.setattr(agent_sessions, "AGENT_HEALTH_TTL", 0)
+    _use()
+    agent.login = 2002                               # login fatto da altri sullo stesso terminale
+    agent.calls.clear()
+    _use()
+    assert agent.calls == ["health", "login"] and agent.login == 1001
+    agent.connected = False
+    agent.calls.clear()
+    _use()
+    assert agent.calls == ["health", "login"]
+    agent.initialized = False
+    agent.calls.clear()
+    _use()
+    assert agent.calls == ["health", "init-mt5", "login"]
+
+
+def test_old_agent_trusts_remembered_login(monkeypatch):
+    fake = FakeAgent(report_login=False)
+    _install(monkeypatch, fake)
+    monkeypatch.setattr(agent_sessions, "AGENT_HEALTH_TTL", 0)
+    try:
+        _use()
+        _use()
+        assert fake.calls == ["health", "login", "health"]
+        _use(login=3003)
+        assert fake.calls[-2:] == ["health", "login"]
+    finally:
+        agent_sessions.invalidate()
+
+
+def test_login_rejected_forgets_session(agent):
+    agent.reject_login = True
+    with pytest.raises(AgentSessionError):
+        _use()
+    agent.reject_login = False
+    agent.calls.clear()
+    _use()
+    assert agent.calls == ["health", "login"]
+
+
+def test_error_in_block_forgets_session(agent):
+    _use()
+    with pytest.raises(RuntimeError):
+        with agent_session(URL, "", 1001, "pwd", "Broker-Demo", log=lambda m: None):
+            raise RuntimeError("ordine fallito")
+    agent.calls.clear()
+    _use()
+    assert agent.calls == ["health"]
+
+
+def test_lock_is_per_agent(agent):
+    entered, release = threading.Event(), threading.Event()
+
+    def hold():
+        with agent_session(URL, "", 1001, "pwd", "Broker-Demo", log=lambda m: None):
+            entered.set()
+            release.wait(5)
+
+    t = threading.Thread(target=hold)
+    t.start()
+    try:
+        assert entered.wait(5)
+        t0 = time.perf_counter()
+        _use(url="http://other-agent:1")             # altro slave: non aspetta
+        assert time.perf_counter() - t0 < 1.0
+        done = threading.Event()
+        threading.Thread(target=lambda: (_use(), done.set())).start()
+        assert not done.wait(0.2)                    # stesso slave: in fila
+    finally:
+        release.set()
+        t.join()
+    assert done.wait(5)
+
+
+# ─────────────────────── open_order_on_slave ───────────────────────
+
+class _Cursor:
+    def execute(self, *args):
+        pass
+
+    def close(self):
+        pass
+
+
+class _Conn:
+    open = 0                                         # connessioni prese e non ancora chiuse
+
+    def __init__(self):
+        _Conn.open += 1
+
+    def cursor(self, dictionary=False):
+        return _Cursor()
+
+    def commit(self):
+        pass
+
+    def close(self):
+        _Conn.open -= 1
+
+
+TRADER = {"slave_ip": "slave-agent", "slave_port": 1, "slave_path": "C:/mt5/terminal64.exe",
+          "slave_user": "1001", "slave_pwd": "pwd", "slave_name": "Broker-Demo"}
+
+
+def _patch_db(monkeypatch, fake, trader=TRADER):
+    import db
+    _install(monkeypatch, fake)
+    monkeypatch.setattr(db, "get_connection", lambda: _Conn())
+    monkeypatch.setattr(db, "get_trader", lambda cursor, trader_id: dict(trader) if trader else None)
+    monkeypatch.setattr(db, "safe_get", fake.get)
+    monkeypatch.setattr(db, "agent_post", fake.post)
+    monkeypatch.setattr(db, "log", lambda *a, **k: None)
+    return db
+
+
+def _orders(monkeypatch, fake, n):
+    db = _patch_db(monkeypatch, fake)
+    payload = db.OrderPayload(trader_id=1, order_type="buy", volume=0.01, symbol="XAUUSD")
+    return [db.open_order_on_slave(payload) for _ in range(n)]
+
+
+def test_open_order_logs_in_once(monkeypatch):
+    fake = FakeAgent()
+    try:
+        results = _orders(monkeypatch, fake, 2)
+    finally:
+        agent_sessions.invalidate()
+    assert [r["status"] for r in results] == ["ok", "ok"] and results[0]["ticket"] == 42
+    assert fake.calls == ["health", "login", "symbol_tick/XAUUSD", "order", "symbol_tick/XAUUSD", "order"]
+
+
+def test_open_order_login_error_is_ko(monkeypatch):
+    fake = FakeAgent()
+    fake.reject_login = True
+    try:
+        result = _orders(monkeypatch, fake, 1)[0]
+    finally:
+        agent_sessions.invalidate()
+    assert result["status"] == "ko" and "login" in result["message"]
+    assert "order" not in fake.calls
+
+
+def test_connection_closed_on_every_branch(monkeypatch):
+    _Conn.open = 0
+    order = dict(trader_id=1, order_type="buy", volume=0.01, symbol="XAUUSD")
+    try:
+        db = _patch_db(monkeypatch, FakeAgent(), trader=None)               # trader non trovato
+        assert db.open_order_on_slave(db.OrderPayload(**order))["status"] == "ko"
+        assert db.close_order_on_slave(db.CloseOrderPayload(trader_id=1, symbol="XAUUSD"))["status"] == "ko"
+        assert _Conn.open == 0
+
+        fake = FakeAgent()
+        fake.reject_login = True                                            # AgentSessionError
+        db = _patch_db(monkeypatch, fake)
+        assert db.open_order_on_slave(db.OrderPayload(**order))["status"] == "ko"
+        assert db.close_order_on_slave(db.CloseOrderPayload(trader_id=1, symbol="XAUUSD"))["status"] == "ko"
+        assert _Conn.open == 0
+
+        fake = FakeAgent()
+        db = _patch_db(monkeypatch, fake)
+        monkeypatch.setattr(db, "safe_get", lambda url, **kwargs: _Resp(500, {"error": "tick"}))
+        assert db.open_order_on_slave(db.OrderPayload(**order))["status"] == "ko"     # errore tick
+        monkeypatch.setattr(db, "safe_get", fake.get)
+        monkeypatch.setattr(db, "agent_post", lambda url, **kwargs: _Resp(500, {"error": "order"}))
+        assert db.open_order_on_slave(db.OrderPayload(**order))["status"] == "ko"     # errore ordine
+        assert db.close_order_on_slave(db.CloseOrderPayload(trader_id=1, symbol="XAUUSD"))["status"] == "ko"
+        assert _Conn.open == 0
+    finally:
+        agent_sessions.invalidate()
+
+
+# =========================================================
+# Benchmark
+# =========================================================
+class _Patch:
+    def __init__(self):
+        self.saved = []
+
+    def setattr(self, obj, name, value):
+        self.saved.append((obj, name, getattr(obj, name)))
+        setattr(obj, name, value)
+
+    def undo(self):
+        for obj, name, value in reversed(self.saved):
+            setattr(obj, name, value)
+
+
+def benchmark(n_orders=20):
+    patch = _Patch()
+    fake = FakeAgent()
+    try:
+        _orders(patch, fake, n_orders)
+    finally:
+        patch.undo()
+        agent_sessions.invalidate()
+    before = 2 + 2                                   # /health + /login + tick + order per ordine
+    print(f"Chiamate all'agent per {n_orders} ordini")
+    print(f"  login a ogni ordine   : {before * n_orders:4d}")
+    print(f"  sessione in cache     : {len(fake.calls):4d}  ({fake.calls.count('login')} login)")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,138 @@
+"""
+Test per la ricerca successive halving di auto-discover (signal_research_routes, research_tasks)
+
+- sull'in-sample intero il gradino coincide con la griglia completa
+- il limite massimo di trade usato per la potatura su min_trades è esatto
+  (mai sotto i trade reali dell'in-sample intero)
+- i sopravvissuti finali hanno le stesse metriche della griglia completa
+- eseguibile con pytest oppure direttamente:  python test_auto_discover_halving.py
+  (in questo caso lancia anche il confronto dei tempi griglia vs halving)
+"""
+
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import research_tasks as rt
+import signal_research_routes as sr
+from research_pool import ResearchPool
+
+# i log dei gradini non finiscono nel auto_discover_log.txt del repo
+sr.AUTO_LOG_FILE = os.path.join(tempfile.gettempdir(), "test_auto_discover_log.txt")
+
+
+def _bars(n=4_000, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 2000 + np.cumsum(rng.normal(0, 1.5, n))
+    op = np.r_[close[0], close[:-1]]
+    return pd.DataFrame({
+        "time": pd.date_range("2026-01-05", periods=n, freq="15min"),
+        "open": op,
+        "high": np.maximum(op, close) + np.abs(rng.normal(0, 0.8, n)),
+        "low": np.minimum(op, close) - np.abs(rng.normal(0, 0.8, n)),
+        "close": close,
+        "tick_volume": rng.integers(1, 100, n),
+    })
+
+
+def _dataset(n=4_000, seed=0, min_trades=20, volume_filter=True):
+    df = _bars(n, seed)
+    cache = rt.prepare_split_cache(df, {5, 9, 15, 30, 50}, {14}, volume_filter, None)
+    return rt.generic_dataset(
+        df, cache, df, cache, lot=0.01, balance=1000, pip=0.01, contract=100, spread_pips=2.0,
+        volume_filter=volume_filter, sessions=None, min_trades=min_trades,
+    )
+
+
+def _combos():
+    return [(ef, es, ro, rb, sl, tp, d)
+            for ef in (5, 9) for es in (30, 50) for ro in (35, 45) for rb in (55, 65)
+            for sl in (100, 300, 500) for tp in (400, 800) if tp > sl for d in ("buy", "sell")]
+
+
+def test_rungs():
+    assert sr._halving_rungs(6_000, 3) == [666, 2_000, 6_000]
+    assert sr._halving_rungs(6_000, 2) == [750, 1_500, 3_000, 6_000]     # al più HALVING_MAX_RUNGS gradini
+    assert sr._halving_rungs(200, 3) == [200]
+
+
+def test_full_window_matches_grid():
+    ds = _dataset(min_trades=0)
+    n = len(ds["is"][0])
+    for combo in _combos():
+        metrics, max_trades = rt.auto_rung_task(ds, (n, combo))
+        assert metrics == rt.auto_is_task(ds, combo)
+        assert max_trades >= metrics["trades"]
+
+
+def test_max_trades_bound_is_exact():
+    ds = _dataset(seed=3)
+    n = len(ds["is"][0])
+    for combo in _combos():
+        full = rt.generic_metrics(ds, "is", *combo[:2], 14, *combo[2:])
+        for bars in (150, 500, 1_300, 2_900):
+            _, max_trades = rt.auto_rung_task(ds, (bars, combo))
+            assert max_trades >= full["trades"], (combo, bars)
+        # la finestra intera: al più il trade rimasto aperto in più
+        _, max_trades = rt.auto_rung_task(ds, (n, combo))
+        assert max_trades - full["trades"] in (0, 1)
+
+
+def test_halving_search_matches_grid_metrics():
+    ds = _dataset(seed=5, min_trades=15)
+    combos = _combos()
+    with ResearchPool(ds, executor="serial") as pool:
+        progress = []
+        found = sr._halving_search(pool, combos, len(ds["is"][0]), 3, 15, progress.append, None)
+        grid = dict(zip(combos, pool.map(rt.auto_is_task, combos)))
+    assert progress[-1] == 100
+    assert found
+    for metrics, combo in found:
+        assert grid[combo] == metrics
+
+
+def test_min_trades_pruning_drops_nothing_valid():
+    # con meno di HALVING_KEEP_MIN combinazioni non c'è taglio per rendimento: resta
+    # solo la potatura su min_trades, che non deve perdere nessuna combinazione valida
+    ds = _dataset(seed=5, min_trades=15)
+    combos = _combos()[:sr.HALVING_KEEP_MIN - 5]
+    with ResearchPool(ds, executor="serial") as pool:
+        found = sr._halving_search(pool, combos, len(ds["is"][0]), 3, 15, lambda pct: None, None)
+        grid = dict(zip(combos, pool.map(rt.auto_is_task, combos)))
+    assert {c for _, c in found} == {c for c, m in grid.items() if m is not None}
+
+
+# =========================================================
+# Benchmark
+# =========================================================
+def benchmark():
+    ds = _dataset(n=6_000, seed=7, volume_filter=False)
+    combos = [(ef, es, ro, rb, sl, tp, d)
+              for ef in (5, 9, 15) for es in (15, 30, 50) if es > ef
+              for ro in (35, 40, 45) for rb in (55, 60, 65)
+              for sl in range(100, 601, 50) for tp in range(200, 1201, 100) if tp > sl
+              for d in ("buy", "sell")]
+    with ResearchPool(ds, executor="serial") as pool:
+        t0 = time.perf_counter()
+        grid = [(m, c) for c, m in zip(combos, pool.map(rt.auto_is_task, combos)) if m is not None]
+        t_grid = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        found = sr._halving_search(pool, combos, len(ds["is"][0]), 3, 20, lambda pct: None, None)
+        t_halv = time.perf_counter() - t0
+    best = lambda rows: max((m["return_pct"] for m, _ in rows), default=float("nan"))
+    print(f"Auto-discover su {len(combos)} combinazioni, 6000 barre in-sample")
+    print(f"  griglia completa   : {t_grid * 1000:9.1f} ms  ({len(grid)} sopra min_trade, best {best(grid):+.2f}%)")
+    print(f"  successive halving : {t_halv * 1000:9.1f} ms  ({len(found)} sopra min_trade, best {best(found):+.2f}%)")
+
+
+if __name__ == "__main__":
+    test_rungs()
+    test_full_window_matches_grid()
+    test_max_trades_bound_is_exact()
+    test_halving_search_matches_grid_metrics()
+    test_min_trades_pruning_drops_nothing_valid()
+    print("✅ Successive halving OK")
+    benchmark()
@@ -0,0 +1,155 @@
+"""
+Test di equivalenza per backtest.run_backtest: modalità vettoriale vs ciclo barra per barra
+
+- tutte le strategie di STRATEGIES, direzioni both / buy / sell: stessi trade
+  (ora, tipo, uscita, PnL, saldo) e stesso saldo finale con vectorized=True e False
+- le strategie con vector_conditions passano davvero dal percorso vettoriale
+- precompute_alignment: colonne m5_idx / m15_idx / h1_idx uguali al vecchio
+  searchsorted per barra, anche con barre mancanti; run_backtest le ricalcola se assenti
+- eseguibile con pytest oppure direttamente:  python test_backtest_vectorized.py
+  (in questo caso lancia anche il confronto dei tempi)
+"""
+
+import contextlib
+import io
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+from backtest import ALIGN_MINUTES, STRATEGIES, precompute_alignment, run_backtest
+
+DIRECTIONS = ("both", "buy", "sell")
+WARMUP_DAYS = 2     # i timeframe superiori partono prima dell'M1, come uno storico già caldo
+
+
+def make_dfs(days=4, seed=0):
+    """Random walk M1 a regimi (drift che cambia ogni 4 ore) e i suoi M5/M15/H1 ricampionati."""
+    rng = np.random.default_rng(seed)
+    n = (days + WARMUP_DAYS) * 1440
+    drift = np.repeat(rng.normal(0, 0.08, n // 240 + 1), 240)[:n]
+    close = 2000 + np.cumsum(rng.normal(0, 0.4, n) + drift)
+    op = np.r_[close[0], close[:-1]]
+    m1 = pd.DataFrame({
+        "time": pd.date_range("2026-01-05", periods=n, freq="min"),
+        "open": op,
+        "high": np.maximum(op, close) + np.abs(rng.normal(0, 0.25, n)),
+        "low": np.minimum(op, close) - np.abs(rng.normal(0, 0.25, n)),
+        "close": close,
+        "tick_volume": rng.integers(1, 200, n),
+    })
+    dfs = {}
+    for tf, freq in (("m5", "5min"), ("m15", "15min"), ("h1", "1h")):
+        dfs[tf] = m1.set_index("time").resample(freq).agg(
+            {"open": "first", "high": "max", "low": "min", "close": "last", "tick_volume": "sum"}).reset_index()
+    dfs["m1"] = m1.iloc[WARMUP_DAYS * 1440:].reset_index(drop=True)
+    return dfs
+
+
+def _frames(strategy, dfs):
+    """Copie dei soli timeframe richiesti dalla strategia (run_backtest aggiunge colonne)."""
+    return {tf: df.copy() for tf, df in dfs.items() if getattr(strategy, f"requires_{tf}")}
+
+
+def _run(strategy, dfs, direction, vectorized):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return run_backtest(strategy, _frames(strategy, dfs), "XAUUSD", 0.01, 1000,
+                            direction_filter=direction, verbose=False, vectorized=vectorized)
+
+
+@pytest.fixture(scope="module")
+def dfs():
+    return make_dfs()
+
+
+@pytest.mark.parametrize("name", list(STRATEGIES))
+def test_vectorized_matches_loop(name, dfs, monkeypatch):
+    strategy = STRATEGIES[name]
+    vector_paths = []
+    vector_signals = backtest._vector_signals
+    monkeypatch.setattr(backtest, "_vector_signals",
+                        lambda *a: vector_paths.append(vector_signals(*a)) or vector_paths[-1])
+    for direction in DIRECTIONS:
+        loop_trades, loop_balance = _run(strategy, dfs, direction, vectorized=False)
+        vec_trades, vec_balance = _run(strategy, dfs, direction, vectorized=True)
+        assert vec_trades == loop_trades, (name, direction)
+        assert vec_balance == loop_balance, (name, direction)
+    if strategy.vector_conditions is not None and strategy.requires_m1 and not strategy.requires_h1:
+        assert len(vector_paths) == len(DIRECTIONS) and all(v is not None for v in vector_paths)
+    else:
+        assert vector_paths == []
+
+
+def test_trades_happen(dfs):
+    # il confronto non è banale: sui dati di test le strategie vettoriali aprono posizioni
+    for name, strategy in STRATEGIES.items():
+        if strategy.vector_conditions is not None:
+            trades, _ = _run(strategy, dfs, "both", vectorized=True)
+            assert trades, name
+
+
+def _legacy_index(df_tf, minutes, times):
+    """Vecchio allineamento di run_backtest: un searchsorted per barra sulla serie degli inizi."""
+    tf_times = df_tf["time"].values
+    starts = pd.Series(tf_times) - pd.to_timedelta(pd.DatetimeIndex(tf_times).minute % minutes, unit="m")
+    return np.array([int(starts.searchsorted(ts, side="right")) - 1 for ts in times])
+
+
+def test_alignment_matches_per_bar_lookup(dfs):
+    rng = np.random.default_rng(3)
+    frames = {}
+    for tf, df in dfs.items():
+        keep = rng.random(len(df)) > 0.05                       # barre mancanti (buchi del broker)
+        frames[tf] = df[keep].reset_index(drop=True)
+    frames["m5"] = frames["m5"].iloc[40:].reset_index(drop=True)  # M5 che parte dopo l'H1
+    precompute_alignment(frames)
+    for tf, minutes in ALIGN_MINUTES.items():
+        for name, df in frames.items():
+            expected = _legacy_index(frames[tf], minutes, df["time"].values)
+            assert np.array_equal(df[f"{tf}_idx"].to_numpy(), expected), (tf, name)
+    assert (frames["h1"]["m5_idx"] == -1).any()                 # prima della prima barra M5
+
+
+def test_run_backtest_adds_missing_alignment(dfs):
+    strategy = STRATEGIES["SUPER"]
+    frames = _frames(strategy, dfs)
+    with contextlib.redirect_stdout(io.StringIO()):
+        backtest.precompute_indicators(frames)
+        reference = run_backtest(strategy, frames, "XAUUSD", 0.01, 1000, skip_indicators=True, verbose=False)
+        for df in frames.values():
+            df.drop(columns=[c for c in df.columns if c.endswith("_idx")], inplace=True)
+        again = run_backtest(strategy, frames, "XAUUSD", 0.01, 1000, skip_indicators=True, verbose=False)
+    assert again == reference
+    assert "m15_idx" in frames["m1"].columns
+
+
+# =========================================================
+# Benchmark
+# =========================================================
+def benchmark(days=20):
+    dfs = make_dfs(days)
+    print(f"run_backtest su {days} giorni M1, direzione both")
+    for name, strategy in STRATEGIES.items():
+        if strategy.vector_conditions is None:
+            continue
+        t0 = time.perf_counter()
+        _run(strategy, dfs, "both", vectorized=False)
+        t_loop = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        _run(strategy, dfs, "both", vectorized=True)
+        t_vec = time.perf_counter() - t0
+        print(f"  {name:14s}: ciclo {t_loop * 1000:8.1f} ms  vettoriale {t_vec * 1000:8.1f} ms  (x{t_loop / t_vec:.1f})")
+
+
+if __name__ == "__main__":
+    data = make_dfs()
+    for strategy in STRATEGIES.values():
+        for direction in DIRECTIONS:
+            assert _run(strategy, data, direction, False) == _run(strategy, data, direction, True)
+    test_trades_happen(data)
+    test_alignment_matches_per_bar_lookup(data)
+    test_run_backtest_adds_missing_alignment(data)
+    print("✅ Backtest vettoriale = ciclo OK")
+    benchmark()
@@ -0,0 +1,92 @@
+"""
+Test per bar_store (archivio locale delle candele per i backtest)
+
+- write/read: append in coda, fusione ordinata di barre più vecchie, finestra per giorni
+- giorno riscaricato con barre cambiate (parziali o corrette dal broker): vincono le nuove
+- riscrittura identica: file invariato, nessun duplicato
+- missing(): l'ultimo giorno prima di oggi non è mai coperto
+- eseguibile con pytest oppure direttamente:  python test_bar_store.py
+"""
+
+import os
+import tempfile
+from datetime import date, timedelta
+
+import numpy as np
+
+import bar_store
+from rates_codec import BAR_DTYPE
+
+
+def _bars(day, n=24, step=3600, close=2000.0):
+    out = np.zeros(n, dtype=BAR_DTYPE)
+    out["time"] = bar_store._day_ts(day) + step * np.arange(n)
+    out["open"] = out["high"] = out["low"] = out["close"] = close + np.arange(n)
+    out["tick_volume"] = 10
+    return out
+
+
+def _series(root):
+    return bar_store.BarSeries(root, "Broker-Demo", "XAUUSD", "H1")
+
+
+def test_write_read_append_and_merge(tmp_path=None):
+    root = str(tmp_path or tempfile.mkdtemp(prefix="bars_"))
+    s = _series(root)
+    d0 = date(2026, 1, 5)
+    s.write(_bars(d0 + timedelta(days=1)), d0 + timedelta(days=1), d0 + timedelta(days=2))
+    s.write(_bars(d0 + timedelta(days=2)), d0 + timedelta(days=2), d0 + timedelta(days=3))   # append
+    s.write(_bars(d0), d0, d0 + timedelta(days=1))                                            # fusione
+    out = s.read(d0, d0 + timedelta(days=3))
+    assert len(out) == 72 and np.all(np.diff(out["time"]) > 0)
+    assert len(s.read(d0 + timedelta(days=1), d0 + timedelta(days=1))) == 1    # solo la mezzanotte
+    assert s.missing(d0, d0 + timedelta(days=3)) == []
+
+
+def test_refetched_day_replaces_changed_bars(tmp_path=None):
+    root = str(tmp_path or tempfile.mkdtemp(prefix="bars_"))
+    s = _series(root)
+    d0, d1 = date(2026, 1, 5), date(2026, 1, 6)
+    s.write(_bars(d0), d0, d1)
+    partial = _bars(d1, n=10)
+    partial["close"][-1] = 1.0                      # ultima barra ancora in formazione
+    s.write(partial, d1, d1 + timedelta(days=1))
+
+    fresh = _bars(d1)                               # riscaricato: barra corretta + barre nuove
+    fresh["tick_volume"][3] = 99                    # corretta dal broker
+    s.write(fresh, d1, d1 + timedelta(days=1))
+    out = s.read(d1, d1 + timedelta(days=1))[:24]
+    assert np.array_equal(out, fresh)
+    assert len(s.read(d0, d1 + timedelta(days=1))) == 48
+    assert np.array_equal(s.read(d0, d0)[:1], _bars(d0)[:1])
+
+
+def test_identical_rewrite_is_noop(tmp_path=None):
+    root = str(tmp_path or tempfile.mkdtemp(prefix="bars_"))
+    s = _series(root)
+    d0 = date(2026, 1, 5)
+    bars = _bars(d0)
+    s.write(bars, d0, d0 + timedelta(days=1))
+    mtime = os.stat(s.data_path).st_mtime_ns
+    s.write(bars[::-1], d0, d0 + timedelta(days=1))
+    assert os.stat(s.data_path).st_mtime_ns == mtime
+    assert s.stats()["bars"] == 24
+
+
+def test_last_day_never_covered(tmp_path=None):
+    root = str(tmp_path or tempfile.mkdtemp(prefix="bars_"))
+    s = _series(root)
+    today = date.today()
+    start = today - timedelta(days=3)
+    s.write(_bars(start), start, today)
+    assert s.missing(start, today) == [(today - timedelta(days=1), today)]
+    reopened = _series(root)                        # ranges persistiti nel .json
+    assert reopened.missing(start, today) == [(today - timedelta(days=1), today)]
+
+
+if __name__ == "__main__":
+    test_write_read_append_and_merge()
+    test_refetched_day_replaces_changed_bars()
+    test_identical_rewrite_is_noop()
+    test_last_day_never_covered()
+    print("✅ BarStore OK")
@@ -0,0 +1,203 @@
+"""
+Test per db_pool (pool di connessioni MySQL di db.get_connection)
+
+- riuso: close() restituisce la connessione, il checkout successivo la riprende
+- overflow: oltre size connessioni temporanee, chiuse al rilascio
+- esaurito: attesa fino a timeout poi PoolError; chi aspetta riparte al primo rilascio
+- rilascio: rollback della transazione aperta; rollback fallito → connessione scartata
+- health check: riciclo oltre recycle, ping dopo ping_after, connessione nuova se il ping fallisce
+- connect fallita: il posto nel pool torna libero
+- eseguibile con pytest oppure direttamente:  python test_db_pool.py
+"""
+
+import gc
+import threading
+import time
+
+import pytest
+from mysql.connector.errors import InterfaceError, PoolError
+
+from db_pool import ConnectionPool
+
+
+class FakeConn:
+    """Connessione MySQL finta: registra rollback, ping e close."""
+
+    def __init__(self, n):
+        self.n = n
+        self.in_transaction = False
+        self.rollbacks = 0
+        self.pings = 0
+        self.closed = False
+        self.fail_ping = False
+        self.fail_rollback = False
+
+    def rollback(self):
+        if self.fail_rollback:
+            raise InterfaceError("connessione persa")
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if self.fail_ping:
+            raise InterfaceError("MySQL server has gone away")
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnect:
+    def __init__(self):
+        self.made = []
+        self.fail = False
+
+    def __call__(self):
+        if self.fail:
+            raise InterfaceError("Can't connect to MySQL server")
+        conn = FakeConn(len(self.made))
+        self.made.append(conn)
+        return conn
+
+
+def _pool(**kwargs):
+    connect = FakeConnect()
+    params = dict(size=2, overflow=1, timeout=0.2, recycle=3600, ping_after=3600)
+    params.update(kwargs)
+    return ConnectionPool(connect=connect, **params), connect
+
+
+def test_reuse():
+    pool, connect = _pool()
+    conn = pool.acquire()
+    first = conn._raw
+    conn.close()
+    with pool.acquire() as again:
+        assert again._raw is first
+    assert len(connect.made) == 1
+    stats = pool.stats()
+    assert stats["checkouts"] == 2 and stats["created"] == 1 and stats["idle"] == 1 and stats["in_use"] == 0
+    with pytest.raises(AttributeError):
+        conn.cursor()                                   # già restituita
+
+
+def test_overflow_closed_on_release():
+    pool, connect = _pool()
+    conns = [pool.acquire() for _ in range(3)]
+    stats = pool.stats()
+    assert stats["open"] == 2 and stats["overflow_in_use"] == 1 and stats["in_use"] == 3
+    overflow_raw = conns[2]._raw
+    for conn in conns:
+        conn.close()
+    assert overflow_raw.closed
+    stats = pool.stats()
+    assert stats["idle"] == 2 and stats["overflow_in_use"] == 0 and stats["in_use"] == 0
+    assert sum(c.closed for c in connect.made) == 1
+
+
+def test_timeout_when_exhausted():
+    pool, _ = _pool(size=1, overflow=0, timeout=0.1)
+    held = pool.acquire()
+    t0 = time.monotonic()
+    with pytest.raises(PoolError):
+        pool.acquire()
+    assert time.monotonic() - t0 >= 0.1
+    assert pool.stats()["timeouts"] == 1
+    held.close()
+
+
+def test_waiter_gets_released_connection():
+    pool, connect = _pool(size=1, overflow=0, timeout=2)
+    held = pool.acquire()
+    got = []
+    t = threading.Thread(target=lambda: got.append(pool.acquire()))
+    t.start()
+    time.sleep(0.1)
+    held.close()
+    t.join(2)
+    assert got and got[0]._raw is connect.made[0]
+    stats = pool.stats()
+    assert stats["waits"] == 1 and stats["wait_max_ms"] >= 50
+    got[0].close()
+
+
+def test_rollback_on_release():
+    pool, connect = _pool()
+    conn = pool.acquire()
+    conn._raw.in_transaction = True                     # SELECT senza commit: snapshot aperto
+    conn.close()
+    raw = connect.made[0]
+    assert raw.rollbacks == 1 and not raw.closed
+    with pool.acquire() as again:
+        assert again._raw is raw
+
+
+def test_failed_rollback_discards_connection():
+    pool, connect = _pool()
+    conn = pool.acquire()
+    conn._raw.in_transaction = True
+    conn._raw.fail_rollback = True
+    conn.close()
+    assert connect.made[0].closed
+    assert pool.stats()["open"] == 0 and pool.stats()["idle"] == 0
+    with pool.acquire() as again:
+        assert again._raw is connect.made[1]
+
+
+def test_recycle_old_connection():
+    pool, connect = _pool(recycle=0.05)
+    pool.acquire().close()
+    time.sleep(0.1)
+    with pool.acquire() as conn:
+        assert conn._raw is connect.made[1]
+    assert connect.made[0].closed and pool.stats()["recycled"] == 1
+
+
+def test_ping_idle_connection():
+    pool, connect = _pool(ping_after=0.05)
+    pool.acquire().close()
+    with pool.acquire() as conn:                        # appena usata: niente ping
+        assert conn._raw.pings == 0
+    time.sleep(0.1)
+    with pool.acquire() as conn:
+        assert conn._raw is connect.made[0] and conn._raw.pings == 1
+    time.sleep(0.1)
+    connect.made[0].fail_ping = True
+    with pool.acquire() as conn:
+        assert conn._raw is connect.made[1]
+    assert connect.made[0].closed and pool.stats()["health_failures"] == 1
+    assert pool.stats()["open"] == 1
+
+
+def test_connect_failure_frees_slot():
+    pool, connect = _pool(size=1, overflow=0)
+    connect.fail = True
+    with pytest.raises(InterfaceError):
+        pool.acquire()
+    assert pool.stats()["open"] == 0
+    connect.fail = False
+    with pool.acquire() as conn:
+        assert conn._raw is connect.made[0]
+
+
+def test_forgotten_close_returns_to_pool():
+    pool, _ = _pool(size=1, overflow=0)
+    conn = pool.acquire()
+    del conn
+    gc.collect()
+    assert pool.stats()["idle"] == 1
+    pool.acquire().close()
+
+
+if __name__ == "__main__":
+    test_reuse()
+    test_overflow_closed_on_release()
+    test_timeout_when_exhausted()
+    test_waiter_gets_released_connection()
+    test_rollback_on_release()
+    test_failed_rollback_discards_connection()
+    test_recycle_old_connection()
+    test_ping_idle_connection()
+    test_connect_failure_frees_slot()
+    test_forgotten_close_returns_to_pool()
+    print("✅ ConnectionPool OK")
@@ -0,0 +1,292 @@
+"""
+Test di equivalenza per exit_kernel (risoluzione SL/TP dei backtest)
+
+- simulate_trades confrontato con il vecchio ciclo per barra di
+  research_tasks.run_generic_backtest (stessi trade, stessi prezzi, stesso saldo)
+- fallback NumPy confrontato con i cicli puri (quelli compilati da numba)
+- eseguibile con pytest oppure direttamente:  python test_exit_kernel.py
+  (in questo caso lancia anche il benchmark su 200k barre)
+"""
+
+import time
+
+import numpy as np
+
+import exit_kernel
+from exit_kernel import (
+    ENTRY_ERROR, EXIT_EVENT, EXIT_LABELS, EXIT_NONE, EXIT_SL, EXIT_TP, HOLD_CLOSE, HOLD_ERROR,
+    first_exit, resolve_exits, simulate_grid, simulate_trades,
+)
+from synthetic_bars import make_bars
+
+
+# =========================================================
+# Implementazione di riferimento (vecchio ciclo di run_generic_backtest)
+# =========================================================
+def generic_loop_legacy(signal_dir, close, low, high, sl_dist, tp_dist, lot_contract, cost, balance, start):
+    trades = []
+    position = None
+    entry = dirn = sl_price = tp_price = 0.0
+    for i in range(start, len(close)):
+        price, lo, hi = close[i], low[i], high[i]
+        if position:
+            if dirn == 0:
+                if lo <= sl_price:
+                    pnl = (sl_price - entry) * lot_contract
+                    balance += pnl
+                    trades.append((i, "BUY", "SL", pnl, balance))
+                    position = None
+                elif hi >= tp_price:
+                    pnl = (tp_price - entry) * lot_contract
+                    balance += pnl
+                    trades.append((i, "BUY", "TP", pnl, balance))
+                    position = None
+            else:
+                if hi >= sl_price:
+                    pnl = (entry - sl_price) * lot_contract
+                    balance += pnl
+                    trades.append((i, "SELL", "SL", pnl, balance))
+                    position = None
+                elif lo <= tp_price:
+                    pnl = (entry - tp_price) * lot_contract
+                    balance += pnl
+                    trades.append((i, "SELL", "TP", pnl, balance))
+                    position = None
+
+        if position is None and signal_dir[i] != 0:
+            entry = price
+            dirn = 0 if signal_dir[i] > 0 else 1
+            if dirn == 0:
+                sl_price, tp_price = price - sl_dist, price + tp_dist
+            else:
+                sl_price, tp_price = price + sl_dist, price - tp_dist
+            position = True
+            balance -= cost
+    return trades, balance
+
+
+def kernel_trades(signal_dir, close, low, high, sl_dist, tp_dist, lot_contract, cost, balance, start):
+    entry_idx, exit_idx, exit_type, pnl = simulate_trades(
+        signal_dir, close, low, high, sl_dist, tp_dist, lot_contract, start=start)
+    trades = []
+    for x, kind, p, is_buy in zip(exit_idx, exit_type, pnl, signal_dir[entry_idx] > 0):
+        balance -= cost
+        if kind == EXIT_NONE:
+            continue
+        balance += p
+        trades.append((int(x), "BUY" if is_buy else "SELL", EXIT_LABELS[kind], p, balance))
+    return trades, balance
+
+
+def make_arrays(n, seed=42):
+    """close, low, high delle candele finte e un flusso di segnali sparso."""
+    bars = make_bars(n, seed=seed)
+    signal_dir = np.random.default_rng(seed + 1).choice([0, 0, 0, 0, 0, 0, 1, -1], size=n).astype(np.int8)
+    return bars["close"].to_numpy(), bars["low"].to_numpy(), bars["high"].to_numpy(), signal_dir
+
+
+def assert_same_trades(new, old):
+    (t_new, bal_new), (t_old, bal_old) = new, old
+    assert len(t_new) == len(t_old)
+    for a, b in zip(t_new, t_old):
+        assert a[:3] == b[:3]
+        assert a[3] == b[3] and a[4] == b[4]
+    assert bal_new == bal_old
+
+
+# =========================================================
+# Test di equivalenza
+# =========================================================
+def test_simulate_trades_matches_legacy_loop():
+    close, low, high, signal_dir = make_arrays(20_000)
+    for sl_pts, tp_pts in ((100, 200), (30, 400), (600, 50)):
+        for start in (0, 57):
+            args = (signal_dir, close, low, high, sl_pts * 0.01, tp_pts * 0.01, 0.01 * 100, 0.02, 1000.0, start)
+            assert_same_trades(kernel_trades(*args), generic_loop_legacy(*args))
+
+
+def test_single_direction_and_no_signals():
+    close, low, high, signal_dir = make_arrays(5000, seed=3)
+    only_buy = np.where(signal_dir > 0, signal_dir, 0).astype(np.int8)
+    args = (only_buy, close, low, high, 1.0, 2.0, 1.0, 0.0, 500.0, 10)
+    assert_same_trades(kernel_trades(*args), generic_loop_legacy(*args))
+
+    entry_idx, exit_idx, exit_type, pnl = simulate_trades(
+        np.zeros(len(close), dtype=np.int8), close, low, high, 1.0, 2.0, 1.0)
+    assert len(entry_idx) == len(exit_idx) == len(exit_type) == len(pnl) == 0
+
+
+def test_sl_has_priority_and_open_trade_at_end():
+    close = np.array([100.0, 100.0, 100.0, 100.0])
+    low = np.array([99.5, 99.5, 98.0, 99.5])
+    high = np.array([100.5, 100.5, 102.0, 100.5])
+    # barra 2 tocca sia SL che TP: vince lo SL
+    assert first_exit(1, low, high, 99.0, 101.0, True) == (2, EXIT_SL)
+    assert first_exit(1, low, high, 101.0, 99.0, False) == (2, EXIT_SL)
+    # nessuna uscita: indice = len, posizione aperta
+    assert first_exit(3, low, high, 90.0, 110.0, True) == (4, EXIT_NONE)
+
+    entry_idx, exit_idx, exit_type, pnl = simulate_trades(
+        np.array([1, 0, 0, 1], dtype=np.int8), close, low, high, 5.0, 5.0, 1.0)
+    assert entry_idx.tolist() == [0]
+    assert exit_idx.tolist() == [4] and exit_type.tolist() == [EXIT_NONE] and pnl.tolist() == [0.0]
+
+
+def test_events_exit():
+    close, low, high, _ = make_arrays(3000, seed=5)
+    events = np.zeros(len(close), dtype=bool)
+    events[1500] = True
+    j, kind = first_exit(1000, low, high, close[1000] - 1e6, close[1000] + 1e6, True, events)
+    assert (j, kind) == (1500, EXIT_EVENT)
+
+
+def test_numpy_fallback_matches_loops():
+    close, low, high, signal_dir = make_arrays(8000, seed=9)
+    events = np.random.default_rng(1).random(len(close)) < 0.002
+    for start in (1, 700, 4000):
+        for is_buy in (True, False):
+            sl = close[start - 1] + (-2.0 if is_buy else 2.0)
+            tp = close[start - 1] + (3.0 if is_buy else -3.0)
+            for ev in (None, events):
+                loop = exit_kernel._first_exit_loop(
+                    start, low, high, sl, tp, is_buy, np.zeros(0, dtype=bool) if ev is None else ev)
+                assert tuple(int(v) for v in loop) == exit_kernel._first_exit_numpy(start, low, high, sl, tp, is_buy, ev)
+
+    loop = exit_kernel._sequential_loop(signal_dir, close, low, high, 1.5, 2.5, 20, 1.0)
+    fallback = exit_kernel._sequential_numpy(signal_dir, close, low, high, 1.5, 2.5, 20, 1.0)
+    for a, b in zip(loop, fallback):
+        assert np.array_equal(a, b)
+
+
+def test_resolve_exits_independent_trades():
+    close, low, high, _ = make_arrays(4000, seed=13)
+    entry_idx = np.array([10, 10, 500, 3990])
+    is_buy = np.array([True, False, True, False])
+    entry = close[entry_idx]
+    sl = np.where(is_buy, entry - 1.0, entry + 1.0)
+    tp = np.where(is_buy, entry + 2.0, entry - 2.0)
+    exit_idx, exit_type, pnl = resolve_exits(entry_idx, is_buy, entry, sl, tp, low, high, 100.0)
+    for k in range(len(entry_idx)):
+        j, kind = first_exit(entry_idx[k] + 1, low, high, sl[k], tp[k], is_buy[k])
+        assert (exit_idx[k], exit_type[k]) == (j, kind)
+        if kind == EXIT_NONE:
+            assert pnl[k] == 0.0
+        else:
+            price = sl[k] if kind == EXIT_SL else tp[k]
+            assert pnl[k] == ((price - entry[k]) if is_buy[k] else (entry[k] - price)) * 100.0
+
+
+def backtest_loop_legacy(signal_dir, close, low, high, sl_dist, tp_dist, lot, contract, balance, start, hold=None):
+    """Ciclo di run_backtest con SL/TP fissi ed eventi di hold; None se la run fallisce."""
+    trades = []
+    position = None
+    for i in range(start, len(close)):
+        if position:
+            entry, is_buy, sl, tp = position
+            exit_price = None
+            if is_buy and low[i] <= sl or not is_buy and high[i] >= sl:
+                exit_price = sl
+            elif is_buy and high[i] >= tp or not is_buy and low[i] <= tp:
+                exit_price = tp
+            elif hold is not None:
+                code = hold["buy" if is_buy else "sell"][i]
+                if code == HOLD_ERROR:
+                    return None
+                if code == HOLD_CLOSE:
+                    exit_price = close[i]
+            if exit_price is not None:
+                pnl = (exit_price - entry) * lot * contract if is_buy else (entry - exit_price) * lot * contract
+                balance += pnl
+                trades.append((i, pnl, balance))
+                position = None
+        if position is None and signal_dir[i] != 0:
+            if signal_dir[i] == ENTRY_ERROR:
+                return None
+            price = close[i]
+            is_buy = signal_dir[i] > 0
+            sl = price - sl_dist if is_buy else price + sl_dist
+            tp = price + tp_dist if is_buy else price - tp_dist
+            position = (price, is_buy, sl, tp)
+    return trades
+
+
+def test_simulate_grid_matches_loop():
+    close, low, high, signal_dir = make_arrays(6000, seed=21)
+    rng = np.random.default_rng(4)
+    hold = {
+        "buy": rng.choice([0] * 60 + [HOLD_CLOSE], size=len(close)).astype(np.int8),
+        "sell": rng.choice([0] * 60 + [HOLD_CLOSE], size=len(close)).astype(np.int8),
+    }
+    hold["sell"][5000] = HOLD_ERROR
+    with_errors = signal_dir.copy()
+    with_errors[4000] = ENTRY_ERROR
+
+    sl_dists = [0.5, 1.0, 1.0, 3.0, 6.0]
+    tp_dists = [1.0, 2.0, 4.0, 3.0, 12.0]
+    for sd, hl in ((signal_dir, None), (signal_dir, hold), (with_errors, hold)):
+        runs = simulate_grid(sd, close, low, high, sl_dists, tp_dists, 0.01, 100, 1000.0, hold=hl, start=30)
+        for (sl, tp), run in zip(zip(sl_dists, tp_dists), runs):
+            ref = backtest_loop_legacy(sd, close, low, high, sl, tp, 0.01, 100, 1000.0, 30, hl)
+            if ref is None:
+                assert run["failed"]
+                continue
+            assert not run["failed"]
+            assert run["exit_idx"].tolist() == [t[0] for t in ref]
+            assert run["pnl"].tolist() == [t[1] for t in ref]
+            assert run["balance"].tolist() == [t[2] for t in ref]
+
+
+def test_simulate_grid_matches_simulate_trades():
+    close, low, high, signal_dir = make_arrays(10_000, seed=17)
+    sl_dists, tp_dists = [1.0, 2.5, 2.5], [2.0, 2.0, 7.5]
+    runs = simulate_grid(signal_dir, close, low, high, sl_dists, tp_dists, 1.0, 1.0, 0.0, start=5)
+    for sl, tp, run in zip(sl_dists, tp_dists, runs):
+        entry_idx, exit_idx, exit_type, pnl = simulate_trades(signal_dir, close, low, high, sl, tp, 1.0, start=5)
+        closed = exit_type != EXIT_NONE
+        assert np.array_equal(run["entry_idx"], entry_idx[closed])
+        assert np.array_equal(run["exit_idx"], exit_idx[closed])
+        assert np.array_equal(run["exit_type"], exit_type[closed])
+        assert np.array_equal(run["pnl"], pnl[closed])
+
+
+# =========================================================
+# Micro-benchmark
+# =========================================================
+def benchmark(n_bars=200_000, repeat=3):
+    close, low, high, signal_dir = make_arrays(n_bars)
+    args = (signal_dir, close, low, high, 3.0, 6.0, 1.0, 0.02, 1000.0, 0)
+
+    def _best(fn):
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - t0)
+        return best
+
+    t_old = _best(lambda: generic_loop_legacy(*args))
+    t_new = _best(lambda: kernel_trades(*args))
+    engine = "numba" if exit_kernel.HAS_NUMBA else "NumPy"
+    print(f"SL/TP su {n_bars} barre")
+    print(f"  ciclo per barra : {t_old * 1000:9.1f} ms")
+    print(f"  kernel {engine:<8} : {t_new * 1000:9.1f} ms  (x{t_old / t_new:.0f})")
+
+    grid = [(sl, tp) for sl in np.arange(2.0, 8.5, 0.5) for tp in np.arange(4.0, 15.0, 1.0) if tp > sl]
+    t_old = _best(lambda: [simulate_trades(signal_dir, close, low, high, sl, tp, 1.0) for sl, tp in grid])
+    t_new = _best(lambda: simulate_grid(signal_dir, close, low, high, [g[0] for g in grid], [g[1] for g in grid], 1.0, 1.0, 0.0))
+    print(f"Griglia {len(grid)} SL×TP su {n_bars} barre")
+    print(f"  simulate_trades x{len(grid)}: {t_old * 1000:9.1f} ms")
+    print(f"  simulate_grid      : {t_new * 1000:9.1f} ms  (x{t_old / t_new:.0f})")
+
+
+if __name__ == "__main__":
+    test_simulate_trades_matches_legacy_loop()
+    test_single_direction_and_no_signals()
+    test_sl_has_priority_and_open_trade_at_end()
+    test_events_exit()
+    test_numpy_fallback_matches_loops()
+    test_resolve_exits_independent_trades()
+    test_simulate_grid_matches_loop()
+    test_simulate_grid_matches_simulate_trades()
+    print("✅ Equivalenza kernel SL/TP OK")
+    benchmark()
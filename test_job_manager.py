@@ -0,0 +1,199 @@
+"""
+Test per job_manager (sessioni di backtest / ricerca in background)
+
+- coda limitata: al più max_running job insieme, gli altri in coda con la loro posizione
+- limiti: per utente e sulla lunghezza della coda (JobRejected)
+- job annullato in coda: non viene eseguito
+- risultati grandi spostati su disco e riletti dallo status; sessioni ripristinate
+  dopo un riavvio ed eliminate (memoria e disco) alla scadenza del TTL
+- stream SSE: progress ad ogni cambiamento, righe parziali migliori, risultato una volta sola
+- eseguibile con pytest oppure direttamente:  python test_job_manager.py
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+import job_manager
+from job_manager import JobStore, JobRejected
+
+
+@pytest.fixture(autouse=True)
+def _tmp_jobs(monkeypatch, tmp_path):
+    monkeypatch.setattr(job_manager, "JOBS_DIR", str(tmp_path))
+
+
+def _session():
+    return {"status": "running", "result": None, "cancelled": False, "progress": 0}
+
+
+def _wait(store, session_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        session = store.get(session_id)
+        if session["status"] in job_manager.FINISHED and session["finished_at"]:
+            return session
+        time.sleep(0.01)
+    raise TimeoutError(session_id)
+
+
+def _target(store, session_id, gate, result):
+    gate.wait(5)
+    with store.lock:
+        store.sessions[session_id]["status"] = "done"
+        store.sessions[session_id]["result"] = result
+
+
+def test_bounded_queue_and_positions():
+    store = JobStore("t-queue", max_running=1, max_queued=5, max_per_user=10)
+    gate = threading.Event()
+    try:
+        for sid in ("a", "b", "c"):
+            store.submit(sid, _session(), _target, store, sid, gate, {"id": sid}, owner="u")
+        time.sleep(0.1)
+        assert not store.get("a")["queued"]
+        assert [store.get(s)["queue_position"] for s in ("b", "c")] == [1, 2]
+        gate.set()
+        for sid in ("a", "b", "c"):
+            assert _wait(store, sid)["status"] == "done"
+            assert store.result(store.get(sid)) == {"id": sid}
+    finally:
+        gate.set()
+        store.shutdown()
+
+
+def test_limits():
+    store = JobStore("t-limits", max_running=1, max_queued=2, max_per_user=2)
+    gate = threading.Event()
+    try:
+        store.submit("a", _session(), _target, store, "a", gate, 1, owner="u1")
+        store.submit("b", _session(), _target, store, "b", gate, 2, owner="u1")
+        with pytest.raises(JobRejected):
+            store.submit("c", _session(), _target, store, "c", gate, 3, owner="u1")    # per utente
+        time.sleep(0.1)
+        store.submit("d", _session(), _target, store, "d", gate, 4, owner="u2")
+        with pytest.raises(JobRejected):
+            store.submit("e", _session(), _target, store, "e", gate, 5, owner="u3")    # coda piena
+        assert "c" not in store.sessions and "e" not in store.sessions
+        gate.set()
+        _wait(store, "d")
+        store.submit("f", _session(), _target, store, "f", gate, 6, owner="u1")         # di nuovo libero
+        assert _wait(store, "f")["status"] == "done"
+    finally:
+        gate.set()
+        store.shutdown()
+
+
+def test_cancel_while_queued_and_errors():
+    store = JobStore("t-cancel", max_running=1)
+    gate = threading.Event()
+    ran = []
+    try:
+        store.submit("a", _session(), _target, store, "a", gate, 1)
+        store.submit("b", _session(), ran.append, "b")
+        store.get("b")["cancelled"] = True
+        store.submit("c", _session(), lambda: 1 / 0)
+        gate.set()
+        assert _wait(store, "b")["status"] == "cancelled" and not ran
+        session = _wait(store, "c")
+        assert session["status"] == "error" and "division" in session["result"]["error"]
+    finally:
+        gate.set()
+        store.shutdown()
+
+
+def test_spill_restore_and_ttl():
+    store = JobStore("t-spill", spill_bytes=1_000)
+    gate = threading.Event()
+    gate.set()
+    big = {"trades": [{"profit": float(i)} for i in range(1_000)]}
+    try:
+        store.submit("big", _session(), _target, store, "big", gate, big)
+        store.submit("small", _session(), _target, store, "small", gate, {"ok": 1})
+    finally:
+        store.shutdown(wait=True)
+    big_session, small_session = store.get("big"), store.get("small")
+    assert big_session["result"] is None and store.result(big_session) == big
+    assert small_session["result"] == {"ok": 1}
+
+    restarted = JobStore("t-spill")                 # riavvio: solo il disco
+    try:
+        assert restarted.get("big")["status"] == "done"
+        assert restarted.result(restarted.get("small")) == {"ok": 1}
+        restarted.ttl = 0
+        time.sleep(0.01)
+        assert restarted.evict_expired() == 2
+        assert restarted.get("big") is None
+        assert os.listdir(os.path.join(job_manager.JOBS_DIR, "t-spill")) == []
+    finally:
+        restarted.shutdown()
+
+
+def _streaming_target(store, session_id, gate):
+    for pct, rows in ((30, [{"r": 1.0}, {"r": 5.0}]), (60, [{"r": 3.0}]), (90, [])):
+        gate.wait(5)
+        gate.clear()
+        with store.lock:
+            store.sessions[session_id]["progress"] = pct
+        if rows:
+            store.push_rows(session_id, rows, key=lambda r: r["r"], n=2)
+    with store.lock:
+        store.sessions[session_id]["status"] = "done"
+        store.sessions[session_id]["result"] = {"results": [{"r": 5.0}, {"r": 3.0}, {"r": 1.0}]}
+
+
+def _parse(chunks):
+    events = []
+    for chunk in chunks:
+        if chunk.startswith(":"):
+            continue
+        fields = dict(line.split(": ", 1) for line in chunk.strip().split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_events_stream():
+    poll, job_manager.SSE_POLL = job_manager.SSE_POLL, 0.01
+    store = JobStore("t-events")
+    gate = threading.Event()
+
+    async def consume():
+        chunks = []
+        async for chunk in store.events("s"):
+            chunks.append(chunk)
+            gate.set()              # un passo del target per ogni evento letto
+        return chunks
+
+    try:
+        store.submit("s", _session(), _streaming_target, store, "s", gate)
+        events = _parse(asyncio.run(consume()))
+    finally:
+        job_manager.SSE_POLL = poll
+        gate.set()
+        store.shutdown()
+    kinds = [k for k, _ in events]
+    assert kinds[-1] == "result" and kinds.count("result") == 1
+    assert events[-1][1] == {"status": "done", "result": {"results": [{"r": 5.0}, {"r": 3.0}, {"r": 1.0}]}}
+    progress = [d["progress"] for k, d in events if k == "progress"]
+    assert progress == sorted(progress) and progress[-1] == 90
+    assert [d["rows"] for k, d in events if k == "rows"][-1] == [{"r": 5.0}, {"r": 3.0}]
+    assert _parse(asyncio.run(_collect(store.events("missing")))) == [("error", {"error": "Session not found"})]
+
+
+async def _collect(gen):
+    return [chunk async for chunk in gen]
+
+
+if __name__ == "__main__":
+    job_manager.JOBS_DIR = tempfile.mkdtemp(prefix="jobs_")
+    test_bounded_queue_and_positions()
+    test_limits()
+    test_cancel_while_queued_and_errors()
+    test_spill_restore_and_ttl()
+    test_events_stream()
+    print("✅ JobManager OK")
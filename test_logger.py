@@ -0,0 +1,135 @@
+"""
+Test per logger (pipeline di log non bloccante)
+
+- ring buffer: capacità fissa, sequenze crescenti, since(seq) ed entries a pagine con buffer già ruotato
+- writer di background: righe su file nell'ordine di log(), anche da più thread
+- rotazione per dimensione con al più LOG_BACKUPS file
+- coda piena: log() non si blocca, la riga resta nel ring buffer e viene contata in dropped
+- eseguibile con pytest oppure direttamente:  python test_logger.py
+  (in questo caso lancia anche il confronto dei tempi con la scrittura riga per riga)
+"""
+
+import os
+import queue
+import tempfile
+import threading
+import time
+
+import logger
+
+
+def _setup(monkeypatch):
+    monkeypatch.setattr(logger, "LOG_CONSOLE", False)
+    logger.flush()
+
+
+def test_ring_buffer_since():
+    buf = logger.LogBuffer(5)
+    assert buf.since(0) == []
+    for i in range(1, 9):
+        assert buf.append(f"l{i}") == i
+    assert list(buf) == ["l4", "l5", "l6", "l7", "l8"]
+    assert buf.since(6) == ["l7", "l8"]
+    assert buf.since(0) == ["l4", "l5", "l6", "l7", "l8"]      # righe già uscite dal buffer: perse
+    assert buf.since(8) == []
+    buf.clear()
+    buf.append("l9")
+    assert buf.seq == 9 and buf.since(8) == ["l9"]
+
+
+def test_ring_buffer_entries_paging():
+    buf = logger.LogBuffer(10)
+    assert buf.first_seq == 1 and buf.entries(0) == []
+    for i in range(1, 26):
+        buf.append(f"l{i}")
+    assert buf.first_seq == 16
+    page = buf.entries(0, limit=4)
+    assert page == [(16, "l16"), (17, "l17"), (18, "l18"), (19, "l19")]
+    assert buf.entries(page[-1][0], limit=4)[0] == (20, "l20")
+    assert [seq for seq, _ in buf.entries(22)] == [23, 24, 25]
+
+
+def test_writer_order_and_multiline(monkeypatch, tmp_path):
+    _setup(monkeypatch)
+    path = str(tmp_path / "server_log.txt")
+    start = logger.logs.seq
+
+    def worker(k):
+        for i in range(200):
+            logger.log(f"t{k} riga {i}", file=path)
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    logger.log({"status": "ok", "n": 1}, file=path)
+    assert logger.flush()
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 800 + 4
+    for k in range(4):
+        mine = [line.split("] ", 1)[1] for line in lines if f"] t{k} " in line]
+        assert mine == [f"t{k} riga {i}" for i in range(200)]
+    assert logger.logs.seq - start == 804
+    assert logger.logs.since(logger.logs.seq - 1)[0].endswith("}")
+
+
+def test_rotation_by_size(monkeypatch, tmp_path):
+    _setup(monkeypatch)
+    monkeypatch.setattr(logger, "LOG_MAX_BYTES", 2_000)
+    monkeypatch.setattr(logger, "LOG_BACKUPS", 2)
+    monkeypatch.setattr(logger, "LOG_BATCH", 10)
+    path = str(tmp_path / "rot.txt")
+    for i in range(300):
+        logger.log(f"riga {i:04d} " + "x" * 40, file=path)
+    assert logger.flush()
+    names = sorted(os.listdir(tmp_path))
+    assert names == ["rot.txt", "rot.txt.1", "rot.txt.2"]
+    assert all(os.path.getsize(tmp_path / n) <= 2_000 for n in names)
+    with open(path, encoding="utf-8") as f:
+        assert f.read().splitlines()[-1].endswith("riga 0299 " + "x" * 40)
+
+
+def test_full_queue_never_blocks(monkeypatch, tmp_path):
+    _setup(monkeypatch)
+    monkeypatch.setattr(logger, "_queue", queue.Queue(maxsize=1))
+    dropped = logger.log_stats()["dropped"]
+    seq = logger.logs.seq
+    t0 = time.perf_counter()
+    for i in range(500):
+        logger.log(f"burst {i}", file=str(tmp_path / "burst.txt"))
+    assert time.perf_counter() - t0 < 1.0
+    assert logger.logs.seq - seq == 500
+    assert logger.log_stats()["dropped"] > dropped
+
+
+# =========================================================
+# Benchmark
+# =========================================================
+def benchmark(n=20_000):
+    logger.LOG_CONSOLE = False
+    folder = tempfile.mkdtemp(prefix="logger_")
+    old = os.path.join(folder, "old.txt")
+    t0 = time.perf_counter()
+    for i in range(n):
+        line = f"[18/10/2026 12:00] trader 7 tick {i}"
+        with open(old, "a", encoding="utf-8") as f:     # vecchio logger: apertura per riga
+            f.write(line + "\n")
+    t_old = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for i in range(n):
+        logger.log(f"trader 7 tick {i}", file=os.path.join(folder, "new.txt"))
+    t_call = time.perf_counter() - t0
+    logger.flush(30)
+    t_total = time.perf_counter() - t0
+    print(f"Log di {n} righe")
+    print(f"  open/append per riga   : {t_old * 1e6 / n:7.1f} µs/riga")
+    print(f"  log() sul thread       : {t_call * 1e6 / n:7.1f} µs/riga  (scritto su disco in {t_total:.2f}s)")
+
+
+if __name__ == "__main__":
+    test_ring_buffer_since()
+    test_ring_buffer_entries_paging()
+    print("✅ Logger OK")
+    benchmark()
@@ -0,0 +1,136 @@
+"""
+Test per metrics (metriche Prometheus del motore di polling)
+
+- istogrammi: bucket cumulativi, _sum/_count, label; contatori per label
+- SignalStrategy.run: durata del tick per trader e motivo dei tick saltati; trader
+  fermato durante il tick → la sua serie non viene ricreata
+- agent_client: errori di connessione contati per endpoint
+- GET /metrics dell'app in formato testo Prometheus
+- eseguibile con pytest oppure direttamente:  python test_metrics.py
+  (in questo caso lancia anche la misura del costo di una osservazione)
+"""
+
+import time
+from types import SimpleNamespace
+
+import metrics
+import trading_signals_multi2 as tsm
+from agent_client import agent_get
+
+# le righe dei tick non finiscono nel server_log.txt del repo
+tsm.global_log = lambda message, file=None: None
+
+
+def _sample(text, line_prefix):
+    for line in text.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def test_histogram_and_counter_render():
+    h = metrics.Histogram("t_latency_seconds", "test", ("stage",), buckets=(0.01, 0.1, 1.0))
+    c = metrics.Counter("t_events_total", "test", ("kind",))
+    for v in (0.005, 0.05, 0.05, 0.5, 3.0):
+        h.observe(v, "a")
+    c.inc("x")
+    c.inc("x", n=2)
+    text = "\n".join(h.render() + c.render())
+    assert "# TYPE t_latency_seconds histogram" in text
+    assert _sample(text, 't_latency_seconds_bucket{stage="a",le="0.01"}') == 1
+    assert _sample(text, 't_latency_seconds_bucket{stage="a",le="0.1"}') == 3
+    assert _sample(text, 't_latency_seconds_bucket{stage="a",le="1.0"}') == 4
+    assert _sample(text, 't_latency_seconds_bucket{stage="a",le="+Inf"}') == 5
+    assert _sample(text, 't_latency_seconds_count{stage="a"}') == 5
+    assert abs(_sample(text, 't_latency_seconds_sum{stage="a"}') - 3.605) < 1e-9
+    assert _sample(text, 't_events_total{kind="x"}') == 3
+    h.remove("a")
+    assert h.snapshot("a") is None
+
+
+def test_tick_duration_and_skip_reason(monkeypatch):
+    tid = 9101
+    trader = SimpleNamespace(selected_symbol="XAUUSD", name="t", block_night_trading=False, sessions_filter=None)
+    with tsm.sessions_lock:
+        tsm.sessions[tid] = {"trader": trader, "trader_data": {"slave_ip": "127.0.0.1", "slave_port": 1},
+                             "prev_signal": "HOLD", "timer": None, "logs": None}
+    monkeypatch.setattr(tsm, "is_market_open", lambda symbol: False)
+    skipped = metrics.TICKS_SKIPPED.value("market_closed")
+    try:
+        tsm.NoReverseStrategy().run(tid)
+        tsm.NoReverseStrategy().run(tid)
+    finally:
+        with tsm.sessions_lock:
+            tsm.sessions.pop(tid, None)
+    assert metrics.TICKS_SKIPPED.value("market_closed") == skipped + 2
+    counts, total, n = metrics.TICK_SECONDS.snapshot(tid)
+    assert n == 2 and sum(counts) == 2 and total >= 0
+    metrics.TICK_SECONDS.remove(tid)
+
+
+def test_stop_during_tick_leaves_no_series(monkeypatch):
+    tid = 9102
+    trader = SimpleNamespace(selected_symbol="XAUUSD", name="t", block_night_trading=False, sessions_filter=None)
+    with tsm.sessions_lock:
+        tsm.sessions[tid] = {"trader": trader, "trader_data": {"slave_ip": "127.0.0.1", "slave_port": 1},
+                             "prev_signal": "HOLD", "timer": None, "logs": None}
+
+    def stop_mid_tick(symbol):
+        tsm.stop_polling(tsm.StopPollingRequest(trader_id=tid))
+        return False
+
+    monkeypatch.setattr(tsm, "is_market_open", stop_mid_tick)
+    try:
+        tsm.NoReverseStrategy().run(tid)
+    finally:
+        with tsm.sessions_lock:
+            tsm.sessions.pop(tid, None)
+    assert metrics.TICK_SECONDS.snapshot(tid) is None
+
+
+def test_agent_connection_errors_counted():
+    before = metrics.AGENT_ERRORS.value("positions", "ConnectionError")
+    try:
+        agent_get("http://127.0.0.1:9/positions", timeout=1)
+    except Exception:
+        pass
+    assert metrics.AGENT_ERRORS.value("positions", "ConnectionError") == before + 1
+    assert metrics.AGENT_SECONDS.snapshot("positions")[2] >= 1
+
+
+def test_metrics_endpoint():
+    from fastapi.testclient import TestClient
+    import main
+
+    metrics.STAGE_SECONDS.observe(0.02, "get_data")
+    resp = TestClient(main.app).get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert "# TYPE polling_stage_seconds histogram" in resp.text
+    assert 'polling_stage_seconds_count{stage="get_data"}' in resp.text
+
+
+# =========================================================
+# Benchmark
+# =========================================================
+def benchmark(n=200_000):
+    h = metrics.Histogram("bench_seconds", "bench", ("stage",))
+    t0 = time.perf_counter()
+    for i in range(n):
+        h.observe(0.003, "get_data")
+    t_obs = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for i in range(n):
+        with h.time("get_data"):
+            pass
+    t_timer = time.perf_counter() - t0
+    print(f"Costo per osservazione ({n} campioni)")
+    print(f"  observe()        : {t_obs * 1e9 / n:7.0f} ns")
+    print(f"  with time()      : {t_timer * 1e9 / n:7.0f} ns")
+
+
+if __name__ == "__main__":
+    test_histogram_and_counter_render()
+    test_agent_connection_errors_counted()
+    print("✅ Metrics OK")
+    benchmark()
@@ -0,0 +1,138 @@
+"""
+Test per polling_scheduler (un thread di scheduling per tutti i trader)
+
+- phase spreading: job con lo stesso intervallo partono sfasati in [0, interval)
+- cadenza fissa, tick mai sovrapposti a sé stessi; tick più lunghi dell'intervallo
+  → overrun, tick saltati contati come deadline mancate, ritardi nelle statistiche
+- restart di un trader (schedule con la stessa chiave) mentre il vecchio tick è in
+  corso: il job nuovo parte solo a fine tick, mai due run() dello stesso trader insieme
+- eseguibile con pytest oppure direttamente:  python test_polling_scheduler.py
+"""
+
+import threading
+import time
+
+import polling_scheduler
+from polling_scheduler import PollingScheduler
+
+# gli errori dei tick non finiscono nel server_log.txt del repo
+polling_scheduler.global_log = lambda message, file=None: None
+
+
+class _Probe:
+    """fn di un job: conta esecuzioni e sovrapposizioni per chiave."""
+
+    def __init__(self, sleep=0.0):
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.starts = []
+
+    def __call__(self):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            self.starts.append(time.monotonic())
+        time.sleep(self.sleep)
+        with self.lock:
+            self.active -= 1
+
+
+def _wait(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def test_phase_spreading():
+    sched = PollingScheduler(max_workers=2)
+    now = time.monotonic()
+    jobs = [sched.schedule(tid, lambda: None, 5) for tid in range(200)]
+    offsets = [job.due - now for job in jobs]
+    assert all(-0.01 <= o < 5 for o in offsets)
+    buckets = {int(o) for o in offsets}                 # 200 trader su tutti e 5 i secondi
+    assert buckets == {0, 1, 2, 3, 4}
+    again = sched.schedule(7, lambda: None, 5)          # stessa chiave → stessa fase
+    assert abs((again.due - time.monotonic()) - offsets[7]) < 0.05
+    for job in jobs + [again]:
+        job.cancel()
+
+
+def test_fixed_cadence_and_stats():
+    sched = PollingScheduler(max_workers=4)
+    probe = _Probe()
+    job = sched.schedule("fast", probe, 0.05, first_delay=0)
+    assert _wait(lambda: job.ticks >= 8)
+    job.cancel()
+    gaps = [b - a for a, b in zip(probe.starts, probe.starts[1:])]
+    assert abs(sum(gaps) / len(gaps) - 0.05) < 0.02    # niente drift
+    stats = sched.stats()
+    assert stats["ticks"] >= 8 and stats["overruns"] == 0 and stats["missed_deadlines"] == 0
+    assert stats["lateness_p50_ms"] is not None and stats["lateness_max_ms"] < 500
+
+
+def test_overrun_skips_ticks():
+    sched = PollingScheduler(max_workers=4)
+    probe = _Probe(sleep=0.12)
+    job = sched.schedule("slow", probe, 0.05, first_delay=0)
+    assert _wait(lambda: job.ticks >= 3)
+    job.cancel()
+    assert probe.max_active == 1                        # il job non si sovrappone a sé stesso
+    stats = sched.stats()
+    assert job.overruns >= 3 and job.missed >= 3
+    assert stats["overruns"] == job.overruns and stats["missed_deadlines"] == job.missed
+    assert stats["tick_p95_ms"] >= 100
+
+
+def test_late_start_counts_as_missed_deadline(monkeypatch):
+    monkeypatch.setattr(polling_scheduler, "LATE_TOLERANCE", 0.05)
+    sched = PollingScheduler(max_workers=1)
+    blocker = threading.Event()
+    sched.schedule("busy", blocker.wait, 10, first_delay=0)   # occupa l'unico worker
+    probe = _Probe()
+    job = sched.schedule("late", probe, 10, first_delay=0)
+    time.sleep(0.2)
+    blocker.set()
+    assert _wait(lambda: job.ticks == 1)
+    assert job.missed == 1 and sched.stats()["lateness_max_ms"] >= 150
+    job.cancel()
+
+
+def test_restart_waits_for_running_tick():
+    sched = PollingScheduler(max_workers=4)
+    probe = _Probe(sleep=0.3)
+    old = sched.schedule(42, probe, 0.05, first_delay=0)
+    assert _wait(lambda: probe.active == 1)
+    new = sched.schedule(42, probe, 0.05, first_delay=0)   # stop + start del trader
+    assert old.cancelled
+    assert _wait(lambda: new.ticks >= 2)
+    new.cancel()
+    assert probe.max_active == 1
+    assert old.ticks == 1
+    assert probe.starts[1] - probe.starts[0] >= 0.29   # il nuovo è partito dopo il vecchio tick
+    assert _wait(lambda: "42" not in sched.stats()["per_job"])
+
+
+def test_restart_then_stop_while_running():
+    sched = PollingScheduler(max_workers=4)
+    probe = _Probe(sleep=0.2)
+    sched.schedule(43, probe, 0.05, first_delay=0)
+    assert _wait(lambda: probe.active == 1)
+    sched.schedule(43, probe, 0.05, first_delay=0).cancel()     # restart e subito stop
+    time.sleep(0.4)
+    assert len(probe.starts) == 1
+    with sched._cond:
+        assert 43 not in sched._jobs and 43 not in sched._running
+
+
+if __name__ == "__main__":
+    test_phase_spreading()
+    test_fixed_cadence_and_stats()
+    test_overrun_skips_ticks()
+    test_restart_waits_for_running_tick()
+    test_restart_then_stop_while_running()
+    print("✅ PollingScheduler OK")
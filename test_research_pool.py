@@ -0,0 +1,156 @@
+"""
+Test per research_pool (esecuzione parallela delle griglie di signal research)
+
+- stessi risultati, nello stesso ordine dei task, con executor seriale e a processi
+- eccezioni restituite al posto del singolo task, cancel -> InterruptedError
+- i task di research_tasks (e backtest per grid_task) si importano senza router né db
+- eseguibile con pytest oppure direttamente:  python test_research_pool.py
+  (in questo caso lancia anche il benchmark seriale vs processi)
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from research_pool import ResearchPool
+
+
+# Task top-level: i worker spawn li importano da questo modulo
+def _window_sum(ds, task):
+    start, width = task
+    return float(ds["values"][start:start + width].sum())
+
+
+def _fail_on_odd(ds, task):
+    if task % 2:
+        raise ValueError(f"task {task}")
+    return task * ds["k"]
+
+
+def _slow_task(ds, task):
+    time.sleep(ds["sleep"])
+    return task
+
+
+def _dataset(n=10_000, seed=0):
+    return {"values": np.random.default_rng(seed).normal(size=n)}
+
+
+def _tasks(n):
+    return [(i * 7 % 9_000, 1 + i % 50) for i in range(n)]
+
+
+def test_serial_order_and_progress():
+    ds = _dataset()
+    tasks = _tasks(500)
+    progress = []
+    with ResearchPool(ds, executor="serial") as pool:
+        out = pool.map(_window_sum, tasks, progress=lambda done, total: progress.append((done, total)), chunk_size=64)
+    assert out == [_window_sum(ds, t) for t in tasks]
+    assert progress[-1] == (500, 500)
+    assert [d for d, _ in progress] == sorted(d for d, _ in progress)
+
+
+@pytest.mark.parametrize("executor", ["serial", "process"])
+def test_on_result_covers_every_chunk(executor):
+    ds = _dataset(seed=4)
+    tasks = _tasks(200)
+    partial = {}
+    with ResearchPool(ds, executor=executor, workers=2) as pool:
+        out = pool.map(_window_sum, tasks, chunk_size=16, on_result=lambda start, res: partial.update(enumerate(res, start)))
+    assert [partial[i] for i in range(len(tasks))] == out
+
+
+def test_process_matches_serial():
+    ds = _dataset(seed=1)
+    tasks = _tasks(300)
+    with ResearchPool(ds, executor="serial") as pool:
+        ref = pool.map(_window_sum, tasks)
+    with ResearchPool(ds, executor="process", workers=2) as pool:
+        out = pool.map(_window_sum, tasks, chunk_size=13)
+        again = pool.map(_window_sum, tasks[::-1], chunk_size=5)   # pool riusabile tra più map
+    assert out == ref
+    assert again == ref[::-1]
+
+
+@pytest.mark.parametrize("executor", ["serial", "process"])
+def test_task_errors_do_not_stop_the_grid(executor):
+    with ResearchPool({"k": 3}, executor=executor, workers=2) as pool:
+        out = pool.map(_fail_on_odd, list(range(10)), chunk_size=3)
+    for i, res in enumerate(out):
+        if i % 2:
+            assert isinstance(res, ValueError) and str(res) == f"task {i}"
+        else:
+            assert res == i * 3
+
+
+@pytest.mark.parametrize("executor", ["serial", "process"])
+def test_cancel_raises_interrupted(executor):
+    calls = []
+
+    def _cancel():
+        calls.append(1)
+        return len(calls) > 1
+
+    with ResearchPool({"sleep": 0.05}, executor=executor, workers=2) as pool:
+        with pytest.raises(InterruptedError):
+            pool.map(_slow_task, list(range(200)), cancel=_cancel, chunk_size=2)
+
+
+def test_empty_tasks():
+    with ResearchPool({}, executor="process", workers=2) as pool:
+        assert pool.map(_window_sum, []) == []
+
+
+def test_worker_imports_skip_db():
+    # quello che importa un worker spawn per auto_is_task / grid_task
+    code = ("import sys, research_tasks, backtest; "
+            "print(sorted(m for m in ('db', 'db_pool', 'ai_analysis', 'job_manager', 'signal_research_routes') "
+            "if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=120,
+                         cwd=os.path.dirname(os.path.abspath(__file__)), env={**os.environ, "OPENAI_API_KEY": ""})
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip() == "[]"
+
+
+# =========================================================
+# Benchmark
+# =========================================================
+def _heavy_task(ds, task):
+    v = ds["values"]
+    return float(np.sort(v * task)[::97].sum())
+
+
+def benchmark(n_tasks=400):
+    ds = _dataset(n=200_000)
+    tasks = list(range(n_tasks))
+    t0 = time.perf_counter()
+    with ResearchPool(ds, executor="serial") as pool:
+        ref = pool.map(_heavy_task, tasks)
+    t_ser = time.perf_counter() - t0
+    workers = max(2, (os.cpu_count() or 2) - 1)
+    t0 = time.perf_counter()
+    with ResearchPool(ds, executor="process", workers=workers) as pool:
+        out = pool.map(_heavy_task, tasks)
+    t_par = time.perf_counter() - t0
+    assert out == ref
+    print(f"{n_tasks} task su 200k valori")
+    print(f"  seriale            : {t_ser * 1000:9.1f} ms")
+    print(f"  processi x{workers:<3}      : {t_par * 1000:9.1f} ms  (x{t_ser / t_par:.1f}, avvio pool incluso)")
+
+
+if __name__ == "__main__":
+    test_serial_order_and_progress()
+    test_process_matches_serial()
+    for executor in ("serial", "process"):
+        test_task_errors_do_not_stop_the_grid(executor)
+        test_cancel_raises_interrupted(executor)
+        test_on_result_covers_every_chunk(executor)
+    test_empty_tasks()
+    test_worker_imports_skip_db()
+    print("✅ ResearchPool OK")
+    benchmark()
@@ -0,0 +1,143 @@
+"""
+Test per result_cache (cache dei risultati dei backtest)
+
+- fingerprint: stesse barre → stessa chiave, barra aggiunta o corretta → chiave nuova,
+  colonne di indicatori ignorate
+- versione: cambia con i metodi ereditati e con i sorgenti del motore (ENGINE_SOURCES)
+- LRU in memoria, persistenza su disco, invalidazione dei fingerprint vecchi dello slot
+- eseguibile con pytest oppure direttamente:  python test_result_cache.py
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import result_cache
+
+
+@pytest.fixture(autouse=True)
+def _tmp_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_ENABLED", True)
+    result_cache.clear()
+    yield
+    result_cache.clear()
+
+
+def _dfs(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 2000 + np.cumsum(rng.normal(size=n))
+    df = pd.DataFrame({
+        "time": pd.date_range("2026-01-05", periods=n, freq="5min"),
+        "open": close, "high": close + 1, "low": close - 1, "close": close,
+        "tick_volume": rng.integers(1, 100, n),
+    })
+    return {"m5": df, "m15": None}
+
+
+def test_fingerprint():
+    dfs = _dfs()
+    fp = result_cache.dataset_fingerprint(dfs)
+    assert fp == result_cache.dataset_fingerprint(_dfs())
+    dfs["m5"]["ema5"] = dfs["m5"]["close"].ewm(span=5).mean()     # indicatori precalcolati: stessa chiave
+    assert fp == result_cache.dataset_fingerprint(dfs)
+    longer = _dfs(n=501)
+    assert fp != result_cache.dataset_fingerprint(longer)
+    fixed = _dfs()
+    fixed["m5"].loc[499, "close"] += 0.5                             # ultima barra corretta
+    assert fp != result_cache.dataset_fingerprint(fixed)
+
+
+def test_slot_params_and_strategy_version():
+    class A:
+        def f(self):
+            return 1
+
+    assert result_cache.make_slot("grid", sl=100, tp=200) == result_cache.make_slot("grid", tp=200, sl=100)
+    assert result_cache.make_slot("grid", sl=100, tp=200) != result_cache.make_slot("grid", sl=100, tp=300)
+    assert result_cache.make_slot("grid", sl=100) != result_cache.make_slot("backtest", sl=100)
+    assert result_cache.strategy_version(A()) == result_cache.strategy_version(A)
+
+
+def test_version_follows_base_classes_and_engine(tmp_path, monkeypatch):
+    class Base:
+        def f(self):
+            return 1
+
+    class OtherBase:
+        def f(self):
+            return 2
+
+    class Child(Base):
+        pass
+
+    before = result_cache.strategy_version(Child)
+    Child.__bases__ = (OtherBase,)                  # stesso sorgente della classe, metodo ereditato diverso
+    result_cache._class_version.cache_clear()
+    assert result_cache.strategy_version(Child) != before
+
+    helper = tmp_path / "helpers.py"
+    helper.write_text("def compute_regime(x):\n    return x\n")
+    monkeypatch.setattr(result_cache, "ENGINE_SOURCES", (str(helper),))
+    result_cache.engine_version.cache_clear()
+    slot = result_cache.make_slot("backtest", strategy="X")
+    helper.write_text("def compute_regime(x):\n    return -x\n")
+    result_cache.engine_version.cache_clear()
+    assert result_cache.make_slot("backtest", strategy="X") != slot
+    monkeypatch.undo()
+    result_cache.engine_version.cache_clear()
+
+
+def test_memory_disk_roundtrip():
+    key = result_cache.make_key(result_cache.make_slot("grid", sl=1), "fp1")
+    assert result_cache.get(key) is None
+    value = {"summary": {"total_trades": 3}, "balances": [1001.0, 999.5, 1002.25]}
+    result_cache.put(key, value)
+    assert result_cache.get(key) is value
+    disk_hits = result_cache.cache_stats()["disk_hits"]
+    result_cache.clear()                        # riavvio: solo il disco
+    assert result_cache.get(key) == value
+    assert result_cache.cache_stats()["disk_hits"] == disk_hits + 1
+
+
+def test_new_fingerprint_invalidates_slot():
+    slot = result_cache.make_slot("backtest", strategy="X")
+    old, new = result_cache.make_key(slot, "fp-old"), result_cache.make_key(slot, "fp-new")
+    result_cache.put(old, {"v": 1})
+    result_cache.put(new, {"v": 2})
+    assert result_cache.get(new) == {"v": 2}
+    assert result_cache.get(old) is None
+    assert not os.path.exists(result_cache._path(old))
+
+
+def test_lru_eviction(monkeypatch):
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_MAX_ENTRIES", 3)
+    keys = [result_cache.make_key(result_cache.make_slot("grid", i=i), "fp") for i in range(4)]
+    for i, k in enumerate(keys[:3]):
+        result_cache.put(k, i)
+    result_cache.get(keys[0])                   # keys[1] diventa il meno usato
+    result_cache.put(keys[3], 3)
+    assert result_cache.cache_stats()["entries"] == 3
+    assert keys[1] not in result_cache._mem and keys[0] in result_cache._mem
+    assert result_cache.get(keys[1]) == 1       # ancora su disco
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_ENABLED", False)
+    key = result_cache.make_key("slot", "fp")
+    result_cache.put(key, 1)
+    assert result_cache.get(key) is None
+
+
+if __name__ == "__main__":
+    result_cache.RESULT_CACHE_DIR = tempfile.mkdtemp(prefix="result_cache_")
+    test_fingerprint()
+    test_slot_params_and_strategy_version()
+    test_memory_disk_roundtrip()
+    result_cache.clear()
+    test_new_fingerprint_invalidates_slot()
+    result_cache.clear()
+    print("✅ ResultCache OK")
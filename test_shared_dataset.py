@@ -0,0 +1,94 @@
+"""
+Test per shared_dataset (dataset di ricerca in memoria condivisa)
+
+- publish/attach restituisce la stessa struttura (dict, tuple, DataFrame, array, oggetti)
+- viste zero-copy e di sola lettura, anche dai worker di ResearchPool
+- refcount: il blocco viene rimosso solo all'ultimo release
+- eseguibile con pytest oppure direttamente:  python test_shared_dataset.py
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import shared_dataset
+from research_pool import ResearchPool
+
+
+def _dataset(n=5_000, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "time": pd.date_range("2026-01-05", periods=n, freq="15min"),
+        "close": 2000 + np.cumsum(rng.normal(size=n)),
+        "tick_volume": rng.integers(1, 100, n),
+        "is_spike": rng.random(n) > 0.9,
+        "label": ["ASIA"] * n,
+    })
+    cache = ({5: rng.normal(size=n), 50: rng.normal(size=n)}, {14: rng.normal(size=n)}, None, ["LONDON"] * n)
+    return {"is": (df, cache), "params": {"lot": 0.01, "sessions": ["LONDON"]}}
+
+
+def _close_sum(ds, task):
+    df, cache = ds["is"]
+    return float(df["close"].to_numpy()[task:].sum() + cache[0][5][task:].sum())
+
+
+def _is_shared(ds, task):
+    df, cache = ds["is"]
+    return (not df["close"].to_numpy().flags.writeable, not cache[0][50].flags.writeable)
+
+
+def test_roundtrip_and_read_only():
+    ds = _dataset()
+    h = shared_dataset.publish("t-roundtrip", ds)
+    try:
+        out = shared_dataset.attach(h)
+        df, cache = out["is"]
+        pd.testing.assert_frame_equal(df, ds["is"][0])
+        assert set(cache[0]) == {5, 50}
+        np.testing.assert_array_equal(cache[0][50], ds["is"][1][0][50])
+        assert cache[2] is None and cache[3] == ["LONDON"] * len(df)
+        assert out["params"] == ds["params"]
+        with pytest.raises(ValueError):
+            df["close"].to_numpy()[0] = 0.0
+        assert shared_dataset.attach(h) is out
+    finally:
+        shared_dataset.release("t-roundtrip")
+
+
+def test_refcount_and_cleanup():
+    ds = _dataset(n=100)
+    h = shared_dataset.publish("t-refs", ds)
+    assert shared_dataset.publish("t-refs", ds) is h
+    assert shared_dataset.published()["t-refs"][0] == 2
+    shared_dataset.release("t-refs")
+    assert "t-refs" in shared_dataset.published()
+    shared_dataset.release("t-refs")
+    assert "t-refs" not in shared_dataset.published()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=h.shm_name)
+    shared_dataset.release("t-refs")    # key sconosciuta: no-op
+
+
+@pytest.mark.parametrize("executor", ["serial", "process"])
+def test_pool_workers_attach(executor):
+    ds = _dataset(seed=2)
+    tasks = list(range(0, 5_000, 250))
+    ref = [_close_sum(ds, t) for t in tasks]
+    h = shared_dataset.publish(f"t-pool-{executor}", ds)
+    try:
+        with ResearchPool(h, executor=executor, workers=2) as pool:
+            assert pool.map(_close_sum, tasks, chunk_size=3) == ref
+            assert pool.map(_is_shared, [0]) == [(True, True)]
+    finally:
+        shared_dataset.release(f"t-pool-{executor}")
+
+
+if __name__ == "__main__":
+    test_roundtrip_and_read_only()
+    test_refcount_and_cleanup()
+    for executor in ("serial", "process"):
+        test_pool_workers_attach(executor)
+    print("✅ SharedDataset OK")
@@ -0,0 +1,200 @@
+"""
+Test di equivalenza e micro-benchmark per indicators/streaming.py
+
+- stati incrementali (EMA, RSI, MACD, ATR, HMA, percentile) confrontati con le
+  funzioni batch di indicators/ta.py su una serie lunga, stessi NaN di warm-up
+- HMA entro 1e-13 relativo dal batch anche dopo 20k candele
+- CandleStream.sync: coda sovrapposta fusa senza ricalcolo, reset solo se i dati
+  non si sovrappongono più (gap); un frame più vecchio dello stato non cambia nulla
+- eseguibile con pytest oppure direttamente:  python test_streaming.py
+  (in questo caso lancia anche il benchmark stream vs ricalcolo batch)
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from indicators.streaming import (
+    CandleStream, EmaState, HmaState, MacdLineState, RankState, RsiState, SmaState,
+    TrueRangeState, candle_body, drop_streams, get_stream, high_low,
+)
+from indicators.ta import (
+    compute_atr, compute_ema, compute_hma, compute_macd, compute_rolling_percentile, compute_rsi,
+)
+from synthetic_bars import make_bars
+
+SPEC = [
+    ("ema21", lambda: EmaState(21), "close"),
+    ("rsi14", lambda: RsiState(14), "close"),
+    ("macd", MacdLineState, "close"),
+    ("macd_sig", lambda: EmaState(9), "macd"),
+    ("atr", lambda: SmaState(14), high_low),
+    ("atr_pct", lambda: RankState(50), "atr"),
+    ("hma", lambda: HmaState(16), "close"),
+    ("tr", TrueRangeState, None),
+    ("body", None, candle_body),
+]
+
+
+def batch(df):
+    """Stesse feature di SPEC calcolate con indicators/ta.py."""
+    macd, macd_sig = compute_macd(df)
+    atr = compute_atr(df, 14)
+    prev = df["close"].shift()
+    tr = np.maximum(df["high"] - df["low"],
+                    np.maximum((df["high"] - prev).abs(), (df["low"] - prev).abs()).fillna(0))
+    return {
+        "ema21": compute_ema(df, 21), "rsi14": compute_rsi(df, 14),
+        "macd": macd, "macd_sig": macd_sig, "atr": atr,
+        "atr_pct": compute_rolling_percentile(atr, 50), "hma": compute_hma(df, 16),
+        "tr": tr, "body": (df["close"] - df["open"]).abs(),
+    }
+
+
+def stream_values(state, xs):
+    return np.array([state.update(float(x)) for x in xs])
+
+
+def assert_same(new, old, rtol=1e-12):
+    new, old = np.asarray(new, dtype=float), np.asarray(old, dtype=float)
+    assert np.array_equal(np.isnan(new), np.isnan(old))
+    np.testing.assert_allclose(new, old, rtol=rtol, atol=0, equal_nan=True)
+
+
+def assert_snapshot(snap, ref, i):
+    """I valori dello snapshot sono quelli batch della candela chiusa i (e delle precedenti)."""
+    for name in ref:
+        for back in (0, 1, 5):
+            assert_same([snap.get(name, back)], [ref[name].iloc[i - back]], rtol=1e-13)
+
+
+# =========================================================
+# Test di equivalenza
+# =========================================================
+def test_states_match_batch():
+    df = make_bars(5000)
+    close = df["close"].to_numpy()
+    hl = (df["high"] - df["low"]).to_numpy()
+    macd, macd_sig = compute_macd(df)
+    assert_same(stream_values(EmaState(21), close), compute_ema(df, 21))
+    assert_same(stream_values(RsiState(14), close), compute_rsi(df, 14))
+    macd_line = stream_values(MacdLineState(), close)
+    assert_same(macd_line, macd)
+    assert_same(stream_values(EmaState(9), macd_line), macd_sig)
+    atr = stream_values(SmaState(14), hl)
+    assert_same(atr, compute_atr(df, 14))
+    assert_same(stream_values(RankState(192), atr), compute_rolling_percentile(pd.Series(atr), 192))
+
+
+def test_hma_long_series():
+    for seed in (1, 2, 3):
+        df = make_bars(20_000, seed=seed)
+        out = stream_values(HmaState(16), df["close"].to_numpy())
+        assert_same(out, compute_hma(df, 16), rtol=1e-13)
+
+
+def test_true_range():
+    df = make_bars(200)
+    state = TrueRangeState()
+    out = [state.update(bar) for bar in df.to_dict("records")]
+    assert_same(out, batch(df)["tr"])
+    assert out[0] == df["high"].iloc[0] - df["low"].iloc[0]
+
+
+def test_sync_tail_merge():
+    df = make_bars(3000)
+    ref = batch(df)
+    stream = CandleStream(SPEC)
+    snap = stream.sync(df.iloc[:1001])                  # 1000 candele chiuse + quella in formazione
+    assert stream.bars == 1000 and snap.last_time == df["time"].iloc[999]
+    assert_snapshot(snap, ref, 999)
+
+    # polling: la coda scaricata si sovrappone allo stato, entrano solo le candele nuove
+    for end in (1001, 1003, *range(1200, 3001, 200)):
+        snap = stream.sync(df.iloc[end - 300:end])
+        assert stream.bars == end - 1
+        assert_snapshot(snap, ref, end - 2)
+    snap = stream.sync(df.iloc[2900:3000])              # stessa coda: niente da aggiungere
+    assert stream.bars == 2999
+    assert_snapshot(snap, ref, 2998)
+
+
+def test_sync_resets_on_gap():
+    df = make_bars(3000)
+    stream = CandleStream(SPEC)
+    stream.sync(df.iloc[:1001])
+
+    gap = df.iloc[1500:2500].reset_index(drop=True)     # coda che non tocca più lo stato
+    snap = stream.sync(gap)
+    assert stream.bars == len(gap) - 1
+    assert_snapshot(snap, batch(gap), len(gap) - 2)
+
+    assert stream.sync(gap.iloc[:1]).last_time == snap.last_time        # solo la candela in formazione
+    assert np.isnan(snap.get("ema21", back=100))                        # oltre la history
+
+
+def test_older_frame_keeps_state():
+    df = make_bars(3000)
+    ref = batch(df)
+    stream = CandleStream(SPEC)
+    stream.sync(df.iloc[:1001])
+    newer = stream.sync(df.iloc[800:1003])              # un trader porta lo stream avanti
+    states = dict(stream._states)
+
+    # un altro trader sincronizza un frame scaricato prima del cambio di candela
+    for older in (df.iloc[700:1002], df.iloc[200:800], df.iloc[900:1003]):
+        snap = stream.sync(older)
+        assert stream.bars == 1002 and snap.last_time == newer.last_time
+        assert_snapshot(snap, ref, 1001)
+    assert all(stream._states[name] is state for name, state in states.items())     # nessun reset
+
+    snap = stream.sync(df.iloc[900:1010])               # e lo stream riprende da dove era
+    assert stream.bars == 1009
+    assert_snapshot(snap, ref, 1008)
+
+
+def test_shared_streams():
+    drop_streams()
+    a = get_stream("http://agent:1", "XAUUSD", 1, SPEC)
+    assert get_stream("http://agent:1", "XAUUSD", 1, SPEC) is a
+    assert get_stream("http://agent:1", "XAUUSD", 5, SPEC) is not a
+    assert get_stream("http://agent:1", "XAUUSD", 1, list(SPEC)) is not a     # spec diversa: stream nuovo
+    drop_streams(agent_url="http://agent:1", symbol="XAUUSD")
+    assert get_stream("http://agent:1", "XAUUSD", 1, SPEC) is not a
+    drop_streams()
+
+
+# =========================================================
+# Micro-benchmark
+# =========================================================
+def benchmark(n_ticks=2000, window=300):
+    df = make_bars(window + n_ticks)
+
+    t0 = time.perf_counter()
+    for end in range(window, window + n_ticks):
+        batch(df.iloc[end - window:end])
+    t_batch = time.perf_counter() - t0
+
+    stream = CandleStream(SPEC)
+    tails = [df.iloc[end - window:end] for end in range(window, window + n_ticks)]
+    t0 = time.perf_counter()
+    for tail in tails:
+        stream.sync(tail)
+    t_stream = time.perf_counter() - t0
+
+    print(f"Indicatori di {len(SPEC)} feature per tick, finestra di {window} candele")
+    print(f"  ricalcolo batch : {t_batch * 1e6 / n_ticks:9.1f} us/tick")
+    print(f"  stream          : {t_stream * 1e6 / n_ticks:9.1f} us/tick  (x{t_batch / t_stream:.0f})")
+
+
+if __name__ == "__main__":
+    test_states_match_batch()
+    test_hma_long_series()
+    test_true_range()
+    test_sync_tail_merge()
+    test_sync_resets_on_gap()
+    test_older_frame_keeps_state()
+    test_shared_streams()
+    print("✅ Equivalenza stream/batch OK")
+    benchmark()
@@ -0,0 +1,142 @@
+"""
+Test di equivalenza e micro-benchmark per i kernel NumPy di indicators/ta.py
+
+- confronto WMA/HMA vettorizzate con la vecchia implementazione rolling.apply
+- confronto del rank mobile incrementale (compute_rolling_percentile)
+- eseguibile con pytest oppure direttamente:  python test_ta_kernels.py
+  (in questo caso lancia anche il benchmark su 100k barre)
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from indicators.ta import wma, compute_hma, compute_rolling_percentile
+from indicators.rolling_rank import RollingRank
+from synthetic_bars import make_bars
+
+
+# =========================================================
+# Implementazioni di riferimento (vecchio percorso rolling.apply)
+# =========================================================
+def wma_legacy(series, n):
+    weights = np.arange(1, n + 1, dtype=float)
+    return series.rolling(n).apply(lambda x: np.dot(x, weights) / weights.sum(), raw=True)
+
+
+def compute_hma_legacy(df, period=16):
+    close = df['close']
+    half = int(period / 2)
+    sqrt = int(np.sqrt(period))
+    wma_half = wma_legacy(close, half)
+    wma_full = wma_legacy(close, period)
+    return wma_legacy(2 * wma_half - wma_full, sqrt)
+
+
+def compute_rolling_percentile_legacy(series, window):
+    def _pct(x):
+        return float(np.mean(x <= x[-1]))
+    return series.rolling(window).apply(_pct, raw=True)
+
+
+def assert_same(new, old):
+    assert new.index.equals(old.index)
+    assert np.array_equal(new.isna().to_numpy(), old.isna().to_numpy())
+    np.testing.assert_allclose(new.to_numpy(), old.to_numpy(), rtol=1e-12, atol=1e-9, equal_nan=True)
+
+
+# =========================================================
+# Test di equivalenza
+# =========================================================
+def test_wma_matches_legacy():
+    df = make_bars(3000).set_index("time")
+    for n in (1, 2, 3, 4, 8, 9, 16, 50):
+        assert_same(wma(df['close'], n), wma_legacy(df['close'], n))
+
+
+def test_hma_matches_legacy():
+    df = make_bars(3000, seed=7).set_index("time")
+    for period in (4, 9, 16, 21, 55):
+        assert_same(compute_hma(df, period), compute_hma_legacy(df, period))
+
+
+def test_wma_nan_propagation():
+    s = make_bars(400, seed=3).set_index("time")['close'].copy()
+    s.iloc[[0, 5, 120, 121, 399]] = np.nan
+    for n in (3, 16):
+        assert_same(wma(s, n), wma_legacy(s, n))
+
+
+def test_short_series():
+    df = make_bars(10).set_index("time")
+    assert wma(df['close'], 16).isna().all()
+    assert_same(compute_hma(df, 16), compute_hma_legacy(df, 16))
+    empty = df.iloc[:0]
+    assert compute_hma(empty, 16).empty
+
+
+def test_rolling_percentile_matches_legacy():
+    df = make_bars(2000, seed=11).set_index("time")
+    atr = df['close'].diff().abs().rolling(14).mean()
+    for window in (1, 5, 192):
+        new = compute_rolling_percentile(atr, window)
+        old = compute_rolling_percentile_legacy(atr, window)
+        assert new.index.equals(old.index)
+        # il rank è un rapporto di interi: i valori devono coincidere esattamente
+        assert np.array_equal(new.to_numpy(), old.to_numpy(), equal_nan=True)
+
+
+def test_rolling_percentile_ties_and_nan():
+    s = pd.Series([1.0, 2.0, 2.0, np.nan, 2.0, 1.0, 1.0, 3.0, 3.0, 0.5, 2.0, 2.0])
+    for window in (2, 3, 4):
+        new = compute_rolling_percentile(s, window)
+        old = compute_rolling_percentile_legacy(s, window)
+        assert np.array_equal(new.to_numpy(), old.to_numpy(), equal_nan=True)
+
+
+def test_rolling_rank_streaming():
+    rr = RollingRank(3)
+    out = [rr.update(v) for v in (5.0, 1.0, 3.0, 4.0, 0.0)]
+    assert np.isnan(out[0]) and np.isnan(out[1])
+    assert out[2:] == [2 / 3, 1.0, 1 / 3]
+
+
+# =========================================================
+# Micro-benchmark
+# =========================================================
+def benchmark(n_bars=100_000, period=16, repeat=3):
+    df = make_bars(n_bars).set_index("time")
+
+    def _best(fn):
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - t0)
+        return best
+
+    t_old = _best(lambda: compute_hma_legacy(df, period))
+    t_new = _best(lambda: compute_hma(df, period))
+    print(f"HMA({period}) su {n_bars} barre")
+    print(f"  rolling.apply : {t_old * 1000:9.1f} ms")
+    print(f"  kernel NumPy  : {t_new * 1000:9.1f} ms  (x{t_old / t_new:.0f})")
+
+    atr = df['close'].diff().abs().rolling(14).mean()
+    t_old = _best(lambda: compute_rolling_percentile_legacy(atr, 192))
+    t_new = _best(lambda: compute_rolling_percentile(atr, 192))
+    print(f"Rolling percentile(192) su {n_bars} barre")
+    print(f"  rolling.apply    : {t_old * 1000:9.1f} ms")
+    print(f"  finestra ordinata: {t_new * 1000:9.1f} ms  (x{t_old / t_new:.0f})")
+
+
+if __name__ == "__main__":
+    test_wma_matches_legacy()
+    test_hma_matches_legacy()
+    test_wma_nan_propagation()
+    test_short_series()
+    test_rolling_percentile_matches_legacy()
+    test_rolling_percentile_ties_and_nan()
+    test_rolling_rank_streaming()
+    print("✅ Equivalenza WMA/HMA/percentile OK")
+    benchmark()
@@ -0,0 +1,249 @@
+"""
+Test per /tick_bundle (candele + posizioni + tick + symbol_info in una chiamata)
+
+- decode_bundle_rates: voce binaria (base64) e voce JSON danno le stesse barre, errore → ValueError
+- get_tick_bundle: prima chiamata con tutte le barre, poi hit in cache e solo coda, in una POST per tick
+- agent senza /tick_bundle (404): stesse informazioni con le chiamate singole, senza riprovare il bundle
+- SignalStrategy.run: un solo round-trip verso lo slave per tick, tick e symbol_info riusati da send_order
+  (ma dopo una chiusura il tick si rilegge: il prezzo del bundle è vecchio)
+- eseguibile con pytest oppure direttamente:  python test_tick_bundle.py
+  (in questo caso lancia anche il confronto dei round-trip per tick)
+"""
+
+import base64
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+import candle_cache
+import trading_signals_multi2 as tsm
+from rates_codec import decode_bundle_rates
+
+# le righe dei tick non finiscono nel server_log.txt del repo
+tsm.global_log = lambda message, file=None: None
+
+AGENT = "http://bundle-agent:1"
+RATES_DTYPE = np.dtype([
+    ("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+    ("tick_volume", "<u8"), ("spread", "<i4"), ("real_volume", "<u8"),
+])
+
+
+def _bars(n, timeframe, end=1_800_000_000, seed=0):
+    rng = np.random.default_rng(seed + timeframe)
+    out = np.zeros(n, dtype=RATES_DTYPE)
+    step = 60 * (60 if timeframe == 16385 else timeframe)
+    out["time"] = end - step * np.arange(n)[::-1]
+    out["close"] = 2000 + np.cumsum(rng.normal(0, 1, n))
+    out["open"] = out["close"] - rng.normal(0, 0.5, n)
+    out["high"] = np.maximum(out["open"], out["close"]) + 0.3
+    out["low"] = np.minimum(out["open"], out["close"]) - 0.3
+    out["tick_volume"] = rng.integers(1, 500, n)
+    return out
+
+
+def _item(rates, binary=True):
+    # stessa voce di _rates_item dell'agent
+    if binary:
+        return {"dtype": rates.dtype.descr, "count": len(rates),
+                "data": base64.b64encode(rates.tobytes()).decode("ascii")}
+    return {"rates": json.loads(pd.DataFrame(rates).to_json(orient="records"))}
+
+
+class _Resp:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body
+        self.headers = {"content-type": "application/json"}
+
+    def json(self):
+        return self._body
+
+
+class FakeAgent:
+    """Agent MT5 finto: barre per timeframe, registra ogni chiamata."""
+
+    def __init__(self, has_bundle=True, n=400):
+        self.has_bundle = has_bundle
+        self.series = {tf: _bars(n, tf) for tf in (1, 5, 15, 16385)}
+        self.positions = []
+        self.calls = []
+
+    def post(self, url, json=None, **kwargs):
+        path = url.split("/", 3)[3]
+        self.calls.append((path, json))
+        if path == "tick_bundle":
+            if not self.has_bundle:
+                return _Resp(404, {"detail": "Not Found"})
+            out = {"rates": [_item(self.series[r["timeframe"]][-r["n_candles"]:]) for r in json["rates"]]}
+            if json.get("positions"):
+                out["positions"] = self.positions
+            if json.get("tick"):
+                out["tick"] = {"bid": 2000.0, "ask": 2000.2, "last": 0.0}
+            if json.get("symbol_info"):
+                out["symbol_info"] = {"name": json["symbol"], "point": 0.01}
+            return _Resp(200, out)
+        if path == "get_rates":
+            return _Resp(200, _item(self.series[json["timeframe"]][-json["n_candles"]:], binary=False))
+        return _Resp(200, {"status": "ok"})
+
+    def get(self, url, **kwargs):
+        path = url.split("/", 3)[3]
+        self.calls.append((path, None))
+        if path == "positions":
+            return _Resp(200, [])
+        if path.startswith("symbol_tick"):
+            return _Resp(200, {"bid": 2000.0, "ask": 2000.2, "last": 0.0})
+        if path.startswith("symbol_info"):
+            return _Resp(200, {"name": "XAUUSD", "point": 0.01})
+        return _Resp(404, None)
+
+    def paths(self):
+        return [p for p, _ in self.calls]
+
+
+def _install(monkeypatch, agent):
+    candle_cache.invalidate()
+    monkeypatch.setattr(candle_cache, "agent_post", agent.post)
+    monkeypatch.setattr(candle_cache, "agent_get", agent.get)
+
+
+def test_decode_bundle_rates_binary_json_parity():
+    rates = _bars(50, 5)
+    binary = decode_bundle_rates(_item(rates, binary=True))
+    from_json = decode_bundle_rates(_item(rates, binary=False))
+    assert binary.dtype == RATES_DTYPE and len(binary) == 50
+    for name in ("time", "tick_volume"):
+        assert np.array_equal(binary[name], from_json[name])
+    for name in ("open", "close"):          # il JSON dell'agent arrotonda a 10 decimali
+        assert np.allclose(binary[name], from_json[name], rtol=0, atol=1e-9)
+    assert decode_bundle_rates(_item(rates[:0])) is None
+    assert decode_bundle_rates({"rates": []}) is None
+    try:
+        decode_bundle_rates({"error": "Missing symbol or timeframe"})
+        assert False, "atteso ValueError"
+    except ValueError:
+        pass
+
+
+def test_bundle_full_then_hit_then_tail(monkeypatch):
+    agent = FakeAgent()
+    _install(monkeypatch, agent)
+    frames = {5: 100, 15: 300}
+
+    first = candle_cache.get_tick_bundle(AGENT, "XAUUSD", frames, positions=True, tick=True)
+    assert agent.paths() == ["tick_bundle"]
+    assert [(r["timeframe"], r["n_candles"]) for r in agent.calls[0][1]["rates"]] == [(5, 100), (15, 300)]
+    assert len(first["frames"][5]) == 100 and len(first["frames"][15]) == 300
+    assert first["positions"] == [] and first["tick"]["ask"] == 2000.2 and first["symbol_info"] is None
+    assert first["frames"][5]["time"].iloc[-1] == pd.to_datetime(agent.series[5]["time"][-1], unit="s")
+
+    # entro max_age: nessuna barra richiesta, la POST porta solo le posizioni
+    candle_cache.get_tick_bundle(AGENT, "XAUUSD", frames, positions=True)
+    assert agent.calls[1][1]["rates"] == []
+
+    # nuova barra M5: solo la coda, fusa con la cache
+    new = _bars(1, 5, end=int(agent.series[5]["time"][-1]) + 300, seed=7)
+    agent.series[5] = np.concatenate([agent.series[5], new])
+    third = candle_cache.get_tick_bundle(AGENT, "XAUUSD", {5: 100}, positions=True, max_age=0)
+    assert agent.paths() == ["tick_bundle"] * 3
+    assert agent.calls[2][1]["rates"] == [{"timeframe": 5, "n_candles": candle_cache.TAIL_BARS}]
+    expected = candle_cache._rates_df(agent.series[5][-100:])
+    pd.testing.assert_frame_equal(third["frames"][5], expected)
+
+
+def test_old_agent_falls_back_to_single_calls(monkeypatch):
+    agent = FakeAgent(has_bundle=False)
+    _install(monkeypatch, agent)
+    out = candle_cache.get_tick_bundle(AGENT, "XAUUSD", {5: 100}, positions=True, tick=True, symbol_info=True)
+    assert len(out["frames"][5]) == 100 and out["positions"] == [] and out["symbol_info"]["point"] == 0.01
+    assert agent.paths() == ["tick_bundle", "get_rates", "positions", "symbol_tick/XAUUSD", "symbol_info/XAUUSD"]
+    agent.calls.clear()
+    candle_cache.get_tick_bundle(AGENT, "XAUUSD", {5: 100}, positions=True)
+    assert "tick_bundle" not in agent.paths()          # ricordato fino a BUNDLE_RETRY_AFTER
+    candle_cache.invalidate(AGENT)
+
+
+class _AlwaysBuyReverse(tsm.NoReverseStrategy):
+    def buy_condition(self, ind):
+        return True
+
+    def reverse_on_buy(self, has_sell):
+        return has_sell
+
+
+def _run_ticks(monkeypatch, agent, n_ticks=1, strategy=tsm.NoReverseStrategy):
+    """n tick di `strategy` sullo slave finto, ordini compresi."""
+    tid = 9201
+    trader = type("T", (), dict(
+        selected_symbol="XAUUSD", name="t", block_night_trading=False, sessions_filter=None,
+        sl=500, tp=1000, fix_lot=0.01, broker="b", use_signal_sl_tp=False, use_profit_tp=False,
+    ))()
+    monkeypatch.setattr(tsm, "is_market_open", lambda symbol: True)
+    monkeypatch.setattr(tsm, "agent_get", agent.get)
+    monkeypatch.setattr(tsm, "agent_post", agent.post)
+    with tsm.sessions_lock:
+        tsm.sessions[tid] = {"trader": trader, "trader_data": {"slave_ip": "bundle-agent", "slave_port": 1},
+                             "prev_signal": "HOLD", "timer": None, "logs": None}
+    try:
+        for _ in range(n_ticks):
+            strategy().run(tid)
+    finally:
+        with tsm.sessions_lock:
+            tsm.sessions.pop(tid, None)
+        tsm.TICK_SECONDS.remove(tid)
+
+
+def test_strategy_tick_is_one_round_trip(monkeypatch):
+    agent = FakeAgent()
+    _install(monkeypatch, agent)
+    _run_ticks(monkeypatch, agent)
+    slave_calls = [p for p in agent.paths() if not p.startswith("db/")]
+    assert slave_calls == ["tick_bundle"]
+    assert agent.calls[0][1]["positions"] and agent.calls[0][1]["symbol_info"]
+    # se la strategia ha aperto un ordine, i prezzi venivano dal bundle
+    assert all(p.endswith("open_order_on_slave") for p in agent.paths() if p.startswith("db/"))
+    candle_cache.invalidate(AGENT)
+
+
+def test_tick_refetched_after_close(monkeypatch):
+    agent = FakeAgent()
+    agent.positions = [{"symbol": "XAUUSD", "type": 1, "profit": 0.0}]      # SELL aperto → reverse
+    _install(monkeypatch, agent)
+    _run_ticks(monkeypatch, agent, strategy=_AlwaysBuyReverse)
+    paths = [p.rsplit("/", 1)[-1] if p.startswith("db/") else p for p in agent.paths()]
+    assert paths == ["tick_bundle", "close_order_on_slave", "symbol_tick/XAUUSD", "open_order_on_slave"]
+    candle_cache.invalidate(AGENT)
+
+
+# =========================================================
+# Benchmark
+# =========================================================
+class _Patch:
+    def setattr(self, obj, name, value):
+        setattr(obj, name, value)
+
+
+def benchmark(n_ticks=50):
+    saved = (candle_cache.agent_post, candle_cache.agent_get, tsm.is_market_open, tsm.agent_get, tsm.agent_post)
+    try:
+        for label, has_bundle in (("chiamate singole", False), ("tick_bundle", True)):
+            agent = FakeAgent(has_bundle=has_bundle)
+            _install(_Patch(), agent)
+            t0 = time.perf_counter()
+            _run_ticks(_Patch(), agent, n_ticks)
+            dt = time.perf_counter() - t0
+            slave = [p for p in agent.paths() if not p.startswith("db/")]
+            print(f"  {label:18s}: {len(slave) / n_ticks:4.1f} round-trip/tick  ({dt * 1e3 / n_ticks:.2f} ms/tick)")
+    finally:
+        (candle_cache.agent_post, candle_cache.agent_get, tsm.is_market_open, tsm.agent_get, tsm.agent_post) = saved
+        candle_cache.invalidate()
+
+
+if __name__ == "__main__":
+    test_decode_bundle_rates_binary_json_parity()
+    print("✅ TickBundle OK")
+    print("Round-trip verso lo slave per tick")
+    benchmark()
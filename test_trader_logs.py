@@ -0,0 +1,113 @@
+"""
+Test per i log per trader di trading_signals_multi2 (ring buffer + /trade/logs/{trader_id})
+
+- solo le righe nuove rispetto a since, a pagine di al più limit righe
+- buffer a capacità fissa: le righe perse sono contate in missed
+- restart del polling: stesso buffer, le sequenze continuano; buffer ripartito → reset
+- restart con buffer ancora vuoto: stesso buffer, stesso epoch
+- stop/start: buffer nuovo con epoch diverso → reset anche se since è ancora valido
+- eseguibile con pytest oppure direttamente:  python test_trader_logs.py
+"""
+
+import contextlib
+
+import trading_signals_multi2 as tsm
+from logger import LogBuffer
+from models import Trader
+
+# le righe non finiscono nel server_log.txt del repo
+tsm.global_log = lambda message, file=None: None
+
+
+def _session(tid, capacity=50):
+    with tsm.sessions_lock:
+        tsm.sessions[tid] = {"trader": None, "trader_data": {}, "prev_signal": "HOLD", "timer": None,
+                             "logs": LogBuffer(capacity)}
+
+
+def _drop(tid):
+    with tsm.sessions_lock:
+        tsm.sessions.pop(tid, None)
+
+
+def test_delta_paging():
+    _session(9001)
+    try:
+        for i in range(12):
+            tsm.log(9001, f"tick {i}")
+        page = tsm.get_trader_logs(9001, since=0, limit=5)
+        assert [l["seq"] for l in page["lines"]] == [1, 2, 3, 4, 5]
+        assert page["lines"][0]["line"].endswith("tick 0") and page["next_since"] == 5
+        page = tsm.get_trader_logs(9001, since=page["next_since"], limit=100)
+        assert [l["seq"] for l in page["lines"]] == list(range(6, 13))
+        assert page["missed"] == 0 and page["last_seq"] == 12
+        assert tsm.get_trader_logs(9001, since=12)["lines"] == []
+    finally:
+        _drop(9001)
+
+
+def test_ring_buffer_missed_and_reset():
+    _session(9002, capacity=10)
+    try:
+        for i in range(30):
+            tsm.log(9002, f"tick {i}")
+        with tsm.sessions_lock:
+            assert len(tsm.sessions[9002]["logs"]) == 10
+        page = tsm.get_trader_logs(9002, since=5)
+        assert page["missed"] == 15 and page["lines"][0]["seq"] == 21
+        page = tsm.get_trader_logs(9002, since=500)         # client con sequenze di una sessione precedente
+        assert page["reset"] and page["lines"][0]["seq"] == 21
+    finally:
+        _drop(9002)
+
+
+def test_new_epoch_after_stop_start():
+    _session(9003)
+    try:
+        for i in range(120):
+            tsm.log(9003, f"tick {i}")
+        page = tsm.get_trader_logs(9003, since=0, limit=200)
+        since, epoch = page["next_since"], page["epoch"]
+        assert since == 120 and epoch
+        _drop(9003)                                     # stop_polling + start_polling: buffer nuovo
+        _session(9003)
+        for i in range(200):
+            tsm.log(9003, f"nuovo {i}")
+        page = tsm.get_trader_logs(9003, since=since, epoch=epoch)
+        assert page["reset"] and page["epoch"] != epoch
+        assert page["lines"][0]["seq"] == 151 and page["missed"] == 150
+        again = tsm.get_trader_logs(9003, since=page["next_since"], epoch=page["epoch"])
+        assert not again["reset"] and again["lines"] == []
+    finally:
+        _drop(9003)
+
+
+def test_restart_keeps_empty_buffer(monkeypatch):
+    import db
+    monkeypatch.setattr(db, "db_cursor", lambda **kwargs: contextlib.nullcontext())
+    monkeypatch.setattr(db, "get_trader", lambda cursor, tid: {"id": tid})
+    monkeypatch.setattr(tsm, "schedule_polling", lambda tid: None)
+    trader = Trader(id=9004, name="t", status="active", master_server_id=None, slave_server_id=None)
+    try:
+        tsm.start_polling(trader)
+        with tsm.sessions_lock:
+            buf = tsm.sessions[9004]["logs"]
+        assert len(buf) == 0
+        tsm.start_polling(trader)                       # restart prima del primo log
+        with tsm.sessions_lock:
+            assert tsm.sessions[9004]["logs"] is buf
+    finally:
+        _drop(9004)
+
+
+def test_not_running():
+    page = tsm.get_trader_logs(424242, since=7)
+    assert page["status"] == "not_running" and page["lines"] == [] and page["next_since"] == 7
+
+
+if __name__ == "__main__":
+    test_delta_paging()
+    test_ring_buffer_missed_and_reset()
+    test_new_epoch_after_stop_start()
+    test_not_running()
+    print("✅ Trader logs OK")
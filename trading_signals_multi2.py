@@ -4,21 +4,29 @@ from zoneinfo import ZoneInfo
 import os
 import threading
 import time
+from typing import Optional
 
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from fastapi import APIRouter
-from logger import log as global_log, logs
-from db import get_trader, get_connection
+from logger import log as global_log, LogBuffer
 from models import Trader
 from indicators.ta import (
     compute_ema, compute_rsi, compute_macd, compute_atr,
     compute_bollinger, compute_hma, compute_adx,
     compute_ichimoku, compute_rolling_percentile
 )
+from indicators.streaming import (
+    EmaState, SmaState, RsiState, MacdLineState, HmaState,
+    TrueRangeState, RankState, high_low, candle_body, get_stream
+)
+import numpy as np
 import pandas as pd
-import requests
 import adaptive_routes
+from candle_cache import get_candles, get_tick_bundle
+from agent_client import agent_get, agent_post
+from polling_scheduler import get_scheduler
+from metrics import STAGE_SECONDS, TICK_SECONDS, TICKS_SKIPPED, SIGNALS
 
 # ─────────────────────── GLOBAL STATE ───────────────────────
 
@@ -35,23 +43,9 @@ BASE_URL = f"http://{HOST}:{PORT}"
 # ─────────────────────── HELPERS ───────────────────────
 
 def get_data(symbol, timeframe, n_candles, agent_url):
-    url = f"{agent_url}/get_rates"
-    payload = {"symbol": symbol, "timeframe": timeframe, "n_candles": n_candles}
-    try:
-        resp = requests.post(url, json=payload, timeout=30)
-        if resp.status_code != 200:
-            return None
-        data = resp.json()
-        rates = data.get("rates", [])
-        if not rates:
-            return None
-        df = pd.DataFrame(rates)
-        if "time" not in df.columns:
-            return None
-        df['time'] = pd.to_datetime(df['time'], unit='s')
-        return df
-    except Exception:
-        return None
+    # cache condivisa per (agent, simbolo, timeframe): scarica solo le barre nuove
+    with STAGE_SECONDS.time("get_data"):
+        return get_candles(agent_url, symbol, timeframe, n_candles)
 
 
 def now_str() -> str:
@@ -102,7 +96,7 @@ def fetch_closed_deals_profit(slave_url: str, symbol: str, days: int = 30) -> di
     Ritorna {position_id: profit} per i deal di chiusura (entry=1) del simbolo.
     """
     try:
-        resp = requests.get(f"{slave_url}/history", params={"days": days}, timeout=15)
+        resp = agent_get(f"{slave_url}/history", params={"days": days}, timeout=15)
         if resp.status_code != 200:
             return {}
         deals = resp.json().get("deals", [])
@@ -125,7 +119,13 @@ def fetch_closed_deals_profit(slave_url: str, symbol: str, days: int = 30) -> di
 
 # ─────────────────────── SEND ORDER (unified) ───────────────────────
 
-def send_order(trader_id: int, direction: str):
+def send_order(trader_id: int, direction: str, market=None):
+    with STAGE_SECONDS.time("send_order"):
+        _send_order(trader_id, direction, market)
+
+
+def _send_order(trader_id: int, direction: str, market=None):
+    # market: "tick" e/o "symbol_info" già letti dallo slave (bundle del tick)
     with sessions_lock:
         if trader_id not in sessions:
             return
@@ -138,14 +138,22 @@ def send_order(trader_id: int, direction: str):
     symbol = trader.selected_symbol
     slave_url = f"http://{trader_data['slave_ip']}:{trader_data['slave_port']}"
 
+    # senza "tick" nel bundle (es. dopo una chiusura) il prezzo si rilegge dallo slave
+    sym_info = (market or {}).get("symbol_info")
+    tick = (market or {}).get("tick")
     try:
-        info_resp = requests.get(f"{slave_url}/symbol_info/{symbol}", timeout=10)
-        tick_resp = requests.get(f"{slave_url}/symbol_tick/{symbol}", timeout=10)
-        if info_resp.status_code != 200 or tick_resp.status_code != 200:
-            log(trader_id, f"Impossibile recuperare dati dallo slave")
-            return
-        sym_info = info_resp.json()
-        tick = tick_resp.json()
+        if not sym_info or "error" in sym_info:
+            info_resp = agent_get(f"{slave_url}/symbol_info/{symbol}", timeout=10)
+            if info_resp.status_code != 200:
+                log(trader_id, f"Impossibile recuperare dati dallo slave")
+                return
+            sym_info = info_resp.json()
+        if not tick or "error" in tick:
+            tick_resp = agent_get(f"{slave_url}/symbol_tick/{symbol}", timeout=10)
+            if tick_resp.status_code != 200:
+                log(trader_id, f"Impossibile recuperare dati dallo slave")
+                return
+            tick = tick_resp.json()
     except Exception as e:
         log(trader_id, f"Errore connessione slave: {e}")
         return
@@ -189,7 +197,7 @@ def send_order(trader_id: int, direction: str):
     }
 
     try:
-        resp = requests.post(
+        resp = agent_post(
             f"{BASE_URL}/db/traders/{trader_id}/open_order_on_slave",
             json=payload, timeout=10
         )
@@ -199,6 +207,11 @@ def send_order(trader_id: int, direction: str):
 
 
 def close_slave_position(trader_id: int):
+    with STAGE_SECONDS.time("close_position"):
+        _close_slave_position(trader_id)
+
+
+def _close_slave_position(trader_id: int):
     with sessions_lock:
         if trader_id not in sessions:
             return
@@ -206,7 +219,7 @@ def close_slave_position(trader_id: int):
 
     payload = {"symbol": trader.selected_symbol, "trader_id": trader_id}
     try:
-        resp = requests.post(
+        resp = agent_post(
             f"{BASE_URL}/db/traders/{trader_id}/close_order_on_slave",
             json=payload, timeout=10
         )
@@ -217,12 +230,18 @@ def close_slave_position(trader_id: int):
 
 # ─────────────────────── PER-TRADER LOG ───────────────────────
 
+TRADER_LOG_LINES = int(os.getenv("TRADER_LOG_LINES", 500))   # righe tenute per trader (ring buffer)
+TRADER_LOG_PAGE = 500                                          # righe massime per risposta di /logs
+
+
 def log(trader_id: int, msg: str):
     ts = datetime.now(ZoneInfo("Europe/Rome")).strftime("%H:%M:%S")
     global_log(msg)
     with sessions_lock:
-        if trader_id in sessions:
-            sessions[trader_id].setdefault("logs", []).append(f"[{ts}] {msg}")
+        session = sessions.get(trader_id)
+        buf = session.get("logs") if session else None
+    if buf is not None:
+        buf.append(f"[{ts}] {msg}")
 
 
 # ─────────────────────── REGIME DI VOLATILITÀ ───────────────────────
@@ -248,6 +267,111 @@ def regime_ok(regime: str) -> bool:
     return regime in ("TREND", "NORMAL", "NEWS")
 
 
+def regime_vector(atr_m15_pct, trend_score=None, is_spike=None):
+    """compute_regime su array (backtest vettoriale): stesse soglie, stesso ordine dei controlli."""
+    pct = np.asarray(atr_m15_pct, dtype=float)
+    spike = np.zeros(pct.shape, dtype=bool) if is_spike is None else np.asarray(is_spike, dtype=bool)
+    if trend_score is None:
+        trend = np.zeros(pct.shape, dtype=bool)
+    else:
+        trend = (pct > 0.60) & (np.abs(trend_score) > 0.35)
+    return np.select(
+        [spike | (pct > 0.90), np.isnan(pct), trend, pct > 0.25],
+        ["NEWS", "NORMAL", "TREND", "NORMAL"],
+        "RANGE",
+    )
+
+
+def regime_ok_vector(regime):
+    return np.isin(regime, ("TREND", "NORMAL", "NEWS"))
+
+
+# ─────────────────────── INDICATORI INCREMENTALI ───────────────────────
+# Stato per (agent, simbolo, timeframe) aggiornato solo alla chiusura di una
+# nuova candela: le strategie con uses_streams leggono da qui invece di
+# ricalcolare tutto su 100-300 barre a ogni tick.
+
+STREAM_SPEC_M1 = [
+    ("ema9", lambda: EmaState(9), "close"),
+    ("ema21", lambda: EmaState(21), "close"),
+    ("rsi9", lambda: RsiState(9), "close"),
+    ("rsi14", lambda: RsiState(14), "close"),
+    ("rsi21", lambda: RsiState(21), "close"),
+    ("macd", MacdLineState, "close"),
+    ("macd_sig", lambda: EmaState(9), "macd"),
+    ("atr", lambda: SmaState(14), high_low),
+    ("atr_ma10", lambda: SmaState(10), "atr"),
+    ("body", None, candle_body),
+]
+
+STREAM_SPEC_M5 = [
+    ("hma", lambda: HmaState(16), "close"),
+    ("tr", TrueRangeState, None),
+    ("atr_m5", lambda: SmaState(14), "tr"),
+]
+
+STREAM_SPEC_M15 = [
+    ("close", None, "close"),
+    ("ema50", lambda: EmaState(50), "close"),
+    ("ema200", lambda: EmaState(200), "close"),
+    ("atr", lambda: SmaState(14), high_low),
+    ("atr_pct", lambda: RankState(REGIME_WINDOW), "atr"),
+]
+
+STREAM_SPECS = {1: STREAM_SPEC_M1, 5: STREAM_SPEC_M5, 15: STREAM_SPEC_M15}
+
+
+def sync_streams(agent_url, symbol, frames):
+    """Aggiorna gli stream con i df appena scaricati; ritorna {tf: StreamSnapshot}."""
+    return {
+        tf: get_stream(agent_url, symbol, tf, STREAM_SPECS[tf]).sync(df)
+        for tf, df in frames.items()
+        if df is not None and tf in STREAM_SPECS
+    }
+
+
+def _m1_stream_indicators(streams, spike_mult=3):
+    """Indicators delle strategie M1/M5/M15 (famiglia SUPER) letti dagli stream."""
+    m1, m5, m15 = streams[1], streams[5], streams[15]
+    atr = m1.get("atr")
+    return Indicators(
+        ema_fast=m1.get("ema9"),
+        ema_slow=m1.get("ema21"),
+        rsi_m1=m1.get("rsi14"),
+        macd=m1.get("macd"),
+        macd_sig=m1.get("macd_sig"),
+        hma_m5=m5.get("hma"),
+        hma_m5_prev=m5.get("hma", 1),
+        trend_macro_up=m15.get("close") > m15.get("ema50"),
+        volatilty_expansion=atr > m1.get("atr_ma10"),
+        is_spike=m1.get("body") > (atr * spike_mult),
+        atr_m5_val=m5.get("atr_m5"),
+    )
+
+
+def _m1_vector_conditions(v, buy_rsi, sell_rsi):
+    """buy/sell della famiglia SUPER FX (USDJPY, GBPUSD, ...) su array: cambiano solo le bande RSI."""
+    buy = (
+        (v.ema_fast > v.ema_slow)
+        & (v.macd > v.macd_sig)
+        & (v.hma_m5 > v.hma_m5_prev)
+        & v.trend_macro_up
+        & (buy_rsi[0] < v.rsi_m1) & (v.rsi_m1 < buy_rsi[1])
+        & v.volatilty_expansion
+        & ~v.is_spike
+    )
+    sell = (
+        (v.ema_fast < v.ema_slow)
+        & (v.macd < v.macd_sig)
+        & (v.hma_m5 < v.hma_m5_prev)
+        & ~v.trend_macro_up
+        & (sell_rsi[0] < v.rsi_m1) & (v.rsi_m1 < sell_rsi[1])
+        & v.volatilty_expansion
+        & ~v.is_spike
+    )
+    return buy, sell
+
+
 # ─────────────────────── STRATEGY BASE CLASS ───────────────────────
 
 class Indicators:
@@ -262,6 +386,13 @@ class SignalStrategy:
     requires_m5 = True
     requires_m15 = False
     requires_h1 = False
+    uses_streams = False  # compute_indicators accetta streams= (indicatori incrementali)
+    # Backtest vettoriale (opzionale): vector_conditions(v) riceve un Indicators
+    # di array allineati alle barre del backtest e ritorna (buy_mask, sell_mask),
+    # vector_hold_conditions(h) fa lo stesso per on_hold_action → (close_buy, close_sell).
+    # Senza, il backtester valuta buy_condition / sell_condition barra per barra.
+    vector_conditions = None
+    vector_hold_conditions = None
 
     def compute_indicators(self, df_m1, df_m5, df_m15, df_h1=None) -> Indicators:
         raise NotImplementedError
@@ -293,6 +424,16 @@ class SignalStrategy:
         return f"S-I-G-N-A-L [{self.name}] | {d}".strip()
 
     def run(self, trader_id: int):
+        t0 = time.perf_counter()
+        try:
+            self._tick(trader_id)
+        finally:
+            # trader fermato durante il tick: stop_polling ha già tolto la sua serie
+            with sessions_lock:
+                if trader_id in sessions:
+                    TICK_SECONDS.observe(time.perf_counter() - t0, trader_id)
+
+    def _tick(self, trader_id: int):
         with sessions_lock:
             if trader_id not in sessions:
                 return
@@ -300,7 +441,6 @@ class SignalStrategy:
             trader = session["trader"]
             trader_data = session["trader_data"]
             prev_signal = session.get("prev_signal", "HOLD")
-            logs.clear()
 
         slave_url = f"http://{trader_data['slave_ip']}:{trader_data['slave_port']}"
         symbol = trader.selected_symbol
@@ -310,18 +450,21 @@ class SignalStrategy:
         if self.requires_m1 and not getattr(self, "live_candle", False):
             current_ts = datetime.now().replace(second=0, microsecond=0)
             if session.get("last_processed_m1") == current_ts:
+                TICKS_SKIPPED.inc("m1_duplicate")
                 return
             session["last_processed_m1"] = current_ts
 
         # ── mercato aperto? ──
         if not is_market_open(symbol):
             log(trader_id, f"⏸ Mercato chiuso (weekend) per {symbol}")
+            TICKS_SKIPPED.inc("market_closed")
             return
 
         # ── blocco notturno ──
         block_night = getattr(trader, 'block_night_trading', False)
         if block_night and is_night_time():
             log(trader_id, f"🌙 Blocco notturno attivo — trading sospeso (22:00-09:00)")
+            TICKS_SKIPPED.inc("night_block")
             return
 
         # ── filtro sessioni ──
@@ -331,21 +474,26 @@ class SignalStrategy:
             current = get_current_session()
             if allowed and current not in allowed:
                 log(trader_id, f"⏸ Sessione {current} non permessa — trading saltato")
+                TICKS_SKIPPED.inc("session_filter")
                 return
 
-        # ── fetch dati ──
-        df_m1 = get_data(symbol, 1, 100, slave_url) if self.requires_m1 else None
-        df_m5 = get_data(symbol, 5, 100, slave_url) if self.requires_m5 else None
-        df_m15 = get_data(symbol, 15, 300, slave_url) if self.requires_m15 else None
-        df_h1 = get_data(symbol, 16385, 120, slave_url) if self.requires_h1 else None
-
-        if self.requires_m1 and (df_m1 is None or df_m1.empty):
-            return
-        if self.requires_m5 and (df_m5 is None or df_m5.empty):
-            return
-        if self.requires_m15 and (df_m15 is None or df_m15.empty):
-            return
-        if self.requires_h1 and (df_h1 is None or df_h1.empty):
+        # ── fetch dati: candele, posizioni, tick e symbol_info in un solo round-trip ──
+        frames = {tf: n for need, tf, n in (
+            (self.requires_m1, 1, 100), (self.requires_m5, 5, 100),
+            (self.requires_m15, 15, 300), (self.requires_h1, 16385, 120),
+        ) if need}
+        with STAGE_SECONDS.time("tick_bundle"):
+            bundle = get_tick_bundle(slave_url, symbol, frames, positions=True, tick=True, symbol_info=True)
+        df_m1 = bundle["frames"].get(1)
+        df_m5 = bundle["frames"].get(5)
+        df_m15 = bundle["frames"].get(15)
+        df_h1 = bundle["frames"].get(16385)
+
+        if any(need and (df is None or df.empty) for need, df in (
+            (self.requires_m1, df_m1), (self.requires_m5, df_m5),
+            (self.requires_m15, df_m15), (self.requires_h1, df_h1),
+        )):
+            TICKS_SKIPPED.inc("no_data")
             return
 
         # ── skip H1 se candela non ancora chiusa ──
@@ -356,12 +504,18 @@ class SignalStrategy:
                 session["h1_skip_count"] = skip_count
                 if skip_count % 5 == 0:
                     log(trader_id, f"⏳ In attesa della prossima candela H1...")
+                TICKS_SKIPPED.inc("h1_not_closed")
                 return
             session["last_processed_h1"] = latest_h1_ts
             session["h1_skip_count"] = 0
 
         # ── indicatori ──
-        ind = self.compute_indicators(df_m1, df_m5, df_m15, df_h1=df_h1)
+        with STAGE_SECONDS.time("indicators"):
+            if self.uses_streams:
+                streams = sync_streams(slave_url, symbol, {1: df_m1, 5: df_m5, 15: df_m15})
+                ind = self.compute_indicators(df_m1, df_m5, df_m15, df_h1=df_h1, streams=streams)
+            else:
+                ind = self.compute_indicators(df_m1, df_m5, df_m15, df_h1=df_h1)
 
         # ── SL/TP dinamico ──
         effective_sl, effective_tp = self.get_dynamic_sl_tp(ind)
@@ -382,15 +536,11 @@ class SignalStrategy:
                 sessions[trader_id]["effective_sl"] = effective_sl
                 sessions[trader_id]["effective_tp"] = effective_tp
 
-        # ── posizioni slave ──
-        try:
-            resp = requests.get(f"{slave_url}/positions", timeout=5)
-            if resp.status_code != 200:
-                log(trader_id, f"Slave non risponde")
-                return
-            positions = resp.json()
-        except Exception as e:
-            log(trader_id, f"Slave non raggiungibile: {e}")
+        # ── posizioni slave (dal bundle) ──
+        positions = bundle["positions"]
+        if not isinstance(positions, list):
+            log(trader_id, f"Slave non risponde")
+            TICKS_SKIPPED.inc("positions_error")
             return
 
         # ── adaptive agent: rileva trade chiusi ──
@@ -411,6 +561,11 @@ class SignalStrategy:
         has_buy = any(p["symbol"] == symbol and p["type"] == 0 for p in positions)
         has_sell = any(p["symbol"] == symbol and p["type"] == 1 for p in positions)
 
+        # prezzi del bundle per send_order: validi solo se prima non si chiude nulla
+        # (la chiusura passa dal manager e può durare secondi → tick da rileggere)
+        market = bundle
+        stale_market = {"symbol_info": bundle["symbol_info"]}
+
         # ── Profit TP check (sovrascrive qualsiasi TP) ──
         use_profit_tp = getattr(trader, 'use_profit_tp', False)
         profit_tp_value = getattr(trader, 'profit_tp_value', None)
@@ -419,6 +574,7 @@ class SignalStrategy:
                 if p["symbol"] == symbol and p.get("profit", 0) >= profit_tp_value:
                     log(trader_id, f"💰 Profit TP {profit_tp_value}$ raggiunto per {symbol} (profit: {p['profit']:.2f})")
                     close_slave_position(trader_id)
+                    market = stale_market
                     has_buy = False
                     has_sell = False
                     break
@@ -439,7 +595,8 @@ class SignalStrategy:
             if not has_buy:
                 if self.reverse_on_buy(has_sell):
                     close_slave_position(trader_id)
-                send_order(trader_id, "buy")
+                    market = stale_market
+                send_order(trader_id, "buy", market=market)
 
         elif self.sell_condition(ind) and direction_filter in ("sell", "both"):
             new_signal = "SELL"
@@ -448,7 +605,8 @@ class SignalStrategy:
             if not has_sell:
                 if self.reverse_on_sell(has_buy):
                     close_slave_position(trader_id)
-                send_order(trader_id, "sell")
+                    market = stale_market
+                send_order(trader_id, "sell", market=market)
 
         else:
             action = self.on_hold_action(ind, has_buy, has_sell, prev_signal)
@@ -459,6 +617,7 @@ class SignalStrategy:
             if not getattr(self, "quiet_holds", False):
                 log(trader_id, f"🔥 HOLD signal per {symbol} {log_details}")
 
+        SIGNALS.inc(new_signal)
         with sessions_lock:
             if trader_id in sessions:
                 sessions[trader_id]["prev_signal"] = new_signal
@@ -523,11 +682,33 @@ class SuperXauNoCloseStrategy(SignalStrategy):
     requires_m1 = True
     requires_m5 = True
     requires_m15 = True
+    uses_streams = True
 
     def __init__(self, regime_filter=True):
         self.regime_filter = regime_filter
 
-    def compute_indicators(self, df_m1, df_m5, df_m15, df_h1=None):
+    def _indicators_from_streams(self, streams):
+        ind = _m1_stream_indicators(streams, spike_mult=4)
+        m1, m15 = streams[1], streams[15]
+        # SUPER confronta l'ATR con la media delle 10 candele PRECEDENTI
+        ind.volatilty_expansion = m1.get("atr") > m1.get("atr_ma10", 1)
+
+        ema_m15 = m15.get("ema50")
+        atr_m15 = m15.get("atr")
+        ema_m15_prev = m15.get("ema50", 8)
+        if atr_m15 > 0 and pd.notna(atr_m15):
+            trend_score = (ema_m15 - ema_m15_prev) / atr_m15
+        else:
+            trend_score = 0.0
+        ind.atr_m15_pct = m15.get("atr_pct")
+        ind.trend_score = trend_score
+        ind.regime = compute_regime(ind.atr_m15_pct, trend_score, ind.is_spike)
+        return ind
+
+    def compute_indicators(self, df_m1, df_m5, df_m15, df_h1=None, streams=None):
+        if streams is not None:
+            return self._indicators_from_streams(streams)
+
         ema_fast = compute_ema(df_m1, 9).iloc[-2]
         ema_slow = compute_ema(df_m1, 21).iloc[-2]
         rsi_m1 = compute_rsi(df_m1, 14).iloc[-2]
@@ -612,6 +793,32 @@ class SuperXauNoCloseStrategy(SignalStrategy):
             and (not self.regime_filter or regime_ok(ind.regime))
         )
 
+    def vector_conditions(self, v):
+        trend = v.regime == "TREND"
+        buy = (
+            (v.ema_fast > v.ema_slow)
+            & (v.macd > v.macd_sig)
+            & (v.hma_m5 > v.hma_m5_prev)
+            & v.trend_macro_up
+            & (45 < v.rsi_m1) & (v.rsi_m1 < np.where(trend, 80, 70))
+            & v.volatilty_expansion
+            & ~v.is_spike
+        )
+        sell = (
+            (v.ema_fast < v.ema_slow)
+            & (v.macd < v.macd_sig)
+            & (v.hma_m5 < v.hma_m5_prev)
+            & ~v.trend_macro_up
+            & (np.where(trend, 25, 30) < v.rsi_m1) & (v.rsi_m1 < 55)
+            & v.volatilty_expansion
+            & ~v.is_spike
+        )
+        if self.regime_filter:
+            ok = regime_ok_vector(v.regime)
+            buy &= ok
+            sell &= ok
+        return buy, sell
+
     def reverse_on_buy(self, has_sell: bool) -> bool:
         return False
 
@@ -774,6 +981,7 @@ class SuperXauProStrategy(SignalStrategy):
     requires_m1 = True
     requires_m5 = True
     requires_m15 = True
+    uses_streams = True
 
     def __init__(self, regime_filter=True):
         self.regime_filter = regime_filter
@@ -839,8 +1047,35 @@ class SuperXauProStrategy(SignalStrategy):
                 "tp_atr_factor": 1.2,
             }
 
-    def compute_indicators(self, df_m1, df_m5, df_m15, df_h1=None):
+    def _indicators_from_streams(self, streams, params):
+        m1, m5, m15 = streams[1], streams[5], streams[15]
+        atr = m1.get("atr")
+        is_spike = m1.get("body") > (atr * 3)
+        atr_m15_pct = m15.get("atr_pct")
+        price_m15 = m15.get("close")
+        return Indicators(
+            ema_fast=m1.get("ema9"),
+            ema_slow=m1.get("ema21"),
+            rsi_m1=m1.get(f"rsi{params['rsi_period']}"),
+            macd=m1.get("macd"),
+            macd_sig=m1.get("macd_sig"),
+            hma_m5=m5.get("hma"),
+            hma_m5_prev=m5.get("hma", 1),
+            trend_macro_up=price_m15 > m15.get("ema200"),
+            trend_macro_50_up=price_m15 > m15.get("ema50"),
+            volatility_expansion=atr > m1.get("atr_ma10") * params["vol_expansion_mult"],
+            is_spike=is_spike,
+            atr_m5_val=m5.get("atr_m5"),
+            atr_m1=atr,
+            atr_m15_pct=atr_m15_pct,
+            regime=compute_regime(atr_m15_pct, is_spike=is_spike),
+            session_label=params["label"],
+        )
+
+    def compute_indicators(self, df_m1, df_m5, df_m15, df_h1=None, streams=None):
         params = self._get_session_params()
+        if streams is not None:
+            return self._indicators_from_streams(streams, params)
 
         # ── M1 ──
         ema_fast = compute_ema(df_m1, 9).iloc[-2]
@@ -942,6 +1177,34 @@ class SuperXauProStrategy(SignalStrategy):
             and not ind.is_spike
         )
 
+    def vector_conditions(self, v):
+        params = self._get_session_params()
+        buy = (
+            v.trend_macro_up
+            & v.trend_macro_50_up
+            & (v.ema_fast > v.ema_slow)
+            & (v.macd > v.macd_sig)
+            & (v.hma_m5 > v.hma_m5_prev)
+            & (params["rsi_buy_min"] < v.rsi_m1) & (v.rsi_m1 < params["rsi_buy_max"])
+            & v.volatility_expansion
+            & ~v.is_spike
+        )
+        sell = (
+            ~v.trend_macro_up
+            & ~v.trend_macro_50_up
+            & (v.ema_fast < v.ema_slow)
+            & (v.macd < v.macd_sig)
+            & (v.hma_m5 < v.hma_m5_prev)
+            & (params["rsi_sell_min"] < v.rsi_m1) & (v.rsi_m1 < params["rsi_sell_max"])
+            & v.volatility_expansion
+            & ~v.is_spike
+        )
+        if self.regime_filter:
+            ok = regime_ok_vector(v.regime)
+            buy &= ok
+            sell &= ok
+        return buy, sell
+
     def reverse_on_buy(self, has_sell: bool) -> bool:
         return False
 
@@ -971,6 +1234,11 @@ class SuperXauProStrategy(SignalStrategy):
             return "close_sell"
         return None
 
+    def vector_hold_conditions(self, h):
+        close_buy = ~h.trend_macro_up & (h.hma_m5 < h.hma_m5_prev)
+        close_sell = h.trend_macro_up & (h.hma_m5 > h.hma_m5_prev)
+        return close_buy, close_sell
+
     def get_log_details(self, ind: Indicators) -> str:
         return f"(ATR:{ind.atr_m5_val:.1f} S:{ind.session_label} RSI:{ind.rsi_m1:.0f} Trend:{'UP' if ind.trend_macro_up else 'DOWN'} REG:{getattr(ind, 'regime', 'NORMAL')})"
 
@@ -1119,8 +1387,12 @@ class SuperUsdJpyStrategy(SignalStrategy):
     requires_m1 = True
     requires_m5 = True
     requires_m15 = True
+    uses_streams = True
+
+    def compute_indicators(self, df_m1, df_m5, df_m15, df_h1=None, streams=None):
+        if streams is not None:
+            return _m1_stream_indicators(streams)
 
-    def compute_indicators(self, df_m1, df_m5, df_m15, df_h1=None):
         ema_fast = compute_ema(df_m1, 9).iloc[-2]
         ema_slow = compute_ema(df_m1, 21).iloc[-2]
         rsi_m1 = compute_rsi(df_m1, 14).iloc[-2]
@@ -1184,6 +1456,9 @@ class SuperUsdJpyStrategy(SignalStrategy):
             and not ind.is_spike
         )
 
+    def vector_conditions(self, v):
+        return _m1_vector_conditions(v, (40, 68), (32, 60))
+
     def reverse_on_buy(self, has_sell: bool) -> bool:
         return False
 
@@ -1208,8 +1483,12 @@ class GbpUsdStrategy(SignalStrategy):
     requires_m1 = True
     requires_m5 = True
     requires_m15 = True
+    uses_streams = True
+
+    def compute_indicators(self, df_m1, df_m5, df_m15, df_h1=None, streams=None):
+        if streams is not None:
+            return _m1_stream_indicators(streams)
 
-    def compute_indicators(self, df_m1, df_m5, df_m15, df_h1=None):
         ema_fast = compute_ema(df_m1, 9).iloc[-2]
         ema_slow = compute_ema(df_m1, 21).iloc[-2]
         rsi_m1 = compute_rsi(df_m1, 14).iloc[-2]
@@ -1273,6 +1552,9 @@ class GbpUsdStrategy(SignalStrategy):
             and not ind.is_spike
         )
 
+    def vector_conditions(self, v):
+        return _m1_vector_conditions(v, (40, 70), (30, 60))
+
     def reverse_on_buy(self, has_sell: bool) -> bool:
         return False
 
@@ -1297,8 +1579,12 @@ class GbpJpyStrategy(SignalStrategy):
     requires_m1 = True
     requires_m5 = True
     requires_m15 = True
+    uses_streams = True
+
+    def compute_indicators(self, df_m1, df_m5, df_m15, df_h1=None, streams=None):
+        if streams is not None:
+            return _m1_stream_indicators(streams)
 
-    def compute_indicators(self, df_m1, df_m5, df_m15, df_h1=None):
         ema_fast = compute_ema(df_m1, 9).iloc[-2]
         ema_slow = compute_ema(df_m1, 21).iloc[-2]
         rsi_m1 = compute_rsi(df_m1, 14).iloc[-2]
@@ -1362,6 +1648,9 @@ class GbpJpyStrategy(SignalStrategy):
             and not ind.is_spike
         )
 
+    def vector_conditions(self, v):
+        return _m1_vector_conditions(v, (35, 75), (25, 65))
+
     def reverse_on_buy(self, has_sell: bool) -> bool:
         return False
 
@@ -1386,8 +1675,12 @@ class AudJpyStrategy(SignalStrategy):
     requires_m1 = True
     requires_m5 = True
     requires_m15 = True
+    uses_streams = True
+
+    def compute_indicators(self, df_m1, df_m5, df_m15, df_h1=None, streams=None):
+        if streams is not None:
+            return _m1_stream_indicators(streams)
 
-    def compute_indicators(self, df_m1, df_m5, df_m15, df_h1=None):
         ema_fast = compute_ema(df_m1, 9).iloc[-2]
         ema_slow = compute_ema(df_m1, 21).iloc[-2]
         rsi_m1 = compute_rsi(df_m1, 14).iloc[-2]
@@ -1451,6 +1744,9 @@ class AudJpyStrategy(SignalStrategy):
             and not ind.is_spike
         )
 
+    def vector_conditions(self, v):
+        return _m1_vector_conditions(v, (38, 72), (28, 62))
+
     def reverse_on_buy(self, has_sell: bool) -> bool:
         return False
 
@@ -1597,21 +1893,15 @@ def run_signal_logic(trader_id: int):
     strategy.run(trader_id)
 
 
-def polling_loop_timer(trader_id: int):
+def schedule_polling(trader_id: int):
+    """Registra il trader sullo scheduler centrale; l'handle resta in sessions[tid]["timer"]."""
     with sessions_lock:
         if trader_id not in sessions:
             return
-        session = sessions[trader_id]
-        trader = session["trader"]
-
-    run_signal_logic(trader_id)
-
-    interval = int(trader.custom_signal_interval or 5)
-    with sessions_lock:
-        if trader_id in sessions:
-            t = threading.Timer(interval, polling_loop_timer, args=[trader_id])
-            sessions[trader_id]["timer"] = t
-            t.start()
+        trader = sessions[trader_id]["trader"]
+        interval = int(trader.custom_signal_interval or 5)
+        job = get_scheduler().schedule(trader_id, lambda: run_signal_logic(trader_id), interval)
+        sessions[trader_id]["timer"] = job
 
 
 # ─────────────────────── API ENDPOINTS ───────────────────────
@@ -1622,27 +1912,30 @@ class StopPollingRequest(BaseModel):
 
 @router.post("/start_polling")
 def start_polling(trader: Trader):
+    # import qui: backtest (e i worker di research_tasks) importano le strategie senza db
+    from db import get_trader, db_cursor
     tid = trader.id
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    trader_data = get_trader(cursor, tid)
+    with db_cursor(dictionary=True) as cursor:
+        trader_data = get_trader(cursor, tid)
     if not trader_data:
         return {"status": "error", "message": "Trader non trovato"}
 
     with sessions_lock:
         if tid in sessions and sessions[tid].get("timer"):
             sessions[tid]["timer"].cancel()
+        # restart: stesso buffer, le sequenze dei log continuano
+        trader_logs = sessions[tid].get("logs") if tid in sessions else None
 
         sessions[tid] = {
             "trader": trader,
             "trader_data": trader_data,
             "prev_signal": "HOLD",
             "timer": None,
-            "logs": [],
+            "logs": trader_logs if trader_logs is not None else LogBuffer(TRADER_LOG_LINES),
         }
 
     global_log(f"▶ START {trader.name} | {trader.selected_symbol}")
-    polling_loop_timer(tid)
+    schedule_polling(tid)
     return {"status": "started", "trader_id": tid}
 
 
@@ -1658,6 +1951,45 @@ def stop_polling(req: StopPollingRequest):
             trader_name = trader.name if trader else str(trader_id)
             trader_symbol = trader.selected_symbol if trader else "?"
             del sessions[trader_id]
+            TICK_SECONDS.remove(trader_id)
             global_log(f"⏹ STOP {trader_name} | {trader_symbol}")
             return {"status": "stopped", "trader_id": trader_id}
     return {"status": "not_running"}
+
+
+@router.get("/logs/{trader_id}")
+def get_trader_logs(trader_id: int, since: int = 0, limit: int = TRADER_LOG_PAGE, epoch: Optional[str] = None):
+    """Righe di log del trader con sequenza > since (al più limit): il client rilegge solo i delta.
+
+    next_since ed epoch vanno ripassati alla chiamata successiva; missed conta le righe
+    già uscite dal ring buffer, reset=True se il buffer è ripartito (nuova sessione dopo
+    stop/start: epoch diverso, le sequenze ripartono da 1) e le righe sono da since=0.
+    """
+    with sessions_lock:
+        session = sessions.get(trader_id)
+        buf = session.get("logs") if session else None
+    if buf is None:
+        return {"status": "not_running", "trader_id": trader_id, "lines": [], "next_since": since, "last_seq": since,
+                "missed": 0, "reset": False, "epoch": epoch}
+
+    reset = (epoch is not None and epoch != buf.epoch) or since > buf.seq
+    if reset:
+        since = 0
+    entries = buf.entries(since, limit=max(1, min(limit, TRADER_LOG_PAGE)))
+    missed = max(0, buf.first_seq - since - 1) if entries else 0
+    return {
+        "status": "running",
+        "trader_id": trader_id,
+        "lines": [{"seq": seq, "line": line} for seq, line in entries],
+        "next_since": entries[-1][0] if entries else since,
+        "last_seq": buf.seq,
+        "missed": missed,
+        "reset": reset,
+        "epoch": buf.epoch,
+    }
+
+
+@router.get("/scheduler_stats")
+def scheduler_stats():
+    """Metriche dello scheduler di polling (deadline mancate, ritardi, durata tick)."""
+    return get_scheduler().stats()